@@ -5,10 +5,13 @@ import re
 from datetime import datetime
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, send_file
-from werkzeug.utils import secure_filename # Mantener por si se necesita para otras subidas, aunque no se usa directamente para el nombre único
+from werkzeug.utils import secure_filename
 
 # Importa la instancia de la base de datos y el modelo AboutUs desde models.py
 from models import db, AboutUs
+from http_cache import respuesta_condicional
+from cache import cache, tabla
+from storage import guardar_stream, liberar, ruta_absoluta
 
 # Importa las bibliotecas para la generación de imágenes y PDF
 from PIL import Image, ImageDraw, ImageFont # Para exportar a JPG
@@ -42,22 +45,38 @@ def is_valid_filename(filename):
     return True
 
 # NUEVO: Función para generar un nombre de archivo único
-def generate_unique_filename(original_filename, upload_folder):
+def eliminar_logo(logo_filename):
     """
-    Genera un nombre de archivo único, manteniendo el nombre original si es posible,
-    o añadiendo un número consecutivo si ya existe.
+    Libera la referencia del logo en el almacén por contenido (storage.py).
+    Los logos anteriores al almacén solo guardan el nombre y se borran de la carpeta como antes.
     """
-    filename_base, extension = os.path.splitext(original_filename)
-    counter = 1
-    unique_filename = original_filename
-    while os.path.exists(os.path.join(upload_folder, unique_filename)):
-        unique_filename = f"{filename_base}_{counter}{extension}"
-        counter += 1
-    return unique_filename
+    if not logo_filename or liberar(logo_filename):
+        return
+    old_logo_path = os.path.join(current_app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER'], logo_filename)
+    if os.path.exists(old_logo_path):
+        os.remove(old_logo_path)
+        print(f"DEBUG: Logo anterior eliminado: {old_logo_path}")
+
+
+# Validadores HTTP: solo se consultan el ID y la fecha de actualización, sin renderizar nada
+def validador_ver_aboutus():
+    entrada = db.session.query(AboutUs.id, AboutUs.logo_filename, AboutUs.updated_at) \
+        .order_by(AboutUs.created_at.desc()).first()
+    if not entrada:
+        return (None,), None
+    return tuple(entrada), entrada.updated_at
+
+def validador_exportar_aboutus(aboutus_id, format):
+    entrada = db.session.query(AboutUs.logo_filename, AboutUs.updated_at).filter_by(id=aboutus_id).first()
+    if not entrada:
+        return None # La vista se encarga del 404
+    return (aboutus_id, format, entrada.logo_filename, entrada.updated_at), entrada.updated_at
 
 
 # Ruta para ver la sección "Acerca de Nosotros"
 @aboutus_bp.route('/ver', methods=['GET'])
+@respuesta_condicional(validador_ver_aboutus, debil=True, por_sesion=True)
+@cache.memoizar((tabla('about_us'), tabla('version')), por_usuario=True) # El navbar muestra la última versión
 def ver_aboutus():
     # Intenta obtener la entrada más reciente de AboutUs.
     # Se asume que solo habrá una sección "Acerca de Nosotros" en la aplicación.
@@ -88,14 +107,9 @@ def crear_aboutus():
                         return redirect(request.url)
 
                     if allowed_file(logo_file.filename):
-                        # MODIFICADO: Usar generate_unique_filename
-                        filename = generate_unique_filename(logo_file.filename, current_app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER'])
-                        upload_folder = current_app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER']
-                        os.makedirs(upload_folder, exist_ok=True)
-                        filepath = os.path.join(upload_folder, filename)
-                        logo_file.save(filepath)
-                        logo_filename = filename
-                        print(f"DEBUG: Archivo de logo guardado en: {filepath}") # DEBUG
+                        # Se guarda en el almacén por contenido; logo_filename queda con la ruta relativa a static/
+                        logo_filename, _ = guardar_stream(logo_file.stream, secure_filename(logo_file.filename), logo_file.mimetype)
+                        print(f"DEBUG: Archivo de logo guardado en: {logo_filename}") # DEBUG
                     else:
                         flash('Tipo de archivo no permitido para el logo. Solo PNG, JPG, JPEG.', 'danger')
                         print("DEBUG: Tipo de archivo de logo no permitido.") # DEBUG
@@ -105,12 +119,9 @@ def crear_aboutus():
             # Esto mantiene una única sección "Acerca de Nosotros".
             existing_about_us = AboutUs.query.first()
             if existing_about_us:
-                # Si ya existe, elimina el logo anterior si se subió uno nuevo y es diferente
-                if logo_filename and existing_about_us.logo_filename and existing_about_us.logo_filename != logo_filename:
-                    old_logo_path = os.path.join(current_app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER'], existing_about_us.logo_filename)
-                    if os.path.exists(old_logo_path):
-                        os.remove(old_logo_path)
-                        print(f"DEBUG: Logo anterior eliminado: {old_logo_path}")
+                # Si ya existe y se subió un logo nuevo, libera el anterior
+                if logo_filename:
+                    eliminar_logo(existing_about_us.logo_filename)
 
                 # Actualiza los campos
                 existing_about_us.logo_filename = logo_filename if logo_filename else existing_about_us.logo_filename # Mantener el antiguo si no se subió nuevo
@@ -167,20 +178,11 @@ def editar_aboutus(aboutus_id):
                     return redirect(request.url)
 
                 if logo_file and allowed_file(logo_file.filename):
-                    # Si ya existe un logo, lo elimina del sistema de archivos
-                    if about_us_entry.logo_filename:
-                        old_logo_path = os.path.join(current_app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER'], about_us_entry.logo_filename)
-                        if os.path.exists(old_logo_path):
-                            os.remove(old_logo_path)
-                            print(f"DEBUG: Logo anterior eliminado durante edición: {old_logo_path}")
-
-                    # Guarda el nuevo logo
-                    # MODIFICADO: Usar generate_unique_filename
-                    filename = generate_unique_filename(logo_file.filename, current_app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER'])
-                    filepath = os.path.join(current_app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER'], filename)
-                    logo_file.save(filepath)
-                    about_us_entry.logo_filename = filename
-                    print(f"DEBUG: Nuevo logo guardado durante edición: {filepath}")
+                    # Guarda el nuevo logo en el almacén por contenido y libera el anterior
+                    nueva_ruta, _ = guardar_stream(logo_file.stream, secure_filename(logo_file.filename), logo_file.mimetype)
+                    eliminar_logo(about_us_entry.logo_filename)
+                    about_us_entry.logo_filename = nueva_ruta
+                    print(f"DEBUG: Nuevo logo guardado durante edición: {nueva_ruta}")
                 else:
                     flash('Tipo de archivo no permitido para el logo. Solo PNG, JPG, JPEG.', 'danger')
                     return redirect(request.url)
@@ -207,12 +209,8 @@ def eliminar_aboutus(aboutus_id):
     # Obtiene la entrada de AboutUs por su ID, o devuelve un 404 si no se encuentra
     about_us_entry = AboutUs.query.get_or_404(aboutus_id)
     try:
-        # Elimina el archivo de logo asociado del sistema de archivos
-        if about_us_entry.logo_filename:
-            logo_path = os.path.join(current_app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER'], about_us_entry.logo_filename)
-            if os.path.exists(logo_path):
-                os.remove(logo_path)
-                print(f"DEBUG: Logo eliminado del sistema de archivos: {logo_path}")
+        # Elimina (o libera en el almacén) el archivo de logo asociado
+        eliminar_logo(about_us_entry.logo_filename)
 
         db.session.delete(about_us_entry) # Elimina la entrada de la base de datos
         db.session.commit() # Guarda los cambios
@@ -226,6 +224,7 @@ def eliminar_aboutus(aboutus_id):
 
 # Ruta para exportar el contenido de "Acerca de Nosotros" a diferentes formatos
 @aboutus_bp.route('/exportar/<int:aboutus_id>/<string:format>', methods=['GET'])
+@respuesta_condicional(validador_exportar_aboutus, debil=True)
 def exportar_aboutus(aboutus_id, format):
     about_us_entry = AboutUs.query.get_or_404(aboutus_id)
 
@@ -259,7 +258,7 @@ def exportar_aboutus(aboutus_id, format):
 
         # Imagen del Logo (si existe)
         if about_us_entry.logo_filename:
-            logo_path = os.path.join(current_app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER'], about_us_entry.logo_filename)
+            logo_path = ruta_absoluta(about_us_entry.logo_path)
             if os.path.exists(logo_path):
                 try:
                     img = RLImage(logo_path)
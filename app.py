@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, current_app, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, current_app, jsonify, make_response
 from config import Config
 import os
 from werkzeug.utils import secure_filename
@@ -6,7 +6,6 @@ from datetime import datetime, date, timedelta
 import re
 import json
 from functools import wraps
-import uuid
 from sqlalchemy.exc import IntegrityError
 from auth_setup import oauth_bp, init_oauth
 from models import db, bcrypt, migrate, User, AboutUs
@@ -14,12 +13,25 @@ from contactos import contactos_bp
 from perfil import perfil_bp
 from aboutus import aboutus_bp
 from flask_cors import CORS
-from flask_mail import Mail, Message
-from version import version_bp, Version
+from flask_mail import Mail
+from version import version_bp, Version, ultima_version
 from btns import btns_bp
 from flask_babel import Babel  # <-- CAMBIO CLAVE: Usa la importación de Flask-Babel
 from colaboradores import colaboradores_bp
 from solicitud import solicitud_bp # NUEVO: Importación del Blueprint de solicitud
+from pwa import pwa_bp # Página offline y comando `flask pwa generar-precache`
+from storage import storage_bp, guardar_stream # Almacén de subidas por contenido y comando `flask storage deduplicar`
+from files import files_bp # Gestión de archivos, subidas reanudables y `flask files reindexar-activos`
+from throttle import espera_para_login, registrar_fallo_de_login, respuesta_limitada
+from hashing import hashing_bp, aplicar_costo_calibrado, verificar_contrasena # Costo de bcrypt calibrado y `flask hashing calibrar`
+from correo import correo_bp, encolar_correo # Bandeja de salida de correo y `flask correo enviar`
+from push import push_bp # Notificaciones Web Push y `flask push enviar`
+from tareas import tareas_bp # Cola de tareas en segundo plano y `flask worker`
+from programador import programador_bp # Trabajos periódicos y `flask programador ejecutar`
+from respaldos import respaldos_bp # Respaldos en línea de SQLite y `flask respaldos crear`
+from mantenimiento import mantenimiento_bp # ANALYZE y vacuum incremental de SQLite, `flask mantenimiento ejecutar`
+from cache import cache_bp, cache # Caché en memoria y compartida entre workers, `flask cache estadisticas`
+from plantillas import plantillas_bp, configurar_cache_bytecode, calentar # Bytecode de Jinja y `flask plantillas precompilar`
 
 
 # --- Instanciar las extensiones globalmente ---
@@ -33,12 +45,15 @@ CORS(app)
 app.config.from_object(Config)
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)
 app.config['BABEL_TRANSLATION_DIRECTORIES'] = 'translations'
+configurar_cache_bytecode(app) # Plantillas compiladas compartidas por los workers en instance/jinja_cache
 
 # --- Inicializar extensiones ---
 db.init_app(app)
+aplicar_costo_calibrado(app) # BCRYPT_LOG_ROUNDS de instance/bcrypt.json si no viene del entorno
 bcrypt.init_app(app)
 migrate.init_app(app, db)
 mail.init_app(app)
+cache.init_app(app)
 
 # --- Función para obtener el idioma seleccionado ---
 LANGUAGES = ['es', 'en']
@@ -77,6 +92,9 @@ os.makedirs(app.config['MAP_FILES_UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['COVERS_UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['UPLOAD_FILES_FOLDER'], exist_ok=True)
+os.makedirs(app.config['UPLOAD_STAGING_FOLDER'], exist_ok=True)
+os.makedirs(app.config['LINE_INDEX_FOLDER'], exist_ok=True)
+os.makedirs(app.config['BLOB_STORE_FOLDER'], exist_ok=True)
 
 
 # Función auxiliar para verificar extensiones permitidas (ahora usando app.config)
@@ -176,9 +194,9 @@ def inject_latest_version():
     try:
         # CORRECCIÓN: Asegurarse de que Version esté disponible en este contexto
         # Ya se importa desde version.py arriba
-        latest_version = Version.query.order_by(Version.fecha_creacion.desc()).first()
+        latest_version = ultima_version()
         if latest_version:
-            return {'latest_version_number': latest_version.numero_version}
+            return {'latest_version_number': latest_version[0]}
     except Exception as e:
         # Esto es importante para manejar el caso donde la tabla Version aún no existe
         # durante el primer inicio o antes de las migraciones.
@@ -220,7 +238,13 @@ def check_for_first_user():
 @app.route('/home') # Añadido /home como ruta alternativa para la página de inicio
 def home():
     # CAMBIO: Ahora renderiza directamente la plantilla home.html
-    return render_template('home.html')
+    response = make_response(render_template('home.html'))
+    response.vary.add('Cookie')
+    if session.get('logged_in'):
+        # La barra de navegación muestra el usuario y sus enlaces: ni el Service Worker ni un
+        # proxy deben guardar esta versión de la página
+        response.cache_control.private = True
+    return response
 
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -284,7 +308,7 @@ def register():
                                    capacidad_opciones=capacidad_opciones,
                                    participacion_opciones=participacion_opciones)
 
-        if User.query.filter_by(username=username).first():
+        if User.por_identidad(username, 'username'):
             flash('El nombre de usuario ya existe. Por favor, elige otro.', 'danger')
             return render_template('register.html',
                                    provincia_opciones=provincia_opciones,
@@ -294,7 +318,7 @@ def register():
                                    participacion_opciones=participacion_opciones)
 
         if email: # Solo validar email si se proporciona
-            if User.query.filter_by(email=email.lower()).first():
+            if User.por_identidad(email, 'email'):
                 flash('Ese correo electrónico ya está registrado. Por favor, usa otro.', 'danger')
                 return render_template('register.html',
                                        provincia_opciones=provincia_opciones,
@@ -320,23 +344,9 @@ def register():
         if 'avatar' in request.files:
             avatar_file = request.files['avatar']
             if avatar_file and avatar_file.filename != '':
-                # Generar un nombre de archivo único
+                # Guardar en el almacén por contenido (un avatar repetido no ocupa espacio extra)
                 filename = secure_filename(avatar_file.filename)
-                unique_filename = str(uuid.uuid4()) + os.path.splitext(filename)[1]
-
-                # Definir la ruta de guardado
-                upload_folder = app.config.get('UPLOAD_FOLDER')
-                if not upload_folder:
-                    flash('Error de configuración: Carpeta de subida de avatares no definida.', 'danger')
-                    return redirect(url_for('register'))
-
-                os.makedirs(upload_folder, exist_ok=True)
-
-                file_path = os.path.join(upload_folder, unique_filename)
-                avatar_file.save(file_path)
-
-                # Actualizar la URL del avatar en el usuario
-                avatar_url = os.path.join('uploads', 'avatars', unique_filename).replace('\\', '/') # Ruta relativa para URL
+                avatar_url, _ = guardar_stream(avatar_file.stream, filename, avatar_file.mimetype) # Ruta relativa para URL
             else:
                 # Si no se sube ninguna imagen, asignar la imagen por defecto
                 avatar_url = 'uploads/avatars/default.png' # Ruta a tu imagen por defecto
@@ -434,13 +444,18 @@ def register():
 def login():
     if request.method == 'POST':
         username_or_email = request.form['username_or_email']
+        # Límite de intentos por IP y por cuenta: se rechaza antes de consultar la DB y de bcrypt
+        espera = espera_para_login(username_or_email)
+        if espera:
+            return respuesta_limitada(espera)
         password = request.form['password']
         remember_me = request.form.get('remember_me') # AÑADIDO: Captura el valor del checkbox
 
-        user = User.query.filter((User.username == username_or_email) | (User.email == username_or_email.lower())).first()
+        user = User.por_identidad(username_or_email, 'username', 'email')
 
         # CORRECCIÓN: Cambiado user.password_hash a user.password
-        if user and bcrypt.check_password_hash(user.password, password):
+        # Mide la verificación y actualiza el hash si se guardó con otro costo de bcrypt
+        if user and verificar_contrasena(user, password):
             # AÑADIDO: Lógica para sesión permanente
             if remember_me:
                 session.permanent = True
@@ -453,6 +468,7 @@ def login():
             flash(f'¡Bienvenido, {user.username}!', 'success')
             return redirect(url_for('perfil.perfil')) # Redirigir al perfil después del login
         else:
+            registrar_fallo_de_login(username_or_email)
             flash('Nombre de usuario, correo electrónico o contraseña incorrectos.', 'danger')
     return render_template('login.html')
 
@@ -491,15 +507,13 @@ def change_language(lang):
 
 def send_reset_email(user):
     token = user.get_reset_token()
-    msg = Message('Solicitud de Restablecimiento de Contraseña',
-                  sender=current_app.config['MAIL_DEFAULT_SENDER'],
-                  recipients=[user.email])
-    msg.body = f'''Para restablecer tu contraseña, visita el siguiente enlace:
+    cuerpo = f'''Para restablecer tu contraseña, visita el siguiente enlace:
 {url_for('reset_password', token=token, _external=True)}
 
 Si no solicitaste este cambio, simplemente ignora este correo y no se realizará ningún cambio.
 '''
-    mail.send(msg)
+    # Se encola: la respuesta no espera al servidor SMTP (ver correo.py)
+    encolar_correo(user.email, 'Solicitud de Restablecimiento de Contraseña', cuerpo)
 
 
 @app.route('/request_password_reset', methods=['GET', 'POST'])
@@ -508,7 +522,7 @@ def request_password_reset():
         return redirect(url_for('home'))
     if request.method == 'POST':
         email = request.form.get('email')
-        user = User.query.filter_by(email=email).first()
+        user = User.por_identidad(email, 'email')
         if user:
             send_reset_email(user)
             flash('Se ha enviado un correo con las instrucciones para restablecer tu contraseña.', 'info')
@@ -562,6 +576,18 @@ app.register_blueprint(version_bp, url_prefix='/version')
 app.register_blueprint(btns_bp) # REGISTRO DEL BLUEPRINT DE BTNS
 app.register_blueprint(colaboradores_bp) # NUEVO: REGISTRO DEL BLUEPRINT DE COLABORADORES
 app.register_blueprint(solicitud_bp) # NUEVO: REGISTRO DEL BLUEPRINT DE SOLICITUDES
+app.register_blueprint(pwa_bp) # Página offline y manifiesto de precache del Service Worker
+app.register_blueprint(storage_bp)
+app.register_blueprint(files_bp) # Gestión de archivos del usuario y activos de la aplicación
+app.register_blueprint(hashing_bp)
+app.register_blueprint(correo_bp)
+app.register_blueprint(push_bp)
+app.register_blueprint(tareas_bp)
+app.register_blueprint(programador_bp)
+app.register_blueprint(respaldos_bp)
+app.register_blueprint(mantenimiento_bp)
+app.register_blueprint(cache_bp)
+app.register_blueprint(plantillas_bp)
 
 
 
@@ -570,6 +596,11 @@ init_oauth(app)
 app.register_blueprint(oauth_bp)
 # --- FIN DE LAS LÍNEAS A AÑADIR ---
 
+# Renderizar las plantillas críticas antes de que el worker acepte tráfico. Los comandos `flask ...`
+# (FLASK_RUN_FROM_CLI) no sirven páginas y se lo saltan.
+if app.config.get('TEMPLATE_WARMUP_ON_START') and not os.environ.get('FLASK_RUN_FROM_CLI'):
+    calentar(app)
+
 
 if __name__ == '__main__':
     with app.app_context(): # Usar app_context para db.create_all()
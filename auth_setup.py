@@ -107,7 +107,7 @@ def get_or_create_oauth_user(provider, user_info):
         return oauth_link.user
 
     # 2. Si no hay vinculación, buscar si el usuario ya existe por su email
-    user = User.query.filter_by(email=user_email).first()
+    user = User.por_identidad(user_email, 'email')
 
     if not user:
         # 3. Si el usuario no existe en absoluto, crearlo
@@ -0,0 +1,83 @@
+# benchmarks/busqueda_blobs.py
+# Búsqueda de blobs en la carpeta plana anterior frente a la estructura fragmentada <ab>/<cd>/
+# (storage.ruta_blob).
+#
+#   python benchmarks/busqueda_blobs.py [--archivos 500000] [--busquedas 20000]
+#
+# Mide stat de un archivo existente y de uno inexistente, creación de archivos y listado de un
+# directorio. Conviene repetirlo tras vaciar la caché de páginas (echo 3 > /proc/sys/vm/drop_caches)
+# para ver el caso en frío.
+import os
+import random
+import hashlib
+import argparse
+
+from entorno import preparar, limpiar, cronometro, formato_duracion
+
+
+def nombres(cantidad, semilla):
+    return [hashlib.sha256(f'{semilla}-{n}'.encode()).hexdigest() + '.jpg' for n in range(cantidad)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--archivos', type=int, default=500000)
+    parser.add_argument('--busquedas', type=int, default=20000)
+    args = parser.parse_args()
+
+    app, temporal = preparar()
+    try:
+        import storage
+
+        with app.test_request_context():
+            carpeta = storage.carpeta_blobs()
+            plana = os.path.join(temporal, 'plana')
+            os.makedirs(plana)
+
+            def fragmentada(nombre):
+                return storage.ruta_absoluta(storage.ruta_blob(nombre[:64], '.jpg'))
+
+            def plana_de(nombre):
+                return os.path.join(plana, nombre)
+
+            existentes = nombres(args.archivos, 'blob')
+            tiempos = {}
+            for disposicion, ruta in (('plana', plana_de), ('fragmentada', fragmentada)):
+                with cronometro(tiempos, f'crear_{disposicion}'):
+                    for nombre in existentes:
+                        destino = ruta(nombre)
+                        if disposicion == 'fragmentada':
+                            os.makedirs(os.path.dirname(destino), exist_ok=True)
+                        with open(destino, 'wb'):
+                            pass
+
+            muestra = random.Random(1).sample(existentes, min(args.busquedas, len(existentes)))
+            ausentes = nombres(args.busquedas, 'ausente')
+            for disposicion, ruta in (('plana', plana_de), ('fragmentada', fragmentada)):
+                with cronometro(tiempos, f'existe_{disposicion}'):
+                    for nombre in muestra:
+                        os.stat(ruta(nombre))
+                with cronometro(tiempos, f'ausente_{disposicion}'):
+                    for nombre in ausentes:
+                        os.path.exists(ruta(nombre))
+
+            with cronometro(tiempos, 'listar_plana'):
+                os.listdir(plana)
+            un_fragmento = os.path.dirname(fragmentada(existentes[0]))
+            with cronometro(tiempos, 'listar_fragmentada'):
+                os.listdir(un_fragmento)
+
+        print(f'{args.archivos} archivos, {len(muestra)} búsquedas ({carpeta})')
+        print(f'{"":24}{"plana":>12}{"fragmentada":>14}')
+        for etiqueta, clave, divisor in (('crear (por archivo)', 'crear', args.archivos),
+                                         ('stat existente', 'existe', len(muestra)),
+                                         ('stat inexistente', 'ausente', len(ausentes)),
+                                         ('listar un directorio', 'listar', 1)):
+            print(f'{etiqueta:24}{formato_duracion(tiempos[f"{clave}_plana"] / divisor):>12}'
+                  f'{formato_duracion(tiempos[f"{clave}_fragmentada"] / divisor):>14}')
+    finally:
+        limpiar(temporal)
+
+
+if __name__ == '__main__':
+    main()
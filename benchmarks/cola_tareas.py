@@ -0,0 +1,92 @@
+# benchmarks/cola_tareas.py
+# Contención de la cola task_queue: hilos productores encolan tareas vacías mientras procesos worker
+# (como `flask worker --procesos M --hilos N`) las reclaman con UPDATE ... RETURNING.
+#
+#   python benchmarks/cola_tareas.py [--tareas 5000] [--productores 4] [--procesos 2] [--hilos 2]
+#
+# Informa tareas encoladas y ejecutadas por segundo, la espera en cola (iniciada_en - programada_en)
+# y los errores de bloqueo de SQLite en los productores. Requiere fork (Linux/macOS).
+import os
+import time
+import signal
+import argparse
+import threading
+import statistics
+import multiprocessing
+
+from entorno import preparar, limpiar
+
+
+def percentil(valores, p):
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tareas', type=int, default=5000)
+    parser.add_argument('--productores', type=int, default=4)
+    parser.add_argument('--procesos', type=int, default=2)
+    parser.add_argument('--hilos', type=int, default=2)
+    args = parser.parse_args()
+
+    app, temporal = preparar()
+    try:
+        import tareas
+        from models import db, TaskQueue
+
+        @tareas.tarea('benchmark.nada')
+        def nada(n):
+            pass
+
+        app.config['TASK_POLL_SECONDS'] = 0.05
+        contexto = multiprocessing.get_context('fork')
+        workers = [contexto.Process(target=tareas._proceso_hijo, args=(app, args.hilos, False))
+                   for _ in range(args.procesos)]
+        for worker in workers:
+            worker.start()
+
+        errores = []
+        por_productor = args.tareas // args.productores
+
+        def producir():
+            with app.app_context():
+                for n in range(por_productor):
+                    try:
+                        tareas.encolar('benchmark.nada', n=n)
+                    except Exception as e:
+                        errores.append(e)
+
+        inicio = time.perf_counter()
+        productores = [threading.Thread(target=producir) for _ in range(args.productores)]
+        for productor in productores:
+            productor.start()
+        for productor in productores:
+            productor.join()
+        encoladas_en = time.perf_counter() - inicio
+        total = por_productor * args.productores - len(errores)
+
+        with app.app_context():
+            while TaskQueue.query.filter_by(estado='hecha').count() < total:
+                time.sleep(0.1)
+            ejecutadas_en = time.perf_counter() - inicio
+            esperas = sorted(t.iniciada_en - t.programada_en for t in TaskQueue.query.filter_by(estado='hecha'))
+            reintentos = TaskQueue.query.filter(TaskQueue.intentos > 1).count()
+
+        for worker in workers:
+            os.kill(worker.pid, signal.SIGTERM)
+        tareas._detener_hijos(workers, 10)
+
+        print(f'{total} tareas, {args.productores} productores, {args.procesos} procesos x {args.hilos} hilos')
+        print(f'encoladas:  {total / encoladas_en:8.1f} tareas/s ({len(errores)} errores al encolar)')
+        print(f'ejecutadas: {total / ejecutadas_en:8.1f} tareas/s (hasta la última, contando desde la primera encolada)')
+        print(f'espera en cola: mediana {statistics.median(esperas) * 1000:.1f} ms, '
+              f'p95 {percentil(esperas, 0.95) * 1000:.1f} ms, máxima {esperas[-1] * 1000:.1f} ms')
+        print(f'tareas reclamadas más de una vez: {reintentos}')
+        if errores:
+            print(f'primer error: {errores[0]}')
+    finally:
+        limpiar(temporal)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# benchmarks/correo_bandeja.py
+# Mensajes por segundo de la bandeja de salida (correo.procesar_bandeja, una conexión SMTP por lote)
+# frente a un mail.send() por mensaje, que abre una conexión en cada envío como hacía el
+# restablecimiento de contraseña antes de la bandeja.
+#
+#   python benchmarks/correo_bandeja.py [--mensajes 2000] [--latencia-ms 50] [--lote 100]
+#
+# El servidor SMTP es un sumidero local que acepta todo; --latencia-ms simula el saludo y el
+# handshake de un servidor remoto en cada conexión nueva.
+import time
+import argparse
+import threading
+import socketserver
+
+from entorno import preparar, limpiar, cronometro
+
+
+class SumideroSMTP(socketserver.StreamRequestHandler):
+    latencia = 0.0
+    conexiones = 0
+    mensajes = 0
+
+    def responder(self, linea):
+        self.wfile.write(linea.encode() + b'\r\n')
+
+    def handle(self):
+        SumideroSMTP.conexiones += 1
+        time.sleep(self.latencia)
+        self.responder('220 sumidero ESMTP')
+        for linea in self.rfile:
+            comando = linea.decode(errors='replace').strip().upper()
+            if comando.startswith(('EHLO', 'HELO')):
+                self.responder('250 sumidero')
+            elif comando == 'DATA':
+                self.responder('354 fin con <CRLF>.<CRLF>')
+                for contenido in self.rfile:
+                    if contenido == b'.\r\n':
+                        break
+                SumideroSMTP.mensajes += 1
+                self.responder('250 aceptado')
+            elif comando == 'QUIT':
+                self.responder('221 adiós')
+                return
+            else:
+                self.responder('250 ok')
+
+
+class Servidor(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mensajes', type=int, default=2000)
+    parser.add_argument('--latencia-ms', type=float, default=50)
+    parser.add_argument('--lote', type=int, default=100)
+    args = parser.parse_args()
+
+    SumideroSMTP.latencia = args.latencia_ms / 1000
+    servidor = Servidor(('127.0.0.1', 0), SumideroSMTP)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    app, temporal = preparar(MAIL_SERVER='127.0.0.1', MAIL_PORT=str(servidor.server_address[1]),
+                             MAIL_USE_TLS='false', MAIL_PASSWORD='', MAIL_OUTBOX_BACKGROUND='false')
+    try:
+        import correo
+        from flask_mail import Message
+
+        app.config.update(MAIL_OUTBOX_RATE=(0, 0), MAIL_OUTBOX_BATCH=args.lote)
+        destinatarios = [f'socio{n}@latribu.test' for n in range(args.mensajes)]
+        tiempos = {}
+        with app.app_context():
+            correo.encolar_correo(destinatarios, 'Aviso', 'Salida el sábado a las 6:00')
+            SumideroSMTP.conexiones = SumideroSMTP.mensajes = 0
+            with cronometro(tiempos, 'bandeja'):
+                while correo.procesar_bandeja()['enviados']:
+                    pass
+            bandeja = (SumideroSMTP.mensajes, SumideroSMTP.conexiones)
+
+            # Un envío por mensaje con su propia conexión; se limita a una muestra si la latencia es alta
+            muestra = destinatarios[:max(1, min(args.mensajes, int(20 / max(SumideroSMTP.latencia, 0.001))))]
+            mail = app.extensions['mail']
+            SumideroSMTP.conexiones = SumideroSMTP.mensajes = 0
+            with cronometro(tiempos, 'directo'):
+                for destinatario in muestra:
+                    mail.send(Message('Aviso', recipients=[destinatario], body='Salida el sábado a las 6:00',
+                                      sender=app.config['MAIL_DEFAULT_SENDER']))
+            directo = (SumideroSMTP.mensajes, SumideroSMTP.conexiones)
+
+        print(f'{args.mensajes} mensajes, latencia por conexión {args.latencia_ms:g} ms, lotes de {args.lote}')
+        print(f'bandeja de salida:  {bandeja[0] / tiempos["bandeja"]:8.1f} mensajes/s '
+              f'({bandeja[0]} mensajes, {bandeja[1]} conexiones)')
+        print(f'mail.send directo:  {directo[0] / tiempos["directo"]:8.1f} mensajes/s '
+              f'({directo[0]} mensajes, {directo[1]} conexiones)')
+    finally:
+        servidor.shutdown()
+        limpiar(temporal)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/entorno.py
+# Instancia aislada de la aplicación para los benchmarks, igual que tests/conftest.py: base SQLite y
+# carpetas de subida y bytecode de Jinja temporales, sin caché, sin programador y sin calentamiento
+# de plantillas.
+# Los scripts de esta carpeta se ejecutan desde la raíz del proyecto: python benchmarks/<script>.py
+import os
+import sys
+import time
+import shutil
+import tempfile
+import contextlib
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Carpetas de activos de la aplicación: se anulan para que ningún benchmark recorra static/ del proyecto
+CARPETAS_DE_ACTIVOS = ('UPLOAD_FOLDER', 'PROJECT_IMAGE_UPLOAD_FOLDER', 'NOTE_IMAGE_UPLOAD_FOLDER',
+                       'CAMINATA_IMAGE_UPLOAD_FOLDER', 'PAGOS_IMAGE_UPLOAD_FOLDER', 'CALENDAR_IMAGE_UPLOAD_FOLDER',
+                       'SONGS_UPLOAD_FOLDER', 'COVERS_UPLOAD_FOLDER', 'ABOUTUS_IMAGE_UPLOAD_FOLDER')
+
+
+def preparar(prefijo='latribu-bench-', **entorno):
+    """
+    Importa la aplicación apuntando a un directorio temporal y crea las tablas.
+    `entorno` sobrescribe variables de entorno antes de la importación (p. ej. CACHE_BACKEND='niveles').
+    Devuelve (app, carpeta_temporal); la carpeta se borra al salir del proceso con `limpiar`.
+    """
+    temporal = tempfile.mkdtemp(prefix=prefijo)
+    os.environ.update({
+        'DATABASE_URL': 'sqlite:///' + os.path.join(temporal, 'db.db'),
+        'CACHE_BACKEND': 'nulo',
+        'CACHE_SQLITE_PATH': os.path.join(temporal, 'cache.db'),
+        'SCHEDULER_ENABLED': 'false',
+        'TEMPLATE_WARMUP_ON_START': 'false',
+        'TEMPLATE_BYTECODE_FOLDER': os.path.join(temporal, 'jinja_cache'),
+        **entorno,
+    })
+    sys.path.insert(0, RAIZ)
+
+    from app import app
+    from models import db
+
+    static = os.path.join(temporal, 'static')
+    carpetas = {
+        'BLOB_STORE_FOLDER': os.path.join(static, 'uploads', 'blobs'),
+        'UPLOAD_FILES_FOLDER': os.path.join(static, 'uploads', 'files'),
+        'UPLOAD_STAGING_FOLDER': os.path.join(temporal, 'upload_staging'),
+        'UPLOAD_QUARANTINE_FOLDER': os.path.join(temporal, 'upload_quarantine'),
+        'LINE_INDEX_FOLDER': os.path.join(temporal, 'line_index'),
+        'BACKUP_FOLDER': os.path.join(temporal, 'backups'),
+    }
+    for carpeta in carpetas.values():
+        os.makedirs(carpeta, exist_ok=True)
+    app.config.update(TESTING=True, **carpetas)
+    app.static_folder = static
+    app.instance_path = temporal
+    for clave in CARPETAS_DE_ACTIVOS:
+        app.config[clave] = None
+    with app.app_context():
+        db.create_all()
+    return app, temporal
+
+
+def limpiar(temporal):
+    shutil.rmtree(temporal, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def cronometro(resultados, nombre):
+    """Acumula en resultados[nombre] los segundos que tarda el bloque."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        resultados[nombre] = resultados.get(nombre, 0.0) + time.perf_counter() - inicio
+
+
+def formato_duracion(segundos):
+    if segundos < 1e-3:
+        return f'{segundos * 1e6:.1f} µs'
+    if segundos < 1:
+        return f'{segundos * 1e3:.1f} ms'
+    return f'{segundos:.2f} s'
@@ -0,0 +1,56 @@
+# benchmarks/entrega_archivos.py
+# Tiempo de worker por descarga con storage.enviar_archivo: el worker transmite el archivo
+# (FILE_DELIVERY vacío) frente a solo responder las cabeceras para el proxy (x-accel / x-sendfile).
+#
+#   python benchmarks/entrega_archivos.py [--tamano-mb 20] [--peticiones 200]
+#
+# Las peticiones pasan por la ruta real /uploads/colaboradores/<nombre> con el cliente de pruebas,
+# así que el resultado es el tiempo que un worker queda ocupado, no el ancho de banda de la red.
+import io
+import os
+import argparse
+
+from entorno import preparar, limpiar, cronometro, formato_duracion
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tamano-mb', type=float, default=20)
+    parser.add_argument('--peticiones', type=int, default=200)
+    args = parser.parse_args()
+
+    app, temporal = preparar()
+    try:
+        import storage
+        from models import db
+
+        app.config['FILE_DELIVERY_ROOT'] = app.static_folder
+        with app.app_context():
+            ruta, _ = storage.guardar_stream(io.BytesIO(os.urandom(int(args.tamano_mb * 1024 * 1024))), 'video.mp4')
+            db.session.commit()
+        url = f'/uploads/colaboradores/{os.path.basename(ruta)}'
+        client = app.test_client()
+
+        tiempos = {}
+        transferidos = {}
+        for modo in (None, 'x-accel', 'x-sendfile'):
+            app.config['FILE_DELIVERY'] = modo
+            etiqueta = modo or 'worker'
+            transferidos[etiqueta] = 0
+            with cronometro(tiempos, etiqueta):
+                for _ in range(args.peticiones):
+                    respuesta = client.get(url)
+                    transferidos[etiqueta] += len(respuesta.data)
+                    respuesta.close()
+
+        print(f'{args.peticiones} descargas de {args.tamano_mb:g} MB')
+        for etiqueta, segundos in tiempos.items():
+            print(f'{etiqueta:12} {args.peticiones / segundos:10.1f} peticiones/s  '
+                  f'{formato_duracion(segundos / args.peticiones):>10} por petición  '
+                  f'{transferidos[etiqueta] / 1024 / 1024:10.1f} MB por el worker')
+    finally:
+        limpiar(temporal)
+
+
+if __name__ == '__main__':
+    main()
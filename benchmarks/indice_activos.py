@@ -0,0 +1,79 @@
+# benchmarks/indice_activos.py
+# Índice de activos (files.refrescar_indice_activos) frente al recorrido completo que hacía ver_files
+# en cada petición (os.walk + stat + mimetypes de cada archivo).
+#
+#   python benchmarks/indice_activos.py [--activos 50000] [--directorios 500]
+#
+# Mide la construcción inicial, un refresco sin cambios y un refresco tras cambiar un directorio.
+import os
+import argparse
+import mimetypes
+
+from entorno import preparar, limpiar, cronometro, formato_duracion
+
+
+def recorrido_completo(carpeta):
+    """Lo que hacía ver_files antes del índice: recorrer y examinar todos los archivos."""
+    activos = 0
+    for raiz, _, archivos in os.walk(carpeta):
+        for nombre in archivos:
+            os.stat(os.path.join(raiz, nombre))
+            mimetypes.guess_type(nombre)
+            activos += 1
+    return activos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--activos', type=int, default=50000)
+    parser.add_argument('--directorios', type=int, default=500)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    app, temporal = preparar()
+    try:
+        import files
+        from models import AppAsset
+
+        carpeta = os.path.join(app.static_folder, 'uploads', 'project_images')
+        por_directorio = max(1, args.activos // args.directorios)
+        for d in range(args.directorios):
+            directorio = os.path.join(carpeta, f'proyecto_{d:05d}')
+            os.makedirs(directorio)
+            for n in range(por_directorio):
+                with open(os.path.join(directorio, f'imagen_{n:04d}.jpg'), 'wb') as f:
+                    f.write(b'x' * 64)
+        app.config['PROJECT_IMAGE_UPLOAD_FOLDER'] = carpeta
+
+        tiempos = {}
+        with app.app_context():
+            with cronometro(tiempos, 'construccion'):
+                inicial = files.refrescar_indice_activos(forzar=True)
+            total = AppAsset.query.count()
+
+            for i in range(args.repeticiones):
+                with cronometro(tiempos, 'sin_cambios'):
+                    sin_cambios = files.refrescar_indice_activos(forzar=True)
+                with cronometro(tiempos, 'recorrido'):
+                    recorrido_completo(carpeta)
+
+                # Un archivo nuevo en un solo directorio
+                with open(os.path.join(carpeta, 'proyecto_00000', f'nueva_{i}.jpg'), 'wb') as f:
+                    f.write(b'y')
+                with cronometro(tiempos, 'un_cambio'):
+                    un_cambio = files.refrescar_indice_activos(forzar=True)
+
+        print(f'{total} activos en {args.directorios} directorios')
+        print(f'construcción inicial:        {formato_duracion(tiempos["construccion"])} '
+              f'({inicial["listados"]} directorios listados)')
+        print(f'refresco sin cambios:        {formato_duracion(tiempos["sin_cambios"] / args.repeticiones)} '
+              f'({sin_cambios["listados"]} directorios listados)')
+        print(f'refresco con un cambio:      {formato_duracion(tiempos["un_cambio"] / args.repeticiones)} '
+              f'({un_cambio["listados"]} directorios listados, {un_cambio["nuevos"]} nuevo)')
+        print(f'recorrido completo anterior: {formato_duracion(tiempos["recorrido"] / args.repeticiones)}')
+    finally:
+        limpiar(temporal)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# benchmarks/instantaneas.py
+# Instantáneas incrementales de subidas (respaldos.crear_instantanea): la primera instantánea lee
+# todos los archivos; las siguientes solo los que cambiaron de tamaño o mtime.
+#
+#   python benchmarks/instantaneas.py [--archivos 100000] [--cambios 0.01] [--tamano-kb 16]
+#
+# Crea N archivos, toma una instantánea completa, modifica el porcentaje indicado y toma otra.
+# Las dos instantáneas se fechan en segundos distintos renombrando la primera.
+import os
+import random
+import argparse
+
+from entorno import preparar, limpiar, formato_duracion
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--archivos', type=int, default=100000)
+    parser.add_argument('--cambios', type=float, default=0.01, help='Fracción de archivos modificados.')
+    parser.add_argument('--tamano-kb', type=float, default=16)
+    parser.add_argument('--duplicados', type=float, default=0.1, help='Fracción de archivos con contenido repetido.')
+    args = parser.parse_args()
+
+    app, temporal = preparar()
+    try:
+        import respaldos
+        from storage import formato_bytes
+
+        fuente = os.path.join(temporal, 'uploads')
+        app.config.update(BACKUP_UPLOADS_SOURCE=fuente, BACKUP_UPLOADS_FOLDER=os.path.join(temporal, 'instantaneas'))
+        azar = random.Random(1)
+        tamano = int(args.tamano_kb * 1024)
+        rutas = []
+        for n in range(args.archivos):
+            carpeta = os.path.join(fuente, f'{n % 256:02x}')
+            os.makedirs(carpeta, exist_ok=True)
+            ruta = os.path.join(carpeta, f'archivo_{n}.bin')
+            # Los duplicados repiten uno de 100 contenidos fijos
+            contenido = (f'repetido {n % 100}'.encode().ljust(tamano, b'.') if azar.random() < args.duplicados
+                         else os.urandom(tamano))
+            with open(ruta, 'wb') as f:
+                f.write(contenido)
+            rutas.append(ruta)
+
+        with app.app_context():
+            completa = respaldos.crear_instantanea()
+            carpeta = respaldos.carpeta_instantaneas()
+            os.replace(os.path.join(carpeta, completa['instantanea']),
+                       os.path.join(carpeta, f'{respaldos.PREFIJO_INSTANTANEA}20000101_000000{respaldos.EXTENSION_INSTANTANEA}'))
+
+            for ruta in azar.sample(rutas, int(len(rutas) * args.cambios)):
+                with open(ruta, 'ab') as f:
+                    f.write(b'cambio')
+            incremental = respaldos.crear_instantanea()
+
+        print(f'{args.archivos} archivos de {args.tamano_kb:g} KB, {args.cambios:.1%} modificados')
+        for etiqueta, datos in (('completa', completa), ('incremental', incremental)):
+            print(f'{etiqueta:12} {formato_duracion(datos["duracion_s"]):>10}  {datos["hasheados"]:7} leídos  '
+                  f'{datos["objetos_nuevos"]:7} objetos nuevos ({formato_bytes(datos["bytes_nuevos"])})  '
+                  f'manifiesto {formato_bytes(datos["bytes_manifiesto"])}')
+    finally:
+        limpiar(temporal)
+
+
+if __name__ == '__main__':
+    main()
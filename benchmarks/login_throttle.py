@@ -0,0 +1,81 @@
+# benchmarks/login_throttle.py
+# Prueba de carga de /login: un bot insiste con contraseñas incorrectas desde una IP mientras un
+# usuario legítimo inicia sesión desde otra. Compara el límite de intentos (throttle.py) activado
+# y desactivado: cuántas verificaciones bcrypt llegan a ejecutarse y la latencia del usuario legítimo.
+#
+#   python benchmarks/login_throttle.py [--segundos 10] [--hilos 8] [--costo 12] [--compartido]
+import time
+import argparse
+import threading
+import statistics
+
+from entorno import preparar, limpiar
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--hilos', type=int, default=8, help='Hilos del bot.')
+    parser.add_argument('--costo', type=int, default=12, help='log_rounds de bcrypt de las contraseñas.')
+    parser.add_argument('--compartido', action='store_true', help='Cubetas en la tabla login_throttle.')
+    args = parser.parse_args()
+
+    app, temporal = preparar()
+    try:
+        import throttle
+        from models import db, bcrypt, User
+
+        app.config.update(BCRYPT_LOG_ROUNDS=args.costo, LOGIN_THROTTLE_SHARED=args.compartido)
+        with app.app_context():
+            for nombre in ('victima', 'legitimo'):
+                db.session.add(User(username=nombre, email=f'{nombre}@example.com', nombre=nombre.capitalize(),
+                                    primer_apellido='Carga', telefono='88880000',
+                                    password=bcrypt.generate_password_hash('secreta', args.costo).decode()))
+            db.session.commit()
+
+        print(f'{args.segundos:g} s por escenario, {args.hilos} hilos del bot, bcrypt costo {args.costo}')
+        for activado in (False, True):
+            app.config['LOGIN_THROTTLE_ENABLED'] = activado
+            throttle._cubetas.clear()
+            contadores = {'bot': 0, 'limitadas': 0}
+            latencias = []
+            fin = time.monotonic() + args.segundos
+            lock = threading.Lock()
+
+            def bot():
+                client = app.test_client()
+                while time.monotonic() < fin:
+                    respuesta = client.post('/login', data={'username_or_email': 'victima', 'password': 'adivinanza'},
+                                            environ_base={'REMOTE_ADDR': '203.0.113.66'})
+                    with lock:
+                        contadores['bot'] += 1
+                        contadores['limitadas'] += respuesta.status_code == 429
+
+            def legitimo():
+                client = app.test_client()
+                while time.monotonic() < fin:
+                    inicio = time.perf_counter()
+                    client.post('/login', data={'username_or_email': 'legitimo', 'password': 'secreta'},
+                                environ_base={'REMOTE_ADDR': '198.51.100.10'})
+                    latencias.append(time.perf_counter() - inicio)
+                    client.get('/logout')
+                    time.sleep(0.5)
+
+            hilos = [threading.Thread(target=bot) for _ in range(args.hilos)] + [threading.Thread(target=legitimo)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+
+            verificaciones = contadores['bot'] - contadores['limitadas']
+            print(f'límite {"activado" if activado else "desactivado":12} '
+                  f'bot: {contadores["bot"] / args.segundos:8.1f} peticiones/s, '
+                  f'{contadores["limitadas"]} con 429, {verificaciones} verificaciones bcrypt | '
+                  f'usuario legítimo: mediana {statistics.median(latencias) * 1000:.0f} ms, '
+                  f'máxima {max(latencias) * 1000:.0f} ms ({len(latencias)} inicios de sesión)')
+    finally:
+        limpiar(temporal)
+
+
+if __name__ == '__main__':
+    main()
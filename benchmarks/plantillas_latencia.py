@@ -0,0 +1,65 @@
+# benchmarks/plantillas_latencia.py
+# Primer render de las plantillas críticas (TEMPLATE_WARMUP) en un worker recién arrancado: sin caché
+# de bytecode (Jinja compila cada plantilla), con la caché llena por `flask plantillas precompilar`
+# y, como referencia, con las plantillas ya cargadas en memoria.
+#
+#   python benchmarks/plantillas_latencia.py [--repeticiones 5]
+#
+# Un worker nuevo se simula vaciando la caché de plantillas en memoria del entorno de Jinja.
+import io
+import argparse
+import statistics
+import contextlib
+
+from entorno import preparar, limpiar, cronometro, formato_duracion
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    app, temporal = preparar()
+    try:
+        import plantillas
+        from jinja2.utils import LRUCache
+
+        entorno = app.jinja_env
+        cache_bytecode = entorno.bytecode_cache
+        escenarios = ('sin bytecode', 'con bytecode', 'en memoria')
+        medidas = {escenario: [] for escenario in escenarios}
+        tiempos = {}
+
+        def calentar():
+            # Las plantillas que esperan variables de su vista fallan al final del render; no importa
+            with contextlib.redirect_stdout(io.StringIO()):
+                return plantillas.calentar(app)
+
+        for _ in range(args.repeticiones):
+            entorno.bytecode_cache = None
+            entorno.cache = LRUCache(400)
+            medidas['sin bytecode'].append(calentar())
+
+            entorno.bytecode_cache = cache_bytecode
+            cache_bytecode.clear()
+            entorno.cache = LRUCache(400)
+            with cronometro(tiempos, 'precompilar'):
+                compiladas, _ = plantillas.compilar_todas(app)
+            entorno.cache = LRUCache(400)
+            medidas['con bytecode'].append(calentar())
+            medidas['en memoria'].append(calentar())
+
+        print(f'{compiladas} plantillas precompiladas en {formato_duracion(tiempos["precompilar"] / args.repeticiones)}; '
+              f'mediana de {args.repeticiones} repeticiones del primer render (ms)')
+        print(f'{"plantilla":28}' + ''.join(f'{escenario:>15}' for escenario in escenarios))
+        for nombre in app.config['TEMPLATE_WARMUP']:
+            print(f'{nombre:28}' + ''.join(f'{statistics.median(m[nombre] for m in medidas[escenario]):15.1f}'
+                                           for escenario in escenarios))
+        print(f'{"total":28}' + ''.join(f'{statistics.median(sum(m.values()) for m in medidas[escenario]):15.1f}'
+                                        for escenario in escenarios))
+    finally:
+        limpiar(temporal)
+
+
+if __name__ == '__main__':
+    main()
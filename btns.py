@@ -1,6 +1,12 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app, session
 import json
 import os
+import copy
+import stat
+import tempfile
+import threading
+from filelock import FileLock
+from http_cache import respuesta_condicional
 
 # Define the blueprint
 btns_bp = Blueprint('btns', __name__)
@@ -12,35 +18,110 @@ def get_config_path():
     # Creates the path inside the 'instance' folder, e.g., /path/to/your/app/instance/btns_config.json
     return os.path.join(current_app.instance_path, 'btns_config.json')
 
+# mkstemp creates files with mode 0600; a new config file gets the mode open() would have given it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+DEFAULT_CONFIG = {
+    'button_one': {'is_visible': False, 'link': '', 'icon': 'fa-link', 'visibility_state': 'all'},
+    'button_two': {'is_visible': False, 'link': '', 'icon': 'fa-file-pdf', 'visibility_state': 'all'}
+}
+
+
+class ButtonConfigStore:
+    """
+    Process-wide cache of the parsed button configuration.
+
+    The parsed document is reused until the file's inode, mtime or size changes, so
+    polling /api/btns/config no longer re-reads and re-parses the JSON on every call.
+    Writes go to a temporary file in the same folder and are swapped in with os.replace
+    while holding an inter-process file lock, so readers in other workers always see
+    either the old or the new document, never a truncated one. The replacement keeps
+    the permissions of the file it replaces.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # path -> (stat signature, parsed config)
+
+    @staticmethod
+    def _signature(stat):
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def load(self, path):
+        try:
+            signature = self._signature(os.stat(path))
+        except FileNotFoundError:
+            return copy.deepcopy(DEFAULT_CONFIG)
+
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry and entry[0] == signature:
+            return copy.deepcopy(entry[1])
+
+        try:
+            with open(path, 'r') as f:
+                config = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            # Default structure if file is missing or corrupt
+            return copy.deepcopy(DEFAULT_CONFIG)
+
+        with self._lock:
+            self._entries[path] = (signature, config)
+        return copy.deepcopy(config)
+
+    def save(self, path, config):
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        with FileLock(path + '.lock'):
+            fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.btns_config.', suffix='.tmp')
+            try:
+                try:
+                    mode = stat.S_IMODE(os.stat(path).st_mode)
+                except FileNotFoundError:
+                    mode = 0o666 & ~_UMASK
+                os.chmod(tmp_path, mode)
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(config, f, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            signature = self._signature(os.stat(path))
+        with self._lock:
+            self._entries[path] = (signature, copy.deepcopy(config))
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+
+config_store = ButtonConfigStore()
+
+
 def load_config():
     """
-    Loads the button configuration from the JSON file.
+    Loads the button configuration from the JSON file (through the cached store).
     Returns a default configuration if the file doesn't exist or is invalid.
     """
-    config_path = get_config_path()
-    try:
-        with open(config_path, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        # Default structure if file is missing or corrupt
-        return {
-            'button_one': {'is_visible': False, 'link': '', 'icon': 'fa-link', 'visibility_state': 'all'},
-            'button_two': {'is_visible': False, 'link': '', 'icon': 'fa-file-pdf', 'visibility_state': 'all'}
-        }
+    return config_store.load(get_config_path())
 
 def save_config(config):
     """
-    Saves the button configuration to the JSON file.
+    Saves the button configuration to the JSON file atomically.
     Returns True on success, False on failure.
     """
     config_path = get_config_path()
     try:
-        # Ensure the instance folder exists before trying to write to it
-        os.makedirs(current_app.instance_path, exist_ok=True)
-        with open(config_path, 'w') as f:
-            json.dump(config, f, indent=4)
+        config_store.save(config_path, config)
         return True
-    except IOError as e:
+    except (IOError, OSError) as e:
         current_app.logger.error(f"Error writing to config file {config_path}: {e}")
         return False
 
@@ -108,7 +189,17 @@ def crear_btns():
     return render_template('crear_btns.html', config=config)
 
 
+def validador_config():
+    """Validadores HTTP de la configuración: mtime y tamaño del archivo JSON."""
+    try:
+        stat = os.stat(get_config_path())
+    except OSError:
+        return ('default',), None
+    return (stat.st_mtime_ns, stat.st_size), stat.st_mtime
+
+
 @btns_bp.route('/api/btns/config')
+@respuesta_condicional(validador_config, privada=False)
 def get_btn_config():
     """API endpoint to provide button configuration to the frontend script."""
     return jsonify(load_config())
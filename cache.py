@@ -0,0 +1,532 @@
+# cache.py
+# Caché de la aplicación con backend intercambiable (CACHE_BACKEND).
+# - 'memoria': LRU por proceso con TTL y límites de entradas y de bytes.
+# - 'sqlite': tabla compartida en CACHE_SQLITE_PATH (modo WAL) que ven todos los workers.
+# - 'niveles' (por defecto): la LRU local delante de la tabla compartida.
+# - 'nulo': desactivada (cada lectura es un fallo).
+# Los valores se guardan serializados con pickle: cada lectura devuelve una copia nueva, así que
+# quien la modifique no altera lo que ven las demás peticiones.
+# Las claves viven en espacios ('version', 'aboutus', ...). Cada espacio tiene un número de versión
+# que forma parte de la clave; invalidar(espacio) lo incrementa en la tabla compartida y las entradas
+# anteriores dejan de encontrarse en todos los workers (las locales salen por LRU o TTL).
+# limpiar() incrementa además el espacio '*', que está en todas las claves.
+# Las versiones se leen una vez por petición y solo las de los espacios que se usan.
+# Seguimiento de cambios: los eventos after_flush/do_orm_execute de la sesión anotan qué tablas y
+# claves primarias cambiaron y after_commit incrementa sus generaciones (espacios 'tabla:<nombre>' y
+# 'tabla:<nombre>#<pk>'); un rollback las descarta. Una entrada declara sus dependencias con
+# tabla('version') o fila('user', 5) y se invalida sola cuando esos datos cambian desde cualquier
+# worker. Las escrituras con SQL en texto (text()) no se siguen.
+import os
+import time
+import pickle
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from functools import wraps
+
+import click
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from flask import Blueprint, current_app, g, has_request_context, jsonify, make_response, request, session, \
+    flash, redirect, url_for
+
+from programador import periodica
+
+cache_bp = Blueprint('cache', __name__)
+
+LANGUAGES = ['es', 'en']
+
+
+def role_required(roles):
+    if not isinstance(roles, list):
+        roles = [roles]
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if 'logged_in' not in session or not session['logged_in']:
+                flash('Por favor, inicia sesión para acceder a esta página.', 'info')
+                return redirect(url_for('login'))
+            if session.get('role') not in roles:
+                flash('No tienes permiso para acceder a esta página.', 'danger')
+                return redirect(url_for('home'))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+class Estadisticas:
+    CAMPOS = ('aciertos', 'fallos', 'escrituras', 'desalojos', 'expirados')
+
+    def __init__(self):
+        self.reiniciar()
+
+    def reiniciar(self):
+        for campo in self.CAMPOS:
+            setattr(self, campo, 0)
+
+    def resumen(self):
+        datos = {campo: getattr(self, campo) for campo in self.CAMPOS}
+        consultas = self.aciertos + self.fallos
+        datos['tasa_aciertos'] = round(self.aciertos / consultas, 4) if consultas else None
+        return datos
+
+
+# --- Backends ---
+
+class MemoriaLRU:
+    """LRU por proceso: OrderedDict clave -> (expira, datos) acotado por entradas y por bytes."""
+    nombre = 'memoria'
+
+    def __init__(self, max_entradas=2048, max_bytes=32 * 1024 * 1024):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._versiones = {}
+        self.estadisticas = Estadisticas()
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.estadisticas.fallos += 1
+                return None
+            expira, datos = entrada
+            if expira < time.time():
+                self._quitar(clave)
+                self.estadisticas.expirados += 1
+                self.estadisticas.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.estadisticas.aciertos += 1
+            return datos, expira
+
+    def guardar(self, clave, datos, expira):
+        if len(datos) > self.max_bytes:
+            return
+        with self._lock:
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = (expira, datos)
+            self._bytes += len(datos)
+            self.estadisticas.escrituras += 1
+            while len(self._entradas) > self.max_entradas or self._bytes > self.max_bytes:
+                self._quitar(next(iter(self._entradas)))
+                self.estadisticas.desalojos += 1
+
+    def _quitar(self, clave):
+        _, datos = self._entradas.pop(clave)
+        self._bytes -= len(datos)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    # Sin nivel compartido las versiones de los espacios solo existen en este proceso
+    def versiones(self, espacios):
+        return {espacio: self._versiones[espacio] for espacio in espacios if espacio in self._versiones}
+
+    def incrementar_versiones(self, espacios):
+        with self._lock:
+            for espacio in espacios:
+                self._versiones[espacio] = self._versiones.get(espacio, 0) + 1
+
+    def ocupacion(self):
+        return {'entradas': len(self._entradas), 'bytes': self._bytes,
+                'max_entradas': self.max_entradas, 'max_bytes': self.max_bytes}
+
+
+class SQLiteCompartida:
+    """Tabla clave -> (datos, expira) en un archivo SQLite aparte, compartida por todos los workers."""
+    nombre = 'sqlite'
+
+    def __init__(self, ruta, max_entradas=50000):
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self._local = threading.local()
+        self.estadisticas = Estadisticas()
+
+    def _conexion(self):
+        conexion = getattr(self._local, 'conexion', None)
+        # Tras un fork (flask worker --procesos) la conexión del padre no se puede reutilizar
+        if conexion is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+            conexion = sqlite3.connect(self.ruta, timeout=5, isolation_level=None, check_same_thread=False)
+            conexion.execute('PRAGMA journal_mode = WAL')
+            conexion.execute('PRAGMA synchronous = NORMAL')
+            conexion.execute('CREATE TABLE IF NOT EXISTS cache (clave TEXT PRIMARY KEY, datos BLOB NOT NULL, '
+                             'expira REAL NOT NULL)')
+            conexion.execute('CREATE INDEX IF NOT EXISTS ix_cache_expira ON cache (expira)')
+            conexion.execute('CREATE TABLE IF NOT EXISTS cache_espacios (espacio TEXT PRIMARY KEY, '
+                             'version INTEGER NOT NULL)')
+            self._local.conexion, self._local.pid = conexion, os.getpid()
+        return conexion
+
+    def obtener(self, clave):
+        fila = self._conexion().execute('SELECT datos, expira FROM cache WHERE clave = ?', (clave,)).fetchone()
+        if fila is None or fila[1] < time.time():
+            if fila is not None:
+                self.estadisticas.expirados += 1
+            self.estadisticas.fallos += 1
+            return None
+        self.estadisticas.aciertos += 1
+        return fila[0], fila[1]
+
+    def guardar(self, clave, datos, expira):
+        self._conexion().execute('INSERT INTO cache (clave, datos, expira) VALUES (?, ?, ?) '
+                                 'ON CONFLICT (clave) DO UPDATE SET datos = excluded.datos, expira = excluded.expira',
+                                 (clave, datos, expira))
+        self.estadisticas.escrituras += 1
+
+    def limpiar(self):
+        self._conexion().execute('DELETE FROM cache')
+
+    def versiones(self, espacios):
+        espacios = list(espacios)
+        marcadores = ', '.join('?' * len(espacios))
+        return dict(self._conexion().execute(
+            f'SELECT espacio, version FROM cache_espacios WHERE espacio IN ({marcadores})', espacios))
+
+    def incrementar_versiones(self, espacios):
+        conexion = self._conexion()
+        # Una sola transacción de escritura por commit, aunque cambien varias tablas y filas
+        conexion.execute('BEGIN IMMEDIATE')
+        try:
+            conexion.executemany('INSERT INTO cache_espacios (espacio, version) VALUES (?, 1) '
+                                 'ON CONFLICT (espacio) DO UPDATE SET version = version + 1',
+                                 [(espacio,) for espacio in espacios])
+        except BaseException:
+            conexion.execute('ROLLBACK')
+            raise
+        conexion.execute('COMMIT')
+
+    def purgar(self):
+        """Borra las expiradas y, si sobran, las que vencen antes. Devuelve cuántas borró."""
+        conexion = self._conexion()
+        borradas = conexion.execute('DELETE FROM cache WHERE expira < ?', (time.time(),)).rowcount
+        sobrantes = conexion.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.max_entradas
+        if sobrantes > 0:
+            borradas += conexion.execute('DELETE FROM cache WHERE clave IN (SELECT clave FROM cache '
+                                         'ORDER BY expira LIMIT ?)', (sobrantes,)).rowcount
+            self.estadisticas.desalojos += sobrantes
+        return borradas
+
+    def ocupacion(self):
+        entradas, total = self._conexion().execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(datos)), 0) FROM cache').fetchone()
+        return {'entradas': entradas, 'bytes': total, 'max_entradas': self.max_entradas}
+
+
+class EnNiveles:
+    """LRU local delante de la tabla compartida; un acierto compartido se copia a la local."""
+    nombre = 'niveles'
+
+    def __init__(self, local, compartida):
+        self.local = local
+        self.compartida = compartida
+
+    def obtener(self, clave):
+        encontrado = self.local.obtener(clave)
+        if encontrado is not None:
+            return encontrado
+        encontrado = self.compartida.obtener(clave)
+        if encontrado is not None:
+            self.local.guardar(clave, *encontrado)
+        return encontrado
+
+    def guardar(self, clave, datos, expira):
+        self.local.guardar(clave, datos, expira)
+        self.compartida.guardar(clave, datos, expira)
+
+    def limpiar(self):
+        self.local.limpiar()
+        self.compartida.limpiar()
+
+    def versiones(self, espacios):
+        return self.compartida.versiones(espacios)
+
+    def incrementar_versiones(self, espacios):
+        self.compartida.incrementar_versiones(espacios)
+
+    def purgar(self):
+        return self.compartida.purgar()
+
+
+class Nula:
+    nombre = 'nulo'
+
+    def __init__(self):
+        self.estadisticas = Estadisticas()
+
+    def obtener(self, clave):
+        self.estadisticas.fallos += 1
+        return None
+
+    def guardar(self, clave, datos, expira):
+        pass
+
+    def limpiar(self):
+        pass
+
+    def versiones(self, espacios):
+        return {}
+
+    def incrementar_versiones(self, espacios):
+        pass
+
+
+# --- Fachada ---
+
+class Cache:
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = 300
+        self.tablas_ignoradas = set()
+        self.cambios = Counter()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        tipo = config.get('CACHE_BACKEND', 'niveles')
+        self.ttl = config.get('CACHE_DEFAULT_TTL', 300)
+        self.tablas_ignoradas = set(config.get('CACHE_UNTRACKED_TABLES', ()))
+        ruta = config.get('CACHE_SQLITE_PATH') or os.path.join(app.instance_path, 'cache.db')
+
+        def local():
+            return MemoriaLRU(config.get('CACHE_MAX_ENTRIES', 2048), config.get('CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+        def compartida():
+            return SQLiteCompartida(ruta, config.get('CACHE_SHARED_MAX_ENTRIES', 50000))
+
+        if tipo == 'memoria':
+            self.backend = local()
+        elif tipo == 'sqlite':
+            self.backend = compartida()
+        elif tipo == 'niveles':
+            self.backend = EnNiveles(local(), compartida())
+        elif tipo == 'nulo':
+            self.backend = Nula()
+        else:
+            raise ValueError(f"CACHE_BACKEND desconocido: {tipo!r} (memoria, sqlite, niveles o nulo)")
+        app.extensions['cache'] = self
+
+    def _versiones(self, espacios):
+        if not has_request_context():
+            return self.backend.versiones(espacios)
+        conocidas = g.setdefault('_cache_versiones', {})
+        faltantes = [espacio for espacio in espacios if espacio not in conocidas]
+        if faltantes:
+            leidas = self.backend.versiones(faltantes)
+            conocidas.update({espacio: leidas.get(espacio, 0) for espacio in faltantes})
+        return conocidas
+
+    def _clave(self, espacio, clave):
+        # Una entrada puede depender de varios espacios: invalidar cualquiera de ellos la descarta
+        espacios = _aplanar(espacio) + ('*',)
+        versiones = self._versiones(espacios)
+        return f"{'+'.join(espacios[:-1])}:{'.'.join(str(versiones.get(e, 0)) for e in espacios)}:{clave}"
+
+    def obtener(self, espacio, clave, por_defecto=None):
+        encontrado = self.backend.obtener(self._clave(espacio, clave))
+        return pickle.loads(encontrado[0]) if encontrado is not None else por_defecto
+
+    def guardar(self, espacio, clave, valor, ttl=None):
+        expira = time.time() + (self.ttl if ttl is None else ttl)
+        self.backend.guardar(self._clave(espacio, clave), pickle.dumps(valor, pickle.HIGHEST_PROTOCOL), expira)
+
+    def obtener_o_calcular(self, espacio, clave, calcular, ttl=None):
+        """Valor en caché o el resultado de calcular(), que se guarda. None no se guarda."""
+        clave_completa = self._clave(espacio, clave)
+        encontrado = self.backend.obtener(clave_completa)
+        if encontrado is not None:
+            return pickle.loads(encontrado[0])
+        valor = calcular()
+        if valor is not None:
+            expira = time.time() + (self.ttl if ttl is None else ttl)
+            self.backend.guardar(clave_completa, pickle.dumps(valor, pickle.HIGHEST_PROTOCOL), expira)
+        return valor
+
+    def invalidar(self, *espacios):
+        """Invalida los espacios en todos los workers (y en el resto de esta petición)."""
+        self.backend.incrementar_versiones(espacios)
+        if has_request_context():
+            g.pop('_cache_versiones', None)
+
+    def limpiar(self):
+        """Vacía la caché; las LRU de los demás workers la dan por vacía al cambiar la versión de '*'."""
+        self.backend.limpiar()
+        self.invalidar('*')
+
+    def memoizar(self, espacio, ttl=None, por_usuario=False):
+        """
+        Decorador para vistas GET: guarda el cuerpo, estado y cabeceras de la respuesta 200 por endpoint,
+        argumentos, query string, sesión iniciada, rol, idioma y tema. `espacio` puede ser una tupla
+        de espacios o dependencias (tabla(), fila()), o una función que las calcula a partir de los
+        argumentos de la vista. Las páginas con el navbar deben usar por_usuario=True (muestra
+        session.username). No se usa con mensajes flash pendientes.
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                    return f(*args, **kwargs)
+                partes = [request.endpoint, repr(sorted(kwargs.items())), request.query_string.decode('latin-1'),
+                          str(bool(session.get('logged_in'))), session.get('role') or '-', _idioma(),
+                          session.get('theme') or '-']
+                if por_usuario:
+                    partes += [str(session.get('user_id') or '-'), session.get('username') or '-']
+                clave = '|'.join(partes)
+                # Las versiones se leen antes de generar la respuesta: si los datos cambian mientras
+                # tanto, la entrada queda guardada con la generación anterior y ya no se encuentra
+                espacios = espacio(**kwargs) if callable(espacio) else espacio
+                guardada = self.obtener(espacios, clave)
+                if guardada is not None:
+                    cuerpo, estado, cabeceras = guardada
+                    return current_app.response_class(cuerpo, status=estado, headers=cabeceras)
+                respuesta = make_response(f(*args, **kwargs))
+                if respuesta.status_code == 200 and not respuesta.direct_passthrough and 'Set-Cookie' not in respuesta.headers:
+                    cabeceras = [(nombre, valor) for nombre, valor in respuesta.headers if nombre != 'Content-Length']
+                    self.guardar(espacios, clave, (respuesta.get_data(), respuesta.status_code, cabeceras), ttl)
+                return respuesta
+            return decorated_function
+        return decorator
+
+    def estadisticas(self):
+        niveles = [self.backend.local, self.backend.compartida] if isinstance(self.backend, EnNiveles) else [self.backend]
+        return {'backend': self.backend.nombre,
+                'tablas_cambiadas': dict(self.cambios.most_common(20)),
+                'niveles': [{'nivel': nivel.nombre, **nivel.estadisticas.resumen(),
+                             **(nivel.ocupacion() if hasattr(nivel, 'ocupacion') else {})} for nivel in niveles]}
+
+
+def _aplanar(espacio):
+    """'a', ('a', 'b') o (tabla('x'), fila('y', 1)) -> tupla plana de espacios."""
+    if isinstance(espacio, str):
+        return (espacio,)
+    return tuple(e for parte in espacio for e in _aplanar(parte))
+
+
+def tabla(nombre):
+    """Dependencia de una tabla completa: cualquier cambio en ella invalida la entrada."""
+    return f'tabla:{nombre}'
+
+
+def fila(nombre, pk):
+    """
+    Dependencia de una sola fila: la invalidan los cambios de esa fila y las sentencias UPDATE/DELETE
+    masivas sobre la tabla (que no dicen qué filas tocaron).
+    """
+    return (f'tabla:{nombre}!', f'tabla:{nombre}#{pk}')
+
+
+def _idioma():
+    lang = session.get('lang')
+    if lang in LANGUAGES:
+        return lang
+    return request.accept_languages.best_match(LANGUAGES) or '-'
+
+
+cache = Cache()
+
+
+# --- Seguimiento de cambios del ORM ---
+
+# Clave en session.info con {tabla: {pk, ...}} de la transacción actual; None = sentencia masiva
+_CAMBIOS = 'cache_cambios'
+
+
+def _anotar(session, nombre, pk):
+    if nombre not in cache.tablas_ignoradas:
+        pks = session.info.setdefault(_CAMBIOS, {}).setdefault(nombre, set())
+        if pk is not False:
+            pks.add(pk)
+
+
+@event.listens_for(Session, 'after_flush')
+def _registrar_flush(session, flush_context):
+    # En after_flush new/dirty/deleted todavía describen lo que se acaba de escribir
+    modificados = [objeto for objeto in session.dirty if session.is_modified(objeto)]
+    nuevos = set(session.new)
+    for objeto in list(nuevos) + modificados + list(session.deleted):
+        estado = inspect(objeto)
+        # Una fila nueva solo invalida la tabla: nadie pudo guardar en caché una fila que no existía
+        # (memoizar no guarda los 404 ni obtener_o_calcular los None)
+        if objeto in nuevos:
+            pk = False
+        else:
+            pk = estado.mapper.primary_key_from_instance(objeto)
+            pk = pk[0] if len(pk) == 1 else tuple(pk)
+        for tabla_modelo in estado.mapper.tables:
+            _anotar(session, tabla_modelo.name, pk)
+        # Tablas de asociación (relationship con secondary) cuyas colecciones cambiaron
+        for relacion in estado.mapper.relationships:
+            if relacion.secondary is not None and estado.attrs[relacion.key].history.has_changes():
+                _anotar(session, relacion.secondary.name, None)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _registrar_sentencia(estado):
+    # insert()/update()/delete() ejecutados con la sesión: no se sabe qué filas tocaron
+    if estado.is_insert or estado.is_update or estado.is_delete:
+        _anotar(estado.session, estado.statement.table.name, None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publicar_cambios(session):
+    cambios = session.info.pop(_CAMBIOS, None)
+    if not cambios or cache.backend is None:
+        return
+    espacios = []
+    for nombre, pks in cambios.items():
+        espacios.append(tabla(nombre))
+        if None in pks:
+            espacios.append(f'tabla:{nombre}!')
+        espacios.extend(f'tabla:{nombre}#{pk}' for pk in pks if pk is not None and pk is not False)
+        cache.cambios[nombre] += 1
+    try:
+        cache.invalidar(*espacios)
+    except sqlite3.Error as e:
+        # El commit ya está hecho; las entradas afectadas caducan por TTL
+        print(f"DEBUG: No se pudieron invalidar en caché las tablas {sorted(cambios)}: {e}")
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _descartar_cambios(session, transaccion_anterior):
+    # Solo al deshacer la transacción externa: un savepoint no descarta lo anotado antes
+    if transaccion_anterior.parent is None:
+        session.info.pop(_CAMBIOS, None)
+
+
+@periodica('cache.purgar', cron='20 * * * *')
+def purgar_periodico():
+    if hasattr(cache.backend, 'purgar'):
+        cache.backend.purgar()
+
+
+@cache_bp.route('/admin/cache')
+@role_required('Superuser')
+def estado_cache():
+    """Aciertos, fallos y desalojos de este worker por nivel."""
+    return jsonify({'success': True, **cache.estadisticas()})
+
+
+@cache_bp.cli.command('estadisticas')
+def estadisticas_command():
+    """Ocupación de la caché (los contadores son de este proceso)."""
+    for nivel in cache.estadisticas()['niveles']:
+        click.echo(', '.join(f'{campo}={valor}' for campo, valor in nivel.items()))
+
+
+@cache_bp.cli.command('invalidar')
+@click.argument('espacios', nargs=-1)
+def invalidar_command(espacios):
+    """Invalida los ESPACIOS indicados en todos los workers, o borra toda la caché si no se indica ninguno."""
+    if espacios:
+        cache.invalidar(*espacios)
+        click.echo(f"Invalidados: {', '.join(espacios)}")
+    else:
+        cache.limpiar()
+        click.echo('Caché vaciada.')
@@ -1,6 +1,6 @@
 # colaboradores.py
 # Módulo de colaboradores
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory, current_app, abort
 from models import db, User
 from functools import wraps
 from datetime import datetime, date
@@ -17,6 +17,9 @@ from reportlab.lib.utils import ImageReader
 from reportlab.pdfgen import canvas
 import pandas as pd
 from sqlalchemy.orm.attributes import get_history
+from http_cache import respuesta_condicional
+from storage import guardar_stream, liberar, reemplazar, ubicar_por_nombre, enviar_archivo
+from werkzeug.security import safe_join
 
 # Define el Blueprint
 colaboradores_bp = Blueprint('colaboradores', __name__)
@@ -115,7 +118,12 @@ class FotografiaVehiculo(db.Model):
     __tablename__ = 'fotografias_vehiculos'
     id = db.Column(db.Integer, primary_key=True)
     vehiculo_id = db.Column(db.Integer, db.ForeignKey('vehiculos.id'), nullable=False)
-    url_foto = db.Column(db.String(200), nullable=False)
+    url_foto = db.Column(db.String(200), nullable=False, index=True)
+
+def liberar_fotos_vehiculo(vehiculo):
+    """Resta la referencia de cada foto del vehículo en el almacén por contenido (sin commit)."""
+    for foto in vehiculo.fotografias:
+        liberar(foto.url_foto)
 
 def role_required(roles):
     if not isinstance(roles, list):
@@ -163,10 +171,7 @@ def crear_colaborador():
                 if ext not in ['jpg', 'png', 'jpeg']:
                     flash('Formato de imagen de perfil no permitido.', 'danger')
                     return redirect(url_for('colaboradores.crear_colaborador'))
-                unique_filename = f"{uuid.uuid4()}.{ext}"
-                foto_perfil_path = os.path.join(current_app.config['UPLOAD_FILES_FOLDER'], unique_filename)
-                foto_perfil.save(foto_perfil_path)
-                foto_perfil_url = f'uploads/colaboradores/{unique_filename}'
+                foto_perfil_url, _ = guardar_stream(foto_perfil.stream, filename, foto_perfil.mimetype)
 
             # Crear el nuevo colaborador
             new_colaborador = Colaborador(
@@ -254,13 +259,11 @@ def crear_colaborador():
                                 flash('Formato de imagen de vehículo no permitido.', 'danger')
                                 db.session.rollback()
                                 return redirect(url_for('colaboradores.crear_colaborador'))
-                            unique_filename = f"{uuid.uuid4()}.{ext}"
-                            foto_path = os.path.join(current_app.config['UPLOAD_FILES_FOLDER'], unique_filename)
-                            # Se guarda la imagen en la carpeta 'uploads/vehiculos'
-                            foto.save(foto_path.replace('uploads/colaboradores', 'uploads/vehiculos')) 
+                            # Las fotos repetidas en cada edición apuntan al mismo blob del almacén
+                            url_foto, _ = guardar_stream(foto.stream, filename, foto.mimetype)
                             new_foto = FotografiaVehiculo(
                                 vehiculo_id=new_vehiculo.id,
-                                url_foto=f'uploads/vehiculos/{unique_filename}'
+                                url_foto=url_foto
                             )
                             db.session.add(new_foto)
                             db.session.commit()
@@ -298,13 +301,13 @@ def editar_colaborador(id):
                 if ext not in ['jpg', 'png', 'jpeg']:
                     flash('Formato de imagen de perfil no permitido.', 'danger')
                     return redirect(url_for('colaboradores.editar_colaborador', id=id))
-                unique_filename = f"{uuid.uuid4()}.{ext}"
-                foto_perfil_path = os.path.join(current_app.config['UPLOAD_FILES_FOLDER'], unique_filename)
-                foto_perfil.save(foto_perfil_path)
-                colaborador.foto_perfil = f'uploads/colaboradores/{unique_filename}'
+                nueva_ruta, _ = guardar_stream(foto_perfil.stream, filename, foto_perfil.mimetype)
+                colaborador.foto_perfil = reemplazar(colaborador.foto_perfil, nueva_ruta)
 
-            # Eliminar vehículos antiguos
-            db.session.query(Vehiculo).filter_by(colaborador_id=colaborador.id).delete()
+            # Eliminar vehículos antiguos (la cascada borra revisiones, pólizas y fotos; las fotos liberan su blob)
+            for vehiculo in list(colaborador.vehiculos):
+                liberar_fotos_vehiculo(vehiculo)
+                db.session.delete(vehiculo)
             db.session.commit()
 
             # Manejar los datos del vehículo
@@ -379,13 +382,11 @@ def editar_colaborador(id):
                                 flash('Formato de imagen de vehículo no permitido.', 'danger')
                                 db.session.rollback()
                                 return redirect(url_for('colaboradores.editar_colaborador', id=id))
-                            unique_filename = f"{uuid.uuid4()}.{ext}"
-                            foto_path = os.path.join(current_app.config['UPLOAD_FILES_FOLDER'], unique_filename)
-                            # Se guarda la imagen en la carpeta 'uploads/vehiculos'
-                            foto.save(foto_path.replace('uploads/colaboradores', 'uploads/vehiculos'))
+                            # Las fotos repetidas en cada edición apuntan al mismo blob del almacén
+                            url_foto, _ = guardar_stream(foto.stream, filename, foto.mimetype)
                             new_foto = FotografiaVehiculo(
                                 vehiculo_id=new_vehiculo.id,
-                                url_foto=f'uploads/vehiculos/{unique_filename}'
+                                url_foto=url_foto
                             )
                             db.session.add(new_foto)
                             db.session.commit()
@@ -406,6 +407,9 @@ def editar_colaborador(id):
 def eliminar_colaborador(id):
     colaborador = Colaborador.query.get_or_404(id)
     try:
+        liberar(colaborador.foto_perfil)
+        for vehiculo in colaborador.vehiculos:
+            liberar_fotos_vehiculo(vehiculo)
         db.session.delete(colaborador)
         db.session.commit()
         flash('Colaborador eliminado exitosamente.', 'success')
@@ -428,10 +432,29 @@ def detalle_colaborador(id):
 @colaboradores_bp.route('/uploads/colaboradores/<filename>')
 @colaboradores_bp.route('/uploads/vehiculos/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(current_app.config['UPLOAD_FILES_FOLDER'], filename)
+    # Las plantillas pasan solo el nombre: primero se busca en el almacén por contenido,
+    # luego en la carpeta donde se guardaban las fotos antes del almacén
+    ruta = ubicar_por_nombre(filename) or safe_join(current_app.config['UPLOAD_FILES_FOLDER'], filename)
+    if not ruta or not os.path.isfile(ruta):
+        abort(404)
+    # El proxy entrega el archivo si está configurado (FILE_DELIVERY); si no, send_file con Range/206
+    return enviar_archivo(ruta)
+
+# Validadores HTTP de la exportación. editar_colaborador recrea los vehículos (y con ellos
+# revisiones, pólizas y fotos), por lo que sus IDs cambian en cada edición.
+def validador_exportar_colaborador(id, format):
+    colaborador = db.session.query(Colaborador.fecha_actualizacion, Colaborador.foto_perfil).filter_by(id=id).first()
+    if not colaborador:
+        return None
+    total_vehiculos, max_vehiculo_id = db.session.query(
+        db.func.count(Vehiculo.id), db.func.max(Vehiculo.id)
+    ).filter_by(colaborador_id=id).one()
+    semilla = (id, format, colaborador.fecha_actualizacion, colaborador.foto_perfil, total_vehiculos, max_vehiculo_id)
+    return semilla, colaborador.fecha_actualizacion
 
 # Rutas de exportación
 @colaboradores_bp.route('/colaboradores/exportar/<int:id>/<format>')
+@respuesta_condicional(validador_exportar_colaborador, debil=True)
 def exportar_colaborador(id, format):
     colaborador = Colaborador.query.get_or_404(id)
     if format == 'pdf':
@@ -25,8 +25,39 @@ class Config:
     COVERS_UPLOAD_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static', 'uploads', 'covers')
     ABOUTUS_IMAGE_UPLOAD_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static', 'uploads', 'aboutus')
     UPLOAD_FILES_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static', 'uploads', 'files')
+    # Almacén por contenido (SHA-256) compartido por todas las subidas, ver storage.py
+    BLOB_STORE_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static', 'uploads', 'blobs')
+    # Entrega de archivos por el proxy: 'x-accel' (nginx), 'x-sendfile' (Apache/lighttpd) o vacío (la app)
+    FILE_DELIVERY = os.environ.get('FILE_DELIVERY') or None
+    FILE_DELIVERY_ROOT = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static')
+    # location interna de nginx que apunta a FILE_DELIVERY_ROOT, p. ej.: location /_protegido/ { internal; alias .../static/; }
+    FILE_DELIVERY_ACCEL_PREFIX = os.environ.get('FILE_DELIVERY_ACCEL_PREFIX', '/_protegido/')
+    # Subidas reanudables por fragmentos: los archivos parciales se guardan fuera de static/
+    UPLOAD_STAGING_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'upload_staging')
+    UPLOAD_SESSION_TTL_HOURS = int(os.environ.get('UPLOAD_SESSION_TTL_HOURS', 24))
+    # Recolección de subidas huérfanas (`flask storage gc`): cuarentena fuera de static/ antes de borrar
+    UPLOAD_QUARANTINE_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'upload_quarantine')
+    UPLOAD_GC_GRACE_DAYS = float(os.environ.get('UPLOAD_GC_GRACE_DAYS', 7))
+    UPLOAD_GC_MIN_AGE_HOURS = float(os.environ.get('UPLOAD_GC_MIN_AGE_HOURS', 1))
+    # Cuota de almacenamiento del módulo files por usuario (0 = sin límite); los roles exentos no tienen límite
+    USER_STORAGE_QUOTA_BYTES = int(os.environ.get('USER_STORAGE_QUOTA_BYTES', 5 * 1024 * 1024 * 1024))
+    STORAGE_QUOTA_EXEMPT_ROLES = ('Superuser',)
+    # Índices de líneas de la vista previa de documentos de texto (files.preview_file)
+    LINE_INDEX_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'line_index')
 
 
+    # Costo de bcrypt: la variable de entorno tiene prioridad sobre instance/bcrypt.json (`flask hashing calibrar`)
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 0)) or None
+    BCRYPT_TARGET_MS = float(os.environ.get('BCRYPT_TARGET_MS', 250))
+    # Límite de intentos de inicio de sesión (throttle.py): (capacidad, fichas recargadas por minuto)
+    LOGIN_THROTTLE_ENABLED = os.environ.get('LOGIN_THROTTLE_ENABLED', 'true').lower() in ('true', '1', 'yes')
+    LOGIN_THROTTLE_IP = (20, 10)      # ráfaga de 20 POST por IP, luego uno cada 6 s
+    LOGIN_THROTTLE_CUENTA = (5, 2)    # 5 contraseñas incorrectas por cuenta, luego una cada 30 s
+    # Comparte las cubetas entre workers en la tabla login_throttle (además de la memoria de cada worker)
+    LOGIN_THROTTLE_SHARED = os.environ.get('LOGIN_THROTTLE_SHARED', 'false').lower() in ('true', '1', 'yes')
+    # Proxies de confianza delante de la app (nginx = 1): la IP se toma de X-Forwarded-For
+    LOGIN_THROTTLE_PROXIES = int(os.environ.get('LOGIN_THROTTLE_PROXIES', 0))
+
     # Configuración de Flask-Mail para recuperación de contraseña
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.googlemail.com')
     MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
@@ -37,4 +68,64 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME', 'noreply@example.com')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER') or MAIL_USERNAME
+    # Bandeja de salida (correo.py): las rutas encolan y un hilo de fondo entrega por una sola conexión SMTP
+    MAIL_OUTBOX_BACKGROUND = os.environ.get('MAIL_OUTBOX_BACKGROUND', 'true').lower() in ('true', '1', 'yes')
+    MAIL_OUTBOX_RATE = (20, int(os.environ.get('MAIL_OUTBOX_PER_MINUTE', 60))) # (ráfaga, mensajes por minuto); 0 = sin límite
+    MAIL_OUTBOX_BATCH = 100             # mensajes reclamados por conexión SMTP
+    MAIL_OUTBOX_MAX_ATTEMPTS = 6        # después, el mensaje queda 'fallido'
+    MAIL_OUTBOX_BACKOFF_SECONDS = 60    # espera tras el primer fallo; se duplica en cada intento
+    MAIL_OUTBOX_BACKOFF_MAX_SECONDS = 6 * 3600
+    MAIL_OUTBOX_LEASE_MINUTES = 10      # un lote 'enviando' más viejo se da por abandonado y se retoma
+    MAIL_OUTBOX_POLL_SECONDS = 30
+    MAIL_OUTBOX_RETENTION_DAYS = 30     # los enviados más antiguos se borran (trabajo correo.purgar_enviados)
+
+    # Web Push (push.py): claves de `python generar_claves_vapid.py`; la privada puede ser una ruta a un PEM
+    VAPID_PRIVATE_KEY = os.environ.get('VAPID_PRIVATE_KEY')
+    VAPID_PUBLIC_KEY = os.environ.get('VAPID_PUBLIC_KEY')
+    VAPID_CLAIM_EMAIL = os.environ.get('VAPID_CLAIM_EMAIL') or f"mailto:{MAIL_DEFAULT_SENDER}"
+    PUSH_MAX_WORKERS = int(os.environ.get('PUSH_MAX_WORKERS', 8)) # envíos simultáneos por notificación
+    PUSH_TIMEOUT_SECONDS = 10
+    PUSH_TTL_SECONDS = 24 * 3600           # cuánto guarda el servicio push un mensaje para un navegador apagado
+    PUSH_VAPID_EXP_SECONDS = 12 * 3600     # vigencia del JWT VAPID (el máximo permitido es 24 h)
+
+    # Cola de tareas en segundo plano (tareas.py, `flask worker`)
+    TASK_VISIBILITY_SECONDS = int(os.environ.get('TASK_VISIBILITY_SECONDS', 300)) # sin latido del worker en este plazo, otro worker la retoma
+    TASK_MAX_ATTEMPTS = 3
+    TASK_BACKOFF_SECONDS = 30     # espera tras el primer fallo; se duplica en cada intento
+    TASK_POLL_SECONDS = 1.0       # espera de un worker sin trabajo
+    TASK_RETENTION_DAYS = 7       # las tareas 'hecha' más antiguas se borran
+    # Trabajos periódicos (programador.py): corren dentro de `flask worker` o con `flask programador ejecutar`
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() in ('true', '1', 'yes')
+    SCHEDULER_TICK_SECONDS = 30
+    # Respaldos en línea de la base SQLite (respaldos.py, `flask respaldos crear`)
+    BACKUP_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'backups')
+    BACKUP_PAGES_PER_STEP = 256   # páginas copiadas por paso; un escritor espera como mucho lo que dura un paso
+    BACKUP_STEP_PAUSE_MS = 5      # pausa entre pasos para que los escritores avancen
+    BACKUP_MAX_RESTARTS = 5       # reinicios por escrituras concurrentes antes de copiar en un solo paso
+    BACKUP_KEEP_DAILY = 7
+    BACKUP_KEEP_WEEKLY = 4
+    BACKUP_KEEP_MONTHLY = 12
+    # Instantáneas incrementales de las subidas (`flask respaldos subidas`); usan la misma retención
+    BACKUP_UPLOADS_SOURCE = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static', 'uploads')
+    BACKUP_UPLOADS_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'backups', 'subidas')
+    # Mantenimiento de la base (mantenimiento.py, `flask mantenimiento ejecutar`)
+    DB_ANALYSIS_LIMIT = 1000              # filas muestreadas por índice en ANALYZE/optimize
+    DB_MAINTENANCE_PAGES_PER_STEP = 200   # páginas devueltas por cada transacción de incremental_vacuum
+    DB_MAINTENANCE_PAUSE_MS = 50          # pausa entre pasos para que los escritores avancen
+    DB_MAINTENANCE_MAX_PAGES = 20000      # presupuesto por ejecución (~80 MB con páginas de 4 KB)
+    DB_MAINTENANCE_MAX_SECONDS = 60
+    # Caché (cache.py): 'niveles' = LRU por proceso delante de una tabla SQLite compartida por los workers
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'niveles') # memoria, sqlite, niveles o nulo
+    CACHE_DEFAULT_TTL = 300
+    CACHE_MAX_ENTRIES = 2048                # por proceso
+    CACHE_MAX_BYTES = 32 * 1024 * 1024      # por proceso, tamaño serializado
+    CACHE_SHARED_MAX_ENTRIES = 50000
+    CACHE_SQLITE_PATH = os.environ.get('CACHE_SQLITE_PATH') # por defecto instance/cache.db
+    # Tablas internas con mucho movimiento cuyos commits no invalidan nada (nadie cachea sus consultas)
+    CACHE_UNTRACKED_TABLES = ('task_queue', 'mail_outbox', 'scheduler_jobs', 'login_throttle', 'upload_sessions')
+    # Plantillas (plantillas.py): bytecode compartido por los workers y calentamiento al arrancar
+    TEMPLATE_BYTECODE_FOLDER = os.environ.get('TEMPLATE_BYTECODE_FOLDER') or \
+        os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'jinja_cache')
+    TEMPLATE_WARMUP_ON_START = os.environ.get('TEMPLATE_WARMUP_ON_START', 'true').lower() in ('true', '1', 'yes')
+    TEMPLATE_WARMUP = ('base.html', 'navbar.html', 'home.html', 'login.html', 'crear_solicitud.html', 'crear_colaborador.html')
 
@@ -7,6 +7,9 @@ import os
 import io
 from sqlalchemy import or_ 
 from functools import wraps 
+from http_cache import respuesta_condicional
+from cache import cache, tabla, fila
+from storage import guardar_stream, liberar
 
 # Librerías para exportación
 import vobject
@@ -53,6 +56,7 @@ def role_required(roles):
 
 @contactos_bp.route('/ver_contactos')
 @role_required(['Superuser', 'Administrador', 'Usuario Regular']) # Todos pueden ver contactos
+@cache.memoizar((tabla('user'), tabla('version')), por_usuario=True)
 def ver_contactos():
     """
     Muestra una lista de todos los usuarios registrados, con funcionalidad de búsqueda y vistas.
@@ -94,6 +98,7 @@ def ver_contactos():
 
 @contactos_bp.route('/ver_detalle/<int:user_id>')
 @role_required(['Superuser', 'Administrador', 'Usuario Regular']) # Todos pueden ver el detalle
+@cache.memoizar(lambda user_id: (fila('user', user_id), tabla('version')), por_usuario=True)
 def ver_detalle(user_id):
     """
     Muestra los detalles completos de un contacto específico.
@@ -136,8 +141,9 @@ def eliminar_contacto(user_id):
 
 
     try:
-        # Opcional: Eliminar el archivo de avatar si no es el por defecto
-        if user_to_delete.avatar_url and 'default_avatar.png' not in user_to_delete.avatar_url:
+        # Opcional: Eliminar el archivo de avatar si no es el por defecto (los del almacén solo pierden una referencia)
+        if not liberar(user_to_delete.avatar_url) and user_to_delete.avatar_url \
+                and 'default' not in os.path.basename(user_to_delete.avatar_url):
             file_path_check_1 = os.path.join(current_app.root_path, 'static', user_to_delete.avatar_url)
             file_path_check_2 = os.path.join(current_app.root_path, user_to_delete.avatar_url)
 
@@ -198,8 +204,8 @@ def editar_contacto(user_id):
             # Y si el username no es el del usuario actual, verificar unicidad
             new_username = request.form['username']
             if new_username != user.username:
-                existing_username_user = User.query.filter_by(username=new_username).first()
-                if existing_username_user and existing_username_user.id != user.id:
+                existing_username_user = User.por_identidad(new_username, 'username', excluir_id=user.id)
+                if existing_username_user:
                     flash('El nombre de usuario ya está en uso. Por favor, elige otro.', 'danger')
                     return render_template('editar_contacto.html', user=user, 
                                            actividad_opciones=actividad_opciones, 
@@ -215,8 +221,8 @@ def editar_contacto(user_id):
             # Y si el email no es el del usuario actual, verificar unicidad
             new_email = request.form.get('email')
             if new_email and new_email.lower() != (user.email.lower() if user.email else ''):
-                existing_email_user = User.query.filter_by(email=new_email.lower()).first()
-                if existing_email_user and existing_email_user.id != user.id:
+                existing_email_user = User.por_identidad(new_email, 'email', excluir_id=user.id)
+                if existing_email_user:
                     flash('Ese correo electrónico ya está registrado. Por favor, usa otro.', 'danger')
                     return render_template('editar_contacto.html', user=user, 
                                            actividad_opciones=actividad_opciones, 
@@ -270,23 +276,17 @@ def editar_contacto(user_id):
                 file = request.files['avatar']
                 # Solo procesar si un archivo fue realmente seleccionado y es permitido
                 if file.filename != '' and allowed_file(file.filename):
-                    # Eliminar el avatar anterior si no es el por defecto
-                    if user.avatar_url and 'default_avatar.png' not in user.avatar_url:
-                        old_avatar_filename = os.path.basename(user.avatar_url)
-                        old_avatar_path = os.path.join(current_app.config['UPLOAD_FOLDER'], old_avatar_filename)
-                        
+                    # Guardar el nuevo avatar en el almacén por contenido (ruta relativa a 'static')
+                    filename = secure_filename(file.filename)
+                    nueva_ruta, _ = guardar_stream(file.stream, filename, file.mimetype)
+                    anterior = user.avatar_url
+                    user.avatar_url = nueva_ruta
+
+                    # Liberar el avatar anterior; los anteriores al almacén se eliminan como siempre si no es el por defecto
+                    if not liberar(anterior) and anterior and 'default' not in os.path.basename(anterior):
+                        old_avatar_path = os.path.join(current_app.config['UPLOAD_FOLDER'], os.path.basename(anterior))
                         if os.path.exists(old_avatar_path):
                             os.unlink(old_avatar_path)
-                    
-                    # Guardar el nuevo avatar con un nombre seguro
-                    filename = secure_filename(f"{user.username}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{file.filename}")
-                    
-                    # Usar la ruta de subida ABSOLUTA definida en app.py para guardar el archivo
-                    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                    file.save(file_path)
-                    
-                    # Guardar la ruta relativa correcta en la base de datos (relativa a la carpeta 'static')
-                    user.avatar_url = os.path.join(AVATAR_UPLOAD_FOLDER_RELATIVE, filename).replace('\\', '/')
                 # Si file.filename está vacío (no se seleccionó un nuevo archivo),
                 # no hacemos nada con user.avatar_url, así se conserva el valor actual.
                 # La lógica que eliminaba el avatar y lo ponía por defecto si file.filename == ''
@@ -367,9 +367,19 @@ def editar_contacto(user_id):
                            role_opciones=role_opciones) # Pasa las opciones aquí también
 
 
+# Validadores HTTP de las exportaciones individuales (fecha_actualizacion la mantiene el onupdate del modelo)
+def validador_exportar_contacto(user_id):
+    user = db.session.query(User.fecha_registro, User.fecha_actualizacion).filter_by(id=user_id).first()
+    if not user:
+        return None
+    ultima_modificacion = user.fecha_actualizacion or user.fecha_registro
+    return (user_id, user.fecha_registro, user.fecha_actualizacion), ultima_modificacion
+
+
 # Rutas de Exportación (Individual)
 @contactos_bp.route('/exportar_vcard/<int:user_id>')
 @role_required(['Superuser', 'Administrador']) # Solo Superusers y Administradores pueden exportar vCard individual
+@respuesta_condicional(validador_exportar_contacto, debil=True)
 def exportar_vcard(user_id):
     """
     Exporta los datos de un contacto individual a un archivo VCard (.vcf).
@@ -450,6 +460,7 @@ def exportar_vcard(user_id):
 
 @contactos_bp.route('/exportar_excel/<int:user_id>')
 @role_required(['Superuser', 'Administrador']) # Solo Superusers y Administradores pueden exportar Excel individual
+@respuesta_condicional(validador_exportar_contacto, debil=True)
 def exportar_excel(user_id):
     """
     Exporta los datos de un contacto individual a un archivo Excel (.xlsx).
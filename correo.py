@@ -0,0 +1,379 @@
+# correo.py
+# Bandeja de salida de correo.
+# - encolar_correo() guarda el mensaje en la tabla mail_outbox y despierta al remitente; la ruta
+#   responde sin esperar al servidor SMTP.
+# - El remitente (hilo de fondo de cada worker o `flask correo enviar`) reclama lotes de forma
+#   atómica y los envía por una sola conexión SMTP, respetando MAIL_OUTBOX_RATE.
+# - Errores temporales: reintento con espera exponencial. Errores permanentes (destinatario
+#   rechazado con 5xx) o MAIL_OUTBOX_MAX_ATTEMPTS agotados: estado 'fallido' (ver /admin/correo).
+# La entrega es "al menos una vez": un lote abandonado por un proceso caído se retoma al vencer
+# MAIL_OUTBOX_LEASE_MINUTES y el mensaje que se estaba enviando podría repetirse. Antes de cada
+# envío el remitente renueva el plazo de ese mensaje solo si sigue siendo suyo, así que un lote
+# lento (límite de envío, servidor SMTP lento) no se envía dos veces cuando otro proceso lo retoma.
+import time
+import uuid
+import random
+import smtplib
+import threading
+from datetime import datetime, timedelta
+from functools import wraps
+
+import click
+from flask import Blueprint, current_app, jsonify, request, session, flash, redirect, url_for
+from flask_mail import Message, BadHeaderError
+
+from models import db, MailOutbox, User
+from throttle import CubetaDeFichas
+from programador import periodica
+
+correo_bp = Blueprint('correo', __name__)
+
+# Cuentas creadas por solicitud.py con un correo de relleno: no reciben avisos masivos
+DOMINIO_DE_RELLENO = '@example.com'
+
+
+def role_required(roles):
+    if not isinstance(roles, list):
+        roles = [roles]
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if 'logged_in' not in session or not session['logged_in']:
+                flash('Por favor, inicia sesión para acceder a esta página.', 'info')
+                return redirect(url_for('login'))
+            if session.get('role') not in roles:
+                flash('No tienes permiso para acceder a esta página.', 'danger')
+                return redirect(url_for('home'))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+# --- Encolar ---
+
+def encolar_correo(destinatarios, asunto, cuerpo, html=None, remitente=None, lote=None, commit=True):
+    """
+    Agrega un mensaje por destinatario a la bandeja de salida. Con commit=False el llamador
+    confirma la transacción (el mensaje sale solo si la operación que lo originó se guarda).
+    """
+    if isinstance(destinatarios, str):
+        destinatarios = [destinatarios]
+    ahora = datetime.utcnow()
+    filas = [
+        {'destinatario': destinatario, 'remitente': remitente, 'asunto': asunto, 'cuerpo': cuerpo,
+         'html': html, 'lote': lote, 'estado': 'pendiente', 'intentos': 0,
+         'disponible_en': ahora, 'creado_en': ahora}
+        for destinatario in destinatarios if destinatario
+    ]
+    if filas:
+        # executemany: un aviso a miles de contactos es una sola sentencia preparada
+        db.session.execute(db.insert(MailOutbox), filas)
+    if commit:
+        db.session.commit()
+        despertar_remitente()
+    return len(filas)
+
+
+# --- Envío ---
+
+def _cubeta_de_envio():
+    rafaga, por_minuto = current_app.config.get('MAIL_OUTBOX_RATE', (0, 0))
+    return CubetaDeFichas(max(rafaga, 1), por_minuto) if por_minuto else None
+
+
+def _esperar_turno(cubeta):
+    if cubeta is None:
+        return
+    espera = cubeta.consumir('smtp')
+    while espera:
+        time.sleep(espera)
+        espera = cubeta.consumir('smtp')
+
+
+def _plazo_de_reclamo():
+    return datetime.utcnow() + timedelta(minutes=current_app.config.get('MAIL_OUTBOX_LEASE_MINUTES', 10))
+
+
+def reclamar_lote(limite):
+    """
+    Marca como 'enviando' hasta `limite` mensajes listos y devuelve (ids, plazo). Un solo UPDATE ...
+    RETURNING: dos procesos nunca reclaman la misma fila. Incluye los 'enviando' cuyo plazo venció.
+    El plazo identifica el reclamo: renovar_reclamo() lo compara antes de enviar cada mensaje.
+    """
+    ahora = datetime.utcnow()
+    plazo = _plazo_de_reclamo()
+    listos = (
+        db.select(MailOutbox.id)
+        .where(MailOutbox.estado.in_(('pendiente', 'enviando')), MailOutbox.disponible_en <= ahora)
+        .order_by(MailOutbox.disponible_en, MailOutbox.id)
+        .limit(limite)
+    )
+    ids = db.session.execute(
+        db.update(MailOutbox)
+        .where(MailOutbox.id.in_(listos.scalar_subquery()))
+        .values(estado='enviando', disponible_en=plazo)
+        .returning(MailOutbox.id)
+    ).scalars().all()
+    db.session.commit()
+    return sorted(ids), plazo
+
+
+def renovar_reclamo(mensaje_id, plazo):
+    """
+    Extiende el plazo de un mensaje reclamado con `plazo` y devuelve el nuevo, o None si el mensaje
+    ya no es de este proceso (el plazo venció y otro lo retomó, o ya no está 'enviando').
+    """
+    nuevo = _plazo_de_reclamo()
+    renovados = db.session.execute(
+        db.update(MailOutbox)
+        .where(MailOutbox.id == mensaje_id, MailOutbox.estado == 'enviando', MailOutbox.disponible_en == plazo)
+        .values(disponible_en=nuevo)
+    ).rowcount
+    db.session.commit()
+    return nuevo if renovados else None
+
+
+def tamano_de_lote():
+    """
+    MAIL_OUTBOX_BATCH, limitado a lo que MAIL_OUTBOX_RATE deja enviar en la mitad del plazo del
+    reclamo: con un límite bajo, el resto de un lote grande vencería antes de salir.
+    """
+    tamano = current_app.config.get('MAIL_OUTBOX_BATCH', 100)
+    rafaga, por_minuto = current_app.config.get('MAIL_OUTBOX_RATE', (0, 0))
+    if por_minuto:
+        plazo = current_app.config.get('MAIL_OUTBOX_LEASE_MINUTES', 10)
+        tamano = min(tamano, max(1, rafaga + int(por_minuto * plazo / 2)))
+    return tamano
+
+
+def _mensaje(fila):
+    msg = Message(fila.asunto,
+                  sender=fila.remitente or current_app.config['MAIL_DEFAULT_SENDER'],
+                  recipients=[fila.destinatario])
+    msg.body = fila.cuerpo
+    msg.html = fila.html
+    return msg
+
+
+def es_error_permanente(error):
+    """Rechazos 5xx del destinatario o del contenido: reintentar no cambia el resultado."""
+    if isinstance(error, (BadHeaderError, AssertionError, ValueError)):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(codigo >= 500 for codigo, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPDataError):
+        return error.smtp_code >= 500
+    return False
+
+
+def espera_de_reintento(intentos):
+    base = current_app.config.get('MAIL_OUTBOX_BACKOFF_SECONDS', 60)
+    maximo = current_app.config.get('MAIL_OUTBOX_BACKOFF_MAX_SECONDS', 6 * 3600)
+    # Variación de ±20 % para que los reintentos de un lote no lleguen todos juntos
+    return min(maximo, base * 2 ** (intentos - 1)) * random.uniform(0.8, 1.2)
+
+
+def _registrar_fallo(fila, error):
+    fila.intentos += 1
+    fila.ultimo_error = f'{type(error).__name__}: {error}'[:2000]
+    if es_error_permanente(error) or fila.intentos >= current_app.config.get('MAIL_OUTBOX_MAX_ATTEMPTS', 6):
+        fila.estado = 'fallido'
+        print(f"DEBUG: Correo {fila.id} a {fila.destinatario} marcado como fallido: {fila.ultimo_error}")
+    else:
+        fila.estado = 'pendiente'
+        fila.disponible_en = datetime.utcnow() + timedelta(seconds=espera_de_reintento(fila.intentos))
+
+
+class _ConexionSMTP:
+    """Conexión de Flask-Mail reutilizable, que se reabre si el servidor la cierra a mitad de lote."""
+
+    def __init__(self, mail):
+        self.mail = mail
+        self.conexion = None
+
+    def enviar(self, msg):
+        for reintento in (False, True):
+            if self.conexion is None:
+                self.conexion = self.mail.connect()
+                self.conexion.__enter__()
+            try:
+                self.conexion.send(msg)
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # Conexión caída (tiempo de inactividad del servidor, límite por sesión): otra vez con una nueva
+                self.conexion = None
+                if reintento:
+                    raise
+
+    def cerrar(self):
+        if self.conexion is not None:
+            try:
+                self.conexion.__exit__(None, None, None)
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.conexion = None
+
+
+def procesar_bandeja(max_mensajes=None):
+    """
+    Envía los mensajes listos, por lotes de MAIL_OUTBOX_BATCH sobre una conexión SMTP.
+    Devuelve {'enviados', 'reintentos', 'fallidos'}. Requiere contexto de aplicación.
+    """
+    mail = current_app.extensions['mail']
+    tamano = tamano_de_lote()
+    cubeta = _cubeta_de_envio()
+    resumen = {'enviados': 0, 'reintentos': 0, 'fallidos': 0}
+    while max_mensajes is None or sum(resumen.values()) < max_mensajes:
+        limite = tamano if max_mensajes is None else min(tamano, max_mensajes - sum(resumen.values()))
+        ids, plazo = reclamar_lote(limite)
+        if not ids:
+            break
+        conexion = _ConexionSMTP(mail)
+        try:
+            for mensaje_id in ids:
+                _esperar_turno(cubeta)
+                if renovar_reclamo(mensaje_id, plazo) is None:
+                    # Otro proceso lo retomó mientras este esperaba turno: lo envía él
+                    continue
+                fila = db.session.get(MailOutbox, mensaje_id)
+                try:
+                    conexion.enviar(_mensaje(fila))
+                except Exception as e:
+                    # Tras una respuesta de error, smtplib deja la sesión lista (RSET) para el siguiente
+                    if not isinstance(e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException)):
+                        conexion.cerrar()
+                    _registrar_fallo(fila, e)
+                    resumen['fallidos' if fila.estado == 'fallido' else 'reintentos'] += 1
+                else:
+                    fila.estado = 'enviado'
+                    fila.enviado_en = datetime.utcnow()
+                    fila.ultimo_error = None
+                    resumen['enviados'] += 1
+                # Confirmar mensaje a mensaje: si el proceso cae, lo ya enviado no se repite
+                db.session.commit()
+        finally:
+            conexion.cerrar()
+    return resumen
+
+
+# --- Hilo de fondo (uno por worker, se inicia con el primer mensaje encolado) ---
+
+class Remitente:
+    def __init__(self):
+        self._despertar = threading.Event()
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    def despertar(self, app):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, args=(app,), name='remitente-correo', daemon=True)
+                self._hilo.start()
+        self._despertar.set()
+
+    def _bucle(self, app):
+        while True:
+            self._despertar.clear()
+            with app.app_context():
+                try:
+                    procesar_bandeja()
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Error en la bandeja de salida de correo: {e}")
+                finally:
+                    db.session.remove()
+                espera = app.config.get('MAIL_OUTBOX_POLL_SECONDS', 30)
+            self._despertar.wait(espera)
+
+
+remitente = Remitente()
+
+
+def despertar_remitente():
+    if current_app.config.get('MAIL_OUTBOX_BACKGROUND', True):
+        remitente.despertar(current_app._get_current_object())
+
+
+@periodica('correo.purgar_enviados', cron='10 4 * * *')
+def purgar_enviados():
+    """Borra los mensajes enviados con más de MAIL_OUTBOX_RETENTION_DAYS días (los fallidos se conservan)."""
+    limite = datetime.utcnow() - timedelta(days=current_app.config.get('MAIL_OUTBOX_RETENTION_DAYS', 30))
+    MailOutbox.query.filter(MailOutbox.estado == 'enviado', MailOutbox.enviado_en < limite).delete(synchronize_session=False)
+    db.session.commit()
+
+
+# --- Administración ---
+
+def resumen_bandeja():
+    conteos = dict(db.session.query(MailOutbox.estado, db.func.count()).group_by(MailOutbox.estado).all())
+    return {estado: conteos.get(estado, 0) for estado in ('pendiente', 'enviando', 'enviado', 'fallido')}
+
+
+@correo_bp.route('/admin/correo')
+@role_required('Superuser')
+def estado_bandeja():
+    """Conteo por estado y los últimos mensajes fallidos."""
+    fallidos = (MailOutbox.query.filter_by(estado='fallido')
+                .order_by(MailOutbox.id.desc()).limit(50).all())
+    return jsonify({
+        'success': True,
+        'estados': resumen_bandeja(),
+        'fallidos': [
+            {'id': f.id, 'destinatario': f.destinatario, 'asunto': f.asunto, 'intentos': f.intentos,
+             'ultimo_error': f.ultimo_error, 'lote': f.lote}
+            for f in fallidos
+        ],
+    })
+
+
+@correo_bp.route('/admin/correo/reintentar', methods=['POST'])
+@role_required('Superuser')
+def reintentar_fallidos():
+    """Devuelve a la cola los mensajes fallidos (todos, o los de `ids`)."""
+    consulta = MailOutbox.query.filter_by(estado='fallido')
+    ids = request.form.getlist('ids', type=int) or (request.get_json(silent=True) or {}).get('ids')
+    if ids:
+        consulta = consulta.filter(MailOutbox.id.in_(ids))
+    total = consulta.update({'estado': 'pendiente', 'intentos': 0, 'disponible_en': datetime.utcnow()},
+                            synchronize_session=False)
+    db.session.commit()
+    despertar_remitente()
+    return jsonify({'success': True, 'message': f'{total} mensajes devueltos a la cola.', 'total': total})
+
+
+@correo_bp.route('/admin/correo/aviso', methods=['POST'])
+@role_required('Superuser')
+def aviso_masivo():
+    """Encola un aviso para todos los usuarios con correo real."""
+    datos = request.get_json(silent=True) or request.form
+    asunto = (datos.get('asunto') or '').strip()
+    cuerpo = (datos.get('cuerpo') or '').strip()
+    if not asunto or not cuerpo:
+        return jsonify({'success': False, 'message': 'El asunto y el mensaje son obligatorios.'}), 400
+
+    destinatarios = [email for (email,) in db.session.query(User.email)
+                     .filter(User.email_norm.isnot(None), ~User.email_norm.endswith(DOMINIO_DE_RELLENO))
+                     .order_by(User.id)]
+    lote = str(uuid.uuid4())
+    total = encolar_correo(destinatarios, asunto, cuerpo, html=datos.get('html') or None, lote=lote)
+    return jsonify({'success': True, 'message': f'Aviso encolado para {total} destinatarios.',
+                    'lote': lote, 'total': total})
+
+
+@correo_bp.cli.command('enviar')
+@click.option('--continuo', is_flag=True, help='Sigue esperando mensajes nuevos (para un proceso dedicado).')
+@click.option('--max', 'max_mensajes', type=int, default=None, help='Detenerse tras este número de mensajes.')
+def enviar_command(continuo, max_mensajes):
+    """Envía los mensajes pendientes de la bandeja de salida."""
+    while True:
+        inicio = time.perf_counter()
+        resumen = procesar_bandeja(max_mensajes)
+        segundos = time.perf_counter() - inicio
+        if sum(resumen.values()):
+            click.echo(f"{resumen['enviados']} enviados, {resumen['reintentos']} para reintentar, "
+                       f"{resumen['fallidos']} fallidos en {segundos:.1f} s.")
+        if not continuo:
+            click.echo(f'Estado de la bandeja: {resumen_bandeja()}')
+            return
+        time.sleep(current_app.config.get('MAIL_OUTBOX_POLL_SECONDS', 30))
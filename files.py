@@ -1,12 +1,29 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, send_from_directory
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, jsonify
 import os
 import uuid # Para generar nombres de archivo únicos
-from datetime import datetime
+import re
+import time
+import heapq
+import base64
+import hashlib
+import codecs
+import threading
+from array import array
+from itertools import islice
+from collections import defaultdict, OrderedDict
+from datetime import datetime, timedelta
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import ClientDisconnected
+from filelock import FileLock, Timeout
 import mimetypes # Para determinar el tipo MIME de los archivos
+import click
 
-# Importa db, File y User desde models.py
-from models import db, File, User
+# Importa db, File, User y el índice de activos desde models.py
+from models import db, File, User, AppAsset, AppAssetDirectory, UploadSession, UserStorage
+from storage import guardar_stream, guardar_archivo, liberar, enviar_archivo, ruta_absoluta, formato_bytes
+from programador import periodica, invocar_comando
+from sqlalchemy import select, func, update, delete, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 # Importa el decorador role_required desde app.py o perfil.py
 # Asumiendo que role_required está disponible globalmente o se importa desde app.py
@@ -39,6 +56,7 @@ def role_required(roles):
 
 
 files_bp = Blueprint('files', __name__)
+files_bp.app_template_filter('formato_bytes')(formato_bytes)
 
 # Configuración de extensiones permitidas y carpetas de subida
 # Estas se adjuntarán desde app.py, pero las definimos aquí para referencia
@@ -77,16 +95,18 @@ def get_file_category(mime_type):
     else:
         return 'other'
 
-def get_all_app_assets():
+# Segundos mínimos entre dos refrescos del índice de activos dentro de un mismo proceso
+ASSET_INDEX_REFRESH_SECONDS = 30
+_ultimo_refresco_activos = 0.0
+_refresco_activos_lock = threading.Lock()
+
+
+def get_app_asset_folders():
     """
-    Escanea las carpetas de subida predefinidas de la aplicación (excluyendo la de 'files')
-    y devuelve una lista de diccionarios de archivos.
-    Estos archivos no están necesariamente en el modelo de base de datos 'File'.
+    Carpetas de subida predefinidas de la aplicación que se indexan como activos
+    (excluye la de 'files', que es gestionada por el modelo File).
     """
-    app_assets = []
-    # Obtener todas las carpetas de subida relevantes de app.config
-    # Asegúrate de que estas rutas se pasen correctamente desde app.py
-    upload_folders_config = {
+    return {
         'avatars': current_app.config.get('UPLOAD_FOLDER'),
         'project_images': current_app.config.get('PROJECT_IMAGE_UPLOAD_FOLDER'),
         'note_images': current_app.config.get('NOTE_IMAGE_UPLOAD_FOLDER'),
@@ -96,41 +116,334 @@ def get_all_app_assets():
         'songs': current_app.config.get('SONGS_UPLOAD_FOLDER'),
         'covers': current_app.config.get('COVERS_UPLOAD_FOLDER'),
         'aboutus_images': current_app.config.get('ABOUTUS_IMAGE_UPLOAD_FOLDER'),
-        # La carpeta 'files' es gestionada por el modelo File, así que la excluimos aquí
-        # 'files': current_app.config.get('UPLOAD_FILES_FOLDER'),
     }
 
-    for folder_name, folder_path in upload_folders_config.items():
-        if folder_path and os.path.exists(folder_path):
-            for root, _, filenames in os.walk(folder_path):
-                for filename in filenames:
-                    full_path = os.path.join(root, filename)
-                    # La ruta relativa debe ser desde 'static/' para que url_for('static', filename=...) funcione
-                    relative_path_from_static = os.path.relpath(full_path, os.path.join(current_app.root_path, 'static'))
-                    
-                    mime_type, _ = mimetypes.guess_type(full_path)
-                    if not mime_type:
-                        mime_type = 'application/octet-stream'
-
-                    file_category = get_file_category(mime_type)
-
-                    # Crear un diccionario que imita la estructura del modelo File
-                    # Se asigna un ID de cadena único para estos archivos virtuales (activos de la aplicación)
-                    app_assets.append({
-                        'id': f"app_asset_{uuid.uuid4()}", # ID único de cadena para activos de la aplicación
-                        'original_filename': filename,
-                        'unique_filename': filename, # Para activos de la aplicación, original y único pueden ser lo mismo para mostrar
-                        'file_path': relative_path_from_static.replace('\\', '/'), # Asegura barras diagonales para URLs
-                        'file_type': file_category,
-                        'mime_type': mime_type,
-                        'upload_date': datetime.fromtimestamp(os.path.getmtime(full_path)), # Usar la fecha de última modificación
-                        'user_id': None, # Sin usuario específico para activos de la aplicación
-                        'is_visible': True,
-                        'is_used': True, # Asumimos que los activos de la aplicación están en uso
-                        'is_app_asset': True, # Bandera para distinguirlos de los archivos de la base de datos
-                        'folder_name': folder_name # Nombre de la carpeta de origen para mostrar
-                    })
-    return app_assets
+
+def _reindexar_directorio(static_root, rel_dir, folder_name, resumen):
+    """
+    Lista un directorio con os.scandir y sincroniza sus filas de AppAsset.
+    Devuelve las rutas relativas de sus subdirectorios.
+    """
+    existentes = {a.file_path: a for a in AppAsset.query.filter_by(directory=rel_dir)}
+    subdirectorios = []
+    with os.scandir(os.path.join(static_root, rel_dir)) as entradas:
+        for entrada in entradas:
+            file_path = f'{rel_dir}/{entrada.name}'
+            if entrada.is_dir(follow_symlinks=False):
+                subdirectorios.append(file_path)
+                continue
+            if not entrada.is_file():
+                continue
+            stat = entrada.stat()
+            fecha = datetime.fromtimestamp(stat.st_mtime) # Usar la fecha de última modificación
+            actual = existentes.pop(file_path, None)
+            if actual:
+                if actual.size != stat.st_size or actual.upload_date != fecha:
+                    actual.size = stat.st_size
+                    actual.upload_date = fecha
+                    resumen['actualizados'] += 1
+                continue
+
+            mime_type, _ = mimetypes.guess_type(entrada.name)
+            if not mime_type:
+                mime_type = 'application/octet-stream'
+            db.session.add(AppAsset(
+                folder_name=folder_name,
+                directory=rel_dir,
+                file_path=file_path,
+                original_filename=entrada.name,
+                file_type=get_file_category(mime_type),
+                mime_type=mime_type,
+                size=stat.st_size,
+                upload_date=fecha
+            ))
+            resumen['nuevos'] += 1
+
+    for eliminado in existentes.values():
+        db.session.delete(eliminado)
+        resumen['eliminados'] += 1
+    return subdirectorios
+
+
+def refrescar_indice_activos(forzar=False):
+    """
+    Sincroniza el índice AppAsset con las carpetas de subida de forma incremental.
+    Solo se vuelven a listar los directorios cuyo mtime cambió desde el último refresco
+    (crear, borrar o renombrar un archivo actualiza el mtime de su directorio); el resto
+    se recorre usando los subdirectorios ya conocidos, sin tocar sus archivos.
+    Devuelve un resumen del refresco, o None si se omitió por el intervalo mínimo.
+    """
+    global _ultimo_refresco_activos
+    intervalo = current_app.config.get('ASSET_INDEX_REFRESH_SECONDS', ASSET_INDEX_REFRESH_SECONDS)
+    if not forzar and time.monotonic() - _ultimo_refresco_activos < intervalo:
+        return None
+    # Si otro hilo ya está refrescando, se usa el índice tal como está
+    if not _refresco_activos_lock.acquire(blocking=False):
+        return None
+
+    try:
+        resumen = {'directorios': 0, 'listados': 0, 'nuevos': 0, 'actualizados': 0, 'eliminados': 0}
+        static_root = os.path.join(current_app.root_path, 'static')
+        directorios = {d.path: d for d in AppAssetDirectory.query.all()}
+        hijos = defaultdict(list)
+        for registro in directorios.values():
+            if registro.parent:
+                hijos[registro.parent].append(registro.path)
+
+        visitados = set()
+        for folder_name, folder_path in get_app_asset_folders().items():
+            if not folder_path or not os.path.isdir(folder_path):
+                continue
+            # La ruta relativa debe ser desde 'static/' para que url_for('static', filename=...) funcione
+            raiz = os.path.relpath(folder_path, static_root).replace('\\', '/')
+            pila = [(raiz, None)]
+            while pila:
+                rel_dir, parent = pila.pop()
+                try:
+                    mtime_ns = os.stat(os.path.join(static_root, rel_dir)).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                visitados.add(rel_dir)
+                resumen['directorios'] += 1
+
+                registro = directorios.get(rel_dir)
+                if registro and registro.mtime_ns == mtime_ns:
+                    pila.extend((hijo, rel_dir) for hijo in hijos[rel_dir])
+                    continue
+
+                subdirectorios = _reindexar_directorio(static_root, rel_dir, folder_name, resumen)
+                resumen['listados'] += 1
+                if registro:
+                    registro.mtime_ns = mtime_ns
+                else:
+                    db.session.add(AppAssetDirectory(path=rel_dir, parent=parent, folder_name=folder_name, mtime_ns=mtime_ns))
+                pila.extend((sub, rel_dir) for sub in subdirectorios)
+
+        # Directorios borrados o carpetas que ya no están configuradas
+        for path, registro in directorios.items():
+            if path not in visitados:
+                resumen['eliminados'] += AppAsset.query.filter_by(directory=path).delete(synchronize_session=False)
+                db.session.delete(registro)
+
+        db.session.commit()
+        _ultimo_refresco_activos = time.monotonic()
+        return resumen
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        _refresco_activos_lock.release()
+
+
+def activo_a_dict(asset):
+    """Convierte una fila de AppAsset al diccionario que consume la plantilla (imita al modelo File)."""
+    return {
+        'id': f"app_asset_{asset.id}", # ID estable de cadena para activos de la aplicación
+        'original_filename': asset.original_filename,
+        'unique_filename': asset.original_filename, # Para activos de la aplicación, original y único pueden ser lo mismo para mostrar
+        'file_path': asset.file_path,
+        'file_type': asset.file_type,
+        'mime_type': asset.mime_type,
+        'upload_date': asset.upload_date,
+        'user_id': None, # Sin usuario específico para activos de la aplicación
+        'is_visible': True,
+        'is_used': True, # Asumimos que los activos de la aplicación están en uso
+        'is_app_asset': True, # Bandera para distinguirlos de los archivos de la base de datos
+        'folder_name': asset.folder_name # Nombre de la carpeta de origen para mostrar
+    }
+
+
+def get_all_app_assets():
+    """
+    Devuelve los activos de las carpetas de subida de la aplicación desde el índice persistente,
+    refrescándolo antes si ya pasó el intervalo mínimo.
+    Estos archivos no están necesariamente en el modelo de base de datos 'File'.
+    """
+    refrescar_indice_activos()
+    return [activo_a_dict(a) for a in AppAsset.query.order_by(AppAsset.upload_date.desc())]
+
+
+def rango_de_fecha(fecha):
+    """Convierte una fecha en el rango [inicio, fin) para que el filtro use los índices por upload_date."""
+    inicio = datetime.combine(fecha, datetime.min.time())
+    return inicio, inicio + timedelta(days=1)
+
+
+# Tamaño de bloque para recibir fragmentos y recalcular hashes sin cargar archivos completos en memoria
+BLOQUE_SUBIDA = 64 * 1024
+
+
+def registrar_archivo(original_filename, file_path, user_id, sha256=None, size=None):
+    """
+    Crea la fila File de un archivo ya guardado en el almacén por contenido y suma su tamaño
+    al uso del usuario (sin hacer commit).
+    """
+    # Determinar el tipo MIME y la categoría del archivo
+    mime_type, _ = mimetypes.guess_type(original_filename)
+    if not mime_type:
+        mime_type = 'application/octet-stream' # Tipo genérico si no se puede adivinar
+
+    new_file = File(
+        original_filename=original_filename,
+        # Nombre único del registro; varios registros pueden compartir el mismo blob en file_path
+        unique_filename=str(uuid.uuid4()) + os.path.splitext(original_filename)[1],
+        file_path=file_path, # Ruta relativa a static/ para URL
+        file_type=get_file_category(mime_type),
+        mime_type=mime_type,
+        upload_date=datetime.utcnow(),
+        user_id=user_id,
+        sha256=sha256,
+        size=size if size is not None else os.path.getsize(ruta_absoluta(file_path))
+    )
+    db.session.add(new_file)
+    sumar_uso(user_id, new_file.file_type, new_file.size, 1)
+    return new_file
+
+
+# --- Uso de almacenamiento por usuario ---
+# user_storage guarda bytes y número de archivos por (usuario, categoría). registrar_archivo y
+# delete_file lo ajustan en la misma transacción que la fila File, así que consultar el uso
+# es una lectura por clave primaria. `flask files reconciliar-almacenamiento` corrige la deriva.
+
+def sumar_uso(user_id, categoria, bytes_delta, cantidad_delta):
+    """Suma (o resta, con deltas negativos) al contador del usuario (atómico en SQLite, sin commit)."""
+    if user_id is None:
+        return
+    stmt = sqlite_insert(UserStorage).values(
+        user_id=user_id, category=categoria, bytes_used=bytes_delta, file_count=cantidad_delta
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'category'],
+        set_={
+            'bytes_used': UserStorage.__table__.c.bytes_used + bytes_delta,
+            'file_count': UserStorage.__table__.c.file_count + cantidad_delta,
+        }
+    )
+    db.session.execute(stmt)
+
+
+def uso_de_usuario(user_id):
+    """{'total': {...}, 'categorias': {categoria: {'bytes', 'archivos'}}, 'cuota': bytes o None}."""
+    categorias = {
+        categoria: {'bytes': bytes_used, 'archivos': file_count}
+        for categoria, bytes_used, file_count in db.session.execute(
+            select(UserStorage.category, UserStorage.bytes_used, UserStorage.file_count)
+            .where(UserStorage.user_id == user_id)
+        )
+    }
+    return {
+        'total': {
+            'bytes': sum(c['bytes'] for c in categorias.values()),
+            'archivos': sum(c['archivos'] for c in categorias.values()),
+        },
+        'categorias': categorias,
+        'cuota': cuota_de_usuario(user_id),
+    }
+
+
+def cuota_de_usuario(user_id):
+    """Bytes que puede ocupar el usuario en el módulo files, o None si no tiene límite."""
+    cuota = current_app.config.get('USER_STORAGE_QUOTA_BYTES', 0)
+    if not cuota:
+        return None
+    role = db.session.execute(select(User.role).where(User.id == user_id)).scalar()
+    if role in current_app.config.get('STORAGE_QUOTA_EXEMPT_ROLES', ()):
+        return None
+    return cuota
+
+
+def espacio_disponible(user_id):
+    """
+    Bytes que le quedan al usuario (None = sin límite). Llamada después de guardar el blob,
+    la transacción ya tiene el bloqueo de escritura de SQLite, así que dos subidas simultáneas
+    del mismo usuario no pueden pasar la comprobación con el mismo saldo.
+    """
+    cuota = cuota_de_usuario(user_id)
+    if cuota is None:
+        return None
+    usados = db.session.execute(
+        select(func.coalesce(func.sum(UserStorage.bytes_used), 0)).where(UserStorage.user_id == user_id)
+    ).scalar()
+    return cuota - usados
+
+
+def mensaje_cuota(user_id, size):
+    disponible = max(espacio_disponible(user_id) or 0, 0)
+    return (f'No hay espacio suficiente: el archivo pesa {formato_bytes(size)} y te quedan '
+            f'{formato_bytes(disponible)} de tu cuota de {formato_bytes(cuota_de_usuario(user_id))}.')
+
+
+@files_bp.cli.command('reconciliar-almacenamiento')
+@click.option('--corregir', is_flag=True, help='Guarda los tamaños medidos y reconstruye user_storage.')
+def reconciliar_almacenamiento_command(corregir):
+    """
+    Mide en disco cada archivo de la tabla files (una sola pasada, por lotes) y muestra
+    la diferencia entre el uso real y los contadores de user_storage.
+    """
+    medido = defaultdict(lambda: [0, 0])
+    correcciones = [] # (file_id, tamaño en disco) de las filas cuyo size no coincide
+    archivos = faltantes = 0
+    consulta = select(File.id, File.user_id, File.file_type, File.file_path, File.size) \
+        .where(File.user_id.isnot(None)).execution_options(yield_per=1000)
+    for file_id, user_id, categoria, file_path, size in db.session.execute(consulta):
+        archivos += 1
+        try:
+            en_disco = os.stat(ruta_absoluta(file_path)).st_size
+        except OSError:
+            faltantes += 1 # se conserva el tamaño registrado
+            en_disco = size or 0
+        else:
+            if en_disco != size:
+                correcciones.append((file_id, en_disco))
+        medido[(user_id, categoria)][0] += en_disco
+        medido[(user_id, categoria)][1] += 1
+
+    contadores = {
+        (user_id, categoria): [bytes_used, file_count]
+        for user_id, categoria, bytes_used, file_count in db.session.execute(
+            select(UserStorage.user_id, UserStorage.category, UserStorage.bytes_used, UserStorage.file_count)
+        )
+    }
+    deriva = []
+    for clave in sorted(set(medido) | set(contadores)):
+        esperado, actual = medido.get(clave, [0, 0]), contadores.get(clave, [0, 0])
+        if esperado != actual:
+            deriva.append((clave, actual, esperado))
+            click.echo(f'  usuario {clave[0]} / {clave[1]}: contador {formato_bytes(actual[0])} en {actual[1]} archivos, '
+                       f'en disco {formato_bytes(esperado[0])} en {esperado[1]} archivos '
+                       f'(deriva {formato_bytes(actual[0] - esperado[0])}, {actual[1] - esperado[1]:+d})')
+    click.echo(f'{archivos} archivos medidos, {faltantes} sin archivo en disco, '
+               f'{len(correcciones)} con tamaño distinto al registrado, {len(deriva)} contadores con deriva.')
+    if not corregir:
+        return
+
+    for inicio in range(0, len(correcciones), 500):
+        db.session.execute(update(File), [{'id': file_id, 'size': size} for file_id, size in correcciones[inicio:inicio + 500]])
+    # Se reconstruye desde la tabla files en una sola transacción: las subidas y eliminaciones
+    # que ocurrieron durante la medición quedan incluidas.
+    db.session.execute(delete(UserStorage))
+    db.session.execute(insert(UserStorage).from_select(
+        ['user_id', 'category', 'bytes_used', 'file_count'],
+        select(File.user_id, File.file_type, func.coalesce(func.sum(File.size), 0), func.count())
+        .where(File.user_id.isnot(None)).group_by(File.user_id, File.file_type)
+    ))
+    db.session.commit()
+    click.echo('Contadores reconstruidos.')
+
+
+@files_bp.cli.command('reindexar-activos')
+@click.option('--completo', is_flag=True, help='Descarta el índice y vuelve a listar todas las carpetas.')
+def reindexar_activos_command(completo):
+    """Refresca el índice de activos de la aplicación (tabla app_assets)."""
+    if completo:
+        AppAsset.query.delete()
+        AppAssetDirectory.query.delete()
+        db.session.commit()
+    inicio = time.perf_counter()
+    resumen = refrescar_indice_activos(forzar=True)
+    click.echo(f"{resumen['directorios']} directorios ({resumen['listados']} listados), "
+               f"{resumen['nuevos']} nuevos, {resumen['actualizados']} actualizados, "
+               f"{resumen['eliminados']} eliminados en {time.perf_counter() - inicio:.2f}s")
 
 
 @files_bp.route('/files', methods=['GET', 'POST'])
@@ -157,11 +470,13 @@ def ver_files():
     if file_type_filter and file_type_filter != 'application_assets':
         db_files_query = db_files_query.filter_by(file_type=file_type_filter)
     
+    search_date = None
     if date_filter:
         try:
             # Asume formato YYYY-MM-DD para la fecha de búsqueda
             search_date = datetime.strptime(date_filter, '%Y-%m-%d').date()
-            db_files_query = db_files_query.filter(db.func.date(File.upload_date) == search_date)
+            inicio, fin = rango_de_fecha(search_date)
+            db_files_query = db_files_query.filter(File.upload_date >= inicio, File.upload_date < fin)
         except ValueError:
             flash('Formato de fecha de búsqueda inválido. Usa YYYY-MM-DD.', 'danger')
 
@@ -186,39 +501,20 @@ def ver_files():
         }
         all_files.append(file_dict)
 
-    # 2. Obtener activos de la aplicación (archivos escaneados dinámicamente)
-    app_assets = get_all_app_assets()
-
-    # Aplicar filtros a los activos de la aplicación manualmente
+    # 2. Obtener activos de la aplicación desde el índice persistente (consultas indexadas, sin recorrer el disco)
     filtered_app_assets = []
     if file_type_filter == 'application_assets' or not file_type_filter: # Si se filtra por app_assets o no hay filtro de tipo
-        for asset in app_assets:
-            match_search = True
-            match_type = True
-            match_date = True
+        refrescar_indice_activos()
+        assets_query = AppAsset.query
+        if search_query:
+            assets_query = assets_query.filter(AppAsset.original_filename.ilike(f'%{search_query}%'))
+        if search_date:
+            inicio, fin = rango_de_fecha(search_date)
+            assets_query = assets_query.filter(AppAsset.upload_date >= inicio, AppAsset.upload_date < fin)
+        filtered_app_assets = [activo_a_dict(a) for a in assets_query.order_by(AppAsset.upload_date.desc())]
 
-            if search_query and search_query.lower() not in asset['original_filename'].lower():
-                match_search = False
-            
-            # Si se ha seleccionado un tipo de archivo específico (que no sea 'application_assets')
-            # entonces los activos de la aplicación solo deben coincidir si su tipo coincide con el filtro.
-            if file_type_filter and file_type_filter != 'application_assets' and asset['file_type'] != file_type_filter:
-                match_type = False
-            
-            if date_filter:
-                try:
-                    search_date = datetime.strptime(date_filter, '%Y-%m-%d').date()
-                    if asset['upload_date'].date() != search_date:
-                        match_date = False
-                except ValueError:
-                    pass # El error de formato de fecha ya se manejó para los archivos de la BD
-
-            if match_search and match_type and match_date:
-                filtered_app_assets.append(asset)
-    
-    # Combinar todos los archivos (archivos de la base de datos + activos de la aplicación filtrados)
-    all_files.extend(filtered_app_assets)
-    all_files.sort(key=lambda x: x['upload_date'], reverse=True) # Ordenar por fecha descendente
+    # Combinar todos los archivos (ambas listas ya vienen ordenadas por fecha descendente)
+    all_files = list(heapq.merge(all_files, filtered_app_assets, key=lambda x: x['upload_date'], reverse=True))
 
     # Categorizar todos los archivos para la vista
     categorized_files = {
@@ -246,10 +542,18 @@ def ver_files():
         search_query=search_query,
         file_type_filter=file_type_filter,
         date_filter=date_filter,
-        file_type_options=file_type_options
+        file_type_options=file_type_options,
+        uso_almacenamiento=uso_de_usuario(user_id)
     )
 
 
+@files_bp.route('/files/uso')
+@role_required(['Superuser', 'Usuario Regular'])
+def uso_almacenamiento():
+    """Uso de almacenamiento del usuario actual por categoría y su cuota."""
+    return jsonify({'success': True, **uso_de_usuario(session['user_id'])})
+
+
 @files_bp.route('/upload_file', methods=['POST'])
 @role_required(['Superuser', 'Usuario Regular'])
 def upload_file():
@@ -268,38 +572,29 @@ def upload_file():
         return redirect(url_for('files.ver_files'))
 
     if uploaded_file and allowed_file_extension(uploaded_file.filename):
-        original_filename = secure_filename(uploaded_file.filename)
-        # Generar un nombre de archivo único para evitar colisiones
-        unique_filename = str(uuid.uuid4()) + os.path.splitext(original_filename)[1]
-        
-        # Define la carpeta de subida para archivos generales (asegúrate de que exista en app.py)
-        upload_folder = current_app.config.get('UPLOAD_FILES_FOLDER')
-        if not upload_folder:
-            flash('Error de configuración: Carpeta de subida de archivos no definida.', 'danger')
-            current_app.logger.error("UPLOAD_FILES_FOLDER no está definido en app.config")
+        user_id = session['user_id']
+        # Rechazo temprano con el tamaño de la petición, antes de copiar nada
+        disponible = espacio_disponible(user_id)
+        if disponible is not None and (request.content_length or 0) > disponible:
+            flash(mensaje_cuota(user_id, request.content_length), 'danger')
             return redirect(url_for('files.ver_files'))
 
-        file_path_on_disk = os.path.join(upload_folder, unique_filename)
-        uploaded_file.save(file_path_on_disk)
-
-        # Determinar el tipo MIME y la categoría del archivo
-        mime_type, _ = mimetypes.guess_type(file_path_on_disk)
-        if not mime_type:
-            mime_type = 'application/octet-stream' # Tipo genérico si no se puede adivinar
+        original_filename = secure_filename(uploaded_file.filename)
+        # Copia por bloques al almacén por contenido calculando el SHA-256 en la misma pasada
+        file_path, sha256 = guardar_stream(uploaded_file.stream, original_filename, uploaded_file.mimetype)
+        size = os.path.getsize(ruta_absoluta(file_path))
 
-        file_category = get_file_category(mime_type)
+        # Comprobación definitiva con el tamaño real, dentro de la transacción
+        disponible = espacio_disponible(user_id)
+        if disponible is not None and size > disponible:
+            mensaje = mensaje_cuota(user_id, size)
+            liberar(file_path) # deshace la referencia; el blob se borra si era nuevo
+            db.session.commit()
+            flash(mensaje, 'danger')
+            return redirect(url_for('files.ver_files'))
 
         # Guardar información en la base de datos
-        new_file = File(
-            original_filename=original_filename,
-            unique_filename=unique_filename,
-            file_path=os.path.join('uploads', 'files', unique_filename), # Ruta relativa para URL
-            file_type=file_category,
-            mime_type=mime_type,
-            upload_date=datetime.utcnow(),
-            user_id=session['user_id']
-        )
-        db.session.add(new_file)
+        registrar_archivo(original_filename, file_path, user_id, sha256, size)
         db.session.commit()
         flash('Archivo subido exitosamente.', 'success')
     else:
@@ -307,6 +602,302 @@ def upload_file():
 
     return redirect(url_for('files.ver_files'))
 
+# --- Subidas reanudables por fragmentos (protocolo por offsets al estilo tus 1.0) ---
+# 1. POST   /files/uploads            crea la subida (filename, size y opcionalmente sha256).
+# 2. PATCH  /files/uploads/<id>       agrega bytes en Upload-Offset (Content-Type: application/offset+octet-stream).
+# 3. HEAD   /files/uploads/<id>       consulta el offset confirmado para reanudar tras un corte.
+# 4. DELETE /files/uploads/<id>       cancela la subida.
+# Al recibir el último byte el archivo se mueve a UPLOAD_FILES_FOLDER y se crea su fila File.
+
+TUS_VERSION = '1.0.0'
+UPLOAD_MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024 # 2 GiB, configurable con UPLOAD_MAX_FILE_SIZE
+_ID_SUBIDA_RE = re.compile(r'^[0-9a-f]{32}$')
+
+# Estado SHA-256 de las subidas en curso dentro de este proceso: upload_id -> (offset, huella).
+# Si se pierde (reinicio, otro worker) se recalcula leyendo el prefijo ya guardado.
+MAX_HUELLAS_EN_MEMORIA = 256
+_huellas_subida = OrderedDict()
+_huellas_lock = threading.Lock()
+
+
+def _ruta_staging(upload_id):
+    return os.path.join(current_app.config['UPLOAD_STAGING_FOLDER'], f'{upload_id}.part')
+
+
+def _recordar_huella(upload_id, offset, huella):
+    with _huellas_lock:
+        _huellas_subida[upload_id] = (offset, huella)
+        _huellas_subida.move_to_end(upload_id)
+        while len(_huellas_subida) > MAX_HUELLAS_EN_MEMORIA:
+            _huellas_subida.popitem(last=False)
+
+
+def _olvidar_huella(upload_id):
+    with _huellas_lock:
+        _huellas_subida.pop(upload_id, None)
+
+
+def _huella_hasta_offset(upload_session, ruta):
+    """Devuelve un objeto sha256 que ya incluye los primeros `offset` bytes del archivo parcial."""
+    with _huellas_lock:
+        estado = _huellas_subida.get(upload_session.id)
+    if estado and estado[0] == upload_session.offset:
+        return estado[1].copy()
+
+    huella = hashlib.sha256()
+    restante = upload_session.offset
+    with open(ruta, 'rb') as parcial:
+        while restante > 0:
+            bloque = parcial.read(min(BLOQUE_SUBIDA, restante))
+            if not bloque:
+                break
+            huella.update(bloque)
+            restante -= len(bloque)
+    return huella
+
+
+def _respuesta_subida(payload, status, upload_session=None):
+    if status == 204:
+        response = current_app.response_class(status=204) # 204 no lleva cuerpo
+    else:
+        response = jsonify(payload)
+        response.status_code = status
+    response.headers['Tus-Resumable'] = TUS_VERSION
+    response.headers['Cache-Control'] = 'no-store'
+    if upload_session is not None:
+        response.headers['Upload-Offset'] = str(upload_session.offset)
+        response.headers['Upload-Length'] = str(upload_session.total_size)
+    return response
+
+
+def _leer_metadatos_tus(cabecera):
+    """Decodifica Upload-Metadata: pares 'clave valor_base64' separados por comas."""
+    metadatos = {}
+    for par in (cabecera or '').split(','):
+        partes = par.strip().split(' ', 1)
+        if not partes[0]:
+            continue
+        try:
+            metadatos[partes[0]] = base64.b64decode(partes[1]).decode('utf-8') if len(partes) > 1 else ''
+        except (ValueError, UnicodeDecodeError):
+            continue
+    return metadatos
+
+
+def _sesion_del_usuario(upload_id):
+    if not _ID_SUBIDA_RE.match(upload_id):
+        return None
+    upload_session = db.session.get(UploadSession, upload_id, populate_existing=True)
+    if not upload_session or upload_session.user_id != session.get('user_id'):
+        return None
+    return upload_session
+
+
+def _descartar_subida(upload_session):
+    """Elimina la sesión y su archivo parcial (sin hacer commit)."""
+    ruta = _ruta_staging(upload_session.id)
+    if os.path.exists(ruta):
+        os.remove(ruta)
+    _olvidar_huella(upload_session.id)
+    db.session.delete(upload_session)
+
+
+def _finalizar_subida(upload_session, ruta, sha256):
+    """
+    Mueve el archivo completo al almacén por contenido y lo registra como File.
+    Devuelve None si el usuario se quedó sin cuota mientras subía (la subida se descarta).
+    """
+    # Si el contenido ya existía, el archivo parcial se descarta sin copiarlo
+    file_path = guardar_archivo(ruta, upload_session.original_filename, sha256=sha256)
+    try:
+        disponible = espacio_disponible(upload_session.user_id)
+        if disponible is not None and upload_session.total_size > disponible:
+            liberar(file_path)
+            _descartar_subida(upload_session)
+            db.session.commit()
+            return None
+        new_file = registrar_archivo(upload_session.original_filename, file_path, upload_session.user_id,
+                                     sha256, upload_session.total_size)
+        db.session.delete(upload_session)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    _olvidar_huella(upload_session.id)
+    return new_file
+
+
+@files_bp.route('/files/uploads', methods=['POST'])
+@role_required(['Superuser', 'Usuario Regular'])
+def crear_subida():
+    data = request.get_json(silent=True) or {}
+    metadatos = _leer_metadatos_tus(request.headers.get('Upload-Metadata'))
+    filename = data.get('filename') or metadatos.get('filename', '')
+    expected_sha256 = (data.get('sha256') or metadatos.get('sha256') or '').lower() or None
+
+    try:
+        total_size = int(data.get('size', request.headers.get('Upload-Length', '')))
+    except (TypeError, ValueError):
+        return _respuesta_subida({'success': False, 'message': 'Falta el tamaño total del archivo.'}, 400)
+
+    max_size = current_app.config.get('UPLOAD_MAX_FILE_SIZE', UPLOAD_MAX_FILE_SIZE)
+    if total_size <= 0 or total_size > max_size:
+        return _respuesta_subida({'success': False, 'message': f'El archivo debe pesar entre 1 byte y {max_size} bytes.'}, 413)
+    if not filename or not allowed_file_extension(filename):
+        return _respuesta_subida({'success': False, 'message': 'Tipo de archivo no permitido o archivo inválido.'}, 400)
+    if expected_sha256 and not re.match(r'^[0-9a-f]{64}$', expected_sha256):
+        return _respuesta_subida({'success': False, 'message': 'El SHA-256 enviado no es válido.'}, 400)
+    disponible = espacio_disponible(session['user_id'])
+    if disponible is not None and total_size > disponible:
+        return _respuesta_subida({'success': False, 'message': mensaje_cuota(session['user_id'], total_size)}, 413)
+
+    upload_session = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=session['user_id'],
+        original_filename=secure_filename(filename),
+        total_size=total_size,
+        offset=0,
+        expected_sha256=expected_sha256
+    )
+    # Archivo parcial vacío: los fragmentos se escriben en su offset
+    open(_ruta_staging(upload_session.id), 'wb').close()
+    db.session.add(upload_session)
+    db.session.commit()
+
+    response = _respuesta_subida({'success': True, 'upload_id': upload_session.id}, 201, upload_session)
+    response.headers['Location'] = url_for('files.estado_subida', upload_id=upload_session.id)
+    return response
+
+
+@files_bp.route('/files/uploads/<upload_id>', methods=['GET', 'HEAD'])
+@role_required(['Superuser', 'Usuario Regular'])
+def estado_subida(upload_id):
+    upload_session = _sesion_del_usuario(upload_id)
+    if not upload_session:
+        return _respuesta_subida({'success': False, 'message': 'Subida no encontrada.'}, 404)
+    return _respuesta_subida({'success': True, 'offset': upload_session.offset, 'size': upload_session.total_size}, 200, upload_session)
+
+
+@files_bp.route('/files/uploads/<upload_id>', methods=['PATCH'])
+@role_required(['Superuser', 'Usuario Regular'])
+def recibir_fragmento(upload_id):
+    if request.mimetype != 'application/offset+octet-stream':
+        return _respuesta_subida({'success': False, 'message': 'Content-Type debe ser application/offset+octet-stream.'}, 415)
+    try:
+        offset_cliente = int(request.headers['Upload-Offset'])
+    except (KeyError, ValueError):
+        return _respuesta_subida({'success': False, 'message': 'Falta la cabecera Upload-Offset.'}, 400)
+    if not _ID_SUBIDA_RE.match(upload_id):
+        return _respuesta_subida({'success': False, 'message': 'Subida no encontrada.'}, 404)
+
+    ruta = _ruta_staging(upload_id)
+    try:
+        # Un solo escritor por subida, también entre procesos
+        with FileLock(ruta + '.lock', timeout=10):
+            upload_session = _sesion_del_usuario(upload_id)
+            if not upload_session:
+                return _respuesta_subida({'success': False, 'message': 'Subida no encontrada.'}, 404)
+            if not os.path.exists(ruta):
+                _descartar_subida(upload_session)
+                db.session.commit()
+                return _respuesta_subida({'success': False, 'message': 'El archivo parcial ya no existe, inicia la subida de nuevo.'}, 410)
+            if offset_cliente != upload_session.offset:
+                return _respuesta_subida({'success': False, 'message': 'El offset no coincide con el servidor.'}, 409, upload_session)
+
+            restante = upload_session.total_size - upload_session.offset
+            if request.content_length is not None and request.content_length > restante:
+                return _respuesta_subida({'success': False, 'message': 'El fragmento excede el tamaño declarado.'}, 413, upload_session)
+
+            huella = _huella_hasta_offset(upload_session, ruta)
+            recibidos = 0
+            with open(ruta, 'r+b') as parcial:
+                # Descarta bytes de una escritura anterior que no llegó a confirmarse
+                parcial.truncate(upload_session.offset)
+                parcial.seek(upload_session.offset)
+                try:
+                    while recibidos < restante:
+                        bloque = request.stream.read(min(BLOQUE_SUBIDA, restante - recibidos))
+                        if not bloque:
+                            break
+                        parcial.write(bloque)
+                        huella.update(bloque)
+                        recibidos += len(bloque)
+                except ClientDisconnected:
+                    # Se conserva lo recibido; el cliente reanuda desde el nuevo offset
+                    current_app.logger.info(f"Subida {upload_id} interrumpida tras {recibidos} bytes")
+                parcial.flush()
+                os.fsync(parcial.fileno())
+
+            upload_session.offset += recibidos
+            upload_session.updated_at = datetime.utcnow()
+            db.session.commit()
+            _recordar_huella(upload_session.id, upload_session.offset, huella)
+
+            if upload_session.offset < upload_session.total_size:
+                return _respuesta_subida({'success': True, 'offset': upload_session.offset}, 204, upload_session)
+
+            sha256 = huella.hexdigest()
+            if upload_session.expected_sha256 and upload_session.expected_sha256 != sha256:
+                _descartar_subida(upload_session)
+                db.session.commit()
+                return _respuesta_subida({'success': False, 'message': 'El SHA-256 del archivo recibido no coincide.'}, 460)
+
+            new_file = _finalizar_subida(upload_session, ruta, sha256)
+            if new_file is None:
+                return _respuesta_subida({'success': False, 'message': 'Se superó la cuota de almacenamiento.'}, 413)
+    except Timeout:
+        return _respuesta_subida({'success': False, 'message': 'La subida está recibiendo otro fragmento.'}, 423)
+
+    response = _respuesta_subida({'success': True, 'file_id': new_file.id, 'sha256': sha256}, 200)
+    response.headers['Upload-Offset'] = str(upload_session.total_size)
+    return response
+
+
+@files_bp.route('/files/uploads/<upload_id>', methods=['DELETE'])
+@role_required(['Superuser', 'Usuario Regular'])
+def cancelar_subida(upload_id):
+    if not _ID_SUBIDA_RE.match(upload_id):
+        return _respuesta_subida({'success': False, 'message': 'Subida no encontrada.'}, 404)
+    try:
+        with FileLock(_ruta_staging(upload_id) + '.lock', timeout=10):
+            upload_session = _sesion_del_usuario(upload_id)
+            if not upload_session:
+                return _respuesta_subida({'success': False, 'message': 'Subida no encontrada.'}, 404)
+            _descartar_subida(upload_session)
+            db.session.commit()
+    except Timeout:
+        return _respuesta_subida({'success': False, 'message': 'La subida está recibiendo otro fragmento.'}, 423)
+    return _respuesta_subida({'success': True}, 204)
+
+
+@files_bp.cli.command('limpiar-subidas')
+def limpiar_subidas_command():
+    """Elimina las subidas reanudables sin actividad durante más de UPLOAD_SESSION_TTL_HOURS."""
+    ttl_horas = current_app.config.get('UPLOAD_SESSION_TTL_HOURS', 24)
+    limite = datetime.utcnow() - timedelta(hours=ttl_horas)
+    vencidas = UploadSession.query.filter(UploadSession.updated_at < limite).all()
+    for upload_session in vencidas:
+        _descartar_subida(upload_session)
+    db.session.commit()
+
+    # Archivos parciales o de bloqueo sin sesión (p. ej. si se borró la fila a mano)
+    vigentes = {id_ for (id_,) in db.session.query(UploadSession.id)}
+    huerfanos = 0
+    staging = current_app.config['UPLOAD_STAGING_FOLDER']
+    with os.scandir(staging) as entradas:
+        for entrada in entradas:
+            upload_id = entrada.name.split('.', 1)[0]
+            if upload_id not in vigentes and entrada.stat().st_mtime < time.time() - ttl_horas * 3600:
+                os.remove(entrada.path)
+                huerfanos += 1
+    click.echo(f'{len(vencidas)} subidas vencidas eliminadas, {huerfanos} archivos huérfanos borrados de {staging}')
+
+
+@periodica('files.limpiar_subidas', cron='15 * * * *')
+def limpiar_subidas_periodico():
+    invocar_comando(limpiar_subidas_command)
+
+
 @files_bp.route('/download_file/<int:file_id>') # Solo IDs enteros para archivos de BD
 @role_required(['Superuser', 'Usuario Regular'])
 def download_file(file_id):
@@ -326,13 +917,12 @@ def download_file(file_id):
         return redirect(url_for('files.ver_files'))
 
     # La ruta completa en el sistema de archivos
-    full_path = os.path.join(current_app.root_path, 'static', file_record.file_path)
+    full_path = ruta_absoluta(file_record.file_path)
 
     if os.path.exists(full_path):
-        # send_from_directory requiere la ruta del directorio y el nombre del archivo
-        directory = os.path.dirname(full_path)
-        filename = os.path.basename(full_path)
-        return send_from_directory(directory, filename, as_attachment=True, download_name=file_record.original_filename)
+        # El proxy entrega el archivo si está configurado (FILE_DELIVERY); si no, send_file con Range/206
+        return enviar_archivo(full_path, as_attachment=True, download_name=file_record.original_filename,
+                              mimetype=file_record.mime_type)
     else:
         flash('El archivo no existe en el servidor.', 'danger')
         return redirect(url_for('files.ver_files'))
@@ -356,15 +946,18 @@ def delete_file(file_id):
         return redirect(url_for('files.ver_files'))
 
     try:
-        # Eliminar el archivo del sistema de archivos
-        full_path = os.path.join(current_app.root_path, 'static', file_record.file_path)
-        if os.path.exists(full_path):
+        # Eliminar el archivo del sistema de archivos (en el almacén se borra al quedar sin referencias)
+        full_path = ruta_absoluta(file_record.file_path)
+        if liberar(file_record.file_path):
+            flash(f'Archivo "{file_record.original_filename}" eliminado del servidor.', 'info')
+        elif os.path.exists(full_path):
             os.remove(full_path)
             flash(f'Archivo "{file_record.original_filename}" eliminado del servidor.', 'info')
         else:
             flash(f'Advertencia: El archivo "{file_record.original_filename}" no se encontró en el servidor, pero se eliminará de la base de datos.', 'warning')
 
-        # Eliminar el registro de la base de datos
+        # Eliminar el registro de la base de datos y descontarlo del uso del usuario
+        sumar_uso(file_record.user_id, file_record.file_type, -(file_record.size or 0), -1)
         db.session.delete(file_record)
         db.session.commit()
         flash('Archivo eliminado exitosamente de la base de datos.', 'success')
@@ -375,6 +968,162 @@ def delete_file(file_id):
 
     return redirect(url_for('files.ver_files'))
 
+# --- Exportación y vista previa de documentos de texto ---
+# El contenido se lee por bloques, así que la memoria no depende del tamaño del archivo.
+# El índice de líneas se guarda en LINE_INDEX_FOLDER/<clave>.idx como enteros de 64 bits:
+#   [total_lineas, paso, offset(0), offset(paso), offset(2*paso), ...]
+# es decir, el byte donde empieza cada línea múltiplo de LINE_INDEX_STRIDE. La clave es el
+# SHA-256 del contenido (un blob nunca cambia); sin hash, la ruta, el tamaño y el mtime.
+
+BLOQUE_TEXTO = 64 * 1024
+LINE_INDEX_STRIDE = 256
+PREVIEW_LINEAS = 200
+PREVIEW_MAX_LINEAS = 500
+PREVIEW_MAX_BYTES_LINEA = 4096 # Las líneas más largas se recortan en la vista previa
+MIME_TEXTO = {'application/json', 'application/xml', 'application/csv', 'application/x-ndjson'}
+_SALTO_DE_LINEA = re.compile(b'\n')
+
+
+def es_texto(file_record):
+    mime_type = (file_record.mime_type or '').split(';', 1)[0]
+    return mime_type.startswith('text/') or mime_type in MIME_TEXTO
+
+
+def generar_texto_utf8(ruta):
+    """Genera el contenido en UTF-8 por bloques; los bytes inválidos se reemplazan por U+FFFD."""
+    # El decodificador incremental conserva los caracteres partidos entre dos bloques
+    decodificador = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(BLOQUE_TEXTO), b''):
+            texto = decodificador.decode(bloque)
+            if texto:
+                yield texto.encode('utf-8')
+    resto = decodificador.decode(b'', final=True)
+    if resto:
+        yield resto.encode('utf-8')
+
+
+def _ruta_indice_lineas(file_record, ruta):
+    clave = file_record.sha256
+    if not clave:
+        stat = os.stat(ruta)
+        clave = hashlib.sha1(f'{ruta}|{stat.st_size}|{stat.st_mtime_ns}'.encode('utf-8')).hexdigest()
+    return os.path.join(current_app.config['LINE_INDEX_FOLDER'], f'{clave}.idx')
+
+
+def _construir_indice_lineas(ruta, destino, paso=LINE_INDEX_STRIDE):
+    """Recorre el archivo una vez y escribe el índice en disco a medida que avanza."""
+    temporal = f'{destino}.{uuid.uuid4().hex}.tmp'
+    lineas = 0
+    posicion = 0
+    faltan = paso # saltos de línea hasta la próxima marca
+    ultimo_byte = b'\n'
+    try:
+        with open(ruta, 'rb') as f, open(temporal, 'wb') as indice:
+            array('Q', [0, paso, 0]).tofile(indice) # cabecera provisional y la línea 0
+            for bloque in iter(lambda: f.read(BLOQUE_TEXTO * 16), b''):
+                saltos = bloque.count(b'\n')
+                if saltos >= faltan:
+                    marcas = islice(_SALTO_DE_LINEA.finditer(bloque), faltan - 1, None, paso)
+                    array('Q', (posicion + marca.end() for marca in marcas)).tofile(indice)
+                    faltan = paso - (saltos - faltan) % paso
+                else:
+                    faltan -= saltos
+                lineas += saltos
+                posicion += len(bloque)
+                ultimo_byte = bloque[-1:]
+            if ultimo_byte != b'\n':
+                lineas += 1 # última línea sin salto final
+            indice.seek(0)
+            array('Q', [lineas, paso]).tofile(indice)
+        os.replace(temporal, destino)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+def _saltar_linea(f):
+    while True:
+        trozo = f.readline(BLOQUE_TEXTO)
+        if not trozo or trozo.endswith(b'\n'):
+            return
+
+
+def leer_lineas(file_record, ruta, inicio, cantidad):
+    """
+    Devuelve (lineas, truncadas, total_lineas) a partir de la línea `inicio` (base 0).
+    Construye el índice de líneas la primera vez; después cada página solo lee el
+    offset de su marca en el índice y, como mucho, LINE_INDEX_STRIDE líneas antes de ella.
+    """
+    ruta_indice = _ruta_indice_lineas(file_record, ruta)
+    if not os.path.exists(ruta_indice):
+        with FileLock(f'{ruta_indice}.lock'):
+            if not os.path.exists(ruta_indice):
+                _construir_indice_lineas(ruta, ruta_indice)
+
+    with open(ruta_indice, 'rb') as indice:
+        cabecera = array('Q')
+        cabecera.fromfile(indice, 2)
+        total_lineas, paso = cabecera
+        if inicio >= total_lineas:
+            return [], [], total_lineas
+        indice.seek((2 + inicio // paso) * 8)
+        marca = array('Q')
+        marca.fromfile(indice, 1)
+
+    lineas, truncadas = [], []
+    with open(ruta, 'rb') as f:
+        f.seek(marca[0])
+        for _ in range(inicio % paso):
+            _saltar_linea(f)
+        while len(lineas) < cantidad:
+            linea = f.readline(PREVIEW_MAX_BYTES_LINEA)
+            if not linea:
+                break
+            if not linea.endswith(b'\n'):
+                # Línea recortada: se descarta el resto hasta el siguiente salto
+                if f.read(1) not in (b'', b'\n'):
+                    truncadas.append(len(lineas))
+                    _saltar_linea(f)
+            lineas.append(linea.rstrip(b'\r\n').decode('utf-8', errors='replace'))
+    return lineas, truncadas, total_lineas
+
+
+@files_bp.route('/files/preview/<int:file_id>')
+@role_required(['Superuser', 'Usuario Regular'])
+def preview_file(file_id):
+    """Página de líneas de un documento de texto: ?linea=<inicio, base 0>&lineas=<cantidad>."""
+    file_record = db.session.get(File, file_id)
+    if not file_record:
+        return jsonify({'success': False, 'message': 'Archivo no encontrado.'}), 404
+    # Asegurarse de que el usuario solo pueda ver sus propios archivos si es Usuario Regular
+    if session.get('role') == 'Usuario Regular' and file_record.user_id != session['user_id']:
+        return jsonify({'success': False, 'message': 'No tienes permiso para ver este archivo.'}), 403
+    if not es_texto(file_record):
+        return jsonify({'success': False, 'message': 'La vista previa solo está disponible para archivos de texto.'}), 415
+    full_path = ruta_absoluta(file_record.file_path)
+    if not os.path.isfile(full_path):
+        return jsonify({'success': False, 'message': 'El archivo no existe en el servidor.'}), 404
+
+    inicio = max(request.args.get('linea', 0, type=int), 0)
+    cantidad = min(max(request.args.get('lineas', PREVIEW_LINEAS, type=int), 1), PREVIEW_MAX_LINEAS)
+    try:
+        lineas, truncadas, total_lineas = leer_lineas(file_record, full_path, inicio, cantidad)
+    except OSError as e:
+        current_app.logger.error(f"Error en la vista previa del archivo {file_id}: {e}")
+        return jsonify({'success': False, 'message': 'No se pudo leer el archivo.'}), 500
+
+    siguiente = inicio + len(lineas)
+    return jsonify({
+        'success': True,
+        'linea': inicio,
+        'lineas': lineas,
+        'truncadas': truncadas,
+        'total_lineas': total_lineas,
+        'siguiente': siguiente if siguiente < total_lineas else None,
+    })
+
+
 # Rutas para exportar (estas son más complejas y requerirían librerías adicionales)
 # Por ahora, solo se proporciona una estructura básica y una nota.
 @files_bp.route('/export_file/<int:file_id>/<string:export_type>')
@@ -385,26 +1134,26 @@ def export_file(file_id, export_type):
         flash('Archivo no encontrado para exportar.', 'danger')
         return redirect(url_for('files.ver_files'))
 
+    # Asegurarse de que el usuario solo pueda exportar sus propios archivos si es Usuario Regular
+    if session.get('role') == 'Usuario Regular' and file_record.user_id != session['user_id']:
+        flash('No tienes permiso para exportar este archivo.', 'danger')
+        return redirect(url_for('files.ver_files'))
+
     # Lógica de exportación (requiere librerías como Pillow para JPG, reportlab/fpdf para PDF)
     # y manejo de contenido para TXT (asegurando UTF-8)
     
-    # Ejemplo muy básico para TXT (solo si el archivo original es TXT)
-    if export_type == 'txt' and file_record.mime_type == 'text/plain':
-        full_path = os.path.join(current_app.root_path, 'static', file_record.file_path)
-        try:
-            with open(full_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            # Puedes devolver el contenido como un archivo de texto
-            response = current_app.response_class(
-                content,
-                mimetype='text/plain; charset=utf-8',
-                headers={"Content-Disposition": f"attachment;filename={file_record.original_filename.rsplit('.', 1)[0]}.txt"}
-            )
-            return response
-        except Exception as e:
-            flash(f'Error al exportar a TXT: {e}', 'danger')
-            current_app.logger.error(f"Error exportando TXT: {e}")
+    # TXT: cualquier documento de texto, enviado por bloques y normalizado a UTF-8
+    if export_type == 'txt' and es_texto(file_record):
+        full_path = ruta_absoluta(file_record.file_path)
+        if not os.path.isfile(full_path):
+            flash('El archivo no existe en el servidor.', 'danger')
             return redirect(url_for('files.ver_files'))
+        # Sin Content-Length: los bytes reemplazados cambian el tamaño de la salida
+        return current_app.response_class(
+            generar_texto_utf8(full_path),
+            mimetype='text/plain; charset=utf-8',
+            headers={"Content-Disposition": f"attachment;filename={file_record.original_filename.rsplit('.', 1)[0]}.txt"}
+        )
     
     # Para JPG y PDF, necesitarías librerías específicas:
     # - Para JPG: Si el archivo es una imagen, podrías reescalarla y guardarla como JPG.
@@ -0,0 +1,249 @@
+# hashing.py
+# Costo de bcrypt ajustado al hardware de cada instalación.
+# - `flask hashing calibrar` mide cuánto tarda un hash en este equipo para cada log_rounds y
+#   guarda en instance/bcrypt.json el mayor costo que no supera BCRYPT_TARGET_MS.
+# - verificar_contrasena() mide cada verificación y, tras un login correcto, vuelve a calcular el
+#   hash si el guardado usa otro costo (el usuario no nota nada: ya tenemos la contraseña en claro).
+# - /admin/metricas/bcrypt muestra la distribución de tiempos de verificación de este worker.
+import os
+import json
+import time
+import tempfile
+import statistics
+import threading
+from collections import deque
+from datetime import datetime
+from functools import wraps
+
+import bcrypt as bcrypt_lib
+import click
+from flask import Blueprint, current_app, jsonify, session, flash, redirect, url_for
+
+from models import db, bcrypt
+
+hashing_bp = Blueprint('hashing', __name__)
+
+ARCHIVO_CALIBRACION = 'bcrypt.json'
+COSTO_POR_DEFECTO = 12
+COSTO_MINIMO = 10 # por debajo, un hash filtrado se rompe demasiado rápido aunque el equipo sea lento
+COSTO_MAXIMO = 16
+
+# Límites superiores (ms) de los intervalos del histograma de verificaciones
+LIMITES_HISTOGRAMA_MS = (10, 25, 50, 100, 200, 300, 500, 750, 1000, 2000)
+MUESTRAS_RECIENTES = 1000
+
+
+def role_required(roles):
+    if not isinstance(roles, list):
+        roles = [roles]
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if 'logged_in' not in session or not session['logged_in']:
+                flash('Por favor, inicia sesión para acceder a esta página.', 'info')
+                return redirect(url_for('login'))
+            if session.get('role') not in roles:
+                flash('No tienes permiso para acceder a esta página.', 'danger')
+                return redirect(url_for('home'))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+# --- Costo configurado ---
+
+def ruta_calibracion(app):
+    return os.path.join(app.instance_path, ARCHIVO_CALIBRACION)
+
+
+def aplicar_costo_calibrado(app):
+    """
+    Fija BCRYPT_LOG_ROUNDS antes de bcrypt.init_app: la variable de entorno tiene prioridad,
+    luego instance/bcrypt.json y por último el valor por defecto de Flask-Bcrypt.
+    """
+    if app.config.get('BCRYPT_LOG_ROUNDS'):
+        return
+    costo = COSTO_POR_DEFECTO
+    try:
+        with open(ruta_calibracion(app)) as f:
+            costo = int(json.load(f)['log_rounds'])
+    except FileNotFoundError:
+        pass
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"DEBUG: {ARCHIVO_CALIBRACION} inválido, se usa log_rounds={COSTO_POR_DEFECTO}: {e}")
+    app.config['BCRYPT_LOG_ROUNDS'] = costo
+
+
+def costo_de_hash(hash_guardado):
+    """log_rounds de un hash bcrypt ('$2b$12$...'), o None si no es un hash bcrypt."""
+    partes = (hash_guardado or '').split('$')
+    if len(partes) < 4 or partes[1] not in ('2a', '2b', '2y'):
+        return None
+    try:
+        return int(partes[2])
+    except ValueError:
+        return None
+
+
+# --- Métricas de verificación (por worker) ---
+
+class MetricasVerificacion:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self.total = 0
+            self.rehashes = 0
+            self.por_costo = {} # costo -> {'cantidad', 'suma_ms', 'histograma'}
+            self.recientes = deque(maxlen=MUESTRAS_RECIENTES)
+
+    def registrar(self, costo, ms):
+        with self._lock:
+            self.total += 1
+            self.recientes.append(ms)
+            datos = self.por_costo.setdefault(costo, {
+                'cantidad': 0, 'suma_ms': 0.0, 'histograma': [0] * (len(LIMITES_HISTOGRAMA_MS) + 1)
+            })
+            datos['cantidad'] += 1
+            datos['suma_ms'] += ms
+            indice = next((i for i, limite in enumerate(LIMITES_HISTOGRAMA_MS) if ms <= limite), len(LIMITES_HISTOGRAMA_MS))
+            datos['histograma'][indice] += 1
+
+    def registrar_rehash(self):
+        with self._lock:
+            self.rehashes += 1
+
+    def resumen(self):
+        with self._lock:
+            recientes = sorted(self.recientes)
+            percentil = lambda p: round(recientes[min(len(recientes) - 1, int(len(recientes) * p))], 1) if recientes else None
+            limites = list(LIMITES_HISTOGRAMA_MS) + [None] # None: más que el último límite
+            return {
+                'total': self.total,
+                'rehashes': self.rehashes,
+                'recientes': {
+                    'muestras': len(recientes),
+                    'p50_ms': percentil(0.50),
+                    'p95_ms': percentil(0.95),
+                    'p99_ms': percentil(0.99),
+                    'max_ms': round(recientes[-1], 1) if recientes else None,
+                },
+                'por_costo': {
+                    str(costo): {
+                        'cantidad': datos['cantidad'],
+                        'promedio_ms': round(datos['suma_ms'] / datos['cantidad'], 1),
+                        'histograma': [
+                            {'hasta_ms': limite, 'cantidad': cantidad}
+                            for limite, cantidad in zip(limites, datos['histograma'])
+                        ],
+                    }
+                    for costo, datos in sorted(self.por_costo.items(), key=lambda item: str(item[0]))
+                },
+            }
+
+
+metricas = MetricasVerificacion()
+
+
+def verificar_contrasena(user, password, rehash=True):
+    """
+    bcrypt.check_password_hash con medición de tiempo. Si la contraseña es correcta y el hash
+    guardado usa un costo distinto de BCRYPT_LOG_ROUNDS, se reemplaza (con commit) por uno nuevo.
+    Los hashes que no son bcrypt (cuentas creadas por OAuth) nunca coinciden.
+    """
+    costo = costo_de_hash(user.password)
+    if costo is None:
+        return False
+    inicio = time.perf_counter()
+    correcta = bcrypt.check_password_hash(user.password, password)
+    metricas.registrar(costo, (time.perf_counter() - inicio) * 1000)
+
+    objetivo = current_app.config.get('BCRYPT_LOG_ROUNDS') or COSTO_POR_DEFECTO
+    if correcta and rehash and costo != objetivo:
+        try:
+            user.password = bcrypt.generate_password_hash(password, objetivo).decode('utf-8')
+            db.session.commit()
+            metricas.registrar_rehash()
+            print(f"DEBUG: Hash del usuario {user.id} actualizado de log_rounds={costo} a {objetivo}")
+        except Exception as e:
+            # El login sigue siendo válido aunque no se pueda guardar el nuevo hash
+            db.session.rollback()
+            current_app.logger.error(f"Error al actualizar el hash del usuario {user.id}: {e}")
+    return correcta
+
+
+@hashing_bp.route('/admin/metricas/bcrypt')
+@role_required('Superuser')
+def metricas_bcrypt():
+    """Distribución de tiempos de verificación de contraseñas en este worker."""
+    return jsonify({
+        'success': True,
+        'log_rounds': current_app.config.get('BCRYPT_LOG_ROUNDS'),
+        'objetivo_ms': current_app.config.get('BCRYPT_TARGET_MS'),
+        **metricas.resumen(),
+    })
+
+
+# --- Calibración ---
+
+def medir_costo(log_rounds, muestras):
+    """Mediana en ms de `muestras` hashes con el costo dado."""
+    salt_password = b'calibracion-de-bcrypt'
+    tiempos = []
+    for _ in range(muestras):
+        inicio = time.perf_counter()
+        bcrypt_lib.hashpw(salt_password, bcrypt_lib.gensalt(rounds=log_rounds))
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+@hashing_bp.cli.command('calibrar')
+@click.option('--objetivo-ms', type=float, default=None, help='Tiempo objetivo por hash (BCRYPT_TARGET_MS).')
+@click.option('--muestras', default=5, show_default=True, help='Hashes medidos por costo (se usa la mediana).')
+@click.option('--dry-run', is_flag=True, help=f'Solo muestra las mediciones, sin escribir instance/{ARCHIVO_CALIBRACION}.')
+def calibrar_command(objetivo_ms, muestras, dry_run):
+    """Elige el mayor log_rounds cuyo hash tarda como mucho el tiempo objetivo en este equipo."""
+    objetivo_ms = objetivo_ms or current_app.config.get('BCRYPT_TARGET_MS', 250)
+    elegido, medido = None, None
+    for log_rounds in range(4, COSTO_MAXIMO + 1):
+        ms = medir_costo(log_rounds, muestras)
+        marca = ''
+        if ms <= objetivo_ms:
+            elegido, medido = log_rounds, ms
+            marca = ' <= objetivo'
+        click.echo(f'  log_rounds={log_rounds:2d}: {ms:8.1f} ms{marca}')
+        # Cada ronda duplica el tiempo: no hace falta medir más allá del objetivo
+        if ms > objetivo_ms:
+            break
+
+    if elegido is None or elegido < COSTO_MINIMO:
+        click.echo(f'Ningún costo >= {COSTO_MINIMO} cabe en {objetivo_ms:g} ms; se usa el mínimo {COSTO_MINIMO}.')
+        elegido, medido = COSTO_MINIMO, medir_costo(COSTO_MINIMO, muestras)
+    click.echo(f'log_rounds={elegido} ({medido:.1f} ms por hash, objetivo {objetivo_ms:g} ms).')
+    if os.environ.get('BCRYPT_LOG_ROUNDS'):
+        click.echo('Aviso: BCRYPT_LOG_ROUNDS está definido en el entorno y tiene prioridad sobre la calibración.')
+    if dry_run:
+        return
+
+    destino = ruta_calibracion(current_app)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    datos = {
+        'log_rounds': elegido,
+        'medido_ms': round(medido, 1),
+        'objetivo_ms': objetivo_ms,
+        'calibrado_en': datetime.utcnow().isoformat(timespec='seconds'),
+    }
+    fd, temporal = tempfile.mkstemp(dir=os.path.dirname(destino), prefix='.bcrypt.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(datos, f, indent=4)
+        os.replace(temporal, destino)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    click.echo(f'Guardado en {destino}. Reinicia la aplicación para aplicarlo; '
+               'los hashes existentes se actualizan en el siguiente login de cada usuario.')
@@ -0,0 +1,133 @@
+# http_cache.py
+# Capa reutilizable de respuestas condicionales (ETag / Last-Modified).
+# Permite que los Blueprints respondan 304 Not Modified sin renderizar la plantilla
+# ni generar la exportación cuando el navegador ya tiene la versión vigente.
+from functools import wraps
+from datetime import datetime, timezone
+import hashlib
+
+from flask import request, session, make_response, current_app
+
+
+def generar_etag(*partes):
+    """
+    Genera un identificador estable a partir de los valores que determinan el contenido
+    de la respuesta (IDs, fechas de actualización, mtime de archivos, etc.).
+    """
+    huella = hashlib.sha1()
+    for parte in partes:
+        huella.update(repr(parte).encode('utf-8'))
+        huella.update(b'\x00')
+    return huella.hexdigest()
+
+
+def a_utc(fecha):
+    """
+    Normaliza una fecha para usarla como Last-Modified.
+    Las fechas de los modelos se guardan con datetime.utcnow() (sin zona horaria),
+    por lo que se interpretan como UTC. Se truncan los microsegundos porque la
+    cabecera HTTP solo tiene precisión de segundos.
+    """
+    if fecha is None:
+        return None
+    if isinstance(fecha, (int, float)):
+        fecha = datetime.fromtimestamp(fecha, tz=timezone.utc)
+    elif fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return fecha.replace(microsecond=0)
+
+
+def huella_plantilla():
+    """
+    Datos de la sesión y del contexto global que alteran el HTML de base.html/navbar.html
+    (usuario, rol, tema, idioma y la última versión inyectada por el context processor).
+    Las vistas HTML deben incluirlos en el ETag para no servir una página de otro usuario.
+    """
+    # Importación local para evitar dependencias circulares con version.py
+    from version import ultima_version as consultar_ultima_version
+
+    try:
+        ultima_version = consultar_ultima_version()
+    except Exception:
+        ultima_version = None
+
+    return (
+        session.get('logged_in', False),
+        session.get('user_id'),
+        session.get('role'),
+        session.get('theme'),
+        session.get('lang') or request.headers.get('Accept-Language', ''),
+        tuple(ultima_version) if ultima_version else None,
+    )
+
+
+def _no_modificado(etag, debil, ultima_modificacion):
+    """
+    Evalúa If-None-Match / If-Modified-Since según RFC 9110:
+    If-None-Match tiene prioridad y, si está presente, If-Modified-Since se ignora.
+    """
+    if request.if_none_match:
+        if debil:
+            return request.if_none_match.contains_weak(etag)
+        return request.if_none_match.contains(etag) or '*' in request.if_none_match
+    if ultima_modificacion is not None and request.if_modified_since is not None:
+        return ultima_modificacion <= request.if_modified_since
+    return False
+
+
+def _aplicar_validadores(response, etag, debil, ultima_modificacion, privada, por_sesion):
+    response.set_etag(etag, weak=debil)
+    if ultima_modificacion is not None:
+        response.last_modified = ultima_modificacion
+    # no-cache obliga a revalidar siempre: el navegador guarda la copia pero pregunta antes de usarla.
+    response.cache_control.no_cache = True
+    if privada:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    if por_sesion:
+        response.vary.add('Cookie')
+    return response
+
+
+def respuesta_condicional(validador, debil=False, privada=True, por_sesion=False):
+    """
+    Decorador para vistas GET cacheables.
+
+    `validador` recibe los mismos argumentos que la vista y devuelve una tupla
+    `(semilla, ultima_modificacion)` calculada con consultas baratas (IDs y fechas de
+    actualización, mtime de archivos). Si devuelve None la vista se ejecuta sin validadores.
+    - `debil`: usa un ETag débil (W/"...") para contenido semánticamente equivalente (HTML).
+    - `privada`: marca la respuesta como Cache-Control: private.
+    - `por_sesion`: incluye huella_plantilla() en el ETag y añade Vary: Cookie.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return f(*args, **kwargs)
+            # Los mensajes flash pendientes se muestran una sola vez; no se puede responder 304.
+            if por_sesion and session.get('_flashes'):
+                return f(*args, **kwargs)
+
+            validadores = validador(*args, **kwargs)
+            if validadores is None:
+                return f(*args, **kwargs)
+            semilla, ultima_modificacion = validadores
+            ultima_modificacion = a_utc(ultima_modificacion)
+
+            partes = [request.endpoint, semilla]
+            if por_sesion:
+                partes.append(huella_plantilla())
+            etag = generar_etag(*partes)
+
+            if _no_modificado(etag, debil, ultima_modificacion):
+                response = current_app.response_class(status=304)
+                return _aplicar_validadores(response, etag, debil, ultima_modificacion, privada, por_sesion)
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                _aplicar_validadores(response, etag, debil, ultima_modificacion, privada, por_sesion)
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,231 @@
+# mantenimiento.py
+# Mantenimiento de la base SQLite: estadísticas del planificador y espacio libre.
+# - estadisticas() informa tamaño, páginas libres y tamaño por tabla (con sus índices) vía dbstat.
+# - ANALYZE la primera vez y después PRAGMA optimize, ambos acotados con analysis_limit.
+# - Las páginas libres que dejan los borrados se devuelven al sistema con PRAGMA incremental_vacuum
+#   en pasos de DB_MAINTENANCE_PAGES_PER_STEP páginas con una pausa entre pasos: cada paso es una
+#   transacción corta y los escritores no esperan a que termine todo. Requiere auto_vacuum=INCREMENTAL,
+#   que se activa una sola vez con `flask mantenimiento ejecutar --activar-incremental` (VACUUM completo).
+# - El trabajo periódico corre de madrugada y guarda el antes/después en instance/mantenimiento_db.json.
+import os
+import json
+import time
+from datetime import datetime
+from functools import wraps
+
+import click
+from flask import Blueprint, current_app, jsonify, session, flash, redirect, url_for
+from sqlalchemy.exc import OperationalError
+
+from models import db
+from programador import periodica
+from storage import formato_bytes
+
+mantenimiento_bp = Blueprint('mantenimiento', __name__)
+
+MODOS_AUTO_VACUUM = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+def role_required(roles):
+    if not isinstance(roles, list):
+        roles = [roles]
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if 'logged_in' not in session or not session['logged_in']:
+                flash('Por favor, inicia sesión para acceder a esta página.', 'info')
+                return redirect(url_for('login'))
+            if session.get('role') not in roles:
+                flash('No tienes permiso para acceder a esta página.', 'danger')
+                return redirect(url_for('home'))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def _conexion():
+    # AUTOCOMMIT: cada PRAGMA (y cada paso de incremental_vacuum) es su propia transacción
+    return db.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+
+
+def _pragma(conexion, nombre):
+    return conexion.exec_driver_sql(f'PRAGMA {nombre}').scalar()
+
+
+def _ruta_informe():
+    return os.path.join(current_app.instance_path, 'mantenimiento_db.json')
+
+
+def estadisticas(conexion, por_tabla=True):
+    """Tamaño, páginas libres, modo de auto_vacuum, si hay estadísticas y (opcional) tamaño por tabla."""
+    tamano_pagina = _pragma(conexion, 'page_size')
+    paginas = _pragma(conexion, 'page_count')
+    libres = _pragma(conexion, 'freelist_count')
+    datos = {
+        'bytes': paginas * tamano_pagina,
+        'paginas': paginas,
+        'paginas_libres': libres,
+        'proporcion_libre': round(libres / paginas, 4) if paginas else 0.0,
+        'auto_vacuum': MODOS_AUTO_VACUUM.get(_pragma(conexion, 'auto_vacuum'), '?'),
+        'analizada': conexion.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").first() is not None,
+        'tablas': None,
+    }
+    if por_tabla:
+        try:
+            # aggregate=TRUE: una fila por tabla o índice en lugar de una por página
+            filas = conexion.exec_driver_sql(
+                "SELECT COALESCE(m.tbl_name, s.name), s.name = COALESCE(m.tbl_name, s.name), "
+                "s.pgsize, s.pageno, s.unused "
+                "FROM dbstat AS s LEFT JOIN sqlite_master AS m ON m.name = s.name "
+                "WHERE s.aggregate = TRUE").all()
+        except OperationalError:
+            # SQLite compilado sin SQLITE_ENABLE_DBSTAT_VTAB
+            return datos
+        tablas = {}
+        for tabla, es_tabla, bytes_, paginas_objeto, sin_usar in filas:
+            fila = tablas.setdefault(tabla, {'tabla': tabla, 'bytes': 0, 'bytes_indices': 0, 'paginas': 0,
+                                             'bytes_sin_usar': 0})
+            fila['bytes' if es_tabla else 'bytes_indices'] += bytes_
+            fila['paginas'] += paginas_objeto
+            fila['bytes_sin_usar'] += sin_usar
+        datos['tablas'] = sorted(tablas.values(), key=lambda f: f['bytes'] + f['bytes_indices'], reverse=True)
+    return datos
+
+
+def analizar(conexion):
+    """ANALYZE si nunca se analizó; si no, PRAGMA optimize sobre todas las tablas. Devuelve lo hecho."""
+    conexion.exec_driver_sql(f"PRAGMA analysis_limit = {int(current_app.config.get('DB_ANALYSIS_LIMIT', 1000))}")
+    if not estadisticas(conexion, por_tabla=False)['analizada']:
+        conexion.exec_driver_sql('ANALYZE')
+        return 'ANALYZE'
+    # 0x10002: analizar las tablas que lo necesiten, no solo las que usó esta conexión
+    conexion.exec_driver_sql('PRAGMA optimize = 0x10002')
+    return 'optimize'
+
+
+def vaciar_incremental(conexion, paginas_por_paso, max_paginas, pausa, max_segundos):
+    """PRAGMA incremental_vacuum por pasos hasta vaciar la lista libre o agotar el presupuesto."""
+    metricas = {'pasos': 0, 'paginas_liberadas': 0, 'paso_mas_largo_ms': 0.0}
+    limite = time.monotonic() + max_segundos
+    while metricas['paginas_liberadas'] < max_paginas and time.monotonic() < limite:
+        libres = _pragma(conexion, 'freelist_count')
+        if not libres:
+            break
+        paso = min(paginas_por_paso, max_paginas - metricas['paginas_liberadas'])
+        inicio = time.perf_counter()
+        # execute() de sqlite3 da un solo paso a la sentencia (una página); executescript la completa
+        conexion.connection.driver_connection.executescript(f'PRAGMA incremental_vacuum({int(paso)})')
+        metricas['paso_mas_largo_ms'] = max(metricas['paso_mas_largo_ms'], (time.perf_counter() - inicio) * 1000)
+        metricas['pasos'] += 1
+        metricas['paginas_liberadas'] += libres - _pragma(conexion, 'freelist_count')
+        time.sleep(pausa)
+    metricas['paso_mas_largo_ms'] = round(metricas['paso_mas_largo_ms'], 1)
+    return metricas
+
+
+def ejecutar_mantenimiento(paginas_por_paso=None, max_paginas=None, pausa_ms=None, max_segundos=None,
+                           activar_incremental=False):
+    """Analiza y recupera espacio; devuelve (y guarda en instance/) las cifras de antes y después."""
+    config = current_app.config
+    paginas_por_paso = paginas_por_paso or config.get('DB_MAINTENANCE_PAGES_PER_STEP', 200)
+    max_paginas = max_paginas or config.get('DB_MAINTENANCE_MAX_PAGES', 20000)
+    pausa_ms = config.get('DB_MAINTENANCE_PAUSE_MS', 50) if pausa_ms is None else pausa_ms
+    max_segundos = max_segundos or config.get('DB_MAINTENANCE_MAX_SECONDS', 60)
+
+    inicio = time.perf_counter()
+    with _conexion() as conexion:
+        antes = estadisticas(conexion)
+        informe = {'inicio': datetime.now().isoformat(timespec='seconds'), 'antes': antes, 'vacuum': None}
+        if activar_incremental and antes['auto_vacuum'] != 'incremental':
+            # El modo solo cambia al reconstruir el archivo; bloquea la base mientras dura
+            conexion.exec_driver_sql('PRAGMA auto_vacuum = INCREMENTAL')
+            t = time.perf_counter()
+            conexion.exec_driver_sql('VACUUM')
+            informe['vacuum'] = {'completo_s': round(time.perf_counter() - t, 3)}
+
+        t = time.perf_counter()
+        informe['analisis'] = analizar(conexion)
+        informe['analisis_s'] = round(time.perf_counter() - t, 3)
+
+        if _pragma(conexion, 'auto_vacuum') == 2:
+            informe['vacuum'] = {**(informe['vacuum'] or {}),
+                                 **vaciar_incremental(conexion, paginas_por_paso, max_paginas, pausa_ms / 1000,
+                                                      max_segundos)}
+        informe['despues'] = estadisticas(conexion)
+    informe['duracion_s'] = round(time.perf_counter() - inicio, 3)
+
+    with open(_ruta_informe(), 'w') as f:
+        json.dump(informe, f, indent=4)
+    return informe
+
+
+def _resumen(datos):
+    return (f"{formato_bytes(datos['bytes'])}, {datos['paginas']} páginas, {datos['paginas_libres']} libres "
+            f"({datos['proporcion_libre']:.1%}), auto_vacuum={datos['auto_vacuum']}, "
+            f"{'con' if datos['analizada'] else 'sin'} estadísticas")
+
+
+def _resumen_informe(informe):
+    lineas = [f"Antes:   {_resumen(informe['antes'])}",
+              f"Después: {_resumen(informe['despues'])}",
+              f"Análisis ({informe['analisis']}) en {informe['analisis_s']:.2f} s; total {informe['duracion_s']:.2f} s"]
+    vacuum = informe['vacuum']
+    if vacuum is None:
+        lineas.append('Sin vacuum incremental: auto_vacuum no es INCREMENTAL (usa --activar-incremental una vez).')
+    else:
+        if 'completo_s' in vacuum:
+            lineas.append(f"VACUUM completo para activar auto_vacuum=INCREMENTAL en {vacuum['completo_s']:.2f} s")
+        if 'pasos' in vacuum:
+            lineas.append(f"incremental_vacuum: {vacuum['paginas_liberadas']} páginas en {vacuum['pasos']} pasos, "
+                          f"paso más largo {vacuum['paso_mas_largo_ms']:.1f} ms")
+    return '\n'.join(lineas)
+
+
+@periodica('mantenimiento.base_de_datos', cron='45 4 * * *')
+def mantenimiento_diario():
+    informe = ejecutar_mantenimiento()
+    print(f"DEBUG: Mantenimiento de la base de datos\n{_resumen_informe(informe)}")
+
+
+@mantenimiento_bp.route('/admin/mantenimiento')
+@role_required('Superuser')
+def estado_mantenimiento():
+    """Estado actual de la base y el informe de la última ejecución."""
+    try:
+        with open(_ruta_informe()) as f:
+            ultimo = json.load(f)
+    except (OSError, ValueError):
+        ultimo = None
+    with _conexion() as conexion:
+        actual = estadisticas(conexion)
+    return jsonify({'success': True, 'actual': actual, 'ultimo': ultimo})
+
+
+@mantenimiento_bp.cli.command('estadisticas')
+@click.option('--tablas', default=15, show_default=True, help='Tablas a listar, de mayor a menor.')
+def estadisticas_command(tablas):
+    """Tamaño de la base, páginas libres y tamaño por tabla."""
+    with _conexion() as conexion:
+        datos = estadisticas(conexion)
+    click.echo(_resumen(datos))
+    if datos['tablas'] is None:
+        click.echo('dbstat no está disponible en este SQLite.')
+        return
+    for fila in datos['tablas'][:tablas]:
+        click.echo(f"  {fila['tabla']:<30} {formato_bytes(fila['bytes']):>10} + índices "
+                   f"{formato_bytes(fila['bytes_indices']):>10} ({formato_bytes(fila['bytes_sin_usar'])} sin usar)")
+
+
+@mantenimiento_bp.cli.command('ejecutar')
+@click.option('--paginas-por-paso', type=int, default=None, help='Páginas por paso (DB_MAINTENANCE_PAGES_PER_STEP).')
+@click.option('--max-paginas', type=int, default=None, help='Páginas liberadas como máximo (DB_MAINTENANCE_MAX_PAGES).')
+@click.option('--pausa-ms', type=float, default=None, help='Pausa entre pasos (DB_MAINTENANCE_PAUSE_MS).')
+@click.option('--activar-incremental', is_flag=True,
+              help='Pasar a auto_vacuum=INCREMENTAL con un VACUUM completo (bloquea la base mientras dura).')
+def ejecutar_command(paginas_por_paso, max_paginas, pausa_ms, activar_incremental):
+    """ANALYZE/optimize y vacuum incremental acotado, con las cifras de antes y después."""
+    informe = ejecutar_mantenimiento(paginas_por_paso, max_paginas, pausa_ms,
+                                     activar_incremental=activar_incremental)
+    click.echo(_resumen_informe(informe))
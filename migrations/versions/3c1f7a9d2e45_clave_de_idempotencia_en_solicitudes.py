@@ -0,0 +1,28 @@
+"""Clave de idempotencia en solicitudes
+
+Revision ID: 3c1f7a9d2e45
+Revises: f6114398f620
+Create Date: 2026-10-19 09:12:41.218305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f7a9d2e45'
+down_revision = 'f6114398f620'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('solicitudes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('clave_idempotencia', sa.String(length=64), nullable=True))
+        batch_op.create_unique_constraint('uq_solicitudes_clave_idempotencia', ['clave_idempotencia'])
+
+
+def downgrade():
+    with op.batch_alter_table('solicitudes', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_solicitudes_clave_idempotencia', type_='unique')
+        batch_op.drop_column('clave_idempotencia')
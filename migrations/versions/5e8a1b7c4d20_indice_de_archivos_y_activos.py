@@ -0,0 +1,83 @@
+"""Tablas de archivos e índice de activos de la aplicación
+
+Revision ID: 5e8a1b7c4d20
+Revises: 3c1f7a9d2e45
+Create Date: 2026-10-19 10:47:03.512874
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8a1b7c4d20'
+down_revision = '3c1f7a9d2e45'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('files',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('original_filename', sa.String(length=255), nullable=False),
+    sa.Column('unique_filename', sa.String(length=255), nullable=False),
+    sa.Column('file_path', sa.String(length=500), nullable=False),
+    sa.Column('file_type', sa.String(length=20), nullable=False),
+    sa.Column('mime_type', sa.String(length=150), nullable=False),
+    sa.Column('upload_date', sa.DateTime(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('is_visible', sa.Boolean(), nullable=False),
+    sa.Column('is_used', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('unique_filename')
+    )
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_files_file_type'), ['file_type'], unique=False)
+        batch_op.create_index('ix_files_user_id_upload_date', ['user_id', 'upload_date'], unique=False)
+
+    op.create_table('app_assets',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('folder_name', sa.String(length=50), nullable=False),
+    sa.Column('directory', sa.String(length=500), nullable=False),
+    sa.Column('file_path', sa.String(length=500), nullable=False),
+    sa.Column('original_filename', sa.String(length=255), nullable=False),
+    sa.Column('file_type', sa.String(length=20), nullable=False),
+    sa.Column('mime_type', sa.String(length=150), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('upload_date', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('file_path')
+    )
+    with op.batch_alter_table('app_assets', schema=None) as batch_op:
+        batch_op.create_index('ix_app_assets_directory', ['directory'], unique=False)
+        batch_op.create_index('ix_app_assets_upload_date', ['upload_date'], unique=False)
+        batch_op.create_index('ix_app_assets_file_type_upload_date', ['file_type', 'upload_date'], unique=False)
+
+    op.create_table('app_asset_directories',
+    sa.Column('path', sa.String(length=500), nullable=False),
+    sa.Column('parent', sa.String(length=500), nullable=True),
+    sa.Column('folder_name', sa.String(length=50), nullable=False),
+    sa.Column('mtime_ns', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('path')
+    )
+    with op.batch_alter_table('app_asset_directories', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_app_asset_directories_parent'), ['parent'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('app_asset_directories', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_app_asset_directories_parent'))
+
+    op.drop_table('app_asset_directories')
+    with op.batch_alter_table('app_assets', schema=None) as batch_op:
+        batch_op.drop_index('ix_app_assets_file_type_upload_date')
+        batch_op.drop_index('ix_app_assets_upload_date')
+        batch_op.drop_index('ix_app_assets_directory')
+
+    op.drop_table('app_assets')
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_index('ix_files_user_id_upload_date')
+        batch_op.drop_index(batch_op.f('ix_files_file_type'))
+
+    op.drop_table('files')
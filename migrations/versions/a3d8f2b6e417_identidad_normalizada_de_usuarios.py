@@ -0,0 +1,95 @@
+"""Identidad normalizada de usuarios
+
+Revision ID: a3d8f2b6e417
+Revises: f1c7a5e9b384
+Create Date: 2026-10-19 22:41:09.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3d8f2b6e417'
+down_revision = 'f1c7a5e9b384'
+branch_labels = None
+depends_on = None
+
+
+# Copia de models.normalizar_identificador / normalizar_telefono: la migración no debe
+# depender de cómo evolucione models.py
+PREFIJO_TELEFONO_POR_DEFECTO = '506'
+
+
+def normalizar_identificador(valor):
+    valor = (valor or '').strip().casefold()
+    return valor or None
+
+
+def normalizar_telefono(valor):
+    valor = (valor or '').strip()
+    digitos = ''.join(c for c in valor if c.isdigit())
+    if not digitos:
+        return None
+    if not valor.startswith('+'):
+        if digitos.startswith('00'):
+            digitos = digitos[2:]
+        elif len(digitos) == 8:
+            digitos = PREFIJO_TELEFONO_POR_DEFECTO + digitos
+    return '+' + digitos
+
+
+def upgrade():
+    conexion = op.get_bind()
+    filas = conexion.execute(sa.text('SELECT id, username, email, telefono FROM user ORDER BY id')).all()
+    normalizados = [
+        (id_, normalizar_identificador(username), normalizar_identificador(email), normalizar_telefono(telefono))
+        for id_, username, email, telefono in filas
+    ]
+
+    # Antes de tocar el esquema: dos cuentas que solo difieren en mayúsculas o espacios
+    # ('Ana' y 'ana') no pueden compartir el índice único. Se deben unificar a mano.
+    colisiones = []
+    for posicion, campo in ((1, 'username'), (2, 'email')):
+        vistos = {}
+        for fila in normalizados:
+            if fila[posicion] is None:
+                continue
+            if fila[posicion] in vistos:
+                colisiones.append(f'{campo}={fila[posicion]!r}: usuarios {vistos[fila[posicion]]} y {fila[0]}')
+            else:
+                vistos[fila[posicion]] = fila[0]
+    if colisiones:
+        raise RuntimeError(
+            'Hay cuentas que solo difieren en mayúsculas o espacios; renómbralas antes de migrar:\n  '
+            + '\n  '.join(colisiones)
+        )
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('username_norm', sa.String(length=80), nullable=True))
+        batch_op.add_column(sa.Column('email_norm', sa.String(length=120), nullable=True))
+        batch_op.add_column(sa.Column('telefono_norm', sa.String(length=20), nullable=True))
+
+    actualizar = sa.text(
+        'UPDATE user SET username_norm = :username, email_norm = :email, telefono_norm = :telefono WHERE id = :id'
+    )
+    if normalizados:
+        conexion.execute(actualizar, [
+            {'id': id_, 'username': username, 'email': email, 'telefono': telefono}
+            for id_, username, email, telefono in normalizados
+        ])
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index('ix_user_username_norm', ['username_norm'], unique=True)
+        batch_op.create_index('ix_user_email_norm', ['email_norm'], unique=True)
+        batch_op.create_index('ix_user_telefono_norm', ['telefono_norm'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_telefono_norm')
+        batch_op.drop_index('ix_user_email_norm')
+        batch_op.drop_index('ix_user_username_norm')
+        batch_op.drop_column('telefono_norm')
+        batch_op.drop_column('email_norm')
+        batch_op.drop_column('username_norm')
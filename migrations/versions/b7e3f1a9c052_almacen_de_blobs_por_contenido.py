@@ -0,0 +1,35 @@
+"""Almacén de blobs por contenido
+
+Revision ID: b7e3f1a9c052
+Revises: 9c2d4e6f8a13
+Create Date: 2026-10-19 14:22:18.640251
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3f1a9c052'
+down_revision = '9c2d4e6f8a13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('blobs',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('path', sa.String(length=255), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('mime_type', sa.String(length=150), nullable=True),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('sha256'),
+    sa.UniqueConstraint('path')
+    )
+    # Las subidas existentes se mueven al almacén con `flask storage deduplicar`
+    # (requiere la app para conocer las carpetas de subida y reporta el espacio liberado).
+
+
+def downgrade():
+    op.drop_table('blobs')
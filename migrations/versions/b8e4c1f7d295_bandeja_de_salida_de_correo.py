@@ -0,0 +1,46 @@
+"""Bandeja de salida de correo
+
+Revision ID: b8e4c1f7d295
+Revises: a3d8f2b6e417
+Create Date: 2026-10-19 23:37:52.804611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e4c1f7d295'
+down_revision = 'a3d8f2b6e417'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('mail_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('destinatario', sa.String(length=320), nullable=False),
+    sa.Column('remitente', sa.String(length=320), nullable=True),
+    sa.Column('asunto', sa.String(length=255), nullable=False),
+    sa.Column('cuerpo', sa.Text(), nullable=False),
+    sa.Column('html', sa.Text(), nullable=True),
+    sa.Column('lote', sa.String(length=36), nullable=True),
+    sa.Column('estado', sa.String(length=12), nullable=False),
+    sa.Column('intentos', sa.Integer(), nullable=False),
+    sa.Column('disponible_en', sa.DateTime(), nullable=False),
+    sa.Column('ultimo_error', sa.Text(), nullable=True),
+    sa.Column('creado_en', sa.DateTime(), nullable=False),
+    sa.Column('enviado_en', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('mail_outbox', schema=None) as batch_op:
+        batch_op.create_index('ix_mail_outbox_estado_disponible', ['estado', 'disponible_en'], unique=False)
+        batch_op.create_index(batch_op.f('ix_mail_outbox_lote'), ['lote'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('mail_outbox', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_mail_outbox_lote'))
+        batch_op.drop_index('ix_mail_outbox_estado_disponible')
+
+    op.drop_table('mail_outbox')
@@ -0,0 +1,47 @@
+"""Cola de tareas en segundo plano
+
+Revision ID: c4a9e7d2b516
+Revises: b8e4c1f7d295
+Create Date: 2026-10-20 00:48:15.207392
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a9e7d2b516'
+down_revision = 'b8e4c1f7d295'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('task_queue',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('nombre', sa.String(length=100), nullable=False),
+    sa.Column('argumentos', sa.Text(), nullable=False),
+    sa.Column('prioridad', sa.Integer(), nullable=False),
+    sa.Column('estado', sa.String(length=12), nullable=False),
+    sa.Column('intentos', sa.Integer(), nullable=False),
+    sa.Column('max_intentos', sa.Integer(), nullable=False),
+    sa.Column('disponible_en', sa.Float(), nullable=False),
+    sa.Column('programada_en', sa.Float(), nullable=False),
+    sa.Column('creada_en', sa.Float(), nullable=False),
+    sa.Column('iniciada_en', sa.Float(), nullable=True),
+    sa.Column('terminada_en', sa.Float(), nullable=True),
+    sa.Column('trabajador', sa.String(length=120), nullable=True),
+    sa.Column('ultimo_error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('task_queue', schema=None) as batch_op:
+        batch_op.create_index('ix_task_queue_estado_disponible', ['estado', 'disponible_en'], unique=False)
+        batch_op.create_index('ix_task_queue_estado_terminada', ['estado', 'terminada_en'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('task_queue', schema=None) as batch_op:
+        batch_op.drop_index('ix_task_queue_estado_terminada')
+        batch_op.drop_index('ix_task_queue_estado_disponible')
+
+    op.drop_table('task_queue')
@@ -0,0 +1,46 @@
+"""Uso de almacenamiento por usuario y tamaño de archivos
+
+Revision ID: d2a6c8e4f173
+Revises: b7e3f1a9c052
+Create Date: 2026-10-19 19:41:05.318207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a6c8e4f173'
+down_revision = 'b7e3f1a9c052'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('size', sa.BigInteger(), nullable=True))
+
+    op.create_table('user_storage',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('category', sa.String(length=20), nullable=False),
+    sa.Column('bytes_used', sa.BigInteger(), nullable=False),
+    sa.Column('file_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'category')
+    )
+
+    # Tamaño conocido por el almacén de blobs; los archivos anteriores al almacén quedan en NULL
+    # hasta `flask files reconciliar-almacenamiento --corregir`, que los mide en disco.
+    op.execute('UPDATE files SET size = (SELECT blobs.size FROM blobs WHERE blobs.path = files.file_path)')
+    op.execute(
+        'INSERT INTO user_storage (user_id, category, bytes_used, file_count) '
+        'SELECT user_id, file_type, COALESCE(SUM(size), 0), COUNT(*) FROM files '
+        'WHERE user_id IS NOT NULL GROUP BY user_id, file_type'
+    )
+
+
+def downgrade():
+    op.drop_table('user_storage')
+
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_column('size')
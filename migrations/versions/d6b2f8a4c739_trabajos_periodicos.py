@@ -0,0 +1,37 @@
+"""Trabajos periódicos del programador
+
+Revision ID: d6b2f8a4c739
+Revises: c4a9e7d2b516
+Create Date: 2026-10-20 01:56:40.113958
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6b2f8a4c739'
+down_revision = 'c4a9e7d2b516'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('scheduler_jobs',
+    sa.Column('nombre', sa.String(length=100), nullable=False),
+    sa.Column('proxima_en', sa.Float(), nullable=False),
+    sa.Column('bloqueado_hasta', sa.Float(), nullable=True),
+    sa.Column('propietario', sa.String(length=120), nullable=True),
+    sa.Column('ultimo_inicio', sa.Float(), nullable=True),
+    sa.Column('ultimo_exito', sa.Float(), nullable=True),
+    sa.Column('ultima_duracion', sa.Float(), nullable=True),
+    sa.Column('ultimo_error', sa.Text(), nullable=True),
+    sa.Column('ejecuciones', sa.Integer(), nullable=False),
+    sa.Column('fallos', sa.Integer(), nullable=False),
+    sa.Column('fallos_seguidos', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('nombre')
+    )
+
+
+def downgrade():
+    op.drop_table('scheduler_jobs')
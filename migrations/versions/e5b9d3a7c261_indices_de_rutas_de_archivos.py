@@ -0,0 +1,33 @@
+"""Índices en las columnas de ruta de archivos
+
+Revision ID: e5b9d3a7c261
+Revises: d2a6c8e4f173
+Create Date: 2026-10-19 20:12:47.904113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b9d3a7c261'
+down_revision = 'd2a6c8e4f173'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # `flask storage gc` y el almacén de blobs buscan por ruta en las tablas más grandes
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_files_file_path'), ['file_path'], unique=False)
+
+    with op.batch_alter_table('fotografias_vehiculos', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_fotografias_vehiculos_url_foto'), ['url_foto'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('fotografias_vehiculos', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_fotografias_vehiculos_url_foto'))
+
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_files_file_path'))
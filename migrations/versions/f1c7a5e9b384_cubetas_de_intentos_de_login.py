@@ -0,0 +1,35 @@
+"""Cubetas compartidas de intentos de login
+
+Revision ID: f1c7a5e9b384
+Revises: e5b9d3a7c261
+Create Date: 2026-10-19 21:03:26.557120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c7a5e9b384'
+down_revision = 'e5b9d3a7c261'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('login_throttle',
+    sa.Column('clave', sa.String(length=320), nullable=False),
+    sa.Column('fichas', sa.Float(), nullable=False),
+    sa.Column('actualizado', sa.Float(), nullable=False),
+    sa.Column('permitido', sa.Boolean(), nullable=False),
+    sa.PrimaryKeyConstraint('clave')
+    )
+    with op.batch_alter_table('login_throttle', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_login_throttle_actualizado'), ['actualizado'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('login_throttle', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_login_throttle_actualizado'))
+
+    op.drop_table('login_throttle')
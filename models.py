@@ -6,14 +6,42 @@ from datetime import datetime, date, time
 import json
 from itsdangerous import URLSafeTimedSerializer as Serializer
 from flask import current_app
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Float, Boolean, Date, Time, UniqueConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Float, Boolean, Date, Time, UniqueConstraint, Index
+from sqlalchemy.orm import relationship, validates
 import sqlalchemy as sa
 
 db = SQLAlchemy()
 bcrypt = Bcrypt()
 migrate = Migrate()
 
+# --- NORMALIZACIÓN DE IDENTIDAD ---
+# Usuario y correo se comparan sin distinguir mayúsculas ni espacios; el teléfono en formato E.164.
+# Los valores normalizados se guardan en columnas indexadas (username_norm, email_norm, telefono_norm)
+# para que las búsquedas de login y registro usen el índice en lugar de lower() sobre toda la tabla.
+PREFIJO_TELEFONO_POR_DEFECTO = '506' # Costa Rica: números locales de 8 dígitos
+
+def normalizar_identificador(valor):
+    """Usuario o correo para comparar: sin espacios en los extremos y en casefold. None si queda vacío."""
+    valor = (valor or '').strip().casefold()
+    return valor or None
+
+def normalizar_telefono(valor):
+    """
+    Teléfono en formato E.164 ('+50688887777'). Se descartan espacios, guiones y paréntesis;
+    '00' inicial equivale a '+' y un número local de 8 dígitos recibe el prefijo del país.
+    None si no hay dígitos.
+    """
+    valor = (valor or '').strip()
+    digitos = ''.join(c for c in valor if c.isdigit())
+    if not digitos:
+        return None
+    if not valor.startswith('+'):
+        if digitos.startswith('00'):
+            digitos = digitos[2:]
+        elif len(digitos) == 8:
+            digitos = PREFIJO_TELEFONO_POR_DEFECTO + digitos
+    return '+' + digitos
+
 # --- MODELOS DE LA APLICACIÓN ---
 
 class User(db.Model):
@@ -52,12 +80,50 @@ class User(db.Model):
     fecha_registro = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, server_default=sa.func.now())
     fecha_actualizacion = db.Column(db.DateTime, onupdate=datetime.utcnow)
 
+    # Copias normalizadas para las búsquedas de identidad (ver User.por_identidad); se mantienen con @validates
+    username_norm = db.Column(db.String(80), nullable=True)
+    email_norm = db.Column(db.String(120), nullable=True)
+    telefono_norm = db.Column(db.String(20), nullable=True)
+
     oauth_logins = db.relationship('OAuthSignIn', backref='user', lazy=True, cascade="all, delete-orphan")
     __table_args__ = (
         UniqueConstraint('username', name='uq_user_username'),
         UniqueConstraint('email', name='uq_user_email'),
+        Index('ix_user_username_norm', 'username_norm', unique=True),
+        Index('ix_user_email_norm', 'email_norm', unique=True),
+        # El teléfono no es único: las cuentas creadas por OAuth comparten un valor por defecto
+        Index('ix_user_telefono_norm', 'telefono_norm'),
     )
 
+    @validates('username', 'email', 'telefono')
+    def _sincronizar_normalizados(self, campo, valor):
+        if campo == 'telefono':
+            self.telefono_norm = normalizar_telefono(valor)
+        else:
+            setattr(self, f'{campo}_norm', normalizar_identificador(valor))
+        return valor
+
+    @classmethod
+    def por_identidad(cls, valor, *campos, excluir_id=None):
+        """
+        Único punto de búsqueda de usuarios por identidad. `campos` indica contra qué se compara
+        `valor`: 'username', 'email' y/o 'telefono' (por defecto usuario o correo, como en el login).
+        Con excluir_id se ignora a ese usuario (comprobar unicidad al editar un perfil).
+        Cada comparación es por igualdad sobre una columna normalizada e indexada.
+        """
+        campos = campos or ('username', 'email')
+        condiciones = []
+        for campo in campos:
+            normalizado = normalizar_telefono(valor) if campo == 'telefono' else normalizar_identificador(valor)
+            if normalizado is not None:
+                condiciones.append(getattr(cls, f'{campo}_norm') == normalizado)
+        if not condiciones:
+            return None
+        consulta = cls.query.filter(sa.or_(*condiciones))
+        if excluir_id is not None:
+            consulta = consulta.filter(cls.id != excluir_id)
+        return consulta.first()
+
     def get_reset_token(self, expires_sec=1800):
         s = Serializer(current_app.config['SECRET_KEY'])
         return s.dumps({'user_id': self.id})
@@ -97,6 +163,17 @@ class AboutUs(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
+    @staticmethod
+    def ruta_logo(logo_filename):
+        """Ruta del logo relativa a static/: los logos anteriores al almacén de blobs solo guardan el nombre."""
+        if not logo_filename or '/' in logo_filename:
+            return logo_filename
+        return f'uploads/aboutus_images/{logo_filename}'
+
+    @property
+    def logo_path(self):
+        return AboutUs.ruta_logo(self.logo_filename)
+
     def __repr__(self):
         return f"<AboutUs {self.title}>"
 
@@ -122,3 +199,214 @@ class PushSubscription(db.Model):
         }
 
 
+class File(db.Model):
+    """Archivos subidos por los usuarios desde el módulo files (static/uploads/files)."""
+    __tablename__ = 'files'
+    id = db.Column(db.Integer, primary_key=True)
+    original_filename = db.Column(db.String(255), nullable=False)
+    unique_filename = db.Column(db.String(255), nullable=False, unique=True)
+    file_path = db.Column(db.String(500), nullable=False, index=True) # Relativa a static/
+    file_type = db.Column(db.String(20), nullable=False, index=True)
+    mime_type = db.Column(db.String(150), nullable=False)
+    upload_date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    is_visible = db.Column(db.Boolean, default=True, nullable=False)
+    is_used = db.Column(db.Boolean, default=False, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=True, index=True) # Calculado al recibir el archivo
+    size = db.Column(db.BigInteger, nullable=True) # Bytes; se descuenta de user_storage al eliminar
+    __table_args__ = (
+        Index('ix_files_user_id_upload_date', 'user_id', 'upload_date'),
+    )
+
+    def __repr__(self):
+        return f'<File {self.original_filename}>'
+
+
+class Blob(db.Model):
+    """
+    Contenido subido, guardado una sola vez por SHA-256 (ver storage.py).
+    ref_count cuenta las filas de otros modelos cuya columna de ruta apunta a `path`.
+    """
+    __tablename__ = 'blobs'
+    sha256 = db.Column(db.String(64), primary_key=True)
+    path = db.Column(db.String(255), nullable=False, unique=True) # Relativa a static/
+    size = db.Column(db.BigInteger, nullable=False)
+    mime_type = db.Column(db.String(150), nullable=True)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<Blob {self.sha256[:12]} refs={self.ref_count}>'
+
+
+class UploadSession(db.Model):
+    """
+    Subida reanudable en curso (protocolo por offsets al estilo tus).
+    Los bytes recibidos se acumulan en UPLOAD_STAGING_FOLDER/<id>.part hasta completar total_size.
+    """
+    __tablename__ = 'upload_sessions'
+    id = db.Column(db.String(32), primary_key=True) # uuid4 en hexadecimal
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    original_filename = db.Column(db.String(255), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    offset = db.Column(db.BigInteger, nullable=False, default=0)
+    expected_sha256 = db.Column(db.String(64), nullable=True) # Opcional, enviado por el cliente
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<UploadSession {self.id} {self.offset}/{self.total_size}>'
+
+
+class UserStorage(db.Model):
+    """
+    Uso del módulo files por usuario y categoría (File.file_type): bytes y número de archivos.
+    Se ajusta en la misma transacción que crea o elimina el File (ver files.sumar_uso);
+    `flask files reconciliar-almacenamiento` lo recalcula desde el disco.
+    """
+    __tablename__ = 'user_storage'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    category = db.Column(db.String(20), primary_key=True)
+    bytes_used = db.Column(db.BigInteger, nullable=False, default=0)
+    file_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<UserStorage {self.user_id}/{self.category} {self.bytes_used}B {self.file_count}>'
+
+
+class AppAsset(db.Model):
+    """
+    Índice persistente de los archivos de las carpetas de subida de la aplicación
+    (avatares, portadas, canciones, etc.). Lo mantiene files.refrescar_indice_activos()
+    para que ver_files no recorra el disco en cada petición y los IDs sean estables.
+    """
+    __tablename__ = 'app_assets'
+    id = db.Column(db.Integer, primary_key=True)
+    folder_name = db.Column(db.String(50), nullable=False)
+    directory = db.Column(db.String(500), nullable=False) # Directorio relativo a static/
+    file_path = db.Column(db.String(500), nullable=False, unique=True) # Relativa a static/
+    original_filename = db.Column(db.String(255), nullable=False)
+    file_type = db.Column(db.String(20), nullable=False)
+    mime_type = db.Column(db.String(150), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False, default=0)
+    upload_date = db.Column(db.DateTime, nullable=False) # Fecha de última modificación del archivo
+    __table_args__ = (
+        Index('ix_app_assets_directory', 'directory'),
+        Index('ix_app_assets_upload_date', 'upload_date'),
+        Index('ix_app_assets_file_type_upload_date', 'file_type', 'upload_date'),
+    )
+
+    def __repr__(self):
+        return f'<AppAsset {self.file_path}>'
+
+
+class AppAssetDirectory(db.Model):
+    """mtime de cada directorio indexado: si no cambió, su contenido no se vuelve a listar."""
+    __tablename__ = 'app_asset_directories'
+    path = db.Column(db.String(500), primary_key=True) # Relativa a static/
+    parent = db.Column(db.String(500), nullable=True, index=True)
+    folder_name = db.Column(db.String(50), nullable=False)
+    mtime_ns = db.Column(db.BigInteger, nullable=False)
+
+    def __repr__(self):
+        return f'<AppAssetDirectory {self.path}>'
+
+
+class LoginThrottle(db.Model):
+    """
+    Cubetas de fichas compartidas entre workers para limitar intentos de login (ver throttle.py).
+    La tabla se actualiza con SQL directo en una sola sentencia por intento.
+    """
+    __tablename__ = 'login_throttle'
+    clave = db.Column(db.String(320), primary_key=True) # 'ip:<dirección>' o 'cuenta:<usuario o correo>'
+    fichas = db.Column(db.Float, nullable=False)
+    actualizado = db.Column(db.Float, nullable=False, index=True) # time.time() de la última recarga
+    permitido = db.Column(db.Boolean, nullable=False, default=True) # resultado del último intento
+
+    def __repr__(self):
+        return f'<LoginThrottle {self.clave} {self.fichas:.2f}>'
+
+
+class MailOutbox(db.Model):
+    """
+    Bandeja de salida de correo (ver correo.py): una fila por destinatario. Las rutas solo
+    encolan; un hilo de fondo o `flask correo enviar` entrega los mensajes por una sola
+    conexión SMTP, con reintentos y los fallidos definitivos en estado 'fallido'.
+    """
+    __tablename__ = 'mail_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    destinatario = db.Column(db.String(320), nullable=False)
+    remitente = db.Column(db.String(320), nullable=True) # None: MAIL_DEFAULT_SENDER al enviar
+    asunto = db.Column(db.String(255), nullable=False)
+    cuerpo = db.Column(db.Text, nullable=False)
+    html = db.Column(db.Text, nullable=True)
+    lote = db.Column(db.String(36), nullable=True, index=True) # avisos masivos: mismo lote para todos
+    # 'pendiente' -> 'enviando' -> 'enviado' | 'pendiente' (reintento) | 'fallido'
+    estado = db.Column(db.String(12), nullable=False, default='pendiente')
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    # Próximo intento; mientras está 'enviando', fin del plazo tras el que otro proceso puede retomarlo
+    disponible_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    ultimo_error = db.Column(db.Text, nullable=True)
+    creado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    enviado_en = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_mail_outbox_estado_disponible', 'estado', 'disponible_en'),
+    )
+
+    def __repr__(self):
+        return f'<MailOutbox {self.id} {self.destinatario} {self.estado}>'
+
+
+class TaskQueue(db.Model):
+    """
+    Cola de tareas en segundo plano (ver tareas.py). Se lee y escribe con SQL directo para que
+    reclamar una tarea sea una sola sentencia; los tiempos son time.time() en segundos.
+    """
+    __tablename__ = 'task_queue'
+    id = db.Column(db.Integer, primary_key=True)
+    nombre = db.Column(db.String(100), nullable=False) # clave en tareas.REGISTRO
+    argumentos = db.Column(db.Text, nullable=False, default='{}') # JSON
+    prioridad = db.Column(db.Integer, nullable=False, default=0) # mayor se ejecuta antes
+    # 'pendiente' -> 'en_curso' -> 'hecha' | 'pendiente' (reintento) | 'fallida'
+    estado = db.Column(db.String(12), nullable=False, default='pendiente')
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    max_intentos = db.Column(db.Integer, nullable=False, default=3)
+    # Cuándo puede tomarse; mientras está 'en_curso', fin del plazo de visibilidad
+    disponible_en = db.Column(db.Float, nullable=False)
+    programada_en = db.Column(db.Float, nullable=False) # cuándo quedó lista (para medir la espera)
+    creada_en = db.Column(db.Float, nullable=False)
+    iniciada_en = db.Column(db.Float, nullable=True)
+    terminada_en = db.Column(db.Float, nullable=True)
+    trabajador = db.Column(db.String(120), nullable=True) # host:pid:hilo del último worker que la tomó
+    ultimo_error = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        Index('ix_task_queue_estado_disponible', 'estado', 'disponible_en'),
+        Index('ix_task_queue_estado_terminada', 'estado', 'terminada_en'),
+    )
+
+    def __repr__(self):
+        return f'<TaskQueue {self.id} {self.nombre} {self.estado}>'
+
+
+class SchedulerJob(db.Model):
+    """
+    Estado y lease de cada trabajo periódico (ver programador.py); tiempos en time.time().
+    Un proceso reclama la ejecución fijando bloqueado_hasta y la próxima fecha en la misma sentencia.
+    """
+    __tablename__ = 'scheduler_jobs'
+    nombre = db.Column(db.String(100), primary_key=True)
+    proxima_en = db.Column(db.Float, nullable=False)
+    bloqueado_hasta = db.Column(db.Float, nullable=True) # lease del proceso que lo está ejecutando
+    propietario = db.Column(db.String(120), nullable=True)
+    ultimo_inicio = db.Column(db.Float, nullable=True)
+    ultimo_exito = db.Column(db.Float, nullable=True)
+    ultima_duracion = db.Column(db.Float, nullable=True) # segundos
+    ultimo_error = db.Column(db.Text, nullable=True)
+    ejecuciones = db.Column(db.Integer, nullable=False, default=0)
+    fallos = db.Column(db.Integer, nullable=False, default=0)
+    fallos_seguidos = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<SchedulerJob {self.nombre}>'
@@ -1,11 +1,12 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, session, current_app, send_from_directory
 from models import db, bcrypt, User
+from storage import guardar_stream, reemplazar
+from hashing import verificar_contrasena
 from functools import wraps
 import os
 import shutil
 from werkzeug.utils import secure_filename
 from datetime import datetime
-import uuid # Importar para nombres de archivo únicos
 
 perfil_bp = Blueprint('perfil', __name__)
 
@@ -41,9 +42,9 @@ def editar_perfil():
         new_username = request.form.get('username')
         new_email = request.form.get('email')
 
-        if new_username != user.username and User.query.filter_by(username=new_username).first():
+        if User.por_identidad(new_username, 'username', excluir_id=user.id):
             flash('Ese nombre de usuario ya está en uso. Por favor, elige otro.', 'danger')
-        elif new_email and new_email != user.email and User.query.filter_by(email=new_email).first():
+        elif new_email and User.por_identidad(new_email, 'email', excluir_id=user.id):
             flash('Ese correo electrónico ya está registrado. Por favor, usa otro.', 'danger')
         else:
             user.username = new_username
@@ -74,11 +75,8 @@ def editar_perfil():
                 avatar_file = request.files['avatar']
                 if avatar_file.filename != '':
                     filename = secure_filename(avatar_file.filename)
-                    unique_filename = str(uuid.uuid4()) + os.path.splitext(filename)[1]
-                    upload_folder = current_app.config['UPLOAD_FOLDER']
-                    file_path = os.path.join(upload_folder, unique_filename)
-                    avatar_file.save(file_path)
-                    user.avatar_url = os.path.join('uploads', 'avatars', unique_filename).replace('\\', '/')
+                    nueva_ruta, _ = guardar_stream(avatar_file.stream, filename, avatar_file.mimetype)
+                    user.avatar_url = reemplazar(user.avatar_url, nueva_ruta)
 
             db.session.commit()
             flash('¡Perfil actualizado con éxito!', 'success')
@@ -98,7 +96,7 @@ def change_password():
         new_password = request.form['new_password']
         confirm_password = request.form['confirm_password']
         user = User.query.get(session['user_id'])
-        if not bcrypt.check_password_hash(user.password, current_password):
+        if not verificar_contrasena(user, current_password, rehash=False):
             flash('La contraseña actual es incorrecta.', 'danger')
         elif new_password != confirm_password:
             flash('Las nuevas contraseñas no coinciden.', 'danger')
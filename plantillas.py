@@ -0,0 +1,73 @@
+# plantillas.py
+# Arranque en caliente de las plantillas Jinja.
+# - configurar_cache_bytecode(app): las plantillas compiladas se guardan en TEMPLATE_BYTECODE_FOLDER
+#   (instance/jinja_cache) y todos los workers las reutilizan en lugar de volver a compilar base.html,
+#   navbar.html y los formularios grandes. Jinja invalida cada archivo por la suma de su fuente, así
+#   que una plantilla editada se recompila sola; las escrituras son atómicas entre procesos.
+# - `flask plantillas precompilar` llena la caché en el despliegue (después de `flask db upgrade`).
+# - calentar(app) renderiza TEMPLATE_WARMUP al importar la aplicación, antes de que el worker acepte
+#   tráfico: carga el bytecode, las traducciones de Babel y el mapa de url_for. Los errores de render
+#   (plantillas que esperan variables de la vista) solo se registran.
+import os
+import time
+
+import click
+from flask import Blueprint, current_app, render_template
+from jinja2 import FileSystemBytecodeCache, TemplateError
+
+plantillas_bp = Blueprint('plantillas', __name__)
+
+
+def configurar_cache_bytecode(app):
+    carpeta = app.config.get('TEMPLATE_BYTECODE_FOLDER')
+    if not carpeta:
+        return
+    os.makedirs(carpeta, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(carpeta)
+
+
+def compilar_todas(app):
+    """Compila todas las plantillas (las de los blueprints incluidas). Devuelve (compiladas, errores)."""
+    compiladas, errores = 0, []
+    for nombre in app.jinja_env.list_templates(extensions=('html', 'xml', 'txt', 'js')):
+        try:
+            app.jinja_env.get_template(nombre)
+            compiladas += 1
+        except TemplateError as e:
+            errores.append((nombre, e))
+    return compiladas, errores
+
+
+def calentar(app, plantillas=None):
+    """Renderiza las plantillas críticas con una petición de prueba; devuelve {plantilla: ms}."""
+    plantillas = app.config.get('TEMPLATE_WARMUP', ()) if plantillas is None else plantillas
+    tiempos = {}
+    with app.test_request_context('/'):
+        for nombre in plantillas:
+            inicio = time.perf_counter()
+            try:
+                render_template(nombre)
+            except Exception as e:
+                # Sin las variables de su vista la plantilla puede fallar; ya quedó compilada
+                print(f"DEBUG: Calentamiento de {nombre}: {e.__class__.__name__}: {e}")
+            tiempos[nombre] = round((time.perf_counter() - inicio) * 1000, 1)
+    return tiempos
+
+
+@plantillas_bp.cli.command('precompilar')
+@click.option('--limpiar', is_flag=True, help='Borra la caché de bytecode antes de compilar.')
+def precompilar_command(limpiar):
+    """Compila todas las plantillas a la caché de bytecode (TEMPLATE_BYTECODE_FOLDER)."""
+    cache_bytecode = current_app.jinja_env.bytecode_cache
+    if cache_bytecode is None:
+        raise click.ClickException('TEMPLATE_BYTECODE_FOLDER no está configurado.')
+    if limpiar:
+        cache_bytecode.clear()
+    inicio = time.perf_counter()
+    compiladas, errores = compilar_todas(current_app)
+    for nombre, error in errores:
+        click.echo(f'  error en {nombre}: {error}')
+    click.echo(f'{compiladas} plantillas compiladas en {time.perf_counter() - inicio:.2f} s '
+               f"({len(errores)} con errores) en {current_app.config['TEMPLATE_BYTECODE_FOLDER']}")
+    if errores:
+        raise SystemExit(1)
@@ -0,0 +1,309 @@
+# programador.py
+# Trabajos periódicos de mantenimiento (recolección de subidas, limpieza de tablas, respaldos...).
+# - Cada módulo registra los suyos con @periodica('nombre', cron='30 3 * * *') o cada=segundos.
+# - Programador.tick() se ejecuta en todos los procesos que corren el programador (`flask worker`
+#   o `flask programador ejecutar`), pero cada ejecución la toma uno solo: la fila del trabajo en
+#   scheduler_jobs se reclama con un UPDATE condicional que además fija la próxima ejecución y un
+#   plazo (lease) durante el que nadie más puede tomarla.
+# - La tabla guarda la duración, el último éxito y el último error de cada trabajo (/admin/programador).
+# - El reloj es inyectable (Programador(reloj=...)) para probar la planificación sin esperar.
+import os
+import time
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+from functools import wraps
+
+import click
+from flask import Blueprint, current_app, jsonify, session, flash, redirect, url_for
+from sqlalchemy import text
+
+from models import db
+
+programador_bp = Blueprint('programador', __name__)
+
+# nombre -> Trabajo; se llena al importar los módulos que declaran trabajos
+REGISTRO = {}
+
+
+def role_required(roles):
+    if not isinstance(roles, list):
+        roles = [roles]
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if 'logged_in' not in session or not session['logged_in']:
+                flash('Por favor, inicia sesión para acceder a esta página.', 'info')
+                return redirect(url_for('login'))
+            if session.get('role') not in roles:
+                flash('No tienes permiso para acceder a esta página.', 'danger')
+                return redirect(url_for('home'))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+# --- Expresiones cron ---
+
+class ExpresionCron:
+    """
+    Cron de cinco campos (minuto hora día-del-mes mes día-de-la-semana) en hora local.
+    Admite '*', 'n', 'a-b', '*/p', 'a-b/p' y listas separadas por comas; domingo = 0 (o 7).
+    Como en cron, si día del mes y día de la semana están restringidos basta con que coincida uno.
+    """
+    RANGOS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expresion):
+        campos = expresion.split()
+        if len(campos) != 5:
+            raise ValueError(f'Expresión cron inválida (se esperaban 5 campos): {expresion!r}')
+        self.expresion = expresion
+        self.minutos, self.horas, self.dias, self.meses, dias_semana = (
+            self._campo(campo, minimo, maximo) for campo, (minimo, maximo) in zip(campos, self.RANGOS)
+        )
+        self.dias_semana = {d % 7 for d in dias_semana}
+        self.dia_restringido = campos[2] != '*'
+        self.semana_restringida = campos[4] != '*'
+
+    @staticmethod
+    def _campo(campo, minimo, maximo):
+        valores = set()
+        for parte in campo.split(','):
+            rango, _, paso = parte.partition('/')
+            if rango == '*':
+                inicio, fin = minimo, maximo
+            elif '-' in rango:
+                inicio, fin = (int(x) for x in rango.split('-', 1))
+            else:
+                inicio = fin = int(rango)
+            paso = int(paso) if paso else 1
+            if not (minimo <= inicio <= fin <= maximo) or paso < 1:
+                raise ValueError(f'Campo cron fuera de rango: {campo!r}')
+            valores.update(range(inicio, fin + 1, paso))
+        return valores
+
+    def _dia_coincide(self, fecha):
+        en_mes = fecha.day in self.dias
+        # isoweekday: lunes = 1 ... domingo = 7 -> % 7 deja domingo = 0
+        en_semana = fecha.isoweekday() % 7 in self.dias_semana
+        if self.dia_restringido and self.semana_restringida:
+            return en_mes or en_semana
+        return en_mes and en_semana
+
+    def siguiente(self, desde):
+        """Primer instante (datetime) estrictamente posterior a `desde` que cumple la expresión."""
+        fecha = desde.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limite = fecha + timedelta(days=366 * 5)
+        while fecha < limite:
+            if fecha.month not in self.meses:
+                fecha = (fecha.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._dia_coincide(fecha):
+                fecha = fecha.replace(hour=0, minute=0) + timedelta(days=1)
+            elif fecha.hour not in self.horas:
+                fecha = fecha.replace(minute=0) + timedelta(hours=1)
+            elif fecha.minute not in self.minutos:
+                fecha += timedelta(minutes=1)
+            else:
+                return fecha
+        raise ValueError(f'La expresión cron {self.expresion!r} no tiene próximas fechas.')
+
+
+# --- Registro ---
+
+class Trabajo:
+    def __init__(self, nombre, funcion, cron=None, cada=None, duracion_maxima=3600):
+        if (cron is None) == (cada is None):
+            raise ValueError(f'El trabajo {nombre!r} necesita cron o cada (uno de los dos).')
+        self.nombre = nombre
+        self.funcion = funcion
+        self.cron = ExpresionCron(cron) if cron else None
+        self.cada = cada
+        self.duracion_maxima = duracion_maxima
+
+    def siguiente(self, ahora):
+        """Próxima ejecución (timestamp) posterior a `ahora` (timestamp)."""
+        if self.cada:
+            return ahora + self.cada
+        return self.cron.siguiente(datetime.fromtimestamp(ahora)).timestamp()
+
+    @property
+    def descripcion(self):
+        return self.cron.expresion if self.cron else f'cada {self.cada:g} s'
+
+
+def periodica(nombre, cron=None, cada=None, duracion_maxima=3600):
+    """
+    Registra la función como trabajo periódico. Se ejecuta en un contexto de aplicación.
+    `duracion_maxima` (s) es el lease: si el proceso muere a mitad, otro puede retomarla después.
+    """
+    def decorator(f):
+        REGISTRO[nombre] = Trabajo(nombre, f, cron=cron, cada=cada, duracion_maxima=duracion_maxima)
+        return f
+    return decorator
+
+
+def invocar_comando(comando, **parametros):
+    """Ejecuta un comando click de la app (p. ej. storage.gc_command) con sus valores por defecto."""
+    with click.Context(comando) as contexto:
+        return contexto.invoke(comando, **parametros)
+
+
+# --- Ejecución ---
+
+_CREAR_SQL = text("""
+    INSERT INTO scheduler_jobs (nombre, proxima_en, ejecuciones, fallos, fallos_seguidos)
+    VALUES (:nombre, :proxima, 0, 0, 0)
+    ON CONFLICT (nombre) DO NOTHING
+""")
+# Solo un proceso consigue actualizar la fila: la condición sobre proxima_en/bloqueado_hasta
+# deja de cumplirse en cuanto otro la reclama.
+_RECLAMAR_SQL = text("""
+    UPDATE scheduler_jobs
+    SET bloqueado_hasta = :ahora + :lease, propietario = :propietario, ultimo_inicio = :ahora,
+        proxima_en = :proxima
+    WHERE nombre = :nombre AND proxima_en <= :ahora
+      AND (bloqueado_hasta IS NULL OR bloqueado_hasta <= :ahora)
+    RETURNING nombre
+""")
+_TERMINAR_SQL = text("""
+    UPDATE scheduler_jobs
+    SET bloqueado_hasta = NULL, ultima_duracion = :duracion, ejecuciones = ejecuciones + 1,
+        ultimo_exito = CASE WHEN :error IS NULL THEN :fin ELSE ultimo_exito END,
+        ultimo_error = COALESCE(:error, ultimo_error),
+        fallos = fallos + (:error IS NOT NULL),
+        fallos_seguidos = CASE WHEN :error IS NULL THEN 0 ELSE fallos_seguidos + 1 END
+    WHERE nombre = :nombre AND propietario = :propietario
+""")
+
+
+class Programador:
+    def __init__(self, reloj=time.time, trabajos=None):
+        self.reloj = reloj
+        self._trabajos = trabajos
+        self.propietario = f'{socket.gethostname()}:{os.getpid()}:{id(self):x}'
+
+    @property
+    def trabajos(self):
+        return REGISTRO if self._trabajos is None else self._trabajos
+
+    def tick(self):
+        """Ejecuta los trabajos vencidos que este proceso consiga reclamar. Devuelve sus nombres."""
+        ejecutados = []
+        for trabajo in list(self.trabajos.values()):
+            ahora = self.reloj()
+            with db.engine.begin() as conexion:
+                # La primera vez se programa para la próxima fecha, no para ahora mismo
+                conexion.execute(_CREAR_SQL, {'nombre': trabajo.nombre, 'proxima': trabajo.siguiente(ahora)})
+                reclamado = conexion.execute(_RECLAMAR_SQL, {
+                    'nombre': trabajo.nombre, 'ahora': ahora, 'lease': trabajo.duracion_maxima,
+                    'propietario': self.propietario, 'proxima': trabajo.siguiente(ahora),
+                }).first()
+            if reclamado:
+                self.ejecutar(trabajo)
+                ejecutados.append(trabajo.nombre)
+        return ejecutados
+
+    def ejecutar(self, trabajo):
+        inicio = time.perf_counter()
+        error = None
+        try:
+            trabajo.funcion()
+        except Exception:
+            db.session.rollback()
+            error = traceback.format_exc()[-4000:]
+            current_app.logger.error(f"Trabajo periódico {trabajo.nombre} falló:\n{error}")
+        finally:
+            db.session.remove()
+        duracion = time.perf_counter() - inicio
+        with db.engine.begin() as conexion:
+            conexion.execute(_TERMINAR_SQL, {
+                'nombre': trabajo.nombre, 'propietario': self.propietario,
+                'duracion': duracion, 'fin': self.reloj(), 'error': error,
+            })
+        return error is None
+
+
+programador = Programador()
+
+
+def iniciar_en_segundo_plano(app, detener=None):
+    """Hilo que llama a programador.tick() cada SCHEDULER_TICK_SECONDS. Devuelve el hilo."""
+    detener = detener or threading.Event()
+
+    def bucle():
+        while not detener.is_set():
+            with app.app_context():
+                try:
+                    programador.tick()
+                except Exception as e:
+                    app.logger.error(f"Error en el programador: {e}")
+                espera = app.config.get('SCHEDULER_TICK_SECONDS', 30)
+            # Alineado al reloj para que los trabajos por minuto no se retrasen un tick entero
+            detener.wait(espera - time.time() % espera)
+
+    hilo = threading.Thread(target=bucle, name='programador', daemon=True)
+    hilo.start()
+    return hilo
+
+
+# --- Estado ---
+
+def estado_trabajos():
+    with db.engine.connect() as conexion:
+        filas = {fila.nombre: fila for fila in conexion.execute(text('SELECT * FROM scheduler_jobs'))}
+    ahora = time.time()
+    fecha = lambda ts: datetime.fromtimestamp(ts).isoformat(timespec='seconds') if ts else None
+    resultado = []
+    for nombre, trabajo in sorted(REGISTRO.items()):
+        fila = filas.get(nombre)
+        resultado.append({
+            'nombre': nombre,
+            'programa': trabajo.descripcion,
+            'proxima': fecha(fila.proxima_en) if fila else None,
+            'en_curso': bool(fila and fila.bloqueado_hasta and fila.bloqueado_hasta > ahora),
+            'ultimo_inicio': fecha(fila.ultimo_inicio) if fila else None,
+            'ultimo_exito': fecha(fila.ultimo_exito) if fila else None,
+            'ultima_duracion_s': round(fila.ultima_duracion, 3) if fila and fila.ultima_duracion is not None else None,
+            'ejecuciones': fila.ejecuciones if fila else 0,
+            'fallos': fila.fallos if fila else 0,
+            'fallos_seguidos': fila.fallos_seguidos if fila else 0,
+            'ultimo_error': ((fila.ultimo_error or '').strip().splitlines() or [None])[-1] if fila else None,
+        })
+    return resultado
+
+
+@programador_bp.route('/admin/programador')
+@role_required('Superuser')
+def estado_programador():
+    """Trabajos periódicos registrados, su próxima ejecución y sus métricas."""
+    return jsonify({'success': True, 'trabajos': estado_trabajos()})
+
+
+@programador_bp.cli.command('ejecutar')
+@click.option('--una-vez', is_flag=True, help='Un solo tick (para cron del sistema) en lugar de quedarse corriendo.')
+def ejecutar_command(una_vez):
+    """Corre el programador de trabajos periódicos (`flask worker` ya lo incluye)."""
+    if una_vez:
+        ejecutados = programador.tick()
+        click.echo(f"Ejecutados: {', '.join(ejecutados) or 'ninguno'}")
+        return
+    click.echo(f"Programador en marcha; trabajos: {', '.join(sorted(REGISTRO))}")
+    detener = threading.Event()
+    hilo = iniciar_en_segundo_plano(current_app._get_current_object(), detener)
+    try:
+        while hilo.is_alive():
+            hilo.join(1)
+    except KeyboardInterrupt:
+        detener.set()
+
+
+@programador_bp.cli.command('estado')
+def estado_command():
+    """Lista los trabajos periódicos con su última ejecución."""
+    for trabajo in estado_trabajos():
+        click.echo(f"{trabajo['nombre']:28} {trabajo['programa']:16} próxima {trabajo['proxima'] or '-':19} "
+                   f"último éxito {trabajo['ultimo_exito'] or '-':19} "
+                   f"{trabajo['ultima_duracion_s'] if trabajo['ultima_duracion_s'] is not None else '-'} s, "
+                   f"{trabajo['ejecuciones']} ejecuciones, {trabajo['fallos']} fallos")
@@ -0,0 +1,325 @@
+# push.py
+# Notificaciones Web Push a las suscripciones guardadas en PushSubscription.
+# - Cada envío es una petición HTTPS al servicio push del navegador (FCM, Mozilla, Apple...). Se
+#   hacen en paralelo con un ThreadPoolExecutor de PUSH_MAX_WORKERS hilos que comparten una
+#   requests.Session: las conexiones TLS a cada servicio se reutilizan entre suscripciones.
+# - La cabecera VAPID (un JWT firmado con ECDSA) depende solo del servicio push (aud), así que se
+#   firma una vez por servicio y se reutiliza hasta poco antes de su vencimiento.
+# - Las suscripciones que responden 404/410 (el navegador se dio de baja) se borran en una sola
+#   sentencia al terminar el envío.
+# - /admin/metricas/push muestra las latencias de envío de este worker.
+import os
+import json
+import time
+import threading
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from urllib.parse import urlparse
+
+import click
+import requests
+from requests.adapters import HTTPAdapter
+from flask import Blueprint, current_app, jsonify, request, session, flash, redirect, url_for
+from pywebpush import WebPusher
+from py_vapid import Vapid
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, PushSubscription
+from tareas import tarea, encolar
+
+push_bp = Blueprint('push', __name__)
+
+ESTADOS_CADUCADOS = (404, 410)
+# La cabecera VAPID se renueva cuando le queda menos que esto
+MARGEN_RENOVACION_VAPID = 10 * 60
+MUESTRAS_RECIENTES = 1000
+
+
+def role_required(roles):
+    if not isinstance(roles, list):
+        roles = [roles]
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if 'logged_in' not in session or not session['logged_in']:
+                flash('Por favor, inicia sesión para acceder a esta página.', 'info')
+                return redirect(url_for('login'))
+            if session.get('role') not in roles:
+                flash('No tienes permiso para acceder a esta página.', 'danger')
+                return redirect(url_for('home'))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+# --- VAPID ---
+
+_vapid_lock = threading.Lock()
+_vapid_cargadas = {} # clave privada (texto de la configuración) -> Vapid
+
+
+def cargar_vapid(clave_privada):
+    """Vapid desde un archivo PEM, un PEM en texto o la clave en base64url (raw o DER)."""
+    with _vapid_lock:
+        vapid = _vapid_cargadas.get(clave_privada)
+        if vapid is None:
+            if os.path.isfile(clave_privada):
+                vapid = Vapid.from_file(private_key_file=clave_privada)
+            elif '-----BEGIN' in clave_privada:
+                vapid = Vapid.from_pem(clave_privada.encode())
+            else:
+                vapid = Vapid.from_string(private_key=clave_privada)
+            _vapid_cargadas[clave_privada] = vapid
+        return vapid
+
+
+class CacheVapid:
+    """Cabeceras Authorization firmadas, por (clave, sub, aud), hasta MARGEN_RENOVACION_VAPID antes de vencer."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cabeceras = {}
+        self.firmas = 0
+
+    def cabeceras(self, clave_privada, sub, aud, duracion):
+        ahora = time.time()
+        llave = (clave_privada, sub, aud)
+        with self._lock:
+            guardada = self._cabeceras.get(llave)
+            if guardada and guardada[1] - MARGEN_RENOVACION_VAPID > ahora:
+                return guardada[0]
+        vencimiento = int(ahora) + duracion
+        firmadas = cargar_vapid(clave_privada).sign({'sub': sub, 'aud': aud, 'exp': vencimiento})
+        with self._lock:
+            self._cabeceras[llave] = (firmadas, vencimiento)
+            self.firmas += 1
+        return firmadas
+
+
+cache_vapid = CacheVapid()
+
+
+def audiencia(endpoint):
+    url = urlparse(endpoint)
+    return f'{url.scheme}://{url.netloc}'
+
+
+# --- Sesión HTTP compartida ---
+
+_sesion = None
+_sesion_hilos = 0
+_sesion_lock = threading.Lock()
+
+
+def sesion_http(hilos):
+    """requests.Session con un pool por servicio push del tamaño del número de hilos."""
+    global _sesion, _sesion_hilos
+    with _sesion_lock:
+        if _sesion is None or _sesion_hilos < hilos:
+            sesion = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=16, pool_maxsize=hilos)
+            sesion.mount('https://', adaptador)
+            sesion.mount('http://', adaptador)
+            _sesion, _sesion_hilos = sesion, hilos
+        return _sesion
+
+
+# --- Métricas (por worker) ---
+
+class MetricasPush:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self.envios = 0
+            self.caducadas = 0
+            self.por_estado = Counter() # código HTTP o 'error'
+            self.recientes = deque(maxlen=MUESTRAS_RECIENTES)
+
+    def registrar(self, estado, ms):
+        with self._lock:
+            self.envios += 1
+            self.por_estado[str(estado or 'error')] += 1
+            self.recientes.append(ms)
+
+    def registrar_caducadas(self, cantidad):
+        with self._lock:
+            self.caducadas += cantidad
+
+    def resumen(self):
+        with self._lock:
+            recientes = sorted(self.recientes)
+            percentil = lambda p: round(recientes[min(len(recientes) - 1, int(len(recientes) * p))], 1) if recientes else None
+            return {
+                'envios': self.envios,
+                'caducadas_borradas': self.caducadas,
+                'por_estado': dict(sorted(self.por_estado.items())),
+                'recientes': {
+                    'muestras': len(recientes),
+                    'p50_ms': percentil(0.50),
+                    'p95_ms': percentil(0.95),
+                    'p99_ms': percentil(0.99),
+                    'max_ms': round(recientes[-1], 1) if recientes else None,
+                },
+            }
+
+
+metricas = MetricasPush()
+
+
+# --- Envío ---
+
+def _opciones_de_envio():
+    """Configuración leída una vez en el hilo de la petición: los hilos del pool no tienen contexto de app."""
+    config = current_app.config
+    if not config.get('VAPID_PRIVATE_KEY'):
+        raise RuntimeError('VAPID_PRIVATE_KEY no está configurada.')
+    hilos = config.get('PUSH_MAX_WORKERS', 8)
+    return {
+        'clave': config['VAPID_PRIVATE_KEY'],
+        'sub': config['VAPID_CLAIM_EMAIL'],
+        'duracion': config.get('PUSH_VAPID_EXP_SECONDS', 12 * 3600),
+        'ttl': config.get('PUSH_TTL_SECONDS', 86400),
+        'timeout': config.get('PUSH_TIMEOUT_SECONDS', 10),
+        'hilos': hilos,
+        'sesion': sesion_http(hilos),
+    }
+
+
+def _enviar_uno(suscripcion_id, info, mensaje, opciones):
+    """Devuelve (id, código HTTP o None, ms, error)."""
+    inicio = time.perf_counter()
+    estado, error = None, None
+    try:
+        cabeceras = dict(cache_vapid.cabeceras(opciones['clave'], opciones['sub'],
+                                               audiencia(info['endpoint']), opciones['duracion']))
+        respuesta = WebPusher(info, requests_session=opciones['sesion']).send(
+            mensaje, cabeceras, ttl=opciones['ttl'], timeout=opciones['timeout']
+        )
+        estado = respuesta.status_code
+        if estado > 202:
+            error = f'{estado} {respuesta.reason}'
+    except Exception as e:
+        # Cualquier fallo queda en esta suscripción: si escapara, pool.map cortaría el envío al resto
+        # y las suscripciones caducadas ya detectadas no se borrarían
+        error = f'{type(e).__name__}: {e}'
+    ms = (time.perf_counter() - inicio) * 1000
+    metricas.registrar(estado, ms)
+    return suscripcion_id, estado, ms, error
+
+
+def despachar(destinos, mensaje):
+    """
+    Envía `mensaje` (texto) a cada (id, subscription_info) de `destinos` en paralelo y borra las
+    suscripciones caducadas. Devuelve un resumen del envío.
+    """
+    inicio = time.perf_counter()
+    resumen = {'total': len(destinos), 'enviadas': 0, 'caducadas': 0, 'errores': 0}
+    if not destinos:
+        return resumen
+    opciones = _opciones_de_envio()
+    with ThreadPoolExecutor(max_workers=min(opciones['hilos'], len(destinos)),
+                            thread_name_prefix='push') as pool:
+        resultados = list(pool.map(lambda destino: _enviar_uno(*destino, mensaje, opciones), destinos))
+
+    caducadas = [suscripcion_id for suscripcion_id, estado, _, _ in resultados if estado in ESTADOS_CADUCADOS]
+    for suscripcion_id, estado, _, error in resultados:
+        if estado is not None and estado <= 202:
+            resumen['enviadas'] += 1
+        elif estado not in ESTADOS_CADUCADOS:
+            resumen['errores'] += 1
+            print(f"DEBUG: Push a la suscripción {suscripcion_id} falló: {error}")
+    if caducadas:
+        PushSubscription.query.filter(PushSubscription.id.in_(caducadas)).delete(synchronize_session=False)
+        db.session.commit()
+        metricas.registrar_caducadas(len(caducadas))
+        resumen['caducadas'] = len(caducadas)
+    resumen['segundos'] = round(time.perf_counter() - inicio, 3)
+    return resumen
+
+
+@tarea('push.notificacion')
+def enviar_notificacion(titulo, cuerpo, url=None, user_ids=None):
+    """Notificación a todas las suscripciones, o solo a las de `user_ids`."""
+    consulta = PushSubscription.query
+    if user_ids is not None:
+        consulta = consulta.filter(PushSubscription.user_id.in_([str(user_id) for user_id in user_ids]))
+    destinos = [(s.id, s.to_dict()) for s in consulta.order_by(PushSubscription.id)]
+    mensaje = json.dumps({'title': titulo, 'body': cuerpo, 'url': url or '/'}, ensure_ascii=False)
+    return despachar(destinos, mensaje)
+
+
+# --- Rutas ---
+
+@push_bp.route('/push/clave-publica')
+def clave_publica():
+    """Clave pública VAPID para PushManager.subscribe({applicationServerKey})."""
+    return jsonify({'success': True, 'public_key': current_app.config.get('VAPID_PUBLIC_KEY')})
+
+
+@push_bp.route('/push/suscripcion', methods=['POST', 'DELETE'])
+def suscripcion():
+    """Guarda (POST) o elimina (DELETE) la PushSubscription que envía el navegador."""
+    datos = request.get_json(silent=True) or {}
+    endpoint = datos.get('endpoint')
+    if not endpoint:
+        return jsonify({'success': False, 'message': 'Falta el endpoint de la suscripción.'}), 400
+
+    if request.method == 'DELETE':
+        PushSubscription.query.filter_by(endpoint=endpoint).delete()
+        db.session.commit()
+        return jsonify({'success': True, 'message': 'Suscripción eliminada.'})
+
+    claves = datos.get('keys') or {}
+    if not claves.get('p256dh') or not claves.get('auth'):
+        return jsonify({'success': False, 'message': 'Faltan las claves de la suscripción.'}), 400
+    user_id = str(session['user_id']) if session.get('logged_in') else None
+    # El mismo navegador puede volver a suscribirse (claves nuevas, otro usuario): se actualiza la fila
+    db.session.execute(
+        sqlite_insert(PushSubscription.__table__)
+        .values(endpoint=endpoint, p256dh_key=claves['p256dh'], auth_key=claves['auth'], user_id=user_id)
+        .on_conflict_do_update(index_elements=['endpoint'],
+                               set_={'p256dh_key': claves['p256dh'], 'auth_key': claves['auth'], 'user_id': user_id})
+    )
+    db.session.commit()
+    return jsonify({'success': True, 'message': 'Suscripción guardada.'})
+
+
+@push_bp.route('/admin/push/enviar', methods=['POST'])
+@role_required('Superuser')
+def enviar_push():
+    datos = request.get_json(silent=True) or request.form
+    titulo = (datos.get('titulo') or '').strip()
+    cuerpo = (datos.get('cuerpo') or '').strip()
+    if not titulo:
+        return jsonify({'success': False, 'message': 'El título es obligatorio.'}), 400
+    if not current_app.config.get('VAPID_PRIVATE_KEY'):
+        return jsonify({'success': False, 'message': 'VAPID_PRIVATE_KEY no está configurada.'}), 503
+    user_ids = datos.get('user_ids') if request.is_json else request.form.getlist('user_ids', type=int)
+    # El envío lo hace `flask worker`: la respuesta no espera a los servicios push
+    id_tarea = encolar('push.notificacion', prioridad=10, titulo=titulo, cuerpo=cuerpo,
+                       url=datos.get('url'), user_ids=user_ids or None)
+    return jsonify({'success': True, 'message': 'Notificación encolada.', 'tarea': id_tarea}), 202
+
+
+@push_bp.route('/admin/metricas/push')
+@role_required('Superuser')
+def metricas_push():
+    """Latencias de envío push de este worker."""
+    return jsonify({'success': True, 'firmas_vapid': cache_vapid.firmas, **metricas.resumen()})
+
+
+@push_bp.cli.command('enviar')
+@click.option('--titulo', required=True)
+@click.option('--cuerpo', default='')
+@click.option('--url', default=None, help='Página que abre la notificación (por defecto /).')
+@click.option('--usuario', 'user_ids', multiple=True, type=int, help='Solo a este usuario (se puede repetir).')
+def enviar_command(titulo, cuerpo, url, user_ids):
+    """Envía una notificación push a todas las suscripciones (o a las de --usuario)."""
+    resumen = enviar_notificacion(titulo, cuerpo, url, user_ids=list(user_ids) or None)
+    click.echo(f"{resumen['enviadas']}/{resumen['total']} enviadas, {resumen['caducadas']} caducadas borradas, "
+               f"{resumen['errores']} errores en {resumen.get('segundos', 0)} s.")
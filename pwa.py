@@ -0,0 +1,127 @@
+# pwa.py
+# Soporte de la PWA: página offline y generación del manifiesto de precache del Service Worker.
+import os
+import json
+import hashlib
+import fnmatch
+
+import click
+from flask import Blueprint, render_template, current_app, send_from_directory
+
+pwa_bp = Blueprint('pwa', __name__)
+
+# Archivos de static/ que se precachean (rutas relativas a static/, patrones fnmatch).
+# Las subidas de usuarios (static/uploads) se sirven con la estrategia de runtime, nunca en el precache.
+PRECACHE_PATTERNS = [
+    'manifest.json',
+    'css/*.css',
+    'js/*.js',
+    'webfonts/*.woff2',
+]
+
+# Archivos que nunca deben entrar al precache (el propio Service Worker y el manifiesto generado).
+PRECACHE_EXCLUDE = [
+    'js/service-worker.js',
+    'js/precache-manifest.js',
+]
+# Nota: js/solicitud-outbox.js sí se precachea, porque crear_solicitud.html la necesita sin conexión.
+
+# Plantillas que se sirven como páginas completas sin conexión: URL -> plantilla
+PRECACHE_TEMPLATES = {
+    '/offline.html': 'offline.html',
+}
+
+MANIFEST_FILENAME = os.path.join('js', 'precache-manifest.js')
+
+
+def hash_archivo(ruta):
+    """SHA-256 (primeros 16 caracteres) del contenido, leído por bloques."""
+    huella = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(64 * 1024), b''):
+            huella.update(bloque)
+    return huella.hexdigest()[:16]
+
+
+def coincide_patron(relativo, patron):
+    """fnmatch por segmentos: '*' no cruza directorios ('css/*.css' no incluye 'css/sub/x.css')."""
+    return relativo.count('/') == patron.count('/') and fnmatch.fnmatch(relativo, patron)
+
+
+def construir_manifiesto_precache(app):
+    """
+    Recorre static/ y las plantillas offline y devuelve la lista de entradas
+    `{'url': ..., 'revision': ...}` ordenada por URL, junto con la versión global del precache.
+    """
+    static_folder = app.static_folder
+    static_url = app.static_url_path.rstrip('/')
+    patrones = app.config.get('PWA_PRECACHE_PATTERNS', PRECACHE_PATTERNS)
+    excluidos = set(app.config.get('PWA_PRECACHE_EXCLUDE', PRECACHE_EXCLUDE))
+
+    entradas = []
+    for root, dirs, filenames in os.walk(static_folder):
+        relativo_root = os.path.relpath(root, static_folder).replace('\\', '/')
+        if relativo_root == 'uploads' or relativo_root.startswith('uploads/'):
+            dirs[:] = []
+            continue
+        for filename in filenames:
+            relativo = filename if relativo_root == '.' else f'{relativo_root}/{filename}'
+            if relativo in excluidos:
+                continue
+            if not any(coincide_patron(relativo, patron) for patron in patrones):
+                continue
+            entradas.append({
+                'url': f'{static_url}/{relativo}',
+                'revision': hash_archivo(os.path.join(root, filename)),
+            })
+
+    for url, plantilla in PRECACHE_TEMPLATES.items():
+        ruta_plantilla = os.path.join(app.root_path, app.template_folder, plantilla)
+        entradas.append({'url': url, 'revision': hash_archivo(ruta_plantilla)})
+
+    entradas.sort(key=lambda entrada: entrada['url'])
+    version = hashlib.sha256(
+        json.dumps(entradas, sort_keys=True).encode('utf-8')
+    ).hexdigest()[:12]
+    return entradas, version
+
+
+def escribir_manifiesto_precache(app):
+    entradas, version = construir_manifiesto_precache(app)
+    destino = os.path.join(app.static_folder, MANIFEST_FILENAME)
+    contenido = (
+        '// precache-manifest.js\n'
+        '// Generado con `flask pwa generar-precache`. No editar a mano.\n'
+        f'self.__PRECACHE_VERSION = {json.dumps(version)};\n'
+        f'self.__PRECACHE_MANIFEST = {json.dumps(entradas, indent=4)};\n'
+    )
+    with open(destino, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(contenido)
+    return destino, entradas, version
+
+
+@pwa_bp.route('/offline.html')
+def offline():
+    """Página que el Service Worker muestra cuando una navegación falla sin conexión."""
+    return render_template('offline.html')
+
+
+@pwa_bp.route('/service-worker.js')
+def service_worker():
+    """
+    Sirve el Service Worker desde la raíz para que su alcance cubra todo el sitio
+    (desde /static/js/ solo podría controlar esa carpeta).
+    """
+    response = send_from_directory(os.path.join(current_app.static_folder, 'js'), 'service-worker.js',
+                                   mimetype='application/javascript', max_age=0)
+    response.headers['Service-Worker-Allowed'] = '/'
+    response.cache_control.no_cache = True
+    return response
+
+
+@pwa_bp.cli.command('generar-precache')
+def generar_precache_command():
+    """Genera static/js/precache-manifest.js con los hashes de contenido de static/ y la página offline."""
+    destino, entradas, version = escribir_manifiesto_precache(current_app)
+    click.echo(f'Manifiesto de precache generado en {destino}')
+    click.echo(f'{len(entradas)} entradas, versión {version}')
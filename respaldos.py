@@ -0,0 +1,617 @@
+# respaldos.py
+# Respaldos en caliente de la base de datos SQLite.
+# - La copia usa la API de respaldo en línea de SQLite por pasos de BACKUP_PAGES_PER_STEP páginas
+#   con una pausa entre pasos: cada paso solo bloquea a los escritores mientras dura, en lugar de
+#   bloquearlos durante toda la copia. Si la base cambia a mitad, SQLite reinicia la copia; tras
+#   BACKUP_MAX_RESTARTS reinicios se hace en un solo paso para garantizar que termine.
+# - La copia se comprime con gzip por bloques a backup_AAAAMMDD_HHMMSS.db.gz y se describe en un
+#   .json con su SHA-256, tamaños, duración y el paso más largo (la mayor espera de un escritor).
+# - Retención GFS: se conservan el último respaldo de cada uno de los últimos BACKUP_KEEP_DAILY días,
+#   BACKUP_KEEP_WEEKLY semanas y BACKUP_KEEP_MONTHLY meses. Las copias manuales (.db) no se tocan.
+# - verificar_respaldo() comprueba el SHA-256, lo descomprime a un archivo temporal y ejecuta
+#   PRAGMA integrity_check: un respaldo solo cuenta si se puede restaurar. Uno recién creado que no
+#   pasa la verificación se renombra a .corrupto y queda fuera de la lista y de la retención.
+# - Instantáneas incrementales de static/uploads: solo se calcula el SHA-256 de los archivos cuyo tamaño
+#   o mtime cambió desde la instantánea anterior; cada contenido se guarda una vez en
+#   BACKUP_UPLOADS_FOLDER/objetos/<ab>/<sha256> y cada instantánea es un manifiesto .jsonl.gz
+#   (una línea [ruta, sha256, tamaño, mtime_ns] por archivo). Se restauran completas o por archivo.
+import os
+import gzip
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+from datetime import datetime
+from functools import wraps
+
+import click
+from flask import Blueprint, current_app, jsonify, session, flash, redirect, url_for
+
+from models import db
+from programador import periodica
+from storage import formato_bytes, _recorrer_archivos
+
+respaldos_bp = Blueprint('respaldos', __name__)
+
+PREFIJO = 'backup_'
+EXTENSION = '.db.gz'
+FORMATO_FECHA = '%Y%m%d_%H%M%S'
+BLOQUE = 1024 * 1024
+PREFIJO_INSTANTANEA = 'subidas_'
+EXTENSION_INSTANTANEA = '.jsonl.gz'
+
+
+class _DemasiadosReinicios(Exception):
+    pass
+
+
+def role_required(roles):
+    if not isinstance(roles, list):
+        roles = [roles]
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if 'logged_in' not in session or not session['logged_in']:
+                flash('Por favor, inicia sesión para acceder a esta página.', 'info')
+                return redirect(url_for('login'))
+            if session.get('role') not in roles:
+                flash('No tienes permiso para acceder a esta página.', 'danger')
+                return redirect(url_for('home'))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def ruta_base_de_datos():
+    url = db.engine.url
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        raise RuntimeError('Los respaldos en línea solo están disponibles para una base SQLite en archivo.')
+    return os.path.abspath(url.database)
+
+
+def carpeta_respaldos():
+    carpeta = current_app.config['BACKUP_FOLDER']
+    os.makedirs(carpeta, exist_ok=True)
+    return carpeta
+
+
+def fecha_de_respaldo(nombre):
+    """Fecha del nombre backup_AAAAMMDD_HHMMSS.db.gz, o None si no es un respaldo automático."""
+    if not (nombre.startswith(PREFIJO) and nombre.endswith(EXTENSION)):
+        return None
+    try:
+        return datetime.strptime(nombre[len(PREFIJO):-len(EXTENSION)], FORMATO_FECHA)
+    except ValueError:
+        return None
+
+
+def listar_respaldos(carpeta=None):
+    """[(fecha, ruta)] de los respaldos automáticos, del más reciente al más antiguo."""
+    carpeta = carpeta or carpeta_respaldos()
+    respaldos = []
+    for nombre in os.listdir(carpeta):
+        fecha = fecha_de_respaldo(nombre)
+        if fecha:
+            respaldos.append((fecha, os.path.join(carpeta, nombre)))
+    return sorted(respaldos, reverse=True)
+
+
+def _metadatos(ruta):
+    return ruta[:-len(EXTENSION)] + '.json'
+
+
+def apartar_respaldo(ruta):
+    """Renombra un respaldo dañado (y su .json) a .corrupto para conservarlo sin que cuente como respaldo."""
+    for actual in (ruta, _metadatos(ruta)):
+        if os.path.exists(actual):
+            os.replace(actual, actual + '.corrupto')
+    return ruta + '.corrupto'
+
+
+# --- Copia ---
+
+def copiar_en_linea(origen, destino, paginas, pausa, max_reinicios):
+    """
+    Copia la base `origen` al archivo `destino` con la API de respaldo. Devuelve las métricas:
+    pasos, reinicios, paso más largo en ms (lo máximo que un escritor pudo esperar) y si se
+    terminó en un solo paso.
+    """
+    metricas = {'pasos': 0, 'reinicios': 0, 'paso_mas_largo_ms': 0.0, 'un_solo_paso': False}
+    estado = {'fin_pausa': None, 'restantes': None}
+
+    def progreso(_, restantes, total):
+        ahora = time.perf_counter()
+        # El paso transcurre entre el final de la pausa anterior y esta llamada
+        inicio_paso = estado['fin_pausa'] if estado['fin_pausa'] is not None else inicio
+        metricas['paso_mas_largo_ms'] = max(metricas['paso_mas_largo_ms'], (ahora - inicio_paso) * 1000)
+        metricas['pasos'] += 1
+        if estado['restantes'] is not None and restantes > estado['restantes']:
+            # Otra conexión escribió en la base: SQLite empezó la copia de nuevo
+            metricas['reinicios'] += 1
+            if metricas['reinicios'] > max_reinicios:
+                raise _DemasiadosReinicios()
+        estado['restantes'] = restantes
+        estado['fin_pausa'] = ahora + pausa
+
+    fuente = sqlite3.connect(origen, timeout=30)
+    try:
+        inicio = time.perf_counter()
+        copia = sqlite3.connect(destino)
+        try:
+            try:
+                fuente.backup(copia, pages=paginas, progress=progreso, sleep=pausa)
+            except _DemasiadosReinicios:
+                # Con escrituras continuas la copia por pasos no termina: un solo paso bloquea más
+                # a los escritores pero siempre acaba
+                inicio = time.perf_counter()
+                fuente.backup(copia, pages=-1)
+                metricas['un_solo_paso'] = True
+                metricas['paso_mas_largo_ms'] = max(metricas['paso_mas_largo_ms'],
+                                                    (time.perf_counter() - inicio) * 1000)
+        finally:
+            copia.close()
+    finally:
+        fuente.close()
+    metricas['paso_mas_largo_ms'] = round(metricas['paso_mas_largo_ms'], 1)
+    return metricas
+
+
+def comprimir(origen, destino):
+    """gzip por bloques de `origen` a `destino`; devuelve el SHA-256 del archivo comprimido."""
+    huella = hashlib.sha256()
+
+    class _ConHuella:
+        def __init__(self, f):
+            self.f = f
+
+        def write(self, datos):
+            huella.update(datos)
+            return self.f.write(datos)
+
+        def flush(self):
+            self.f.flush()
+
+    with open(origen, 'rb') as entrada, open(destino, 'wb') as salida:
+        # mtime=0: el mismo contenido produce el mismo .gz (y la misma huella)
+        with gzip.GzipFile(filename='', mode='wb', fileobj=_ConHuella(salida), compresslevel=6, mtime=0) as gz:
+            shutil.copyfileobj(entrada, gz, BLOQUE)
+        salida.flush()
+        os.fsync(salida.fileno())
+    return huella.hexdigest()
+
+
+def crear_respaldo(paginas=None, pausa_ms=None):
+    """Crea un respaldo comprimido en BACKUP_FOLDER y devuelve sus metadatos."""
+    config = current_app.config
+    paginas = paginas or config.get('BACKUP_PAGES_PER_STEP', 256)
+    pausa_ms = config.get('BACKUP_STEP_PAUSE_MS', 5) if pausa_ms is None else pausa_ms
+    carpeta = carpeta_respaldos()
+    creado = datetime.now()
+    destino = os.path.join(carpeta, f'{PREFIJO}{creado.strftime(FORMATO_FECHA)}{EXTENSION}')
+    if os.path.exists(destino):
+        raise FileExistsError(f'Ya existe {destino}')
+
+    inicio = time.perf_counter()
+    fd, temporal = tempfile.mkstemp(dir=carpeta, prefix='.backup.', suffix='.db')
+    os.close(fd)
+    fd, comprimido = tempfile.mkstemp(dir=carpeta, prefix='.backup.', suffix=EXTENSION)
+    os.close(fd)
+    try:
+        metricas = copiar_en_linea(ruta_base_de_datos(), temporal, paginas, pausa_ms / 1000,
+                                   config.get('BACKUP_MAX_RESTARTS', 5))
+        segundos_copia = time.perf_counter() - inicio
+        sha256 = comprimir(temporal, comprimido)
+        datos = {
+            'archivo': os.path.basename(destino),
+            'creado': creado.isoformat(timespec='seconds'),
+            'sha256': sha256,
+            'bytes': os.path.getsize(comprimido),
+            'bytes_db': os.path.getsize(temporal),
+            'paginas_por_paso': paginas,
+            'pausa_ms': pausa_ms,
+            'copia_s': round(segundos_copia, 3),
+            'duracion_s': round(time.perf_counter() - inicio, 3),
+            **metricas,
+        }
+        os.replace(comprimido, destino)
+        with open(_metadatos(destino), 'w') as f:
+            json.dump(datos, f, indent=4)
+        return datos
+    finally:
+        for ruta in (temporal, comprimido):
+            if os.path.exists(ruta):
+                os.remove(ruta)
+
+
+# --- Verificación ---
+
+def verificar_respaldo(ruta):
+    """
+    Comprueba la huella, restaura el respaldo a un archivo temporal y ejecuta PRAGMA integrity_check.
+    Devuelve {'ok', 'mensaje', 'tablas', 'alembic'}.
+    """
+    try:
+        with open(_metadatos(ruta)) as f:
+            esperado = json.load(f)['sha256']
+    except (OSError, ValueError, KeyError):
+        return {'ok': False, 'mensaje': 'Falta el .json con la huella del respaldo.'}
+
+    huella = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(BLOQUE), b''):
+            huella.update(bloque)
+    if huella.hexdigest() != esperado:
+        return {'ok': False, 'mensaje': 'El SHA-256 no coincide: el archivo está dañado o incompleto.'}
+
+    fd, restaurado = tempfile.mkstemp(prefix='.verificacion.', suffix='.db', dir=os.path.dirname(ruta))
+    try:
+        with os.fdopen(fd, 'wb') as salida, gzip.open(ruta, 'rb') as entrada:
+            shutil.copyfileobj(entrada, salida, BLOQUE)
+        conexion = sqlite3.connect(f'file:{restaurado}?mode=ro', uri=True)
+        try:
+            integridad = conexion.execute('PRAGMA integrity_check').fetchall()
+            tablas = conexion.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]
+            try:
+                alembic = conexion.execute('SELECT version_num FROM alembic_version').fetchone()
+            except sqlite3.OperationalError:
+                alembic = None
+        finally:
+            conexion.close()
+    except (OSError, EOFError, sqlite3.DatabaseError) as e:
+        return {'ok': False, 'mensaje': f'No se pudo restaurar: {e}'}
+    finally:
+        os.remove(restaurado)
+
+    if integridad != [('ok',)]:
+        return {'ok': False, 'mensaje': 'integrity_check: ' + '; '.join(fila[0] for fila in integridad[:5])}
+    return {'ok': True, 'mensaje': 'Restaurado y verificado.', 'tablas': tablas,
+            'alembic': alembic[0] if alembic else None}
+
+
+# --- Retención ---
+
+def respaldos_a_conservar(fechas, diarios, semanales, mensuales):
+    """Abuelo-padre-hijo: el más reciente de cada uno de los últimos N días, semanas ISO y meses."""
+    conservar = set()
+    for cantidad, periodo in ((diarios, lambda f: f.date()),
+                              (semanales, lambda f: f.isocalendar()[:2]),
+                              (mensuales, lambda f: (f.year, f.month))):
+        vistos = set()
+        for fecha in sorted(fechas, reverse=True):
+            clave = periodo(fecha)
+            if clave in vistos:
+                continue
+            if len(vistos) == cantidad:
+                break
+            vistos.add(clave)
+            conservar.add(fecha)
+    return conservar
+
+
+def podar_respaldos(dry_run=False):
+    """Borra los respaldos fuera de la retención GFS. Devuelve las rutas borradas (o a borrar)."""
+    config = current_app.config
+    respaldos = listar_respaldos()
+    conservar = respaldos_a_conservar([fecha for fecha, _ in respaldos], config.get('BACKUP_KEEP_DAILY', 7),
+                                      config.get('BACKUP_KEEP_WEEKLY', 4), config.get('BACKUP_KEEP_MONTHLY', 12))
+    borrados = [ruta for fecha, ruta in respaldos if fecha not in conservar]
+    if not dry_run:
+        for ruta in borrados:
+            os.remove(ruta)
+            if os.path.exists(_metadatos(ruta)):
+                os.remove(_metadatos(ruta))
+    return borrados
+
+
+# --- Instantáneas de subidas ---
+
+def carpeta_instantaneas():
+    carpeta = current_app.config['BACKUP_UPLOADS_FOLDER']
+    os.makedirs(os.path.join(carpeta, 'objetos'), exist_ok=True)
+    return carpeta
+
+
+def _ruta_objeto(carpeta, sha256):
+    return os.path.join(carpeta, 'objetos', sha256[:2], sha256[2:4], sha256)
+
+
+def listar_instantaneas(carpeta=None):
+    """[(fecha, ruta)] de los manifiestos de instantáneas, del más reciente al más antiguo."""
+    carpeta = carpeta or carpeta_instantaneas()
+    instantaneas = []
+    for nombre in os.listdir(carpeta):
+        if nombre.startswith(PREFIJO_INSTANTANEA) and nombre.endswith(EXTENSION_INSTANTANEA):
+            try:
+                fecha = datetime.strptime(nombre[len(PREFIJO_INSTANTANEA):-len(EXTENSION_INSTANTANEA)], FORMATO_FECHA)
+            except ValueError:
+                continue
+            instantaneas.append((fecha, os.path.join(carpeta, nombre)))
+    return sorted(instantaneas, reverse=True)
+
+
+def leer_manifiesto(ruta):
+    """{ruta_relativa: (sha256, tamaño, mtime_ns)} de una instantánea."""
+    archivos = {}
+    with gzip.open(ruta, 'rt', encoding='utf-8') as f:
+        for linea in f:
+            relativa, sha256, tamano, mtime_ns = json.loads(linea)
+            archivos[relativa] = (sha256, tamano, mtime_ns)
+    return archivos
+
+
+def _guardar_objeto(carpeta, origen):
+    """
+    Copia `origen` a un temporal del almacén calculando su SHA-256 en la misma lectura y lo mueve a
+    su objeto si el contenido es nuevo. Devuelve (sha256, bytes_nuevos).
+    """
+    huella = hashlib.sha256()
+    fd, temporal = tempfile.mkstemp(dir=os.path.join(carpeta, 'objetos'), prefix='.nuevo.')
+    try:
+        with os.fdopen(fd, 'wb') as salida, open(origen, 'rb') as entrada:
+            for bloque in iter(lambda: entrada.read(BLOQUE), b''):
+                huella.update(bloque)
+                salida.write(bloque)
+        sha256 = huella.hexdigest()
+        destino = _ruta_objeto(carpeta, sha256)
+        if os.path.exists(destino):
+            return sha256, 0
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        os.replace(temporal, destino)
+        return sha256, os.path.getsize(destino)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+def crear_instantanea():
+    """Instantánea incremental de BACKUP_UPLOADS_SOURCE. Devuelve sus métricas."""
+    raiz = current_app.config['BACKUP_UPLOADS_SOURCE']
+    carpeta = carpeta_instantaneas()
+    inicio = time.perf_counter()
+    anteriores = listar_instantaneas(carpeta)
+    anterior = leer_manifiesto(anteriores[0][1]) if anteriores else {}
+
+    creado = datetime.now()
+    destino = os.path.join(carpeta, f'{PREFIJO_INSTANTANEA}{creado.strftime(FORMATO_FECHA)}{EXTENSION_INSTANTANEA}')
+    if os.path.exists(destino):
+        raise FileExistsError(f'Ya existe {destino}')
+    metricas = {'archivos': 0, 'bytes': 0, 'hasheados': 0, 'objetos_nuevos': 0, 'bytes_nuevos': 0, 'omitidos': 0}
+    fd, temporal = tempfile.mkstemp(dir=carpeta, prefix='.subidas.', suffix=EXTENSION_INSTANTANEA)
+    os.close(fd)
+    try:
+        with gzip.open(temporal, 'wt', encoding='utf-8', compresslevel=6) as manifiesto:
+            for entrada in _recorrer_archivos(raiz):
+                relativa = os.path.relpath(entrada.path, raiz).replace(os.sep, '/')
+                try:
+                    estado = entrada.stat(follow_symlinks=False)
+                    previo = anterior.get(relativa)
+                    if previo and previo[1] == estado.st_size and previo[2] == estado.st_mtime_ns:
+                        sha256 = previo[0]
+                    else:
+                        sha256, nuevos = _guardar_objeto(carpeta, entrada.path)
+                        metricas['hasheados'] += 1
+                        if nuevos:
+                            metricas['objetos_nuevos'] += 1
+                            metricas['bytes_nuevos'] += nuevos
+                        # Si cambió mientras se copiaba, se copia de nuevo con el estado actual
+                        if os.stat(entrada.path).st_mtime_ns != estado.st_mtime_ns:
+                            estado = os.stat(entrada.path)
+                            sha256, _ = _guardar_objeto(carpeta, entrada.path)
+                except FileNotFoundError:
+                    # Borrado durante el recorrido
+                    metricas['omitidos'] += 1
+                    continue
+                manifiesto.write(json.dumps([relativa, sha256, estado.st_size, estado.st_mtime_ns],
+                                            separators=(',', ':')) + '\n')
+                metricas['archivos'] += 1
+                metricas['bytes'] += estado.st_size
+        os.replace(temporal, destino)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    metricas.update({
+        'instantanea': os.path.basename(destino),
+        'bytes_manifiesto': os.path.getsize(destino),
+        'duracion_s': round(time.perf_counter() - inicio, 3),
+    })
+    return metricas
+
+
+def restaurar_instantanea(instantanea, rutas=None, destino=None):
+    """
+    Restaura los archivos de `instantanea` (todos o solo `rutas`) bajo `destino` (por defecto, en su
+    lugar). Los que ya coinciden en tamaño y mtime se omiten; el resto se escribe de forma atómica
+    comprobando el SHA-256 del objeto y recuperando su mtime. Devuelve (restaurados, omitidos, faltantes).
+    """
+    carpeta = carpeta_instantaneas()
+    destino = destino or current_app.config['BACKUP_UPLOADS_SOURCE']
+    ruta = instantanea if os.path.isabs(instantanea) else os.path.join(carpeta, instantanea)
+    archivos = leer_manifiesto(ruta)
+    if rutas:
+        faltantes = [r for r in rutas if r not in archivos]
+        archivos = {r: archivos[r] for r in rutas if r in archivos}
+    else:
+        faltantes = []
+    restaurados = omitidos = 0
+    for relativa, (sha256, tamano, mtime_ns) in archivos.items():
+        final = os.path.join(destino, *relativa.split('/'))
+        try:
+            estado = os.stat(final)
+            if estado.st_size == tamano and estado.st_mtime_ns == mtime_ns:
+                omitidos += 1
+                continue
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        huella = hashlib.sha256()
+        fd, temporal = tempfile.mkstemp(dir=os.path.dirname(final), prefix='.restaurando.')
+        try:
+            with os.fdopen(fd, 'wb') as salida, open(_ruta_objeto(carpeta, sha256), 'rb') as entrada:
+                for bloque in iter(lambda: entrada.read(BLOQUE), b''):
+                    huella.update(bloque)
+                    salida.write(bloque)
+            if huella.hexdigest() != sha256:
+                raise RuntimeError(f'El objeto de {relativa} está dañado (SHA-256 distinto).')
+            os.utime(temporal, ns=(mtime_ns, mtime_ns))
+            os.replace(temporal, final)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+        restaurados += 1
+    return restaurados, omitidos, faltantes
+
+
+def podar_instantaneas(dry_run=False):
+    """
+    Aplica la retención GFS a las instantáneas y borra los objetos que ya no aparecen en ninguna.
+    Devuelve (instantáneas borradas, objetos borrados).
+    """
+    config = current_app.config
+    carpeta = carpeta_instantaneas()
+    instantaneas = listar_instantaneas(carpeta)
+    conservar = respaldos_a_conservar([fecha for fecha, _ in instantaneas], config.get('BACKUP_KEEP_DAILY', 7),
+                                      config.get('BACKUP_KEEP_WEEKLY', 4), config.get('BACKUP_KEEP_MONTHLY', 12))
+    borradas = [ruta for fecha, ruta in instantaneas if fecha not in conservar]
+    vivos = set()
+    for fecha, ruta in instantaneas:
+        if fecha in conservar:
+            vivos.update(sha256 for sha256, _, _ in leer_manifiesto(ruta).values())
+    # Los temporales (.nuevo.*) pertenecen a una instantánea en curso
+    objetos = [entrada.path for entrada in _recorrer_archivos(os.path.join(carpeta, 'objetos'))
+               if not entrada.name.startswith('.') and entrada.name not in vivos]
+    if not dry_run:
+        for ruta in borradas + objetos:
+            os.remove(ruta)
+    return borradas, objetos
+
+
+# --- Trabajo periódico, rutas y comandos ---
+
+def _resumen(datos):
+    return (f"{datos['archivo']}: {formato_bytes(datos['bytes_db'])} -> {formato_bytes(datos['bytes'])} en "
+            f"{datos['duracion_s']:.2f} s (copia {datos['copia_s']:.2f} s, {datos['pasos']} pasos, "
+            f"{datos['reinicios']} reinicios{', terminado en un solo paso' if datos['un_solo_paso'] else ''}); "
+            f"mayor espera de un escritor {datos['paso_mas_largo_ms']:.1f} ms")
+
+
+def _resumen_instantanea(datos):
+    return (f"{datos['instantanea']}: {datos['archivos']} archivos ({formato_bytes(datos['bytes'])}) en "
+            f"{datos['duracion_s']:.2f} s; {datos['hasheados']} leídos, {datos['objetos_nuevos']} objetos nuevos "
+            f"({formato_bytes(datos['bytes_nuevos'])}), manifiesto {formato_bytes(datos['bytes_manifiesto'])}")
+
+
+@periodica('respaldos.diario', cron='0 2 * * *', duracion_maxima=2 * 3600)
+def respaldo_diario():
+    datos = crear_respaldo()
+    print(f"DEBUG: Respaldo {_resumen(datos)}")
+    ruta = os.path.join(carpeta_respaldos(), datos['archivo'])
+    verificacion = verificar_respaldo(ruta)
+    if not verificacion['ok']:
+        # Se aparta antes de fallar para que no cuente como el respaldo del día; sin podar, los
+        # respaldos anteriores se conservan. El programador registra el error.
+        apartado = apartar_respaldo(ruta)
+        raise RuntimeError(f"El respaldo {datos['archivo']} no pasó la verificación ({verificacion['mensaje']}); "
+                           f"se apartó como {os.path.basename(apartado)}")
+    podar_respaldos()
+
+
+@periodica('respaldos.subidas', cron='30 2 * * *', duracion_maxima=2 * 3600)
+def instantanea_diaria():
+    datos = crear_instantanea()
+    print(f"DEBUG: Instantánea {_resumen_instantanea(datos)}")
+    podar_instantaneas()
+
+
+@respaldos_bp.route('/admin/respaldos')
+@role_required('Superuser')
+def lista_respaldos():
+    """Respaldos disponibles con sus métricas."""
+    respaldos = []
+    for _, ruta in listar_respaldos():
+        try:
+            with open(_metadatos(ruta)) as f:
+                respaldos.append(json.load(f))
+        except (OSError, ValueError):
+            respaldos.append({'archivo': os.path.basename(ruta), 'bytes': os.path.getsize(ruta)})
+    return jsonify({'success': True, 'respaldos': respaldos})
+
+
+@respaldos_bp.cli.command('crear')
+@click.option('--paginas', type=int, default=None, help='Páginas por paso (BACKUP_PAGES_PER_STEP).')
+@click.option('--pausa-ms', type=float, default=None, help='Pausa entre pasos (BACKUP_STEP_PAUSE_MS).')
+@click.option('--verificar', is_flag=True, help='Restaurar y comprobar el respaldo recién creado.')
+def crear_command(paginas, pausa_ms, verificar):
+    """Crea un respaldo comprimido de la base de datos sin detener la aplicación."""
+    datos = crear_respaldo(paginas, pausa_ms)
+    click.echo(_resumen(datos))
+    if verificar:
+        ruta = os.path.join(carpeta_respaldos(), datos['archivo'])
+        resultado = verificar_respaldo(ruta)
+        click.echo(f"Verificación: {resultado['mensaje']}")
+        if not resultado['ok']:
+            click.echo(f'Respaldo apartado como {os.path.basename(apartar_respaldo(ruta))}.')
+            raise SystemExit(1)
+
+
+@respaldos_bp.cli.command('verificar')
+@click.argument('archivo', required=False)
+def verificar_command(archivo):
+    """Restaura y comprueba un respaldo (por defecto, el más reciente)."""
+    if archivo:
+        ruta = archivo if os.path.isabs(archivo) else os.path.join(carpeta_respaldos(), archivo)
+    else:
+        respaldos = listar_respaldos()
+        if not respaldos:
+            raise click.ClickException('No hay respaldos.')
+        ruta = respaldos[0][1]
+    resultado = verificar_respaldo(ruta)
+    click.echo(f"{os.path.basename(ruta)}: {resultado['mensaje']}")
+    if not resultado['ok']:
+        raise SystemExit(1)
+
+
+@respaldos_bp.cli.command('podar')
+@click.option('--dry-run', is_flag=True, help='Solo muestra qué respaldos se borrarían.')
+def podar_command(dry_run):
+    """Aplica la retención diaria/semanal/mensual."""
+    borrados = podar_respaldos(dry_run)
+    for ruta in borrados:
+        click.echo(f"  {'se borraría' if dry_run else 'borrado'}: {os.path.basename(ruta)}")
+    click.echo(f'{len(borrados)} respaldos fuera de la retención; quedan {len(listar_respaldos())}.')
+
+
+@respaldos_bp.cli.command('subidas')
+def subidas_command():
+    """Instantánea incremental de static/uploads."""
+    click.echo(_resumen_instantanea(crear_instantanea()))
+
+
+@respaldos_bp.cli.command('restaurar-subidas')
+@click.argument('instantanea', required=False)
+@click.argument('rutas', nargs=-1)
+@click.option('--destino', type=click.Path(file_okay=False), default=None,
+              help='Carpeta donde restaurar (por defecto, en su lugar bajo static/uploads).')
+def restaurar_subidas_command(instantanea, rutas, destino):
+    """Restaura una instantánea (por defecto, la más reciente) completa o solo las RUTAS indicadas."""
+    if not instantanea:
+        instantaneas = listar_instantaneas()
+        if not instantaneas:
+            raise click.ClickException('No hay instantáneas.')
+        instantanea = instantaneas[0][1]
+    restaurados, omitidos, faltantes = restaurar_instantanea(instantanea, list(rutas), destino)
+    for ruta in faltantes:
+        click.echo(f'  no está en la instantánea: {ruta}')
+    click.echo(f'{restaurados} archivos restaurados, {omitidos} ya estaban al día.')
+
+
+@respaldos_bp.cli.command('podar-subidas')
+@click.option('--dry-run', is_flag=True, help='Solo muestra qué se borraría.')
+def podar_subidas_command(dry_run):
+    """Aplica la retención a las instantáneas y borra los objetos que ninguna usa."""
+    borradas, objetos = podar_instantaneas(dry_run)
+    for ruta in borradas:
+        click.echo(f"  {'se borraría' if dry_run else 'borrada'}: {os.path.basename(ruta)}")
+    click.echo(f'{len(borradas)} instantáneas y {len(objetos)} objetos fuera de la retención.')
@@ -1,6 +1,7 @@
 import re
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, send_file
 from models import db, User
+from http_cache import respuesta_condicional
 from datetime import datetime, date, timedelta
 from sqlalchemy import Column, Integer, String, Boolean, Text, DateTime, Date, ForeignKey
 import uuid
@@ -14,6 +15,7 @@ import os
 from flask import current_app
 import json
 from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 
 # Blueprint para el sistema de solicitudes
 solicitud_bp = Blueprint('solicitud', __name__, template_folder='templates', static_folder='static')
@@ -61,6 +63,9 @@ class Solicitud(db.Model):
     fecha_solicitud = db.Column(db.DateTime, default=datetime.utcnow)
     fecha_cancelacion = db.Column(db.DateTime, nullable=True)
 
+    # Clave generada por el cliente para que los reintentos (bandeja offline) no dupliquen solicitudes
+    clave_idempotencia = db.Column(db.String(64), unique=True, nullable=True)
+
 # Rutas del Blueprint de Solicitud
 @solicitud_bp.route('/crear_solicitud', methods=['GET', 'POST'])
 def crear_solicitud():
@@ -92,7 +97,7 @@ def guardar_usuario():
     try:
         data = request.json
         user_id = data.get('id')
-        user = User.query.get(user_id)
+        user = User.query.get(user_id) if isinstance(user_id, (int, str)) else None
         if not user:
             return jsonify({'success': False, 'message': 'Usuario no encontrado.'})
 
@@ -129,7 +134,7 @@ def ver_detalle_solicitud(solicitud_id):
 @solicitud_bp.route('/check_user', methods=['POST'])
 def check_user():
     numero_usuario = request.form.get('numero_usuario')
-    user = User.query.filter_by(telefono=numero_usuario).first()
+    user = User.por_identidad(numero_usuario, 'telefono')
 
     if user:
         solicitudes = Solicitud.query.filter(
@@ -166,9 +171,41 @@ def check_user():
             'message': 'Número de usuario no encontrado. Continúe para crear uno nuevo.'
         })
 
-@solicitud_bp.route('/guardar_solicitud', methods=['POST'])
-def guardar_solicitud():
-    data = request.json
+# Campos que el formulario envía como texto. Un cliente de la bandeja offline puede mandar
+# números (cantidad de personas, teléfonos): se convierten a texto antes de validar.
+CAMPOS_DE_TEXTO = (
+    'tipo_servicio_nuevo', 'a_donde_va', 'cantidad_personas', 'actividad_select', 'otra_actividad',
+    'lugar_salida', 'lugar_destino', 'puntos_encuentro', 'hora_salida', 'hora_retorno', 'fecha',
+    'enlace_mapa', 'nombre_personal', 'primer_apellido_personal', 'segundo_apellido_personal',
+    'telefono_personal', 'nombre_empresa', 'nombre_contacto', 'telefono_empresa', 'extension',
+    'whatsapp_empresa', 'email_empresa', 'horario_atencion', 'nota_empresa'
+)
+
+def normalizar_campos(data):
+    """
+    Devuelve (datos, None) con los campos numéricos convertidos a texto, o (None, mensaje_de_error)
+    si algún campo no es texto ni número (listas, objetos, booleanos).
+    """
+    datos = dict(data)
+    for campo in CAMPOS_DE_TEXTO:
+        valor = datos.get(campo)
+        if valor is None or isinstance(valor, str):
+            continue
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            datos[campo] = str(valor)
+        else:
+            return None, f'Formato inválido en el campo {campo}.'
+    return datos, None
+
+def construir_solicitud(data):
+    """
+    Valida los datos de una solicitud (mismo formato JSON que envía crear_solicitud.html)
+    y construye el objeto Solicitud sin confirmar la transacción.
+    Devuelve (solicitud, None) si es válida o (None, mensaje_de_error) si no lo es.
+    """
+    data, error = normalizar_campos(data)
+    if error:
+        return None, error
     user_has_account = data.get('userHasAccount')
     tipo_servicio = data.get('tipo_servicio_nuevo') or "Particular" # Asumir Particular si ya tiene cuenta
 
@@ -185,20 +222,23 @@ def guardar_solicitud():
     hora_salida = data.get('hora_salida')
     hora_retorno = data.get('hora_retorno')
     fecha_viaje_str = data.get('fecha')
-    fecha_viaje = datetime.strptime(fecha_viaje_str, '%Y-%m-%d').date() if fecha_viaje_str else None
+    try:
+        fecha_viaje = datetime.strptime(fecha_viaje_str, '%Y-%m-%d').date() if fecha_viaje_str else None
+    except (TypeError, ValueError):
+        return None, 'Formato de fecha del viaje inválido.'
     enlace_mapa = data.get('enlace_mapa')
     
     # Validar que los campos de viaje no estén vacíos antes de guardar
     if not (destino and cantidad_personas and actividad and lugar_salida and lugar_destino and fecha_viaje):
-        return jsonify({'success': False, 'message': 'Faltan datos obligatorios del viaje.'})
+        return None, 'Faltan datos obligatorios del viaje.'
         
     nueva_solicitud = None
     if user_has_account:
         # Lógica para usuario existente
         user_id = data.get('id')
-        user = User.query.get(user_id)
+        user = User.query.get(user_id) if isinstance(user_id, (int, str)) else None
         if not user:
-            return jsonify({'success': False, 'message': 'Usuario no encontrado.'})
+            return None, 'Usuario no encontrado.'
         
         iniciales = (user.nombre[0] if user.nombre else '') + \
                     (user.primer_apellido[0] if user.primer_apellido else '') + \
@@ -232,7 +272,7 @@ def guardar_solicitud():
             telefono = data.get('telefono_personal')
 
             if not (nombre and primer_apellido and telefono):
-                return jsonify({'success': False, 'message': 'Faltan datos personales obligatorios.'})
+                return None, 'Faltan datos personales obligatorios.'
 
             iniciales = (nombre[0] if nombre else '') + \
                         (primer_apellido[0] if primer_apellido else '') + \
@@ -249,7 +289,8 @@ def guardar_solicitud():
                 email=f"{str(uuid.uuid4())[:8]}@example.com"
             )
             db.session.add(nuevo_usuario)
-            db.session.commit()
+            # flush (no commit) para obtener el ID sin cerrar la transacción de la solicitud
+            db.session.flush()
             
             nueva_solicitud = Solicitud(
                 numero_solicitud=numero_solicitud_generado,
@@ -277,7 +318,7 @@ def guardar_solicitud():
             telefono_empresa = data.get('telefono_empresa')
 
             if not (nombre_empresa and nombre_contacto and telefono_empresa):
-                return jsonify({'success': False, 'message': 'Faltan datos empresariales obligatorios.'})
+                return None, 'Faltan datos empresariales obligatorios.'
 
             iniciales = (nombre_contacto[0] if nombre_contacto else '')
             numero_solicitud_generado = f"{iniciales.upper()}{telefono_empresa}-{str(uuid.uuid4())[:8]}"
@@ -305,23 +346,163 @@ def guardar_solicitud():
                 enlace_mapa=enlace_mapa
             )
         else:
-            return jsonify({'success': False, 'message': 'Tipo de servicio no válido.'})
+            return None, 'Tipo de servicio no válido.'
+
+    return nueva_solicitud, None
+
+
+def respuesta_guardada(solicitud, duplicada=False):
+    return {
+        'success': True,
+        'message': '¡Su solicitud ha sido guardada!',
+        'numero_solicitud': solicitud.numero_solicitud,
+        'solicitud_id': solicitud.id,
+        'duplicada': duplicada
+    }
+
+
+def obtener_clave_idempotencia(data):
+    clave = data.get('clave_idempotencia')
+    if not isinstance(clave, str):
+        # El cliente genera la clave con crypto.randomUUID(); cualquier otro tipo se trata como ausente
+        return None
+    return clave.strip()[:64] or None
+
+
+@solicitud_bp.route('/guardar_solicitud', methods=['POST'])
+def guardar_solicitud():
+    data = request.json
+    clave = obtener_clave_idempotencia(data)
+
+    # Un reintento con la misma clave devuelve la solicitud ya guardada en lugar de duplicarla
+    if clave:
+        existente = Solicitud.query.filter_by(clave_idempotencia=clave).first()
+        if existente:
+            return jsonify(respuesta_guardada(existente, duplicada=True))
+
+    nueva_solicitud, error = construir_solicitud(data)
+    if error:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': error})
+    nueva_solicitud.clave_idempotencia = clave
 
     try:
         db.session.add(nueva_solicitud)
         db.session.commit()
-        return jsonify({
-            'success': True,
-            'message': '¡Su solicitud ha sido guardada!',
-            'numero_solicitud': nueva_solicitud.numero_solicitud,
-            'solicitud_id': nueva_solicitud.id
-        })
+        return jsonify(respuesta_guardada(nueva_solicitud))
+    except IntegrityError:
+        # Otra petición con la misma clave se confirmó primero
+        db.session.rollback()
+        existente = Solicitud.query.filter_by(clave_idempotencia=clave).first() if clave else None
+        if existente:
+            return jsonify(respuesta_guardada(existente, duplicada=True))
+        return jsonify({'success': False, 'message': 'Error al guardar la solicitud.'})
     except Exception as e:
         db.session.rollback()
         print(f"Error al guardar la solicitud: {e}")
         return jsonify({'success': False, 'message': f'Error al guardar la solicitud: {e}'})
 
+
+# Máximo de solicitudes aceptadas en un solo lote de sincronización
+MAX_LOTE_SOLICITUDES = 100
+
+@solicitud_bp.route('/guardar_solicitudes_batch', methods=['POST'])
+def guardar_solicitudes_batch():
+    """
+    Guarda en una sola transacción las solicitudes capturadas sin conexión (bandeja de salida
+    de IndexedDB). Cada elemento debe traer `clave_idempotencia`; las claves ya registradas
+    se devuelven como duplicadas, de modo que los reintentos nunca crean registros repetidos.
+    Los elementos inválidos se informan individualmente y no impiden guardar los demás.
+    """
+    data = request.get_json(silent=True) or {}
+    elementos = data.get('solicitudes')
+    if not isinstance(elementos, list) or not elementos:
+        return jsonify({'success': False, 'message': 'No se recibieron solicitudes.'}), 400
+    if len(elementos) > MAX_LOTE_SOLICITUDES:
+        return jsonify({'success': False, 'message': f'Máximo {MAX_LOTE_SOLICITUDES} solicitudes por lote.'}), 413
+
+    # Dos intentos: si otra petición confirma alguna de las claves en paralelo (IntegrityError),
+    # se revierte el lote y el segundo intento las resuelve como duplicadas.
+    for intento in range(2):
+        resultados = []
+        nuevas = []
+        claves = [obtener_clave_idempotencia(e) for e in elementos if isinstance(e, dict)]
+        existentes = {
+            s.clave_idempotencia: s
+            for s in Solicitud.query.filter(Solicitud.clave_idempotencia.in_([c for c in claves if c])).all()
+        }
+        vistas = {}
+
+        for elemento in elementos:
+            if not isinstance(elemento, dict):
+                resultados.append({'clave_idempotencia': None, 'estado': 'invalida', 'message': 'Formato inválido.'})
+                continue
+            clave = obtener_clave_idempotencia(elemento)
+            if not clave:
+                resultados.append({'clave_idempotencia': None, 'estado': 'invalida', 'message': 'Falta la clave de idempotencia o no es texto.'})
+                continue
+            if clave in existentes:
+                resultados.append({'clave_idempotencia': clave, 'estado': 'duplicada', **respuesta_guardada(existentes[clave], duplicada=True)})
+                continue
+            if clave in vistas:
+                # Clave repetida dentro del mismo lote: se resuelve con la primera aparición
+                resultados.append({'clave_idempotencia': clave, 'estado': 'duplicada', 'indice_original': vistas[clave]})
+                continue
+
+            solicitud, error = construir_solicitud(elemento)
+            if error:
+                resultados.append({'clave_idempotencia': clave, 'estado': 'invalida', 'message': error})
+                continue
+            solicitud.clave_idempotencia = clave
+            db.session.add(solicitud)
+            vistas[clave] = len(resultados)
+            nuevas.append((len(resultados), solicitud))
+            resultados.append(None) # Se completa después del commit, cuando ya existe el ID
+
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            if intento == 0:
+                continue
+            return jsonify({'success': False, 'message': 'Conflicto al guardar el lote, intente de nuevo.'}), 409
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error al guardar el lote de solicitudes: {e}")
+            return jsonify({'success': False, 'message': f'Error al guardar el lote: {e}'}), 500
+
+        for indice, solicitud in nuevas:
+            resultados[indice] = {'clave_idempotencia': solicitud.clave_idempotencia, 'estado': 'guardada', **respuesta_guardada(solicitud)}
+        for indice, resultado in enumerate(resultados):
+            if resultado and 'indice_original' in resultado:
+                original = resultados[resultado.pop('indice_original')]
+                resultado.update({k: v for k, v in original.items() if k not in ('estado', 'duplicada')}, duplicada=True)
+
+        return jsonify({
+            'success': True,
+            'guardadas': len(nuevas),
+            'resultados': resultados
+        })
+
+# Validadores HTTP: Solicitud no tiene fecha de actualización, así que el ETag se deriva
+# del contenido de la fila. La fila queda en el identity map y la vista no la vuelve a consultar.
+def huella_solicitud(solicitud):
+    return tuple(getattr(solicitud, c.name) for c in Solicitud.__table__.columns)
+
+def validador_get_solicitud(solicitud_id):
+    solicitud = db.session.get(Solicitud, solicitud_id)
+    if not solicitud:
+        return None
+    return huella_solicitud(solicitud), None
+
+def validador_exportar_solicitud(solicitud_id, formato):
+    solicitud = db.session.get(Solicitud, solicitud_id)
+    if not solicitud:
+        return None
+    return (formato,) + huella_solicitud(solicitud), None
+
 @solicitud_bp.route('/get_solicitud/<int:solicitud_id>')
+@respuesta_condicional(validador_get_solicitud)
 def get_solicitud(solicitud_id):
     solicitud = Solicitud.query.get(solicitud_id)
     if not solicitud:
@@ -351,6 +532,7 @@ def get_solicitud(solicitud_id):
 
 
 @solicitud_bp.route('/exportar/<int:solicitud_id>/<string:formato>')
+@respuesta_condicional(validador_exportar_solicitud, debil=True)
 def exportar_solicitud(solicitud_id, formato):
     solicitud = Solicitud.query.get_or_404(solicitud_id)
     
@@ -393,7 +575,7 @@ def exportar_solicitud(solicitud_id, formato):
             output.write(f"{key}: {value}\n".encode('utf-8'))
         
         output.seek(0)
-        return current_app.send_file(
+        return send_file(
             output,
             mimetype='text/plain',
             as_attachment=True,
@@ -436,7 +618,7 @@ def exportar_solicitud(solicitud_id, formato):
         buffer.seek(0)
         
         if formato == 'pdf':
-            return current_app.send_file(
+            return send_file(
                 buffer,
                 mimetype='application/pdf',
                 as_attachment=True,
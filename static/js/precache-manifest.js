@@ -0,0 +1,61 @@
+// precache-manifest.js
+// Generado con `flask pwa generar-precache`. No editar a mano.
+self.__PRECACHE_VERSION = "2da157c1e546";
+self.__PRECACHE_MANIFEST = [
+    {
+        "url": "/offline.html",
+        "revision": "b01d86944c2ec362"
+    },
+    {
+        "url": "/static/css/all.min.css",
+        "revision": "16e807c93beb928c"
+    },
+    {
+        "url": "/static/css/base.css",
+        "revision": "ba7851fa569d2a4c"
+    },
+    {
+        "url": "/static/css/main.css",
+        "revision": "30117636a05b2c2e"
+    },
+    {
+        "url": "/static/css/rutas.css",
+        "revision": "ef2db6a1d0c3cfa5"
+    },
+    {
+        "url": "/static/js/ckeditor.js",
+        "revision": "a4a83ccd4ef7d2f7"
+    },
+    {
+        "url": "/static/js/navbar.js",
+        "revision": "e3b0c44298fc1c14"
+    },
+    {
+        "url": "/static/js/solicitud-outbox.js",
+        "revision": "f5aa2d51f32fb6ce"
+    },
+    {
+        "url": "/static/js/timezone_converter.js",
+        "revision": "e3aada68c3dcbed8"
+    },
+    {
+        "url": "/static/manifest.json",
+        "revision": "25a8493e19dae31b"
+    },
+    {
+        "url": "/static/webfonts/fa-brands-400.woff2",
+        "revision": "8ea8791754915a89"
+    },
+    {
+        "url": "/static/webfonts/fa-regular-400.woff2",
+        "revision": "e42a88444448ac3d"
+    },
+    {
+        "url": "/static/webfonts/fa-solid-900.woff2",
+        "revision": "9834b82ad26e2a37"
+    },
+    {
+        "url": "/static/webfonts/fa-v4compatibility.woff2",
+        "revision": "0ce9033c69dc714f"
+    }
+];
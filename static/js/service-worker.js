@@ -1,105 +1,303 @@
 // service-worker.js
 
-// Versión de la caché. Cámbiala para forzar la actualización del Service Worker y la caché.
-const CACHE_NAME = 'la-tribu-pwa-cache-v1.0.5';
-
-// Archivos esenciales para cachear durante la instalación.
-const urlsToCache = [
-    '/',
-    '/offline.html', // Página para mostrar cuando no hay conexión
-    '/static/manifest.json', // El manifest de la PWA
-    '/static/css/main.css',
-    'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
-    'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0-beta3/css/all.min.css',
-    'https://cdn.jsdelivr.net/npm/@popperjs/core@2.11.7/dist/umd/popper.min.js',
-    'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.min.js',
-    // Asegúrate de que las rutas a tus imágenes y otros assets sean correctas.
-    '/static/uploads/icons/icon-192x192.jpg',
-    '/static/uploads/icons/icon-512x512.jpg'
+// Lista de precache generada con `flask pwa generar-precache` (URL + hash de contenido).
+// Define self.__PRECACHE_VERSION y self.__PRECACHE_MANIFEST.
+// Rutas absolutas: el Service Worker se sirve desde /service-worker.js para controlar todo el sitio.
+importScripts('/static/js/precache-manifest.js');
+// Bandeja de salida offline de solicitudes (self.SolicitudOutbox).
+importScripts('/static/js/solicitud-outbox.js');
+
+const PRECACHE_NAME = `la-tribu-precache-${self.__PRECACHE_VERSION}`;
+const STATIC_CACHE_NAME = 'la-tribu-static-v1';
+// v2: la v1 podía contener páginas privadas de usuarios autenticados y se elimina al activar
+const HTML_CACHE_NAME = 'la-tribu-html-v3';
+const CACHES_ACTUALES = [PRECACHE_NAME, STATIC_CACHE_NAME, HTML_CACHE_NAME];
+
+// Límites de entradas por caché de runtime (se expulsan las más antiguas).
+const STATIC_MAX_ENTRIES = 80;
+const HTML_MAX_ENTRIES = 20;
+
+// Tiempo máximo de espera de la red para páginas HTML antes de usar la copia en caché.
+const HTML_NETWORK_TIMEOUT_MS = 4000;
+
+const OFFLINE_URL = '/offline.html';
+
+// Páginas HTML que se pueden guardar para verlas sin conexión. Las demás (contactos, perfiles,
+// solicitudes...) muestran datos de la sesión y nunca se guardan; tampoco las respuestas
+// marcadas como private o no-store. Con sesión iniciada, / y /home llevan el usuario en la barra
+// de navegación y el servidor las envía como private: solo se guarda la versión anónima.
+const HTML_CACHE_ALLOWLIST = ['/', '/home', '/login'];
+
+// Al cerrar sesión se borran las páginas guardadas para que el siguiente usuario del dispositivo no las vea.
+const LOGOUT_PATHS = ['/logout'];
+
+// Orígenes externos (CDN) cuyos recursos se tratan como estáticos.
+const CDN_ORIGINS = [
+    'https://cdn.jsdelivr.net',
+    'https://cdnjs.cloudflare.com',
 ];
 
-// Evento 'install': Se dispara cuando el Service Worker se instala.
+// --- Utilidades del precache ---
+
+// La revisión forma parte de la clave para que cada versión del archivo ocupe su propia entrada.
+function precacheKey(entry) {
+    const url = new URL(entry.url, self.location.origin);
+    url.searchParams.set('__rev', entry.revision);
+    return url.href;
+}
+
+const PRECACHE_KEYS = new Map(
+    (self.__PRECACHE_MANIFEST || []).map((entry) => [new URL(entry.url, self.location.origin).href, precacheKey(entry)])
+);
+
+// Reutiliza las entradas cuya revisión no cambió (están en el precache anterior) y descarga solo las nuevas.
+async function precacheAll() {
+    const cache = await caches.open(PRECACHE_NAME);
+    const entries = self.__PRECACHE_MANIFEST || [];
+    await Promise.all(entries.map(async (entry) => {
+        const key = precacheKey(entry);
+        if (await cache.match(key)) {
+            return;
+        }
+        const previous = await caches.match(key);
+        if (previous) {
+            await cache.put(key, previous);
+            return;
+        }
+        const response = await fetch(entry.url, { cache: 'reload', credentials: 'same-origin' });
+        if (!response.ok) {
+            throw new Error(`No se pudo precachear ${entry.url}: ${response.status}`);
+        }
+        await cache.put(key, response);
+    }));
+}
+
+// --- Utilidades de runtime ---
+
+async function trimCache(cacheName, maxEntries) {
+    const cache = await caches.open(cacheName);
+    const keys = await cache.keys();
+    // cache.keys() devuelve las entradas en orden de inserción: se borran las más antiguas.
+    for (let i = 0; i < keys.length - maxEntries; i++) {
+        await cache.delete(keys[i]);
+    }
+}
+
+async function putInCache(cacheName, maxEntries, request, response) {
+    const cache = await caches.open(cacheName);
+    // Se borra antes de guardar para que la entrada pase al final del orden de inserción (LRU aproximado).
+    await cache.delete(request);
+    await cache.put(request, response);
+    await trimCache(cacheName, maxEntries);
+}
+
+function isCacheable(response) {
+    if (!response || !(response.ok || response.type === 'opaque')) {
+        return false;
+    }
+    const cacheControl = response.headers.get('Cache-Control') || '';
+    return !cacheControl.includes('no-store');
+}
+
+// Solo páginas de la lista, sin redirecciones y sin Cache-Control: private.
+function isHtmlCacheable(request, response) {
+    const url = new URL(request.url);
+    const contentType = response.headers.get('Content-Type') || '';
+    const cacheControl = response.headers.get('Cache-Control') || '';
+    return HTML_CACHE_ALLOWLIST.includes(url.pathname)
+        && !url.search
+        && !response.redirected
+        && contentType.includes('text/html')
+        && !cacheControl.includes('private')
+        && isCacheable(response);
+}
+
+async function clearHtmlCache() {
+    await caches.delete(HTML_CACHE_NAME);
+}
+
+// Clasifica cada solicitud GET en: 'precache', 'api', 'static', 'html' o null (se deja pasar a la red).
+function routeClass(request, url) {
+    if (PRECACHE_KEYS.has(url.href)) {
+        return 'precache';
+    }
+    if (url.origin === self.location.origin) {
+        if (url.pathname.startsWith('/api/')) {
+            return 'api';
+        }
+        const accept = request.headers.get('Accept') || '';
+        if (accept.includes('application/json')) {
+            return 'api';
+        }
+        if (url.pathname.startsWith('/static/')) {
+            return 'static';
+        }
+        if (request.mode === 'navigate' || accept.includes('text/html')) {
+            return 'html';
+        }
+        return null;
+    }
+    if (CDN_ORIGINS.includes(url.origin)) {
+        return 'static';
+    }
+    return null;
+}
+
+// --- Estrategias ---
+
+async function precacheFirst(request, url) {
+    const cached = await caches.match(PRECACHE_KEYS.get(url.href));
+    return cached || fetch(request);
+}
+
+// Stale-while-revalidate: responde con la copia en caché y la actualiza en segundo plano.
+async function staleWhileRevalidate(event) {
+    const request = event.request;
+    const cached = await caches.match(request, { cacheName: STATIC_CACHE_NAME });
+    const network = fetch(request)
+        .then(async (response) => {
+            if (isCacheable(response)) {
+                await putInCache(STATIC_CACHE_NAME, STATIC_MAX_ENTRIES, request, response.clone());
+            }
+            return response;
+        });
+    if (cached) {
+        event.waitUntil(network.catch(() => undefined));
+        return cached;
+    }
+    return network;
+}
+
+// Network-first con tiempo límite: la red siempre tiene prioridad; la caché solo se usa si falla o tarda.
+async function networkFirstWithTimeout(event) {
+    const request = event.request;
+    const network = fetch(request).then(async (response) => {
+        if (isHtmlCacheable(request, response)) {
+            await putInCache(HTML_CACHE_NAME, HTML_MAX_ENTRIES, request, response.clone());
+        }
+        return response;
+    });
+
+    let timeoutId;
+    const timeout = new Promise((resolve) => {
+        timeoutId = setTimeout(resolve, HTML_NETWORK_TIMEOUT_MS);
+    });
+
+    try {
+        const response = await Promise.race([network, timeout]);
+        if (response) {
+            return response;
+        }
+        const cached = await caches.match(request, { cacheName: HTML_CACHE_NAME });
+        if (cached) {
+            event.waitUntil(network.catch(() => undefined));
+            return cached;
+        }
+        return await network;
+    } catch (error) {
+        const cached = await caches.match(request, { cacheName: HTML_CACHE_NAME });
+        return cached || (await caches.match(PRECACHE_KEYS.get(new URL(OFFLINE_URL, self.location.origin).href)));
+    } finally {
+        clearTimeout(timeoutId);
+    }
+}
+
+// Evento 'install': descarga (o reutiliza) los archivos del manifiesto de precache.
 self.addEventListener('install', (event) => {
-    console.log('[Service Worker] Instalando...');
+    console.log('[Service Worker] Instalando precache', self.__PRECACHE_VERSION);
     event.waitUntil(
-        caches.open(CACHE_NAME)
-            .then((cache) => {
-                console.log('[Service Worker] Cacheando archivos esenciales');
-                return cache.addAll(urlsToCache);
-            })
+        precacheAll()
+            .then(() => self.skipWaiting())
             .catch((error) => {
-                console.error('[Service Worker] Falló la caché de archivos esenciales:', error);
+                console.error('[Service Worker] Falló el precache:', error);
+                throw error;
             })
     );
-    // Forzar al nuevo Service Worker a activarse inmediatamente.
-    self.skipWaiting();
 });
 
-// Evento 'activate': Se dispara cuando el Service Worker se activa.
+// Evento 'activate': elimina las cachés de versiones anteriores.
 self.addEventListener('activate', (event) => {
     console.log('[Service Worker] Activando...');
     event.waitUntil(
-        caches.keys().then((cacheNames) => {
-            return Promise.all(
-                cacheNames.map((cacheName) => {
-                    // Elimina las cachés antiguas que no coincidan con la versión actual.
-                    if (cacheName !== CACHE_NAME) {
+        caches.keys()
+            .then((cacheNames) => Promise.all(
+                cacheNames
+                    .filter((cacheName) => !CACHES_ACTUALES.includes(cacheName))
+                    .map((cacheName) => {
                         console.log('[Service Worker] Eliminando caché antigua:', cacheName);
                         return caches.delete(cacheName);
-                    }
-                })
-            );
-        })
+                    })
+            ))
+            .then(() => self.clients.claim())
     );
-    // Toma el control de las páginas abiertas para que el Service Worker funcione de inmediato.
-    return self.clients.claim();
 });
 
-// Evento 'fetch': Intercepta todas las solicitudes de red.
+// Evento 'fetch': aplica la estrategia según la clase de ruta.
 self.addEventListener('fetch', (event) => {
-    // Solo procesa solicitudes GET.
     if (event.request.method !== 'GET') {
         return;
     }
+    const url = new URL(event.request.url);
 
-    // Estrategia: Cache First, then Network, with Offline Fallback for navigation.
-    event.respondWith(
-        caches.match(event.request)
-            .then((cachedResponse) => {
-                // Si el recurso está en la caché, lo servimos desde allí.
-                if (cachedResponse) {
-                    // Opcional: Actualizar la caché en segundo plano (stale-while-revalidate)
-                    // fetch(event.request).then(networkResponse => {
-                    //     caches.open(CACHE_NAME).then(cache => cache.put(event.request, networkResponse));
-                    // });
-                    return cachedResponse;
-                }
-
-                // Si no está en caché, vamos a la red.
-                return fetch(event.request)
-                    .then((networkResponse) => {
-                        // Si la respuesta es válida, la guardamos en caché para futuras solicitudes.
-                        if (networkResponse && networkResponse.status === 200) {
-                            const responseToCache = networkResponse.clone();
-                            caches.open(CACHE_NAME)
-                                .then((cache) => {
-                                    cache.put(event.request, responseToCache);
-                                });
-                        }
-                        return networkResponse;
-                    });
-            })
-            .catch(() => {
-                // Si todo falla (sin caché y sin red), mostramos la página offline.
-                // Esto es crucial para las solicitudes de navegación.
-                if (event.request.mode === 'navigate') {
-                    return caches.match('/offline.html');
-                }
-                // Para otros tipos de solicitudes, puedes devolver una respuesta de error genérica.
-                return new Response("Contenido no disponible sin conexión.", {
-                    status: 404,
-                    statusText: "Offline"
-                });
-            })
-    );
+    if (url.origin === self.location.origin && LOGOUT_PATHS.includes(url.pathname)) {
+        event.respondWith(clearHtmlCache().then(() => fetch(event.request)));
+        return;
+    }
+
+    switch (routeClass(event.request, url)) {
+        case 'precache':
+            event.respondWith(precacheFirst(event.request, url));
+            break;
+        case 'static':
+            event.respondWith(staleWhileRevalidate(event));
+            break;
+        case 'html':
+            event.respondWith(networkFirstWithTimeout(event));
+            break;
+        case 'api':
+            // no-store: las respuestas de API nunca se guardan en caché.
+            event.respondWith(fetch(event.request, { cache: 'no-store' }));
+            break;
+        default:
+            // Sin estrategia: el navegador maneja la solicitud normalmente.
+            break;
+    }
+});
+
+// Mensaje { tipo: 'limpiar-html' } desde las páginas (p. ej. cuando la sesión expira).
+self.addEventListener('message', (event) => {
+    if (event.data && event.data.tipo === 'limpiar-html') {
+        event.waitUntil(clearHtmlCache());
+    }
+});
+
+// Evento 'sync' (Background Sync): reenvía las solicitudes capturadas sin conexión.
+self.addEventListener('sync', (event) => {
+    if (event.tag === self.SolicitudOutbox.SYNC_TAG) {
+        event.waitUntil(self.SolicitudOutbox.sincronizar());
+    }
+});
+
+// Evento 'push': notificación enviada desde push.py ({title, body, url}).
+self.addEventListener('push', (event) => {
+    let datos = {};
+    try {
+        datos = event.data ? event.data.json() : {};
+    } catch (e) {
+        datos = { body: event.data ? event.data.text() : '' };
+    }
+    event.waitUntil(self.registration.showNotification(datos.title || 'La Tribu', {
+        body: datos.body || '',
+        data: { url: datos.url || '/' },
+    }));
+});
+
+// Al tocar la notificación se enfoca una pestaña abierta de la app o se abre la URL indicada.
+self.addEventListener('notificationclick', (event) => {
+    event.notification.close();
+    const destino = new URL(event.notification.data.url || '/', self.location.origin).href;
+    event.waitUntil(clients.matchAll({ type: 'window', includeUncontrolled: true }).then((ventanas) => {
+        const abierta = ventanas.find((ventana) => ventana.url === destino);
+        return abierta ? abierta.focus() : clients.openWindow(destino);
+    }));
 });
@@ -0,0 +1,179 @@
+// solicitud-outbox.js
+// Bandeja de salida offline para crear_solicitud.html.
+// Las solicitudes que no se pueden enviar se guardan en IndexedDB y se reenvían en lote a
+// /guardar_solicitudes_batch mediante Background Sync (o al recuperar la conexión).
+// Las que el servidor rechaza no se borran: quedan con estado 'rechazada' y su mensaje de error
+// para que el usuario las corrija o las descarte desde la página.
+// Este archivo se carga tanto en la página como en el Service Worker (importScripts).
+
+(function (global) {
+    const DB_NAME = 'la-tribu-outbox';
+    const DB_VERSION = 1;
+    const STORE = 'solicitudes';
+    const SYNC_TAG = 'sync-solicitudes';
+    const BATCH_URL = '/guardar_solicitudes_batch';
+    const BATCH_SIZE = 50;
+    const ESTADO_RECHAZADA = 'rechazada';
+
+    function openDb() {
+        return new Promise((resolve, reject) => {
+            const request = indexedDB.open(DB_NAME, DB_VERSION);
+            request.onupgradeneeded = () => {
+                const db = request.result;
+                if (!db.objectStoreNames.contains(STORE)) {
+                    // La clave de idempotencia identifica cada solicitud en la bandeja y en el servidor
+                    db.createObjectStore(STORE, { keyPath: 'clave_idempotencia' });
+                }
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    function withStore(mode, callback) {
+        return openDb().then((db) => new Promise((resolve, reject) => {
+            const tx = db.transaction(STORE, mode);
+            const store = tx.objectStore(STORE);
+            const result = callback(store);
+            tx.oncomplete = () => {
+                db.close();
+                resolve(result && 'result' in result ? result.result : result);
+            };
+            tx.onerror = () => {
+                db.close();
+                reject(tx.error);
+            };
+        }));
+    }
+
+    function nuevaClave() {
+        if (global.crypto && global.crypto.randomUUID) {
+            return global.crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+    }
+
+    // Registra Background Sync si está disponible; si no, se sincroniza al volver la conexión.
+    function programarSincronizacion() {
+        if (!('serviceWorker' in navigator)) {
+            return Promise.resolve(false);
+        }
+        return navigator.serviceWorker.ready
+            .then((registration) => {
+                if (registration.sync) {
+                    return registration.sync.register(SYNC_TAG).then(() => true);
+                }
+                return false;
+            })
+            .catch(() => false);
+    }
+
+    // Una solicitud corregida vuelve a la bandeja como pendiente (con la misma clave)
+    function encolar(data) {
+        const { estado, error, rechazada_en, ...datos } = data;
+        const item = Object.assign({}, datos, {
+            clave_idempotencia: data.clave_idempotencia || nuevaClave(),
+            encolada_en: new Date().toISOString(),
+        });
+        return withStore('readwrite', (store) => store.put(item))
+            .then(() => {
+                if (typeof window !== 'undefined') {
+                    programarSincronizacion();
+                }
+                return item;
+            });
+    }
+
+    function todas() {
+        return withStore('readonly', (store) => store.getAll());
+    }
+
+    // Solicitudes por enviar (las rechazadas esperan a que el usuario las corrija)
+    function pendientes() {
+        return todas().then((items) => items.filter((item) => item.estado !== ESTADO_RECHAZADA));
+    }
+
+    function rechazadas() {
+        return todas().then((items) => items.filter((item) => item.estado === ESTADO_RECHAZADA));
+    }
+
+    function eliminar(claves) {
+        return withStore('readwrite', (store) => {
+            claves.forEach((clave) => store.delete(clave));
+        });
+    }
+
+    function marcarRechazadas(rechazos) {
+        if (!rechazos.length) {
+            return Promise.resolve();
+        }
+        const ahora = new Date().toISOString();
+        return withStore('readwrite', (store) => {
+            rechazos.forEach(({ item, message }) => store.put(Object.assign({}, item, {
+                estado: ESTADO_RECHAZADA,
+                error: message || 'El servidor rechazó la solicitud.',
+                rechazada_en: ahora,
+            })));
+        });
+    }
+
+    function descartar(clave) {
+        return eliminar([clave]);
+    }
+
+    // Envía la bandeja en lotes. Solo las solicitudes guardadas o duplicadas salen de la bandeja;
+    // las rechazadas se marcan y se conservan. Si la red falla la promesa se rechaza y Background
+    // Sync reintenta más tarde.
+    function sincronizar() {
+        return pendientes().then((items) => {
+            const lotes = [];
+            for (let i = 0; i < items.length; i += BATCH_SIZE) {
+                lotes.push(items.slice(i, i + BATCH_SIZE));
+            }
+            const resumen = { guardadas: 0, duplicadas: 0, invalidas: [] };
+            return lotes.reduce((promesa, lote) => promesa.then(() =>
+                fetch(BATCH_URL, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json', 'Accept': 'application/json' },
+                    credentials: 'same-origin',
+                    body: JSON.stringify({ solicitudes: lote }),
+                })
+                    .then((response) => {
+                        if (!response.ok) {
+                            throw new Error(`Error ${response.status} al sincronizar solicitudes`);
+                        }
+                        return response.json();
+                    })
+                    .then((data) => {
+                        const enviadas = [];
+                        const rechazos = [];
+                        (data.resultados || []).forEach((resultado, indice) => {
+                            const clave = lote[indice].clave_idempotencia;
+                            if (resultado.estado === 'guardada') {
+                                resumen.guardadas += 1;
+                                enviadas.push(clave);
+                            } else if (resultado.estado === 'duplicada') {
+                                resumen.duplicadas += 1;
+                                enviadas.push(clave);
+                            } else {
+                                resumen.invalidas.push({ clave_idempotencia: clave, message: resultado.message });
+                                rechazos.push({ item: lote[indice], message: resultado.message });
+                            }
+                        });
+                        return eliminar(enviadas).then(() => marcarRechazadas(rechazos));
+                    })
+            ), Promise.resolve()).then(() => resumen);
+        });
+    }
+
+    global.SolicitudOutbox = {
+        SYNC_TAG,
+        nuevaClave,
+        encolar,
+        pendientes,
+        rechazadas,
+        descartar,
+        sincronizar,
+        programarSincronizacion,
+    };
+})(self);
@@ -0,0 +1,661 @@
+# storage.py
+# Almacén de archivos subidos direccionado por contenido (SHA-256) con conteo de referencias.
+# Cada contenido distinto se guarda una sola vez en BLOB_STORE_FOLDER/<ab>/<cd>/<sha256><extensión>,
+# donde ab y cd son los primeros caracteres del hash (ningún directorio crece sin límite).
+# Las columnas de ruta de los modelos (User.avatar_url, File.file_path, Colaborador.foto_perfil,
+# FotografiaVehiculo.url_foto, AboutUs.logo_filename) guardan la ruta del blob relativa a static/,
+# que es única en la tabla blobs, por lo que las plantillas siguen usando url_for('static', ...).
+import os
+import re
+import shutil
+import time
+import hashlib
+import tempfile
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+import click
+from flask import Blueprint, current_app, request, send_file
+from werkzeug.utils import send_file as werkzeug_send_file
+from sqlalchemy import event, select, update, delete, func
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Blob, User, File, AboutUs
+from programador import periodica, invocar_comando
+
+storage_bp = Blueprint('storage', __name__)
+
+# Tamaño de bloque para copiar y calcular hashes sin cargar archivos completos en memoria
+BLOQUE = 64 * 1024
+
+# Imágenes por defecto compartidas: no son subidas de usuarios y nunca se mueven al almacén
+RUTAS_POR_DEFECTO = {
+    'uploads/avatars/default.png',
+    'uploads/colaboradores/default.png',
+}
+
+# Clave en session.info con los blobs que quedaron sin referencias en la transacción actual
+_BLOBS_LIBERADOS = 'blobs_liberados'
+
+
+def carpeta_blobs():
+    return current_app.config['BLOB_STORE_FOLDER']
+
+
+def prefijo_blobs():
+    """Ruta de la carpeta del almacén relativa a static/, con barra final (p. ej. 'uploads/blobs/')."""
+    return os.path.relpath(carpeta_blobs(), current_app.static_folder).replace('\\', '/') + '/'
+
+
+def es_blob(ruta):
+    return bool(ruta) and ruta.startswith(prefijo_blobs())
+
+
+def ruta_absoluta(ruta):
+    """Convierte una ruta relativa a static/ en la ruta del archivo en disco."""
+    return os.path.join(current_app.static_folder, *ruta.split('/'))
+
+
+def extension_segura(nombre):
+    extension = os.path.splitext(nombre or '')[1].lower()
+    return extension if re.match(r'^\.[a-z0-9]{1,10}$', extension) else ''
+
+
+def ruta_blob(sha256, extension):
+    """Ruta fragmentada en dos niveles (256 x 256 directorios): uploads/blobs/ab/cd/abcd...<ext>."""
+    return f'{prefijo_blobs()}{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+
+
+_NOMBRE_BLOB_RE = re.compile(r'^([0-9a-f]{64})(\.[a-z0-9]{1,10})?$')
+
+
+def ubicar_por_nombre(nombre):
+    """
+    Ruta en disco de un blob a partir de su nombre (<sha256><ext>), para las rutas de servicio
+    que solo reciben el nombre. También busca en la carpeta plana anterior a `flask storage fragmentar`.
+    Devuelve None si el nombre no es de un blob o el archivo no existe.
+    """
+    coincidencia = _NOMBRE_BLOB_RE.match(nombre)
+    if not coincidencia:
+        return None
+    sha256, extension = coincidencia.group(1), coincidencia.group(2) or ''
+    for candidata in (ruta_absoluta(ruta_blob(sha256, extension)), os.path.join(carpeta_blobs(), nombre)):
+        if os.path.isfile(candidata):
+            return candidata
+    return None
+
+
+def hash_archivo(ruta):
+    huella = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(BLOQUE), b''):
+            huella.update(bloque)
+    return huella.hexdigest()
+
+
+def _registrar_referencia(sha256, ruta, tamano, mime_type):
+    """
+    Crea el blob con una referencia o suma una si ya existía (atómico en SQLite) y devuelve la ruta
+    registrada del blob. La sentencia toma el bloqueo de escritura de SQLite hasta el commit.
+    """
+    stmt = sqlite_insert(Blob).values(
+        sha256=sha256, path=ruta, size=tamano, mime_type=mime_type,
+        ref_count=1, created_at=datetime.utcnow()
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['sha256'],
+        set_={'ref_count': Blob.__table__.c.ref_count + 1}
+    )
+    db.session.execute(stmt)
+    # Si el blob ya existía conserva su ruta (p. ej. con otra extensión o en la carpeta plana)
+    ruta = db.session.execute(select(Blob.path).where(Blob.sha256 == sha256)).scalar()
+    # Si se vuelve a referenciar un blob liberado en esta misma transacción, ya no se borra
+    pendientes = db.session.info.get(_BLOBS_LIBERADOS)
+    if pendientes:
+        pendientes.pop(ruta, None)
+    return ruta
+
+
+def guardar_archivo(ruta_origen, nombre_original, sha256=None, mime_type=None, conservar_origen=False):
+    """
+    Incorpora un archivo ya presente en disco al almacén y suma una referencia (sin commit).
+    Si el contenido ya existía, el archivo de origen se descarta. Devuelve la ruta del blob.
+    """
+    if sha256 is None:
+        sha256 = hash_archivo(ruta_origen)
+    tamano = os.path.getsize(ruta_origen)
+
+    # La referencia se suma antes de mirar el disco: desde aquí esta transacción tiene el bloqueo de
+    # escritura y _borrar_blobs_liberados (que lo necesita para borrar) no puede quitar el archivo
+    # hasta que confirme. Si otra transacción lo borró antes, el archivo ya no está y se vuelve a poner.
+    ruta = _registrar_referencia(sha256, ruta_blob(sha256, extension_segura(nombre_original)), tamano, mime_type)
+    destino = ruta_absoluta(ruta)
+
+    if os.path.exists(destino):
+        if not conservar_origen:
+            os.remove(ruta_origen)
+        return ruta
+
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    if conservar_origen:
+        fd, temporal = tempfile.mkstemp(dir=os.path.dirname(destino), prefix='.copia-')
+        os.close(fd)
+        shutil.copyfile(ruta_origen, temporal)
+        os.replace(temporal, destino)
+    else:
+        shutil.move(ruta_origen, destino)
+    return ruta
+
+
+def guardar_stream(stream, nombre_original, mime_type=None):
+    """
+    Guarda un stream (p. ej. FileStorage.stream) calculando el SHA-256 en la misma pasada.
+    Se escribe a un temporal dentro del almacén para que el paso final sea un rename.
+    Devuelve (ruta del blob, sha256).
+    """
+    os.makedirs(carpeta_blobs(), exist_ok=True)
+    huella = hashlib.sha256()
+    fd, temporal = tempfile.mkstemp(dir=carpeta_blobs(), prefix='.subida-')
+    try:
+        with os.fdopen(fd, 'wb') as destino:
+            for bloque in iter(lambda: stream.read(BLOQUE), b''):
+                destino.write(bloque)
+                huella.update(bloque)
+        sha256 = huella.hexdigest()
+        return guardar_archivo(temporal, nombre_original, sha256=sha256, mime_type=mime_type), sha256
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+def liberar(ruta):
+    """
+    Resta una referencia al blob de `ruta` (sin commit). Si llega a cero, la fila se elimina y el
+    archivo se borra del disco después del commit. Devuelve False si la ruta no es un blob
+    (archivos anteriores al almacén), para que el llamador aplique su lógica de siempre.
+    """
+    if not es_blob(ruta):
+        return False
+    db.session.execute(update(Blob).where(Blob.path == ruta).values(ref_count=Blob.ref_count - 1))
+    eliminados = db.session.execute(delete(Blob).where(Blob.path == ruta, Blob.ref_count <= 0)).rowcount
+    if eliminados:
+        db.session.info.setdefault(_BLOBS_LIBERADOS, {})[ruta] = ruta_absoluta(ruta)
+    return True
+
+
+def reemplazar(ruta_anterior, ruta_nueva):
+    """
+    Para ediciones que sustituyen una imagen ya guardada con guardar_*: libera la referencia
+    de la ruta anterior. Si el contenido es el mismo, la referencia extra se compensa.
+    """
+    if ruta_anterior:
+        liberar(ruta_anterior)
+    return ruta_nueva
+
+
+# --- Entrega de archivos ---
+# FILE_DELIVERY = 'x-accel'    -> nginx: X-Accel-Redirect con FILE_DELIVERY_ACCEL_PREFIX + ruta relativa a FILE_DELIVERY_ROOT
+# FILE_DELIVERY = 'x-sendfile' -> Apache mod_xsendfile / lighttpd: X-Sendfile con la ruta absoluta
+# Sin valor                    -> el worker envía el archivo (send_file condicional con Range/206)
+
+def _bajo_raiz_de_entrega(ruta):
+    raiz = os.path.realpath(current_app.config.get('FILE_DELIVERY_ROOT') or current_app.static_folder)
+    return os.path.commonpath([raiz, os.path.realpath(ruta)]) == raiz, raiz
+
+
+def enviar_archivo(ruta, download_name=None, as_attachment=False, mimetype=None):
+    """
+    Responde con un archivo del disco sin ocupar al worker cuando hay un proxy configurado.
+    Con proxy solo se envían las cabeceras (el proxy atiende Range y transmite el cuerpo);
+    los 304 de If-None-Match / If-Modified-Since se siguen resolviendo aquí.
+    Sin proxy, o si el archivo está fuera de FILE_DELIVERY_ROOT, se usa send_file(conditional=True):
+    Range/206 para que audio y video puedan adelantarse, y wsgi.file_wrapper (sendfile) si el servidor lo ofrece.
+    """
+    modo = current_app.config.get('FILE_DELIVERY')
+    bajo_raiz, raiz = _bajo_raiz_de_entrega(ruta) if modo else (False, None)
+    if not bajo_raiz:
+        return send_file(ruta, download_name=download_name, as_attachment=as_attachment,
+                         mimetype=mimetype, conditional=True)
+
+    # El rango lo resuelve el proxy sobre el archivo completo: se quita del entorno para werkzeug
+    entorno = {k: v for k, v in request.environ.items() if k not in ('HTTP_RANGE', 'HTTP_IF_RANGE')}
+    response = werkzeug_send_file(
+        ruta, entorno, download_name=download_name, as_attachment=as_attachment, mimetype=mimetype,
+        use_x_sendfile=True, conditional=True, response_class=current_app.response_class,
+        max_age=current_app.get_send_file_max_age
+    )
+    # El cuerpo lo genera el proxy; un Content-Length sin cuerpo confundiría al servidor WSGI
+    response.headers.pop('Content-Length', None)
+    if response.status_code == 304:
+        return response
+
+    response.headers['Accept-Ranges'] = 'bytes'
+    if modo == 'x-accel':
+        ruta_interna = os.path.relpath(os.path.realpath(ruta), raiz).replace(os.sep, '/')
+        prefijo = current_app.config.get('FILE_DELIVERY_ACCEL_PREFIX', '/_protegido/').rstrip('/')
+        response.headers.pop('X-Sendfile', None)
+        response.headers['X-Accel-Redirect'] = f'{prefijo}/{quote(ruta_interna)}'
+    return response
+
+
+@event.listens_for(Session, 'after_commit')
+def _borrar_blobs_liberados(session):
+    pendientes = session.info.pop(_BLOBS_LIBERADOS, None)
+    if not pendientes:
+        return
+    # No se puede usar la sesión dentro de after_commit: se usa una conexión aparte con BEGIN IMMEDIATE.
+    # Con el bloqueo de escritura tomado, ninguna otra transacción tiene pendiente una referencia nueva
+    # al blob (guardar_archivo la registra antes de mirar el disco), así que si la fila no existe el
+    # archivo se puede borrar. Si no se obtiene el bloqueo, el archivo queda para `flask storage gc`.
+    with db.engine.connect() as conexion:
+        conexion = conexion.execution_options(isolation_level='AUTOCOMMIT')
+        try:
+            conexion.exec_driver_sql('BEGIN IMMEDIATE')
+        except OperationalError as e:
+            current_app.logger.warning(f"No se borraron {len(pendientes)} blobs liberados: {e}")
+            return
+        try:
+            for ruta, absoluta in pendientes.items():
+                if conexion.execute(select(Blob.sha256).where(Blob.path == ruta)).first():
+                    continue
+                try:
+                    os.remove(absoluta)
+                except FileNotFoundError:
+                    pass
+        finally:
+            conexion.exec_driver_sql('COMMIT')
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_blobs_liberados(session):
+    session.info.pop(_BLOBS_LIBERADOS, None)
+
+
+# --- Migración de las subidas existentes al almacén ---
+
+def _referencias_de_archivos():
+    """
+    Columnas que apuntan a archivos subidos: (modelo, atributo, función que devuelve la ruta en disco).
+    Las fotos de colaboradores y vehículos se guardaban en UPLOAD_FILES_FOLDER aunque su ruta diga
+    uploads/colaboradores o uploads/vehiculos (así las sirve colaboradores.uploaded_file).
+    """
+    # Importación local: colaboradores.py importa este módulo
+    from colaboradores import Colaborador, FotografiaVehiculo
+
+    def en_static(valor):
+        return ruta_absoluta(valor)
+
+    def en_carpeta_files(valor):
+        directa = ruta_absoluta(valor)
+        if os.path.exists(directa):
+            return directa
+        return os.path.join(current_app.config['UPLOAD_FILES_FOLDER'], os.path.basename(valor))
+
+    return [
+        (User, 'avatar_url', en_static),
+        (File, 'file_path', en_static),
+        (Colaborador, 'foto_perfil', en_carpeta_files),
+        (FotografiaVehiculo, 'url_foto', en_carpeta_files),
+        (AboutUs, 'logo_filename', lambda valor: ruta_absoluta(AboutUs.ruta_logo(valor))),
+    ]
+
+
+def formato_bytes(total):
+    for unidad in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(total) < 1024 or unidad == 'GiB':
+            return f'{total:.1f} {unidad}' if unidad != 'B' else f'{total} B'
+        total /= 1024
+
+
+@storage_bp.cli.command('deduplicar')
+@click.option('--dry-run', is_flag=True, help='Solo calcula el ahorro, sin mover archivos ni tocar la base de datos.')
+def deduplicar_command(dry_run):
+    """Mueve las subidas existentes al almacén por contenido y actualiza las rutas en la base de datos."""
+    hashes = {} # ruta en disco -> (sha256, tamaño)
+    faltantes = 0
+    referencias = 0
+    originales = set()
+    blobs_nuevos = {} # sha256 -> tamaño
+
+    for modelo, atributo, resolver in _referencias_de_archivos():
+        columna = getattr(modelo, atributo)
+        filas = modelo.query.filter(columna.isnot(None), columna != '').all()
+        for fila in filas:
+            valor = getattr(fila, atributo)
+            if es_blob(valor) or valor in RUTAS_POR_DEFECTO:
+                continue
+            origen = resolver(valor)
+            if not os.path.isfile(origen):
+                faltantes += 1
+                continue
+            if origen not in hashes:
+                hashes[origen] = (hash_archivo(origen), os.path.getsize(origen))
+            sha256, tamano = hashes[origen]
+            referencias += 1
+            originales.add(origen)
+            if dry_run:
+                blobs_nuevos.setdefault(sha256, tamano)
+                continue
+
+            ya_existia = db.session.execute(select(Blob.sha256).where(Blob.sha256 == sha256)).first()
+            if not ya_existia:
+                blobs_nuevos[sha256] = tamano
+            setattr(fila, atributo, guardar_archivo(origen, origen, sha256=sha256, conservar_origen=True))
+
+    bytes_originales = sum(hashes[origen][1] for origen in originales)
+    bytes_blobs = sum(blobs_nuevos.values())
+
+    if not dry_run:
+        db.session.commit()
+        # Los originales se borran solo después de confirmar las nuevas rutas
+        for origen in originales:
+            try:
+                os.remove(origen)
+            except FileNotFoundError:
+                pass
+
+    accion = 'Se liberarían' if dry_run else 'Liberados'
+    click.echo(f'{referencias} referencias a {len(originales)} archivos ({formato_bytes(bytes_originales)}), '
+               f'{len(blobs_nuevos)} blobs nuevos ({formato_bytes(bytes_blobs)}), {faltantes} archivos faltantes.')
+    click.echo(f'{accion} {formato_bytes(bytes_originales - bytes_blobs)}.')
+
+
+@storage_bp.cli.command('fragmentar')
+@click.option('--lote', default=500, show_default=True, help='Blobs movidos por transacción.')
+@click.option('--pausa', default=0.0, show_default=True, help='Segundos de espera entre lotes para no saturar el disco.')
+def fragmentar_command(lote, pausa):
+    """
+    Mueve los blobs de la carpeta plana a <ab>/<cd>/ por lotes, con la aplicación en marcha.
+    Cada archivo se enlaza en su nueva ruta, se actualizan las rutas en la base de datos y,
+    tras el commit del lote, se borra la ruta anterior.
+    """
+    prefijo = prefijo_blobs()
+    columnas = [(modelo, atributo) for modelo, atributo, _ in _referencias_de_archivos()]
+    # Blobs cuya ruta no tiene subdirectorios después del prefijo
+    en_carpeta_plana = (
+        Blob.path.startswith(prefijo, autoescape=True),
+        func.instr(func.substr(Blob.path, len(prefijo) + 1), '/') == 0,
+    )
+    pendientes = Blob.query.filter(*en_carpeta_plana).count()
+    click.echo(f'{pendientes} blobs por mover en lotes de {lote}.')
+
+    movidos = faltantes = 0
+    while True:
+        blobs = Blob.query.filter(*en_carpeta_plana).order_by(Blob.sha256).limit(lote).all()
+        if not blobs:
+            break
+
+        anteriores = []
+        for blob in blobs:
+            nueva_ruta = ruta_blob(blob.sha256, extension_segura(blob.path))
+            origen, destino = ruta_absoluta(blob.path), ruta_absoluta(nueva_ruta)
+            if os.path.exists(origen):
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                if not os.path.exists(destino):
+                    # Enlace duro: el archivo sigue accesible por la ruta anterior hasta el commit
+                    try:
+                        os.link(origen, destino)
+                    except OSError:
+                        shutil.copy2(origen, destino)
+                anteriores.append(origen)
+            else:
+                faltantes += 1
+
+            for modelo, atributo in columnas:
+                columna = getattr(modelo, atributo)
+                db.session.execute(
+                    update(modelo).where(columna == blob.path).values({atributo: nueva_ruta}),
+                    execution_options={'synchronize_session': False}
+                )
+            blob.path = nueva_ruta
+
+        db.session.commit()
+        for origen in anteriores:
+            try:
+                os.remove(origen)
+            except FileNotFoundError:
+                pass
+        movidos += len(blobs)
+        click.echo(f'{movidos}/{pendientes} blobs movidos')
+        if pausa:
+            time.sleep(pausa)
+
+    click.echo(f'Listo: {movidos} blobs en la estructura fragmentada, {faltantes} sin archivo en disco.')
+
+
+# --- Recolección de archivos huérfanos ---
+# 1. Se arma el conjunto de rutas referenciadas leyendo solo las columnas de ruta (consultas por lotes).
+# 2. Se recorren con scandir las carpetas de subida que pertenecen a esos modelos.
+# 3. Los archivos sin referencia y con más de UPLOAD_GC_MIN_AGE_HOURS se mueven a
+#    UPLOAD_QUARANTINE_FOLDER/<lote>/<ruta relativa a static/> (fuera de static/, ya no se sirven).
+# 4. Los lotes de cuarentena con más de UPLOAD_GC_GRACE_DAYS se borran definitivamente.
+# Las demás carpetas de static/uploads (canciones, portadas, proyectos...) son activos de la
+# aplicación sin modelo que las referencie y nunca se recolectan.
+
+_FORMATO_LOTE = '%Y%m%dT%H%M%S'
+
+
+def carpetas_recolectables():
+    config = current_app.config
+    return config.get('UPLOAD_GC_FOLDERS') or [
+        config['UPLOAD_FOLDER'],
+        config['UPLOAD_FILES_FOLDER'],
+        config['BLOB_STORE_FOLDER'],
+        config['ABOUTUS_IMAGE_UPLOAD_FOLDER'],
+        ruta_absoluta('uploads/aboutus_images'), # logos anteriores al almacén (AboutUs.ruta_logo)
+    ]
+
+
+def _normalizar(ruta):
+    return os.path.normcase(os.path.abspath(ruta))
+
+
+def _rutas_referenciadas():
+    """Rutas en disco (normalizadas) que alguna fila referencia, más las imágenes por defecto."""
+    referenciadas = {_normalizar(ruta_absoluta(ruta)) for ruta in RUTAS_POR_DEFECTO}
+    carpeta_logos = current_app.config['ABOUTUS_IMAGE_UPLOAD_FOLDER']
+    for modelo, atributo, resolver in _referencias_de_archivos():
+        columna = getattr(modelo, atributo)
+        # Solo la columna de ruta: con su índice, SQLite la lee sin tocar las filas completas
+        consulta = select(columna).where(columna.isnot(None), columna != '').distinct() \
+            .execution_options(yield_per=2000)
+        for (valor,) in db.session.execute(consulta):
+            referenciadas.add(_normalizar(ruta_absoluta(valor)))
+            referenciadas.add(_normalizar(resolver(valor)))
+            if modelo is AboutUs:
+                referenciadas.add(_normalizar(os.path.join(carpeta_logos, os.path.basename(valor))))
+    consulta = select(Blob.path).execution_options(yield_per=2000)
+    for (ruta,) in db.session.execute(consulta):
+        referenciadas.add(_normalizar(ruta_absoluta(ruta)))
+    return referenciadas
+
+
+def _recorrer_archivos(carpeta):
+    """Genera los os.DirEntry de todos los archivos bajo `carpeta` (sin seguir enlaces simbólicos)."""
+    pendientes = [carpeta]
+    while pendientes:
+        try:
+            entradas = os.scandir(pendientes.pop())
+        except FileNotFoundError:
+            continue
+        with entradas:
+            for entrada in entradas:
+                if entrada.is_dir(follow_symlinks=False):
+                    pendientes.append(entrada.path)
+                elif entrada.is_file(follow_symlinks=False):
+                    yield entrada
+
+
+def _sigue_huerfano(conexion, ruta_relativa):
+    """Comprobación justo antes de mover: un blob pudo volver a usarse después de armar el conjunto."""
+    if not es_blob(ruta_relativa):
+        return True
+    sha256 = os.path.basename(ruta_relativa)[:64]
+    return conexion.execute(
+        select(Blob.sha256).where((Blob.path == ruta_relativa) | (Blob.sha256 == sha256))
+    ).first() is None
+
+
+# Huérfanos movidos por transacción: el bloqueo de escritura no se retiene durante toda la recolección
+_LOTE_GC = 200
+
+
+def _mover_a_cuarentena(huerfanos, carpeta_lote):
+    """
+    Mueve a `carpeta_lote` los huérfanos [(ruta relativa a static/, ruta absoluta, bytes)] que siguen sin fila
+    en blobs. Como en _borrar_blobs_liberados, la comprobación y el movimiento se hacen con BEGIN IMMEDIATE:
+    guardar_archivo registra la referencia antes de colocar el archivo, así que con el bloqueo tomado ninguna
+    subida puede estar reutilizando el blob. Si no se obtiene el bloqueo, el lote queda para la próxima pasada.
+    Devuelve los huérfanos movidos.
+    """
+    movidos = []
+    with db.engine.connect() as conexion:
+        conexion = conexion.execution_options(isolation_level='AUTOCOMMIT')
+        for inicio in range(0, len(huerfanos), _LOTE_GC):
+            try:
+                conexion.exec_driver_sql('BEGIN IMMEDIATE')
+            except OperationalError as e:
+                current_app.logger.warning(f"No se movieron {len(huerfanos) - inicio} huérfanos a cuarentena: {e}")
+                break
+            try:
+                for huerfano in huerfanos[inicio:inicio + _LOTE_GC]:
+                    relativa, absoluta, _ = huerfano
+                    if not _sigue_huerfano(conexion, relativa):
+                        continue
+                    destino = os.path.join(carpeta_lote, *relativa.split('/'))
+                    os.makedirs(os.path.dirname(destino), exist_ok=True)
+                    try:
+                        shutil.move(absoluta, destino)
+                    except FileNotFoundError:
+                        continue
+                    movidos.append(huerfano)
+            finally:
+                conexion.exec_driver_sql('COMMIT')
+    return movidos
+
+
+def _lotes_de_cuarentena(carpeta):
+    """(nombre, fecha) de los lotes de cuarentena existentes."""
+    lotes = []
+    if os.path.isdir(carpeta):
+        for nombre in os.listdir(carpeta):
+            try:
+                lotes.append((nombre, datetime.strptime(nombre, _FORMATO_LOTE)))
+            except ValueError:
+                continue
+    return sorted(lotes, key=lambda lote: lote[1])
+
+
+def _tamano_de_carpeta(carpeta):
+    return sum(entrada.stat(follow_symlinks=False).st_size for entrada in _recorrer_archivos(carpeta))
+
+
+@storage_bp.cli.command('gc')
+@click.option('--dry-run', is_flag=True, help='Solo informa qué se movería a cuarentena o se borraría.')
+@click.option('--gracia-dias', type=float, default=None, help='Días en cuarentena antes de borrar (UPLOAD_GC_GRACE_DAYS).')
+@click.option('--edad-minima-horas', type=float, default=None,
+              help='Antigüedad mínima de un huérfano para recolectarlo (UPLOAD_GC_MIN_AGE_HOURS).')
+@click.option('--detalle', is_flag=True, help='Lista cada archivo huérfano.')
+def gc_command(dry_run, gracia_dias, edad_minima_horas, detalle):
+    """Mueve a cuarentena las subidas que ninguna fila referencia y purga la cuarentena vencida."""
+    config = current_app.config
+    if gracia_dias is None:
+        gracia_dias = config.get('UPLOAD_GC_GRACE_DAYS', 7)
+    if edad_minima_horas is None:
+        edad_minima_horas = config.get('UPLOAD_GC_MIN_AGE_HOURS', 1)
+    cuarentena = config['UPLOAD_QUARANTINE_FOLDER']
+    ahora = datetime.utcnow()
+    limite_mtime = time.time() - edad_minima_horas * 3600
+
+    referenciadas = _rutas_referenciadas()
+    click.echo(f'{len(referenciadas)} rutas referenciadas.')
+
+    lote = ahora.strftime(_FORMATO_LOTE)
+    vistas = set()
+    total_archivos = total_bytes = recientes = 0
+    for carpeta in carpetas_recolectables():
+        carpeta = os.path.abspath(carpeta)
+        if carpeta in vistas:
+            continue
+        vistas.add(carpeta)
+        huerfanos = []
+        for entrada in _recorrer_archivos(carpeta):
+            if _normalizar(entrada.path) in referenciadas:
+                continue
+            stat = entrada.stat(follow_symlinks=False)
+            if stat.st_mtime > limite_mtime:
+                recientes += 1 # puede ser una subida cuya fila aún no se confirmó
+                continue
+            relativa = os.path.relpath(entrada.path, current_app.static_folder).replace(os.sep, '/')
+            if detalle:
+                click.echo(f'  huérfano: {relativa} ({formato_bytes(stat.st_size)})')
+            huerfanos.append((relativa, entrada.path, stat.st_size))
+        if not dry_run:
+            huerfanos = _mover_a_cuarentena(huerfanos, os.path.join(cuarentena, lote))
+        archivos = len(huerfanos)
+        bytes_carpeta = sum(tamano for _, _, tamano in huerfanos)
+        if archivos:
+            click.echo(f'{os.path.relpath(carpeta, current_app.static_folder)}: {archivos} huérfanos, {formato_bytes(bytes_carpeta)}')
+        total_archivos += archivos
+        total_bytes += bytes_carpeta
+
+    accion = 'Se moverían' if dry_run else 'Movidos'
+    click.echo(f'{accion} a cuarentena: {total_archivos} archivos, {formato_bytes(total_bytes)} '
+               f'({recientes} huérfanos con menos de {edad_minima_horas:g} h se conservan).')
+    if not dry_run and total_archivos:
+        click.echo(f'Lote {lote}; se restaura con `flask storage restaurar-cuarentena {lote}`.')
+
+    vencidos = [nombre for nombre, fecha in _lotes_de_cuarentena(cuarentena) if fecha < ahora - timedelta(days=gracia_dias)]
+    bytes_vencidos = sum(_tamano_de_carpeta(os.path.join(cuarentena, nombre)) for nombre in vencidos)
+    if not dry_run:
+        for nombre in vencidos:
+            shutil.rmtree(os.path.join(cuarentena, nombre))
+    accion = 'Se borrarían' if dry_run else 'Borrados'
+    click.echo(f'{accion} {len(vencidos)} lotes de cuarentena con más de {gracia_dias:g} días: '
+               f'{formato_bytes(bytes_vencidos)} recuperados.')
+
+    # Índices de líneas de la vista previa (files.py) de contenidos que ya no existen; se regeneran al usarse
+    carpeta_indices = config.get('LINE_INDEX_FOLDER')
+    if carpeta_indices and os.path.isdir(carpeta_indices):
+        hashes = {sha256 for (sha256,) in db.session.execute(
+            select(File.sha256).where(File.sha256.isnot(None)).distinct().execution_options(yield_per=2000)
+        )}
+        limite_indices = time.time() - gracia_dias * 86400
+        indices = bytes_indices = 0
+        for entrada in _recorrer_archivos(carpeta_indices):
+            stat = entrada.stat(follow_symlinks=False)
+            if entrada.name.split('.', 1)[0] in hashes or stat.st_mtime > limite_indices:
+                continue
+            if not dry_run:
+                os.remove(entrada.path)
+            indices += 1
+            bytes_indices += stat.st_size
+        click.echo(f'{accion} {indices} índices de líneas sin archivo: {formato_bytes(bytes_indices)}.')
+
+
+@periodica('storage.gc', cron='30 3 * * *', duracion_maxima=4 * 3600)
+def gc_periodico():
+    invocar_comando(gc_command)
+
+
+@storage_bp.cli.command('restaurar-cuarentena')
+@click.argument('lote')
+def restaurar_cuarentena_command(lote):
+    """Devuelve a static/ los archivos de un lote de cuarentena (no sobrescribe archivos existentes)."""
+    carpeta = os.path.join(current_app.config['UPLOAD_QUARANTINE_FOLDER'], os.path.basename(lote))
+    if not os.path.isdir(carpeta):
+        raise click.ClickException(f'No existe el lote {lote}.')
+    restaurados = omitidos = 0
+    for entrada in list(_recorrer_archivos(carpeta)):
+        destino = os.path.join(current_app.static_folder, os.path.relpath(entrada.path, carpeta))
+        if os.path.exists(destino):
+            omitidos += 1
+            continue
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        shutil.move(entrada.path, destino)
+        restaurados += 1
+    if not omitidos:
+        shutil.rmtree(carpeta)
+    click.echo(f'{restaurados} archivos restaurados, {omitidos} omitidos porque ya existían.')
@@ -0,0 +1,414 @@
+# tareas.py
+# Cola de tareas persistente en la base de datos de la aplicación (tabla task_queue).
+# - Las funciones se registran con @tarea('nombre') y se encolan con encolar('nombre', **argumentos),
+#   con prioridad (mayor primero), retraso opcional y número máximo de intentos.
+# - `flask worker --hilos N --procesos M` las ejecuta. Cada hilo reclama una tarea con un solo
+#   UPDATE ... RETURNING (dos hilos nunca toman la misma) y la marca invisible durante
+#   TASK_VISIBILITY_SECONDS. Mientras la ejecuta, un latido renueva ese plazo; si el proceso muere,
+#   la tarea vuelve a la cola al vencer el plazo.
+# - Un fallo reintenta con espera exponencial; agotados los intentos queda 'fallida' (ver /admin/tareas).
+# Los tiempos se guardan como time.time() (segundos, float) para medir latencias sin conversiones.
+import os
+import json
+import time
+import uuid
+import random
+import signal
+import socket
+import threading
+import traceback
+from functools import wraps
+
+import click
+from flask import Blueprint, current_app, jsonify, request, session, flash, redirect, url_for
+from sqlalchemy import text, bindparam
+
+from models import db
+from programador import periodica, iniciar_en_segundo_plano
+
+# cli_group=None: el comando queda como `flask worker`
+tareas_bp = Blueprint('tareas', __name__, cli_group=None)
+
+# nombre -> función; se llena al importar los módulos que declaran tareas
+REGISTRO = {}
+ESTADOS = ('pendiente', 'en_curso', 'hecha', 'fallida')
+
+
+def role_required(roles):
+    if not isinstance(roles, list):
+        roles = [roles]
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if 'logged_in' not in session or not session['logged_in']:
+                flash('Por favor, inicia sesión para acceder a esta página.', 'info')
+                return redirect(url_for('login'))
+            if session.get('role') not in roles:
+                flash('No tienes permiso para acceder a esta página.', 'danger')
+                return redirect(url_for('home'))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def tarea(nombre):
+    """Registra la función como tarea. Se ejecuta dentro de un contexto de aplicación."""
+    def decorator(f):
+        if nombre in REGISTRO and REGISTRO[nombre] is not f:
+            raise ValueError(f'La tarea {nombre!r} ya está registrada.')
+        REGISTRO[nombre] = f
+        return f
+    return decorator
+
+
+# --- Encolar ---
+
+_ENCOLAR_SQL = text("""
+    INSERT INTO task_queue (nombre, argumentos, prioridad, estado, intentos, max_intentos,
+                            disponible_en, programada_en, creada_en)
+    VALUES (:nombre, :argumentos, :prioridad, 'pendiente', 0, :max_intentos, :disponible, :disponible, :ahora)
+    RETURNING id
+""")
+
+
+def encolar(nombre, prioridad=0, retraso=0, max_intentos=None, **argumentos):
+    """
+    Agrega la tarea a la cola y devuelve su id. Los argumentos deben ser serializables a JSON.
+    Usa su propia conexión: la tarea queda guardada aunque la sesión del llamador haga rollback.
+    """
+    if nombre not in REGISTRO:
+        raise ValueError(f'Tarea desconocida: {nombre!r}')
+    ahora = time.time()
+    parametros = {
+        'nombre': nombre,
+        'argumentos': json.dumps(argumentos, ensure_ascii=False),
+        'prioridad': prioridad,
+        'max_intentos': max_intentos or current_app.config.get('TASK_MAX_ATTEMPTS', 3),
+        'disponible': ahora + retraso,
+        'ahora': ahora,
+    }
+    with db.engine.begin() as conexion:
+        return conexion.execute(_ENCOLAR_SQL, parametros).scalar()
+
+
+# --- Reclamar y terminar ---
+
+# La subconsulta elige la tarea lista de mayor prioridad; incluye las 'en_curso' cuyo plazo de
+# visibilidad venció (worker caído). Al ser una sola sentencia de escritura, SQLite la serializa.
+_RECLAMAR_SQL = text("""
+    UPDATE task_queue
+    SET estado = 'en_curso', intentos = intentos + 1, disponible_en = :ahora + :visibilidad,
+        iniciada_en = :ahora, trabajador = :trabajador
+    WHERE id = (
+        SELECT id FROM task_queue
+        WHERE estado IN ('pendiente', 'en_curso') AND disponible_en <= :ahora
+        ORDER BY prioridad DESC, disponible_en, id
+        LIMIT 1
+    )
+    RETURNING id, nombre, argumentos, intentos, max_intentos
+""")
+# Solo el worker que tiene la tarea puede cerrarla: si perdió el plazo y otro la retomó, no la pisa
+_TERMINAR_SQL = text("""
+    UPDATE task_queue SET estado = 'hecha', terminada_en = :ahora, ultimo_error = NULL
+    WHERE id = :id AND trabajador = :trabajador AND estado = 'en_curso'
+""")
+_FALLAR_SQL = text("""
+    UPDATE task_queue
+    SET estado = :estado, disponible_en = :disponible, programada_en = :disponible,
+        terminada_en = :terminada, ultimo_error = :error
+    WHERE id = :id AND trabajador = :trabajador AND estado = 'en_curso'
+""")
+# Latido del worker mientras ejecuta: extiende el plazo de visibilidad solo si sigue siendo dueño
+# de la tarea (mismo trabajador y mismo intento; un reclamo de otro worker suma un intento)
+_RENOVAR_SQL = text("""
+    UPDATE task_queue SET disponible_en = :ahora + :visibilidad
+    WHERE id = :id AND trabajador = :trabajador AND intentos = :intentos AND estado = 'en_curso'
+""")
+_PURGAR_SQL = text("DELETE FROM task_queue WHERE estado = 'hecha' AND terminada_en < :limite")
+
+
+def reclamar(trabajador):
+    """Toma la siguiente tarea lista, o None. Devuelve (id, nombre, argumentos, intentos, max_intentos)."""
+    parametros = {
+        'ahora': time.time(),
+        'visibilidad': current_app.config.get('TASK_VISIBILITY_SECONDS', 300),
+        'trabajador': trabajador,
+    }
+    with db.engine.begin() as conexion:
+        return conexion.execute(_RECLAMAR_SQL, parametros).first()
+
+
+def renovar_visibilidad(id_tarea, trabajador, intentos):
+    """Extiende el plazo de visibilidad de una tarea en curso. Devuelve False si ya no es de este worker."""
+    parametros = {
+        'id': id_tarea, 'trabajador': trabajador, 'intentos': intentos, 'ahora': time.time(),
+        'visibilidad': current_app.config.get('TASK_VISIBILITY_SECONDS', 300),
+    }
+    with db.engine.begin() as conexion:
+        return conexion.execute(_RENOVAR_SQL, parametros).rowcount == 1
+
+
+def _latido(app, id_tarea, trabajador, intentos, terminada):
+    """
+    Renueva la visibilidad cada tercio del plazo hasta que la tarea termine, para que una tarea
+    larga no se entregue a otro worker mientras este la sigue ejecutando. Si el proceso muere,
+    el latido muere con él y la tarea vuelve a la cola al vencer el plazo.
+    """
+    intervalo = app.config.get('TASK_VISIBILITY_SECONDS', 300) / 3
+    with app.app_context():
+        while not terminada.wait(intervalo):
+            try:
+                if not renovar_visibilidad(id_tarea, trabajador, intentos):
+                    return
+            except Exception as e:
+                # Base bloqueada: se reintenta en el siguiente latido, todavía dentro del plazo
+                app.logger.warning(f"No se renovó la visibilidad de la tarea {id_tarea}: {e}")
+
+
+def terminar(id_tarea, trabajador):
+    with db.engine.begin() as conexion:
+        conexion.execute(_TERMINAR_SQL, {'id': id_tarea, 'trabajador': trabajador, 'ahora': time.time()})
+
+
+def espera_de_reintento(intentos):
+    base = current_app.config.get('TASK_BACKOFF_SECONDS', 30)
+    return min(base * 2 ** (intentos - 1), 6 * 3600) * random.uniform(0.8, 1.2)
+
+
+def fallar(id_tarea, trabajador, intentos, max_intentos, error):
+    ahora = time.time()
+    definitiva = intentos >= max_intentos
+    with db.engine.begin() as conexion:
+        conexion.execute(_FALLAR_SQL, {
+            'id': id_tarea, 'trabajador': trabajador, 'error': error[-4000:],
+            'estado': 'fallida' if definitiva else 'pendiente',
+            'disponible': ahora if definitiva else ahora + espera_de_reintento(intentos),
+            'terminada': ahora if definitiva else None,
+        })
+    return definitiva
+
+
+def ejecutar_siguiente(trabajador):
+    """Reclama y ejecuta una tarea. Devuelve False si la cola no tenía nada listo."""
+    fila = reclamar(trabajador)
+    if fila is None:
+        return False
+    id_tarea, nombre, argumentos, intentos, max_intentos = fila
+    if intentos > max_intentos:
+        # Volvió a la cola por vencer el plazo de visibilidad más veces de las permitidas
+        fallar(id_tarea, trabajador, intentos, max_intentos, 'Plazo de visibilidad vencido en todos los intentos.')
+        return True
+    funcion = REGISTRO.get(nombre)
+    terminada = threading.Event()
+    latido = threading.Thread(target=_latido, name=f'latido-{id_tarea}', daemon=True,
+                              args=(current_app._get_current_object(), id_tarea, trabajador, intentos, terminada))
+    latido.start()
+    try:
+        if funcion is None:
+            raise LookupError(f'Tarea desconocida: {nombre!r}')
+        funcion(**json.loads(argumentos))
+    except Exception:
+        error = traceback.format_exc()
+        db.session.rollback()
+    else:
+        error = None
+    finally:
+        # El latido se detiene antes de cerrar la tarea para que no la renueve después
+        terminada.set()
+        latido.join()
+        db.session.remove()
+    if error is None:
+        terminar(id_tarea, trabajador)
+    elif fallar(id_tarea, trabajador, intentos, max_intentos, error):
+        print(f"DEBUG: Tarea {id_tarea} ({nombre}) fallida tras {intentos} intentos.")
+    return True
+
+
+@periodica('tareas.purgar', cron='0 4 * * *')
+def purgar_terminadas():
+    """Borra las tareas 'hecha' con más de TASK_RETENTION_DAYS días."""
+    dias = current_app.config.get('TASK_RETENTION_DAYS', 7)
+    with db.engine.begin() as conexion:
+        return conexion.execute(_PURGAR_SQL, {'limite': time.time() - dias * 86400}).rowcount
+
+
+# --- Worker ---
+
+def _bucle(app, detener, nombre, hasta_vaciar):
+    with app.app_context():
+        espera = app.config.get('TASK_POLL_SECONDS', 1.0)
+        while not detener.is_set():
+            try:
+                if ejecutar_siguiente(nombre):
+                    continue
+            except Exception as e:
+                # Error de la cola misma (p. ej. base de datos bloqueada): se reintenta tras la espera
+                app.logger.error(f"Error en el worker {nombre}: {e}")
+            else:
+                if hasta_vaciar:
+                    return
+            detener.wait(espera)
+
+
+def _detener_con_senales(detener):
+    for senal in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(senal, lambda *_: detener.set())
+
+
+def ejecutar_worker(app, hilos, hasta_vaciar=False):
+    """Corre `hilos` hilos de worker en este proceso hasta SIGINT/SIGTERM (o hasta vaciar la cola)."""
+    detener = threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        _detener_con_senales(detener)
+    prefijo = f'{socket.gethostname()}:{os.getpid()}'
+    trabajadores = [
+        threading.Thread(target=_bucle, args=(app, detener, f'{prefijo}:{i}:{uuid.uuid4().hex[:6]}', hasta_vaciar),
+                         name=f'worker-{i}')
+        for i in range(hilos)
+    ]
+    for hilo in trabajadores:
+        hilo.start()
+    # join con tiempo límite para que la señal llegue al hilo principal
+    while any(hilo.is_alive() for hilo in trabajadores):
+        for hilo in trabajadores:
+            hilo.join(0.5)
+
+
+def _proceso_hijo(app, hilos, hasta_vaciar):
+    with app.app_context():
+        # Las conexiones heredadas del padre no se comparten entre procesos
+        db.engine.dispose(close=False)
+    ejecutar_worker(app, hilos, hasta_vaciar)
+
+
+def _detener_hijos(hijos, plazo):
+    """SIGTERM a los hijos vivos (terminan la tarea en curso); los que sigan pasado `plazo` reciben SIGKILL."""
+    for hijo in hijos:
+        if hijo.is_alive():
+            hijo.terminate()
+    limite = time.monotonic() + plazo
+    for hijo in hijos:
+        hijo.join(max(limite - time.monotonic(), 0))
+        if hijo.is_alive():
+            hijo.kill()
+            hijo.join()
+
+
+@tareas_bp.cli.command('worker')
+@click.option('--hilos', default=2, show_default=True, help='Hilos de worker por proceso.')
+@click.option('--procesos', default=1, show_default=True, help='Procesos de worker (requiere fork: Linux/macOS).')
+@click.option('--hasta-vaciar', is_flag=True, help='Terminar cuando no queden tareas listas (para cron).')
+def worker_command(hilos, procesos, hasta_vaciar):
+    """Ejecuta las tareas de la cola task_queue."""
+    import multiprocessing
+    app = current_app._get_current_object()
+    click.echo(f'Worker: {procesos} proceso(s) x {hilos} hilo(s); tareas registradas: {", ".join(sorted(REGISTRO))}')
+    # Trabajos periódicos (programador.py): cada uno corre una sola vez aunque haya varios workers
+    programar = not hasta_vaciar and app.config.get('SCHEDULER_ENABLED', True)
+    if procesos <= 1:
+        if programar:
+            iniciar_en_segundo_plano(app)
+        ejecutar_worker(app, hilos, hasta_vaciar)
+        return
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        raise click.UsageError('--procesos > 1 necesita fork; en este sistema usa varios `flask worker` por separado.')
+    contexto = multiprocessing.get_context('fork')
+    hijos = [contexto.Process(target=_proceso_hijo, args=(app, hilos, hasta_vaciar)) for _ in range(procesos)]
+    for hijo in hijos:
+        hijo.start()
+
+    # Después del fork: los hijos no heredan el hilo del programador (un fork con hilos puede dejar
+    # bloqueos tomados) y el padre, que solo supervisa, corre los trabajos periódicos
+    detener = threading.Event()
+    _detener_con_senales(detener)
+    if programar:
+        iniciar_en_segundo_plano(app, detener)
+    while not detener.is_set() and any(hijo.is_alive() for hijo in hijos):
+        detener.wait(0.5)
+    # Una tarea que no termina dentro de TASK_VISIBILITY_SECONDS la retoma otro worker de todos modos
+    _detener_hijos(hijos, app.config.get('TASK_VISIBILITY_SECONDS', 300))
+
+
+# --- Administración ---
+
+def _percentiles(valores):
+    valores = sorted(valores)
+    if not valores:
+        return {'muestras': 0, 'p50_ms': None, 'p95_ms': None, 'max_ms': None}
+    percentil = lambda p: round(valores[min(len(valores) - 1, int(len(valores) * p))] * 1000, 1)
+    return {'muestras': len(valores), 'p50_ms': percentil(0.50), 'p95_ms': percentil(0.95),
+            'max_ms': round(valores[-1] * 1000, 1)}
+
+
+def resumen_cola(muestras=500):
+    ahora = time.time()
+    with db.engine.connect() as conexion:
+        por_estado = conexion.execute(text("""
+            SELECT nombre, estado, COUNT(*), SUM(estado = 'pendiente' AND disponible_en <= :ahora)
+            FROM task_queue GROUP BY nombre, estado
+        """), {'ahora': ahora}).all()
+        mas_antigua = conexion.execute(text("""
+            SELECT MIN(disponible_en) FROM task_queue WHERE estado = 'pendiente' AND disponible_en <= :ahora
+        """), {'ahora': ahora}).scalar()
+        recientes = conexion.execute(text("""
+            SELECT iniciada_en - programada_en, terminada_en - iniciada_en FROM task_queue
+            WHERE estado = 'hecha' ORDER BY terminada_en DESC LIMIT :muestras
+        """), {'muestras': muestras}).all()
+
+    estados = {estado: 0 for estado in ESTADOS}
+    por_tarea = {}
+    listas = 0
+    for nombre, estado, cantidad, listas_ahora in por_estado:
+        estados[estado] = estados.get(estado, 0) + cantidad
+        por_tarea.setdefault(nombre, {e: 0 for e in ESTADOS})[estado] = cantidad
+        listas += listas_ahora or 0
+    return {
+        'estados': estados,
+        'listas': listas, # pendientes cuyo momento ya llegó (la profundidad real de la cola)
+        'espera_mas_antigua_s': round(ahora - mas_antigua, 1) if mas_antigua else 0,
+        'por_tarea': por_tarea,
+        'espera': _percentiles([espera for espera, _ in recientes if espera is not None]),
+        'ejecucion': _percentiles([duracion for _, duracion in recientes if duracion is not None]),
+    }
+
+
+@tareas_bp.route('/admin/tareas')
+@role_required('Superuser')
+def estado_tareas():
+    """Profundidad de la cola, latencia de espera/ejecución y las últimas tareas fallidas."""
+    with db.engine.connect() as conexion:
+        fallidas = conexion.execute(text("""
+            SELECT id, nombre, intentos, terminada_en, ultimo_error FROM task_queue
+            WHERE estado = 'fallida' ORDER BY id DESC LIMIT 20
+        """)).all()
+    return jsonify({
+        'success': True,
+        'registradas': sorted(REGISTRO),
+        **resumen_cola(),
+        'fallidas': [
+            {'id': id_tarea, 'nombre': nombre, 'intentos': intentos, 'terminada_en': terminada_en,
+             'error': ((error or '').strip().splitlines() or [''])[-1]} # última línea del traceback
+            for id_tarea, nombre, intentos, terminada_en, error in fallidas
+        ],
+    })
+
+
+@tareas_bp.route('/admin/tareas/reintentar', methods=['POST'])
+@role_required('Superuser')
+def reintentar_fallidas():
+    """Devuelve a la cola las tareas fallidas (todas, o las de `ids`)."""
+    ids = request.form.getlist('ids', type=int) or (request.get_json(silent=True) or {}).get('ids') or []
+    sql = """
+        UPDATE task_queue SET estado = 'pendiente', intentos = 0, disponible_en = :ahora,
+               programada_en = :ahora, terminada_en = NULL
+        WHERE estado = 'fallida'
+    """
+    parametros = {'ahora': time.time()}
+    if ids:
+        sql += ' AND id IN :ids'
+        parametros['ids'] = [int(i) for i in ids]
+    sentencia = text(sql).bindparams(bindparam('ids', expanding=True)) if ids else text(sql)
+    with db.engine.begin() as conexion:
+        total = conexion.execute(sentencia, parametros).rowcount
+    return jsonify({'success': True, 'message': f'{total} tareas devueltas a la cola.', 'total': total})
@@ -0,0 +1,88 @@
+# tests/conftest.py
+# Configuración común de las pruebas.
+# La aplicación se importa con una base SQLite temporal, sin caché, sin programador y sin
+# calentamiento de plantillas; las carpetas de subidas, staging e índices y la caché de bytecode de
+# Jinja también son temporales, así que las pruebas nunca tocan instance/ ni static/uploads/ del proyecto.
+import os
+import sys
+import tempfile
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPORAL = tempfile.mkdtemp(prefix='latribu-pruebas-')
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(TEMPORAL, 'db.db')
+os.environ['CACHE_BACKEND'] = 'nulo'
+os.environ['CACHE_SQLITE_PATH'] = os.path.join(TEMPORAL, 'cache.db')
+os.environ['SCHEDULER_ENABLED'] = 'false'
+os.environ['TEMPLATE_WARMUP_ON_START'] = 'false'
+os.environ['TEMPLATE_BYTECODE_FOLDER'] = os.path.join(TEMPORAL, 'jinja_cache')
+sys.path.insert(0, RAIZ)
+
+from app import app as aplicacion  # noqa: E402
+from models import db as _db, User  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    static = os.path.join(TEMPORAL, 'static')
+    carpetas = {
+        'BLOB_STORE_FOLDER': os.path.join(static, 'uploads', 'blobs'),
+        'UPLOAD_FILES_FOLDER': os.path.join(static, 'uploads', 'files'),
+        'UPLOAD_STAGING_FOLDER': os.path.join(TEMPORAL, 'upload_staging'),
+        'UPLOAD_QUARANTINE_FOLDER': os.path.join(TEMPORAL, 'upload_quarantine'),
+        'LINE_INDEX_FOLDER': os.path.join(TEMPORAL, 'line_index'),
+        'BACKUP_FOLDER': os.path.join(TEMPORAL, 'backups'),
+        'BACKUP_UPLOADS_SOURCE': os.path.join(static, 'uploads'),
+        'BACKUP_UPLOADS_FOLDER': os.path.join(TEMPORAL, 'backups', 'subidas'),
+    }
+    for carpeta in carpetas.values():
+        os.makedirs(carpeta, exist_ok=True)
+    aplicacion.config.update(TESTING=True, **carpetas)
+    aplicacion.static_folder = static
+    aplicacion.instance_path = TEMPORAL
+    # El índice de activos recorre las carpetas de la aplicación; en las pruebas no hay ninguna
+    for clave in ('UPLOAD_FOLDER', 'PROJECT_IMAGE_UPLOAD_FOLDER', 'NOTE_IMAGE_UPLOAD_FOLDER',
+                  'CAMINATA_IMAGE_UPLOAD_FOLDER', 'PAGOS_IMAGE_UPLOAD_FOLDER', 'CALENDAR_IMAGE_UPLOAD_FOLDER',
+                  'SONGS_UPLOAD_FOLDER', 'COVERS_UPLOAD_FOLDER', 'ABOUTUS_IMAGE_UPLOAD_FOLDER'):
+        aplicacion.config[clave] = None
+    return aplicacion
+
+
+@pytest.fixture
+def db(app):
+    """Base vacía en cada prueba, dentro de un contexto de aplicación."""
+    with app.app_context():
+        _db.drop_all()
+        _db.create_all()
+        yield _db
+        _db.session.remove()
+
+
+@pytest.fixture
+def client(app, db):
+    return app.test_client()
+
+
+@pytest.fixture
+def crear_usuario(db):
+    def crear(username='usuario', role='Usuario Regular', **campos):
+        datos = {'email': f'{username}@example.com', 'nombre': username.capitalize(),
+                 'primer_apellido': 'Pruebas', 'telefono': '88880000', **campos}
+        usuario = User(username=username, role=role, **datos)
+        db.session.add(usuario)
+        db.session.commit()
+        return usuario
+    return crear
+
+
+@pytest.fixture
+def iniciar_sesion(client):
+    def iniciar(usuario):
+        with client.session_transaction() as sesion:
+            sesion['logged_in'] = True
+            sesion['user_id'] = usuario.id
+            sesion['role'] = usuario.role
+            sesion['username'] = usuario.username
+    return iniciar
@@ -0,0 +1,109 @@
+# tests/test_btns.py
+# ButtonConfigStore: lecturas y escrituras concurrentes desde varios procesos y permisos del archivo.
+import os
+import json
+import stat
+import multiprocessing
+
+import pytest
+
+from btns import ButtonConfigStore, DEFAULT_CONFIG
+
+ESCRITORES = 4
+LECTORES = 4
+ESCRITURAS = 150
+LECTURAS = 600
+
+
+def documento(escritor, n):
+    # Relleno para que cada escritura ocupe varios bloques y un archivo a medias sea detectable
+    return {
+        'button_one': {'is_visible': True, 'link': f'https://example.com/{escritor}/{n}', 'icon': 'fa-link',
+                       'visibility_state': 'all'},
+        'button_two': {'is_visible': False, 'link': 'x' * 20000, 'icon': 'fa-file-pdf', 'visibility_state': 'all'},
+        'escritor': escritor,
+        'n': n,
+    }
+
+
+def escribir(ruta, escritor, errores):
+    store = ButtonConfigStore()
+    try:
+        for n in range(ESCRITURAS):
+            store.save(ruta, documento(escritor, n))
+    except Exception as e:
+        errores.put(f'escritor {escritor}: {e!r}')
+
+
+def leer(ruta, lector, errores):
+    # Un store por proceso, como cada worker; también se lee el archivo directamente
+    store = ButtonConfigStore()
+    try:
+        for _ in range(LECTURAS):
+            config = store.load(ruta)
+            if config == DEFAULT_CONFIG or config != documento(config['escritor'], config['n']):
+                errores.put(f'lector {lector}: documento inesperado')
+                return
+            with open(ruta) as f:
+                json.load(f)
+    except Exception as e:
+        errores.put(f'lector {lector}: {e!r}')
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='requiere fork')
+def test_lectores_nunca_ven_un_documento_a_medias(tmp_path):
+    ruta = str(tmp_path / 'btns_config.json')
+    ButtonConfigStore().save(ruta, documento(-1, 0))
+
+    contexto = multiprocessing.get_context('fork')
+    errores = contexto.Queue()
+    procesos = [contexto.Process(target=escribir, args=(ruta, i, errores)) for i in range(ESCRITORES)]
+    procesos += [contexto.Process(target=leer, args=(ruta, i, errores)) for i in range(LECTORES)]
+    for proceso in procesos:
+        proceso.start()
+    for proceso in procesos:
+        proceso.join(60)
+        assert proceso.exitcode == 0
+
+    encontrados = []
+    while not errores.empty():
+        encontrados.append(errores.get())
+    assert encontrados == []
+
+    final = ButtonConfigStore().load(ruta)
+    assert final['n'] == ESCRITURAS - 1
+    assert [n for n in os.listdir(tmp_path) if n.endswith('.tmp')] == []
+
+
+def test_el_cache_detecta_la_escritura_de_otro_proceso(tmp_path):
+    ruta = str(tmp_path / 'btns_config.json')
+    lector, escritor = ButtonConfigStore(), ButtonConfigStore()
+    escritor.save(ruta, documento(0, 0))
+    assert lector.load(ruta)['n'] == 0
+    escritor.save(ruta, documento(0, 1))
+    assert lector.load(ruta)['n'] == 1
+
+
+def test_la_copia_devuelta_no_altera_el_cache(tmp_path):
+    ruta = str(tmp_path / 'btns_config.json')
+    store = ButtonConfigStore()
+    store.save(ruta, documento(0, 0))
+    store.load(ruta)['button_one']['link'] = 'modificado'
+    assert store.load(ruta) == documento(0, 0)
+
+
+def test_guardar_conserva_los_permisos(tmp_path):
+    ruta = str(tmp_path / 'btns_config.json')
+    with open(ruta, 'w') as f:
+        json.dump(DEFAULT_CONFIG, f)
+    os.chmod(ruta, 0o664)
+    ButtonConfigStore().save(ruta, documento(0, 0))
+    assert stat.S_IMODE(os.stat(ruta).st_mode) == 0o664
+
+
+def test_un_archivo_nuevo_respeta_la_umask(tmp_path):
+    ruta = str(tmp_path / 'btns_config.json')
+    ButtonConfigStore().save(ruta, documento(0, 0))
+    umask = os.umask(0)
+    os.umask(umask)
+    assert stat.S_IMODE(os.stat(ruta).st_mode) == 0o666 & ~umask
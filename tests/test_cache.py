@@ -0,0 +1,202 @@
+# tests/test_cache.py
+# Caché de la aplicación con el backend 'niveles' sobre un archivo propio: desalojo de la LRU por
+# bytes, TTL, dos instancias que comparten el archivo (como dos workers), la clave de memoizar y la
+# invalidación por los commits del ORM (filas, sentencias masivas, rollback y savepoints).
+import time
+
+import pytest
+from flask import g
+
+import contactos
+from models import User
+from cache import cache, Cache, MemoriaLRU, SQLiteCompartida
+
+
+@pytest.fixture
+def niveles(app, tmp_path, monkeypatch):
+    """La caché de la aplicación con el backend 'niveles'; se restaura la configuración de las pruebas."""
+    for atributo in ('backend', 'ttl', 'tablas_ignoradas'):
+        monkeypatch.setattr(cache, atributo, getattr(cache, atributo))
+    monkeypatch.setitem(app.config, 'CACHE_BACKEND', 'niveles')
+    monkeypatch.setitem(app.config, 'CACHE_SQLITE_PATH', str(tmp_path / 'cache.db'))
+    cache.init_app(app)
+    yield cache
+    conexion = getattr(cache.backend.compartida._local, 'conexion', None)
+    if conexion is not None:
+        conexion.close()
+
+
+@pytest.fixture
+def pedir(client, monkeypatch):
+    """GET de una URL; devuelve la respuesta y si salió de la caché (la vista no llegó a renderizar)."""
+    renderizadas = []
+    render_template = contactos.render_template
+
+    def contar(*args, **kwargs):
+        renderizadas.append(args[0])
+        return render_template(*args, **kwargs)
+    monkeypatch.setattr(contactos, 'render_template', contar)
+
+    def pedir_url(url):
+        # El contexto de aplicación del fixture db se comparte entre peticiones; una petición real
+        # empieza con g vacío y vuelve a leer las versiones
+        g.pop('_cache_versiones', None)
+        antes = len(renderizadas)
+        respuesta = client.get(url)
+        assert respuesta.status_code == 200
+        return respuesta, len(renderizadas) == antes
+    return pedir_url
+
+
+def test_la_lru_desaloja_la_menos_usada_por_bytes():
+    lru = MemoriaLRU(max_entradas=100, max_bytes=250)
+    expira = time.time() + 60
+    lru.guardar('a', b'a' * 100, expira)
+    lru.guardar('b', b'b' * 100, expira)
+    lru.obtener('a')
+    lru.guardar('c', b'c' * 100, expira)
+    assert lru.obtener('b') is None
+    assert lru.obtener('a') is not None and lru.obtener('c') is not None
+    assert (lru.ocupacion()['bytes'], lru.estadisticas.desalojos) == (200, 1)
+    # Un valor mayor que el límite no se guarda ni desaloja nada
+    lru.guardar('d', b'd' * 300, expira)
+    assert lru.obtener('d') is None
+    assert lru.ocupacion()['entradas'] == 2
+
+
+def test_las_entradas_vencidas_no_se_devuelven(tmp_path):
+    lru = MemoriaLRU()
+    lru.guardar('vieja', b'x', time.time() - 1)
+    assert lru.obtener('vieja') is None
+    assert (lru.estadisticas.expirados, lru.ocupacion()['entradas']) == (1, 0)
+
+    compartida = SQLiteCompartida(str(tmp_path / 'cache.db'))
+    compartida.guardar('vieja', b'x', time.time() - 1)
+    compartida.guardar('nueva', b'y', time.time() + 60)
+    assert compartida.obtener('vieja') is None
+    assert compartida.purgar() == 1
+    assert compartida.ocupacion()['entradas'] == 1
+    compartida._local.conexion.close()
+
+
+def test_dos_instancias_ven_la_invalidacion_de_la_otra(app, niveles):
+    otra = Cache()
+    otra.init_app(app)
+    app.extensions['cache'] = cache
+    try:
+        cache.guardar('version', 'ultima', {'numero': '1.0'})
+        assert otra.obtener('version', 'ultima') == {'numero': '1.0'}
+        # Ya está en las dos LRU locales; la versión del espacio vive en el archivo compartido
+        otra.invalidar('version')
+        assert cache.obtener('version', 'ultima') is None
+        otra.guardar('version', 'ultima', {'numero': '2.0'})
+        assert cache.obtener('version', 'ultima') == {'numero': '2.0'}
+        cache.limpiar()
+        assert otra.obtener('version', 'ultima') is None
+    finally:
+        otra.backend.compartida._local.conexion.close()
+
+
+def test_cada_lectura_devuelve_una_copia(niveles):
+    cache.guardar('aboutus', 'contenido', {'titulos': ['uno']})
+    cache.obtener('aboutus', 'contenido')['titulos'].append('dos')
+    assert cache.obtener('aboutus', 'contenido') == {'titulos': ['uno']}
+
+
+def test_memoizar_separa_por_usuario_idioma_y_tema(niveles, pedir, client, crear_usuario, iniciar_sesion):
+    ana, luis = crear_usuario('ana'), crear_usuario('luis')
+    iniciar_sesion(ana)
+    assert not pedir('/contactos/ver_contactos')[1]
+    assert pedir('/contactos/ver_contactos')[1]
+    assert not pedir('/contactos/ver_contactos?search_query=luis')[1]
+
+    with client.session_transaction() as sesion:
+        sesion['theme'] = 'dark'
+    assert not pedir('/contactos/ver_contactos')[1]
+    with client.session_transaction() as sesion:
+        sesion['lang'] = 'en'
+    assert not pedir('/contactos/ver_contactos')[1]
+    assert pedir('/contactos/ver_contactos')[1]
+
+    iniciar_sesion(luis)
+    with client.session_transaction() as sesion:
+        sesion.pop('theme')
+        sesion.pop('lang')
+    respuesta, acierto = pedir('/contactos/ver_contactos')
+    assert not acierto
+    assert b'luis' in respuesta.data
+
+
+def test_memoizar_no_usa_la_cache_con_mensajes_pendientes(niveles, pedir, client, crear_usuario, iniciar_sesion):
+    iniciar_sesion(crear_usuario('ana'))
+    pedir('/contactos/ver_contactos')
+    assert pedir('/contactos/ver_contactos')[1]
+    with client.session_transaction() as sesion:
+        sesion['_flashes'] = [('success', 'Contacto actualizado.')]
+    respuesta, acierto = pedir('/contactos/ver_contactos')
+    assert not acierto
+    assert 'Contacto actualizado.' in respuesta.get_data(as_text=True)
+    # La página con el mensaje no reemplaza a la guardada
+    respuesta, acierto = pedir('/contactos/ver_contactos')
+    assert acierto
+    assert 'Contacto actualizado.' not in respuesta.get_data(as_text=True)
+
+
+# --- Invalidación por cambios del ORM ---
+
+def versiones(*espacios):
+    return cache.backend.versiones(espacios)
+
+
+def test_editar_una_fila_invalida_solo_su_detalle(niveles, pedir, db, crear_usuario, iniciar_sesion):
+    ana, luis = crear_usuario('ana'), crear_usuario('luis')
+    iniciar_sesion(crear_usuario('admin', role='Superuser'))
+    for usuario in (ana, luis):
+        pedir(f'/contactos/ver_detalle/{usuario.id}')
+        assert pedir(f'/contactos/ver_detalle/{usuario.id}')[1]
+
+    ana.nombre = 'Anabel'
+    db.session.commit()
+    respuesta, acierto = pedir(f'/contactos/ver_detalle/{ana.id}')
+    assert not acierto
+    assert b'Anabel' in respuesta.data
+    assert pedir(f'/contactos/ver_detalle/{luis.id}')[1]
+    # El listado depende de la tabla entera
+    assert versiones('tabla:user')['tabla:user'] >= 1
+
+
+def test_una_actualizacion_masiva_invalida_todas_las_filas(niveles, pedir, db, crear_usuario, iniciar_sesion):
+    luis = crear_usuario('luis')
+    iniciar_sesion(crear_usuario('admin', role='Superuser'))
+    pedir(f'/contactos/ver_detalle/{luis.id}')
+    assert 'tabla:user!' not in versiones('tabla:user!')
+
+    User.query.filter(User.role == 'Usuario Regular').update({'telefono': '77770000'})
+    db.session.commit()
+    assert versiones('tabla:user!') == {'tabla:user!': 1}
+    respuesta, acierto = pedir(f'/contactos/ver_detalle/{luis.id}')
+    assert not acierto
+    assert b'77770000' in respuesta.data
+
+
+def test_un_rollback_no_invalida_nada(niveles, db, crear_usuario):
+    ana = crear_usuario('ana')
+    antes = versiones('tabla:user', f'tabla:user#{ana.id}')
+    ana.nombre = 'Anabel'
+    db.session.flush()
+    db.session.rollback()
+    db.session.commit()
+    assert versiones('tabla:user', f'tabla:user#{ana.id}') == antes
+
+
+def test_deshacer_un_savepoint_conserva_lo_anotado_antes(niveles, db, crear_usuario):
+    ana, luis = crear_usuario('ana'), crear_usuario('luis')
+    antes = versiones(f'tabla:user#{ana.id}')
+    ana.nombre = 'Anabel'
+    db.session.flush()
+    with db.session.begin_nested() as savepoint:
+        luis.nombre = 'Luisa'
+        db.session.flush()
+        savepoint.rollback()
+    db.session.commit()
+    assert versiones(f'tabla:user#{ana.id}')[f'tabla:user#{ana.id}'] == antes.get(f'tabla:user#{ana.id}', 0) + 1
@@ -0,0 +1,117 @@
+# tests/test_correo.py
+# Bandeja de salida: envío por lotes contra un servidor SMTP de prueba, reintentos y reclamos vencidos.
+import smtplib
+from datetime import datetime, timedelta
+
+import pytest
+
+import correo
+from models import db, MailOutbox
+
+
+class ServidorSMTP:
+    """Sustituye a Flask-Mail: registra los mensajes y puede fallar o ejecutar algo al recibir uno."""
+
+    def __init__(self):
+        self.recibidos = []
+        self.errores = {}       # destinatario -> excepción que se lanza al enviarle
+        self.al_recibir = None  # función(msg) llamada antes de aceptar cada mensaje
+        self.conexiones = 0
+
+    def connect(self):
+        self.conexiones += 1
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def send(self, msg):
+        if self.al_recibir:
+            self.al_recibir(msg)
+        destinatario, = msg.recipients
+        if destinatario in self.errores:
+            raise self.errores[destinatario]
+        self.recibidos.append(destinatario)
+
+
+@pytest.fixture
+def smtp(app, db, monkeypatch):
+    servidor = ServidorSMTP()
+    monkeypatch.setitem(app.extensions, 'mail', servidor)
+    monkeypatch.setitem(app.config, 'MAIL_OUTBOX_BACKGROUND', False)
+    monkeypatch.setitem(app.config, 'MAIL_OUTBOX_RATE', (0, 0))
+    monkeypatch.setitem(app.config, 'MAIL_DEFAULT_SENDER', 'avisos@latribu.test')
+    return servidor
+
+
+def encolar(*destinatarios):
+    correo.encolar_correo(list(destinatarios), 'Aviso', 'Hola')
+
+
+def estados():
+    return {fila.destinatario: fila.estado for fila in MailOutbox.query.order_by(MailOutbox.id)}
+
+
+def test_envia_la_bandeja_por_una_conexion(smtp):
+    encolar('a@latribu.test', 'b@latribu.test', 'c@latribu.test')
+    assert correo.procesar_bandeja() == {'enviados': 3, 'reintentos': 0, 'fallidos': 0}
+    assert smtp.recibidos == ['a@latribu.test', 'b@latribu.test', 'c@latribu.test']
+    assert smtp.conexiones == 1
+    assert set(estados().values()) == {'enviado'}
+    assert correo.procesar_bandeja() == {'enviados': 0, 'reintentos': 0, 'fallidos': 0}
+
+
+def test_errores_temporales_y_permanentes(smtp):
+    encolar('a@latribu.test', 'b@latribu.test', 'c@latribu.test')
+    smtp.errores['a@latribu.test'] = smtplib.SMTPRecipientsRefused({'a@latribu.test': (451, b'Intente luego')})
+    smtp.errores['b@latribu.test'] = smtplib.SMTPRecipientsRefused({'b@latribu.test': (550, b'No existe')})
+    assert correo.procesar_bandeja() == {'enviados': 1, 'reintentos': 1, 'fallidos': 1}
+    assert estados() == {'a@latribu.test': 'pendiente', 'b@latribu.test': 'fallido', 'c@latribu.test': 'enviado'}
+    reintento = MailOutbox.query.filter_by(destinatario='a@latribu.test').one()
+    assert reintento.intentos == 1
+    assert reintento.disponible_en > datetime.utcnow()
+
+
+def test_no_reenvia_lo_que_otro_proceso_retomo(app, smtp):
+    encolar('a@latribu.test', 'b@latribu.test', 'c@latribu.test')
+
+    # Mientras se envía el primero, el reclamo vence y otro proceso retoma el resto del lote
+    def otro_proceso_retoma(msg):
+        if smtp.al_recibir is None:
+            return
+        smtp.al_recibir = None
+        with db.engine.begin() as conexion:
+            conexion.execute(
+                db.update(MailOutbox).where(MailOutbox.destinatario != msg.recipients[0])
+                .values(estado='enviando', disponible_en=datetime.utcnow() + timedelta(minutes=30))
+            )
+
+    smtp.al_recibir = otro_proceso_retoma
+    assert correo.procesar_bandeja() == {'enviados': 1, 'reintentos': 0, 'fallidos': 0}
+    assert smtp.recibidos == ['a@latribu.test']
+    db.session.expire_all()
+    assert estados() == {'a@latribu.test': 'enviado', 'b@latribu.test': 'enviando', 'c@latribu.test': 'enviando'}
+
+
+def test_retoma_un_lote_abandonado(smtp):
+    encolar('a@latribu.test', 'b@latribu.test')
+    ids, plazo = correo.reclamar_lote(10)
+    assert len(ids) == 2
+    # Un proceso que cae no renueva el plazo: hasta que vence nadie más reclama sus mensajes
+    assert correo.reclamar_lote(10)[0] == []
+    MailOutbox.query.update({'disponible_en': datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+    assert correo.procesar_bandeja()['enviados'] == 2
+    # El plazo del proceso caído ya no sirve para renovar
+    assert correo.renovar_reclamo(ids[0], plazo) is None
+
+
+def test_el_lote_cabe_en_el_plazo_del_reclamo(app, smtp, monkeypatch):
+    monkeypatch.setitem(app.config, 'MAIL_OUTBOX_BATCH', 100)
+    monkeypatch.setitem(app.config, 'MAIL_OUTBOX_LEASE_MINUTES', 10)
+    assert correo.tamano_de_lote() == 100
+    monkeypatch.setitem(app.config, 'MAIL_OUTBOX_RATE', (2, 6))
+    assert correo.tamano_de_lote() == 32
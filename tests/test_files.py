@@ -0,0 +1,216 @@
+# tests/test_files.py
+# Módulo files: página de archivos, subidas (simples y reanudables) e índice de activos de la aplicación.
+import io
+import os
+import hashlib
+
+import pytest
+
+import files
+from models import db, File, AppAsset, Blob, UserStorage
+
+
+@pytest.fixture
+def usuario(crear_usuario, iniciar_sesion):
+    usuario = crear_usuario('ana')
+    iniciar_sesion(usuario)
+    return usuario
+
+
+def subir(client, nombre, contenido):
+    return client.post('/upload_file', data={'file': (io.BytesIO(contenido), nombre)},
+                       content_type='multipart/form-data')
+
+
+def test_la_pagina_de_archivos_lista_las_subidas(client, usuario):
+    respuesta = subir(client, 'notas.txt', b'hola\n')
+    assert respuesta.status_code == 302
+    pagina = client.get('/files')
+    assert pagina.status_code == 200
+    assert 'notas.txt' in pagina.get_data(as_text=True)
+    assert File.query.filter_by(user_id=usuario.id).count() == 1
+
+
+def test_sin_sesion_redirige_al_login(client, db):
+    respuesta = client.get('/files')
+    assert respuesta.status_code == 302
+    assert '/login' in respuesta.headers['Location']
+
+
+def test_el_indice_de_activos_es_incremental(app, db, tmp_path):
+    carpeta = tmp_path / 'avatars'
+    (carpeta / 'sub').mkdir(parents=True)
+    (carpeta / 'a.png').write_bytes(b'a')
+    (carpeta / 'sub' / 'b.png').write_bytes(b'b')
+    app.config['UPLOAD_FOLDER'] = str(carpeta)
+    try:
+        primero = files.refrescar_indice_activos(forzar=True)
+        assert primero['nuevos'] == 2
+        assert primero['listados'] == 2
+
+        sin_cambios = files.refrescar_indice_activos(forzar=True)
+        assert sin_cambios['listados'] == 0
+        assert sin_cambios['nuevos'] == sin_cambios['eliminados'] == 0
+
+        os.remove(carpeta / 'sub' / 'b.png')
+        (carpeta / 'sub' / 'c.png').write_bytes(b'c')
+        cambio = files.refrescar_indice_activos(forzar=True)
+        assert cambio['listados'] == 1
+        assert (cambio['nuevos'], cambio['eliminados']) == (1, 1)
+        assert sorted(a.original_filename for a in AppAsset.query) == ['a.png', 'c.png']
+    finally:
+        app.config['UPLOAD_FOLDER'] = None
+
+
+# --- Subidas reanudables ---
+
+def crear_subida(client, nombre, contenido, sha256=None):
+    datos = {'filename': nombre, 'size': len(contenido)}
+    if sha256:
+        datos['sha256'] = sha256
+    respuesta = client.post('/files/uploads', json=datos)
+    assert respuesta.status_code == 201
+    return respuesta.headers['Location'], respuesta.get_json()['upload_id']
+
+
+def enviar_fragmento(client, url, offset, contenido, longitud=None):
+    # Un cuerpo más corto que su Content-Length es lo que ve el servidor cuando el cliente se desconecta
+    return client.patch(url, input_stream=io.BytesIO(contenido),
+                        headers={'Upload-Offset': str(offset), 'Tus-Resumable': files.TUS_VERSION},
+                        content_type='application/offset+octet-stream',
+                        environ_overrides={'CONTENT_LENGTH': str(longitud or len(contenido))})
+
+
+def test_subida_interrumpida_y_reanudada(app, client, usuario, caplog):
+    caplog.set_level('INFO', logger=app.logger.name)
+    contenido = os.urandom(300 * 1024)
+    sha256 = hashlib.sha256(contenido).hexdigest()
+    url, upload_id = crear_subida(client, 'ruta.gpx', contenido, sha256)
+
+    # La conexión se corta a los 100 KiB de un fragmento que anunciaba el archivo completo
+    cortada = enviar_fragmento(client, url, 0, contenido[:100 * 1024], longitud=len(contenido))
+    assert cortada.status_code == 204
+    assert cortada.headers['Upload-Offset'] == str(100 * 1024)
+    assert f'Subida {upload_id} interrumpida tras {100 * 1024} bytes' in caplog.text
+
+    estado = client.head(url)
+    assert estado.status_code == 200
+    assert estado.headers['Upload-Offset'] == str(100 * 1024)
+
+    # Un offset distinto al confirmado se rechaza sin escribir nada
+    assert enviar_fragmento(client, url, 0, contenido).status_code == 409
+
+    # Otro worker reanuda la subida: el SHA-256 se recalcula desde el archivo parcial
+    files._olvidar_huella(upload_id)
+    final = enviar_fragmento(client, url, 100 * 1024, contenido[100 * 1024:])
+    assert final.status_code == 200
+    assert final.get_json()['sha256'] == sha256
+
+    registro = db.session.get(File, final.get_json()['file_id'])
+    assert registro.size == len(contenido)
+    with open(os.path.join(app.static_folder, registro.file_path), 'rb') as f:
+        assert f.read() == contenido
+    assert not os.path.exists(os.path.join(app.config['UPLOAD_STAGING_FOLDER'], f'{upload_id}.part'))
+    assert client.head(url).status_code == 404
+
+
+def test_subida_con_hash_distinto_se_descarta(app, client, usuario):
+    contenido = b'x' * 1000
+    url, upload_id = crear_subida(client, 'a.txt', contenido, sha256='0' * 64)
+    respuesta = enviar_fragmento(client, url, 0, contenido)
+    assert respuesta.status_code == 460
+    assert File.query.count() == 0
+    assert not os.path.exists(os.path.join(app.config['UPLOAD_STAGING_FOLDER'], f'{upload_id}.part'))
+
+
+def test_otro_usuario_no_puede_continuar_la_subida(client, usuario, crear_usuario, iniciar_sesion):
+    url, _ = crear_subida(client, 'a.txt', b'abc')
+    iniciar_sesion(crear_usuario('beto'))
+    assert client.head(url).status_code == 404
+    assert enviar_fragmento(client, url, 0, b'abc').status_code == 404
+
+
+
+# --- Permisos sobre archivos ajenos ---
+
+def test_vista_previa_y_exportacion_solo_para_el_dueno(client, usuario, crear_usuario, iniciar_sesion):
+    subir(client, 'diario.txt', b'linea privada\n')
+    archivo = File.query.one()
+    assert client.get(f'/files/preview/{archivo.id}').get_json()['lineas'] == ['linea privada']
+
+    iniciar_sesion(crear_usuario('beto'))
+    vista = client.get(f'/files/preview/{archivo.id}')
+    assert vista.status_code == 403
+    assert 'linea privada' not in vista.get_data(as_text=True)
+    exportacion = client.get(f'/export_file/{archivo.id}/txt')
+    assert exportacion.status_code == 302
+    assert 'linea privada' not in exportacion.get_data(as_text=True)
+    assert client.get(f'/download_file/{archivo.id}').status_code == 302
+
+    iniciar_sesion(crear_usuario('admin', role='Superuser'))
+    assert client.get(f'/files/preview/{archivo.id}').status_code == 200
+    assert client.get(f'/export_file/{archivo.id}/txt').get_data() == b'linea privada\n'
+
+
+# --- Cuota de almacenamiento ---
+
+@pytest.fixture
+def cuota(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'USER_STORAGE_QUOTA_BYTES', 1000)
+    return 1000
+
+
+def test_la_subida_simple_respeta_la_cuota(client, usuario, cuota):
+    assert subir(client, 'a.txt', b'a' * 600).status_code == 302
+    rechazada = subir(client, 'b.txt', b'b' * 600)
+    assert rechazada.status_code == 302
+    assert 'No hay espacio suficiente' in client.get('/files').get_data(as_text=True)
+    assert [f.original_filename for f in File.query] == ['a.txt']
+    assert client.get('/files/uso').get_json()['total'] == {'bytes': 600, 'archivos': 1}
+
+
+def test_la_subida_reanudable_respeta_la_cuota(client, usuario, cuota):
+    assert client.post('/files/uploads', json={'filename': 'grande.txt', 'size': 2000}).status_code == 413
+
+    # La cuota se agota mientras la subida está en curso: se descarta al recibir el último byte
+    contenido = b'c' * 600
+    url, upload_id = crear_subida(client, 'c.txt', contenido)
+    subir(client, 'a.txt', b'a' * 600)
+    respuesta = enviar_fragmento(client, url, 0, contenido)
+    assert respuesta.status_code == 413
+    assert [f.original_filename for f in File.query] == ['a.txt']
+    assert Blob.query.count() == 1
+    assert client.head(url).status_code == 404
+
+
+def test_los_superusuarios_no_tienen_cuota(client, crear_usuario, iniciar_sesion, cuota):
+    iniciar_sesion(crear_usuario('admin', role='Superuser'))
+    subir(client, 'a.txt', b'a' * 600)
+    subir(client, 'b.txt', b'b' * 600)
+    assert File.query.count() == 2
+    assert client.get('/files/uso').get_json()['cuota'] is None
+
+
+def test_reconciliar_almacenamiento(app, client, usuario):
+    subir(client, 'a.txt', b'a' * 600)
+    subir(client, 'b.txt', b'b' * 400)
+    # Deriva en el contador y un archivo cuyo tamaño registrado no coincide con el disco
+    UserStorage.query.filter_by(user_id=usuario.id).update({'bytes_used': 5, 'file_count': 7})
+    File.query.filter_by(original_filename='b.txt').update({'size': 1})
+    db.session.commit()
+    runner = app.test_cli_runner()
+
+    informe = runner.invoke(args=['files', 'reconciliar-almacenamiento'])
+    assert informe.exit_code == 0, informe.output
+    assert '2 archivos medidos, 0 sin archivo en disco, 1 con tamaño distinto al registrado, 1 contadores con deriva.' in informe.output
+    db.session.expire_all()
+    assert UserStorage.query.one().file_count == 7
+
+    corregido = runner.invoke(args=['files', 'reconciliar-almacenamiento', '--corregir'])
+    assert corregido.exit_code == 0, corregido.output
+    assert 'Contadores reconstruidos.' in corregido.output
+    db.session.expire_all()
+    contador = UserStorage.query.one()
+    assert (contador.bytes_used, contador.file_count) == (1000, 2)
+    assert File.query.filter_by(original_filename='b.txt').one().size == 400
+    assert '0 contadores con deriva' in runner.invoke(args=['files', 'reconciliar-almacenamiento']).output
@@ -0,0 +1,117 @@
+# tests/test_http_cache.py
+# respuesta_condicional: un 304 se decide con los validadores, sin ejecutar la vista ni renderizar.
+from contextlib import contextmanager
+
+from flask import template_rendered
+
+from btns import DEFAULT_CONFIG, save_config
+from models import AboutUs
+from version import Version
+
+
+@contextmanager
+def plantillas_renderizadas(app):
+    renderizadas = []
+
+    def registrar(sender, template, context, **extra):
+        renderizadas.append(template.name)
+
+    template_rendered.connect(registrar, app)
+    try:
+        yield renderizadas
+    finally:
+        template_rendered.disconnect(registrar, app)
+
+
+def crear_version(db, numero):
+    db.session.add(Version(nombre_version='Canario', numero_version=numero))
+    db.session.commit()
+
+
+def test_304_no_renderiza_la_plantilla(app, client, db):
+    crear_version(db, '1.0')
+    with plantillas_renderizadas(app) as renderizadas:
+        primera = client.get('/version/ver_versiones')
+    assert primera.status_code == 200
+    assert 'ver_versiones.html' in renderizadas
+    assert primera.headers['ETag'].startswith('W/')
+    assert 'no-cache' in primera.headers['Cache-Control']
+    assert 'Cookie' in primera.headers['Vary']
+
+    with plantillas_renderizadas(app) as renderizadas:
+        segunda = client.get('/version/ver_versiones', headers={'If-None-Match': primera.headers['ETag']})
+    assert segunda.status_code == 304
+    assert renderizadas == []
+    assert segunda.data == b''
+    assert segunda.headers['ETag'] == primera.headers['ETag']
+
+
+def test_un_cambio_en_los_datos_vuelve_a_renderizar(app, client, db):
+    crear_version(db, '1.0')
+    etag = client.get('/version/ver_versiones').headers['ETag']
+    crear_version(db, '1.1')
+    with plantillas_renderizadas(app) as renderizadas:
+        respuesta = client.get('/version/ver_versiones', headers={'If-None-Match': etag})
+    assert respuesta.status_code == 200
+    assert 'ver_versiones.html' in renderizadas
+    assert respuesta.headers['ETag'] != etag
+
+
+def test_el_etag_depende_de_la_sesion(app, client, db, crear_usuario, iniciar_sesion):
+    crear_version(db, '1.0')
+    etag_anonimo = client.get('/version/ver_versiones').headers['ETag']
+    iniciar_sesion(crear_usuario('ana'))
+    respuesta = client.get('/version/ver_versiones', headers={'If-None-Match': etag_anonimo})
+    assert respuesta.status_code == 200
+
+
+def test_con_mensajes_flash_pendientes_no_responde_304(app, client, db):
+    crear_version(db, '1.0')
+    etag = client.get('/version/ver_versiones').headers['ETag']
+    with client.session_transaction() as sesion:
+        sesion['_flashes'] = [('info', 'Versión guardada')]
+    with plantillas_renderizadas(app) as renderizadas:
+        respuesta = client.get('/version/ver_versiones', headers={'If-None-Match': etag})
+    assert respuesta.status_code == 200
+    assert 'ver_versiones.html' in renderizadas
+
+
+def test_if_modified_since_con_etag_fuerte(app, client, db):
+    with app.test_request_context():
+        save_config(DEFAULT_CONFIG)
+    primera = client.get('/api/btns/config')
+    assert primera.status_code == 200
+    assert 'public' in primera.headers['Cache-Control']
+    assert not primera.headers['ETag'].startswith('W/')
+
+    segunda = client.get('/api/btns/config', headers={'If-Modified-Since': primera.headers['Last-Modified']})
+    assert segunda.status_code == 304
+    tercera = client.get('/api/btns/config', headers={'If-None-Match': primera.headers['ETag']})
+    assert tercera.status_code == 304
+    assert tercera.data == b''
+
+
+def test_las_exportaciones_usan_etag_debil(app, client, db):
+    # Los PDF y XLSX llevan la fecha de generación: los bytes cambian en cada render
+    entrada = AboutUs(logo_filename='logo.png', logo_info='Logo', title='La Tribu', detail='Caminatas')
+    db.session.add(entrada)
+    db.session.commit()
+    primera = client.get(f'/aboutus/exportar/{entrada.id}/pdf')
+    assert primera.status_code == 200
+    assert primera.headers['ETag'].startswith('W/')
+    segunda = client.get(f'/aboutus/exportar/{entrada.id}/pdf', headers={'If-None-Match': primera.headers['ETag']})
+    assert segunda.status_code == 304
+
+
+def test_inicio_privado_con_sesion(client, db, crear_usuario, iniciar_sesion):
+    # El Service Worker solo guarda / y /home si la respuesta no es private
+    anonima = client.get('/')
+    assert anonima.status_code == 200
+    assert 'private' not in anonima.headers.get('Cache-Control', '')
+    assert 'Cookie' in anonima.headers['Vary']
+
+    iniciar_sesion(crear_usuario('ana'))
+    for ruta in ('/', '/home'):
+        respuesta = client.get(ruta)
+        assert respuesta.status_code == 200
+        assert 'private' in respuesta.headers['Cache-Control']
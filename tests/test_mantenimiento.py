@@ -0,0 +1,104 @@
+# tests/test_mantenimiento.py
+# Mantenimiento de SQLite sobre una base propia: activar auto_vacuum=INCREMENTAL, ANALYZE y luego
+# optimize, devolver las páginas libres por pasos dentro del presupuesto y el informe sin dbstat.
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+import mantenimiento
+
+
+class SinDbstat:
+    """Conexión de un SQLite compilado sin SQLITE_ENABLE_DBSTAT_VTAB."""
+
+    def __init__(self, conexion):
+        self.conexion = conexion
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.conexion.close()
+        return False
+
+    def exec_driver_sql(self, sql, *args):
+        if 'dbstat' in sql:
+            raise OperationalError(sql, None, sqlite3.OperationalError('no such table: dbstat'))
+        return self.conexion.exec_driver_sql(sql, *args)
+
+
+@pytest.fixture
+def base(app, db, tmp_path, monkeypatch):
+    """Base SQLite aparte con una tabla de 2000 filas de 1 KB; el mantenimiento trabaja sobre ella."""
+    motor = create_engine(f"sqlite:///{tmp_path / 'mantenimiento.db'}")
+    with motor.begin() as conexion:
+        conexion.exec_driver_sql('CREATE TABLE notas (id INTEGER PRIMARY KEY, texto BLOB)')
+        conexion.exec_driver_sql('CREATE INDEX ix_notas_texto ON notas (texto)')
+        conexion.exec_driver_sql('WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 2000) '
+                                 'INSERT INTO notas (texto) SELECT randomblob(1024) FROM n')
+    monkeypatch.setattr(mantenimiento, '_conexion',
+                        lambda: motor.connect().execution_options(isolation_level='AUTOCOMMIT'))
+    monkeypatch.setattr(mantenimiento, '_ruta_informe', lambda: str(tmp_path / 'mantenimiento_db.json'))
+    yield motor
+    motor.dispose()
+
+
+def borrar_notas(motor):
+    with motor.begin() as conexion:
+        conexion.exec_driver_sql('DELETE FROM notas WHERE id > 100')
+
+
+def test_activar_incremental_y_liberar_paginas(base):
+    primero = mantenimiento.ejecutar_mantenimiento(pausa_ms=0, activar_incremental=True)
+    assert primero['antes']['auto_vacuum'] == 'none'
+    assert not primero['antes']['analizada']
+    assert 'completo_s' in primero['vacuum']
+    assert primero['analisis'] == 'ANALYZE'
+    assert (primero['despues']['auto_vacuum'], primero['despues']['analizada']) == ('incremental', True)
+    with base.connect() as conexion:
+        assert conexion.exec_driver_sql("SELECT COUNT(*) FROM sqlite_stat1 WHERE tbl = 'notas'").scalar() > 0
+
+    borrar_notas(base)
+    segundo = mantenimiento.ejecutar_mantenimiento(paginas_por_paso=100, pausa_ms=0)
+    libres = segundo['antes']['paginas_libres']
+    assert libres > 500
+    assert segundo['analisis'] == 'optimize'
+    assert segundo['vacuum']['paginas_liberadas'] == libres
+    assert segundo['vacuum']['pasos'] == -(-libres // 100)
+    assert segundo['despues']['paginas_libres'] == 0
+    # También se liberan las páginas del mapa de punteros que ya no hacen falta
+    assert segundo['despues']['paginas'] <= segundo['antes']['paginas'] - libres
+    tablas = {fila['tabla']: fila for fila in segundo['despues']['tablas']}
+    assert tablas['notas']['bytes_indices'] > 0
+
+
+def test_el_vacuum_respeta_el_presupuesto_de_paginas(base):
+    mantenimiento.ejecutar_mantenimiento(pausa_ms=0, activar_incremental=True)
+    borrar_notas(base)
+    informe = mantenimiento.ejecutar_mantenimiento(paginas_por_paso=10, max_paginas=25, pausa_ms=0)
+    assert (informe['vacuum']['pasos'], informe['vacuum']['paginas_liberadas']) == (3, 25)
+    assert informe['despues']['paginas_libres'] == informe['antes']['paginas_libres'] - 25
+
+
+def test_sin_auto_vacuum_incremental_solo_analiza(base):
+    borrar_notas(base)
+    informe = mantenimiento.ejecutar_mantenimiento(pausa_ms=0)
+    assert informe['vacuum'] is None
+    # El archivo no se achica: las páginas libres solo se reutilizan (ANALYZE toma alguna)
+    assert informe['despues']['paginas'] == informe['antes']['paginas']
+    assert informe['despues']['paginas_libres'] > 0
+    assert 'usa --activar-incremental una vez' in mantenimiento._resumen_informe(informe)
+
+
+def test_sin_dbstat_no_hay_detalle_por_tabla(app, base, monkeypatch):
+    with base.connect() as conexion:
+        datos = mantenimiento.estadisticas(SinDbstat(conexion))
+    assert datos['tablas'] is None
+    assert datos['paginas'] > 0
+
+    monkeypatch.setattr(mantenimiento, '_conexion', lambda: SinDbstat(base.connect()))
+    resultado = app.test_cli_runner().invoke(args=['mantenimiento', 'estadisticas'])
+    assert resultado.exit_code == 0, resultado.output
+    assert 'dbstat no está disponible en este SQLite.' in resultado.output
@@ -0,0 +1,61 @@
+# tests/test_models.py
+# User.por_identidad: búsquedas por columnas normalizadas que SQLite resuelve con sus índices.
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from models import User
+
+
+@contextmanager
+def consultas_ejecutadas(engine):
+    ejecutadas = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        ejecutadas.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', registrar)
+    try:
+        yield ejecutadas
+    finally:
+        event.remove(engine, 'before_cursor_execute', registrar)
+
+
+def plan_de(db, *args, **kwargs):
+    """Ejecuta User.por_identidad y devuelve el EXPLAIN QUERY PLAN de la consulta que emitió."""
+    with consultas_ejecutadas(db.engine) as ejecutadas:
+        encontrado = User.por_identidad(*args, **kwargs)
+    (statement, parameters), = ejecutadas
+    with db.engine.connect() as conexion:
+        filas = conexion.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+    return encontrado, ' | '.join(fila[-1] for fila in filas)
+
+
+@pytest.fixture
+def usuarios(crear_usuario):
+    for n in range(50):
+        crear_usuario(f'persona{n}', telefono=f'8800{n:04d}')
+    return crear_usuario('Ana.Mora', email='Ana.Mora@Example.com', telefono='+506 8888-1234')
+
+
+def test_login_usa_los_indices_de_usuario_y_correo(db, usuarios):
+    encontrado, plan = plan_de(db, '  ANA.MORA@example.COM ')
+    assert encontrado.id == usuarios.id
+    assert 'ix_user_username_norm' in plan
+    assert 'ix_user_email_norm' in plan
+    assert 'SCAN user' not in plan
+
+
+def test_telefono_usa_su_indice(db, usuarios):
+    encontrado, plan = plan_de(db, '8888 1234', 'telefono')
+    assert encontrado.id == usuarios.id
+    assert 'ix_user_telefono_norm' in plan
+    assert 'SCAN user' not in plan
+
+
+def test_excluir_id_no_cambia_el_plan(db, usuarios):
+    encontrado, plan = plan_de(db, 'ana.mora', 'username', excluir_id=usuarios.id)
+    assert encontrado is None
+    assert 'ix_user_username_norm' in plan
+    assert 'SCAN user' not in plan
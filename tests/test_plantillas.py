@@ -0,0 +1,97 @@
+# tests/test_plantillas.py
+# Caché de bytecode de Jinja: `flask plantillas precompilar` la llena con todas las plantillas, los
+# workers las cargan sin volver a compilar y el calentamiento renderiza las críticas sin fallar.
+import os
+
+import pytest
+from jinja2 import ChoiceLoader, DictLoader, FileSystemBytecodeCache
+from jinja2.utils import LRUCache
+
+import plantillas
+
+
+@pytest.fixture
+def bytecode(app, tmp_path, monkeypatch):
+    """Caché de bytecode vacía en tmp_path y sin plantillas ya cargadas en el entorno de Jinja."""
+    carpeta = tmp_path / 'jinja_cache'
+    carpeta.mkdir()
+    monkeypatch.setitem(app.config, 'TEMPLATE_BYTECODE_FOLDER', str(carpeta))
+    monkeypatch.setattr(app.jinja_env, 'bytecode_cache', FileSystemBytecodeCache(str(carpeta)))
+    monkeypatch.setattr(app.jinja_env, 'cache', LRUCache(400))
+    return carpeta
+
+
+@pytest.fixture
+def extra(app, monkeypatch):
+    """Añade plantillas de prueba delante de las de la aplicación."""
+    def anadir(**fuentes):
+        monkeypatch.setattr(app.jinja_env, 'loader', ChoiceLoader([DictLoader(fuentes), app.jinja_env.loader]))
+    return anadir
+
+
+def test_la_cache_de_bytecode_de_las_pruebas_es_temporal(app):
+    assert os.path.dirname(app.jinja_env.bytecode_cache.directory) == app.instance_path
+
+
+def test_compilar_todas_incluye_las_de_los_blueprints(app, bytecode):
+    compiladas, errores = plantillas.compilar_todas(app)
+    assert errores == []
+    assert compiladas == len(app.jinja_env.list_templates(extensions=('html', 'xml', 'txt', 'js')))
+    assert 'base.html' in app.jinja_env.list_templates()
+    assert len(os.listdir(bytecode)) == compiladas
+
+
+def test_compilar_todas_devuelve_los_errores(app, bytecode, extra):
+    extra(**{'rota.html': '{% if %}'})
+    compiladas, errores = plantillas.compilar_todas(app)
+    assert [nombre for nombre, _ in errores] == ['rota.html']
+    assert compiladas == len(os.listdir(bytecode))
+
+
+def test_precompilar_llena_la_cache_y_se_carga_sin_compilar(app, bytecode, monkeypatch):
+    resultado = app.test_cli_runner().invoke(args=['plantillas', 'precompilar'])
+    assert resultado.exit_code == 0, resultado.output
+    assert 'plantillas compiladas' in resultado.output and '(0 con errores)' in resultado.output
+
+    # Otro worker: entorno sin plantillas en memoria, el bytecode del disco basta
+    monkeypatch.setattr(app.jinja_env, 'cache', LRUCache(400))
+
+    def compilar(*args, **kwargs):
+        raise AssertionError('la plantilla se volvió a compilar')
+    monkeypatch.setattr(app.jinja_env, 'compile', compilar)
+    assert app.jinja_env.get_template('base.html') is not None
+
+
+def test_precompilar_limpiar_borra_el_bytecode_anterior(app, bytecode):
+    viejo = bytecode / '__jinja2_obsoleto.cache'
+    viejo.write_bytes(b'basura')
+    resultado = app.test_cli_runner().invoke(args=['plantillas', 'precompilar', '--limpiar'])
+    assert resultado.exit_code == 0, resultado.output
+    assert not viejo.exists()
+    assert len(os.listdir(bytecode)) > 0
+
+
+def test_precompilar_falla_con_errores_o_sin_carpeta(app, bytecode, extra, monkeypatch):
+    extra(**{'rota.html': '{% if %}'})
+    resultado = app.test_cli_runner().invoke(args=['plantillas', 'precompilar'])
+    assert resultado.exit_code == 1
+    assert 'error en rota.html' in resultado.output
+
+    monkeypatch.setattr(app.jinja_env, 'bytecode_cache', None)
+    resultado = app.test_cli_runner().invoke(args=['plantillas', 'precompilar'])
+    assert resultado.exit_code == 1
+    assert 'TEMPLATE_BYTECODE_FOLDER no está configurado.' in resultado.output
+
+
+def test_calentar_renderiza_las_plantillas_criticas(app, db, bytecode):
+    tiempos = plantillas.calentar(app)
+    assert list(tiempos) == list(app.config['TEMPLATE_WARMUP'])
+    assert all(ms >= 0 for ms in tiempos.values())
+    assert len(os.listdir(bytecode)) >= len(tiempos)
+
+
+def test_calentar_registra_los_errores_de_render(app, db, bytecode, extra, capsys):
+    extra(**{'sin_datos.html': '{{ usuario.nombre.upper() }}'})
+    tiempos = plantillas.calentar(app, ['sin_datos.html', 'login.html'])
+    assert list(tiempos) == ['sin_datos.html', 'login.html']
+    assert 'DEBUG: Calentamiento de sin_datos.html: UndefinedError' in capsys.readouterr().out
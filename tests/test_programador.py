@@ -0,0 +1,191 @@
+# tests/test_programador.py
+# Programador con reloj congelado: una sola ejecución por trabajo vencido aunque haya varios procesos,
+# sin ponerse al día tras una pausa larga, leases vencidos y casos límite de las expresiones cron.
+import threading
+from datetime import datetime
+
+import pytest
+
+from models import db, SchedulerJob
+from programador import Programador, Trabajo, ExpresionCron
+
+INICIO = datetime(2026, 3, 2, 10, 0).timestamp() # lunes
+
+
+class Reloj:
+    def __init__(self, ahora=INICIO):
+        self.ahora = ahora
+
+    def __call__(self):
+        return self.ahora
+
+    def avanzar(self, segundos):
+        self.ahora += segundos
+
+
+@pytest.fixture
+def reloj():
+    return Reloj()
+
+
+def trabajo(nombre='limpieza', ejecuciones=None, **programacion):
+    ejecuciones = [] if ejecuciones is None else ejecuciones
+    return Trabajo(nombre, lambda: ejecuciones.append(nombre), **programacion), ejecuciones
+
+
+def fila(nombre='limpieza'):
+    db.session.expire_all()
+    return db.session.get(SchedulerJob, nombre)
+
+
+def test_la_primera_vez_se_programa_sin_ejecutar(db, reloj):
+    limpieza, ejecuciones = trabajo(cada=60)
+    programador = Programador(reloj=reloj, trabajos={'limpieza': limpieza})
+    assert programador.tick() == []
+    assert fila().proxima_en == INICIO + 60
+    reloj.avanzar(59)
+    assert programador.tick() == []
+    reloj.avanzar(1)
+    assert programador.tick() == ['limpieza']
+    assert ejecuciones == ['limpieza']
+    assert fila().proxima_en == INICIO + 120
+
+
+def test_un_solo_proceso_ejecuta_cada_trabajo_vencido(app, db, reloj):
+    ejecuciones = []
+    trabajos = {nombre: trabajo(nombre, ejecuciones, cada=60)[0] for nombre in ('gc', 'respaldo', 'correo')}
+    procesos = [Programador(reloj=reloj, trabajos=trabajos) for _ in range(6)]
+    procesos[0].tick()
+    reloj.avanzar(60)
+
+    barrera = threading.Barrier(len(procesos))
+
+    def tick(programador):
+        with app.app_context():
+            barrera.wait()
+            programador.tick()
+
+    hilos = [threading.Thread(target=tick, args=(programador,)) for programador in procesos]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(30)
+    assert sorted(ejecuciones) == ['correo', 'gc', 'respaldo']
+    assert all(fila(nombre).ejecuciones == 1 for nombre in trabajos)
+
+
+def test_tras_una_pausa_larga_se_ejecuta_una_sola_vez(db, reloj):
+    cada_hora, ejecuciones = trabajo(cron='0 * * * *')
+    programador = Programador(reloj=reloj, trabajos={'limpieza': cada_hora})
+    programador.tick()
+    # El proceso estuvo detenido 5 horas: se perdieron 5 ejecuciones y no se recuperan
+    reloj.avanzar(5 * 3600 + 15 * 60)
+    assert programador.tick() == ['limpieza']
+    assert programador.tick() == []
+    assert ejecuciones == ['limpieza']
+    assert fila().proxima_en == datetime(2026, 3, 2, 16, 0).timestamp()
+
+
+def test_un_lease_vencido_permite_retomar_el_trabajo(db, reloj):
+    lento, ejecuciones = trabajo(cada=60, duracion_maxima=600)
+    caido = Programador(reloj=reloj, trabajos={'limpieza': lento})
+    otro = Programador(reloj=reloj, trabajos={'limpieza': lento})
+    caido.tick()
+    reloj.avanzar(60)
+    # El proceso reclama el trabajo y muere antes de terminarlo: el lease queda puesto
+    caido.ejecutar = lambda trabajo: None
+    assert caido.tick() == ['limpieza']
+    assert fila().bloqueado_hasta == reloj() + 600
+
+    reloj.avanzar(120)
+    assert otro.tick() == []
+    reloj.avanzar(480)
+    assert otro.tick() == ['limpieza']
+    assert ejecuciones == ['limpieza']
+    assert fila().bloqueado_hasta is None
+    assert fila().propietario == otro.propietario
+
+
+def test_el_proceso_anterior_no_libera_el_lease_del_nuevo(db, reloj):
+    estados = []
+    caido = Programador(reloj=reloj)
+    nuevo = Programador(reloj=reloj)
+
+    def durante_la_ejecucion():
+        # El proceso que se creía caído termina tarde: su cierre no debe tocar el lease del nuevo
+        Programador.ejecutar(caido, Trabajo('limpieza', lambda: None, cada=60))
+        estados.append(fila().bloqueado_hasta)
+
+    trabajos = {'limpieza': Trabajo('limpieza', durante_la_ejecucion, cada=60, duracion_maxima=300)}
+    caido._trabajos = nuevo._trabajos = trabajos
+    caido.tick()
+    reloj.avanzar(60)
+    caido.ejecutar = lambda trabajo: None
+    caido.tick()
+    reloj.avanzar(300)
+    assert nuevo.tick() == ['limpieza']
+    assert estados == [reloj() + 300]
+    assert fila().ejecuciones == 1
+
+
+def test_un_fallo_queda_registrado_y_no_detiene_el_programador(db, reloj):
+    def falla():
+        raise RuntimeError('disco lleno')
+
+    trabajos = {'roto': Trabajo('roto', falla, cada=60)}
+    programador = Programador(reloj=reloj, trabajos=trabajos)
+    programador.tick()
+    reloj.avanzar(60)
+    assert programador.tick() == ['roto']
+    registro = fila('roto')
+    assert (registro.fallos, registro.fallos_seguidos, registro.ultimo_exito) == (1, 1, None)
+    assert 'disco lleno' in registro.ultimo_error
+    reloj.avanzar(60)
+    assert programador.tick() == ['roto']
+    assert fila('roto').fallos_seguidos == 2
+
+
+# --- Expresiones cron ---
+
+@pytest.mark.parametrize('expresion, desde, esperado', [
+    # Los segundos se descartan y el resultado es estrictamente posterior
+    ('* * * * *', datetime(2026, 3, 2, 10, 0, 30), datetime(2026, 3, 2, 10, 1)),
+    ('30 3 * * *', datetime(2026, 3, 2, 3, 30), datetime(2026, 3, 3, 3, 30)),
+    # Fin de año
+    ('59 23 31 12 *', datetime(2026, 12, 31, 23, 59), datetime(2027, 12, 31, 23, 59)),
+    ('0 0 1 1 *', datetime(2026, 12, 31, 23, 59), datetime(2027, 1, 1, 0, 0)),
+    # Día 31 salta los meses que no lo tienen; 29 de febrero espera al próximo bisiesto
+    ('0 0 31 * *', datetime(2026, 4, 1), datetime(2026, 5, 31)),
+    ('0 0 29 2 *', datetime(2026, 3, 1), datetime(2028, 2, 29)),
+    # Día del mes y día de la semana restringidos: basta con uno (el lunes llega antes que el día 1)
+    ('0 9 1 * 1', datetime(2026, 10, 20), datetime(2026, 10, 26, 9, 0)),
+    ('0 9 1 * 1', datetime(2026, 10, 27), datetime(2026, 11, 1, 9, 0)),
+    # Domingo como 0 o 7
+    ('0 0 * * 7', datetime(2026, 3, 2), datetime(2026, 3, 8)),
+    ('0 0 * * 0', datetime(2026, 3, 2), datetime(2026, 3, 8)),
+    # Rangos con paso y listas
+    ('10-20/5 * * * *', datetime(2026, 3, 2, 10, 16), datetime(2026, 3, 2, 10, 20)),
+    ('10-20/5 * * * *', datetime(2026, 3, 2, 10, 20), datetime(2026, 3, 2, 11, 10)),
+    ('0 8,20 * * 1-5', datetime(2026, 3, 6, 20, 0), datetime(2026, 3, 9, 8, 0)),
+])
+def test_cron_siguiente(expresion, desde, esperado):
+    assert ExpresionCron(expresion).siguiente(desde) == esperado
+
+
+@pytest.mark.parametrize('expresion', ['* * * *', '60 * * * *', '* 24 * * *', '0 0 0 * *', '0 0 * 13 *',
+                                       '*/0 * * * *', '20-10 * * * *', 'a * * * *'])
+def test_cron_invalida(expresion):
+    with pytest.raises(ValueError):
+        ExpresionCron(expresion)
+
+
+def test_cron_sin_fechas_posibles():
+    with pytest.raises(ValueError, match='no tiene próximas fechas'):
+        ExpresionCron('0 0 30 2 *').siguiente(datetime(2026, 1, 1))
+
+
+def test_trabajo_necesita_cron_o_intervalo():
+    with pytest.raises(ValueError):
+        Trabajo('x', lambda: None)
+    with pytest.raises(ValueError):
+        Trabajo('x', lambda: None, cron='* * * * *', cada=60)
@@ -0,0 +1,108 @@
+# tests/test_push.py
+# Envío Web Push contra un servicio push local: firmas VAPID reutilizadas, suscripciones caducadas
+# borradas y fallos aislados por suscripción.
+import os
+import base64
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from py_vapid import Vapid
+
+import push
+from models import db, PushSubscription
+
+# Ruta del endpoint -> respuesta del servicio push
+RESPUESTAS = {'/ok': 201, '/baja': 410, '/desconocida': 404, '/saturado': 503}
+
+
+class ServicioPush(BaseHTTPRequestHandler):
+    recibidas = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        ServicioPush.recibidas.append((self.path.split('/')[1], self.headers.get('Authorization')))
+        self.send_response(RESPUESTAS['/' + self.path.split('/')[1]])
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servicio(app, db, monkeypatch):
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), ServicioPush)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    ServicioPush.recibidas = []
+    vapid = Vapid()
+    vapid.generate_keys()
+    monkeypatch.setitem(app.config, 'VAPID_PRIVATE_KEY', vapid.private_pem().decode())
+    monkeypatch.setitem(app.config, 'VAPID_CLAIM_EMAIL', 'mailto:avisos@latribu.test')
+    monkeypatch.setitem(app.config, 'PUSH_MAX_WORKERS', 4)
+    push.metricas.reiniciar()
+    yield f'http://127.0.0.1:{servidor.server_port}'
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def b64(datos):
+    return base64.urlsafe_b64encode(datos).rstrip(b'=').decode()
+
+
+def suscribir(base, ruta, n):
+    """Suscripción con claves reales de navegador, para que pywebpush cifre el mensaje."""
+    clave = ec.generate_private_key(ec.SECP256R1()).public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint)
+    suscripcion = PushSubscription(endpoint=f'{base}{ruta}/{n}', p256dh_key=b64(clave), auth_key=b64(os.urandom(16)))
+    db.session.add(suscripcion)
+    db.session.commit()
+    return suscripcion
+
+
+def endpoints_restantes():
+    return sorted(s.endpoint.rsplit('/', 2)[1] for s in PushSubscription.query)
+
+
+def test_envio_y_limpieza_de_caducadas(servicio):
+    for n in range(3):
+        suscribir(servicio, '/ok', n)
+    suscribir(servicio, '/baja', 0)
+    suscribir(servicio, '/desconocida', 0)
+    suscribir(servicio, '/saturado', 0)
+
+    resumen = push.enviar_notificacion('Caminata', 'Salimos a las 7')
+    assert (resumen['total'], resumen['enviadas'], resumen['caducadas'], resumen['errores']) == (6, 3, 2, 1)
+    assert endpoints_restantes() == ['ok', 'ok', 'ok', 'saturado']
+    assert len(ServicioPush.recibidas) == 6
+    assert all(autorizacion.startswith('vapid t=') for _, autorizacion in ServicioPush.recibidas)
+    assert push.metricas.resumen()['por_estado'] == {'201': 3, '404': 1, '410': 1, '503': 1}
+
+    # Mismo servicio push: el siguiente envío reutiliza la cabecera VAPID ya firmada
+    firmas = push.cache_vapid.firmas
+    ServicioPush.recibidas = []
+    assert push.enviar_notificacion('Caminata', 'Cambio de hora')['enviadas'] == 3
+    assert push.cache_vapid.firmas == firmas
+    assert len({autorizacion for _, autorizacion in ServicioPush.recibidas}) == 1
+
+
+def test_un_fallo_inesperado_no_corta_el_envio(servicio, monkeypatch):
+    for n in range(4):
+        suscribir(servicio, '/ok', n)
+    suscribir(servicio, '/baja', 0)
+    rota = suscribir(servicio, '/ok', 99)
+
+    class WebPusherConFallo(push.WebPusher):
+        def send(self, *args, **kwargs):
+            if self.subscription_info['endpoint'] == rota.endpoint:
+                raise RuntimeError('fallo inesperado en el cliente push')
+            return super().send(*args, **kwargs)
+
+    monkeypatch.setattr(push, 'WebPusher', WebPusherConFallo)
+    resumen = push.enviar_notificacion('Caminata', 'Salimos a las 7')
+    assert (resumen['enviadas'], resumen['caducadas'], resumen['errores']) == (4, 1, 1)
+    assert 'baja' not in endpoints_restantes()
+    assert push.metricas.resumen()['por_estado']['error'] == 1
@@ -0,0 +1,161 @@
+# tests/test_respaldos.py
+# Respaldo diario: un respaldo que no pasa la verificación se aparta y no cuenta para la retención.
+# Instantáneas de subidas: solo se leen los archivos cambiados, cada contenido se guarda una vez,
+# se restauran completas o por archivo y la poda borra los objetos que ninguna instantánea usa.
+import os
+import hashlib
+
+import pytest
+
+import respaldos
+
+
+@pytest.fixture
+def carpeta(app, db, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'BACKUP_FOLDER', str(tmp_path))
+    return tmp_path
+
+
+def envejecer(carpeta, nombre, fecha):
+    """Renombra un respaldo (y su .json) como si se hubiera creado en `fecha` (AAAAMMDD_HHMMSS)."""
+    nuevo = f'{respaldos.PREFIJO}{fecha}{respaldos.EXTENSION}'
+    os.replace(carpeta / nombre, carpeta / nuevo)
+    os.replace(carpeta / respaldos._metadatos(nombre), carpeta / respaldos._metadatos(nuevo))
+    return nuevo
+
+
+def test_respaldo_diario_verificado(carpeta):
+    respaldos.respaldo_diario()
+    (fecha, ruta), = respaldos.listar_respaldos()
+    assert respaldos.verificar_respaldo(ruta)['ok']
+
+
+def test_un_respaldo_danado_se_aparta(carpeta, monkeypatch):
+    respaldos.respaldo_diario()
+    (_, ruta), = respaldos.listar_respaldos()
+    anterior = envejecer(carpeta, os.path.basename(ruta), '20200101_020000')
+
+    crear = respaldos.crear_respaldo
+
+    def crear_danado():
+        datos = crear()
+        with open(carpeta / datos['archivo'], 'r+b') as f:
+            f.truncate(os.path.getsize(f.name) // 2)
+        return datos
+
+    monkeypatch.setattr(respaldos, 'crear_respaldo', crear_danado)
+    with pytest.raises(RuntimeError, match='no pasó la verificación'):
+        respaldos.respaldo_diario()
+
+    # Solo queda el respaldo bueno anterior: el dañado no se lista ni se poda como si fuera el del día
+    assert [os.path.basename(ruta) for _, ruta in respaldos.listar_respaldos()] == [anterior]
+    apartados = sorted(nombre for nombre in os.listdir(carpeta) if nombre.endswith('.corrupto'))
+    assert len(apartados) == 2
+    assert apartados[0].endswith('.db.gz.corrupto') and apartados[1].endswith('.json.corrupto')
+    assert respaldos.podar_respaldos(dry_run=True) == []
+
+
+# --- Instantáneas incrementales de subidas ---
+
+@pytest.fixture
+def subidas(app, db, tmp_path, monkeypatch):
+    fuente = tmp_path / 'uploads'
+    (fuente / 'avatars').mkdir(parents=True)
+    (fuente / 'avatars' / 'ana.png').write_bytes(b'foto de ana')
+    (fuente / 'avatars' / 'beto.png').write_bytes(b'foto de beto')
+    (fuente / 'copia.png').write_bytes(b'foto de ana') # mismo contenido que ana.png
+    monkeypatch.setitem(app.config, 'BACKUP_UPLOADS_SOURCE', str(fuente))
+    monkeypatch.setitem(app.config, 'BACKUP_UPLOADS_FOLDER', str(tmp_path / 'instantaneas'))
+    return fuente
+
+
+def fechar_instantanea(nombre, fecha):
+    """Renombra una instantánea como si se hubiera creado en `fecha` (AAAAMMDD_HHMMSS)."""
+    carpeta = respaldos.carpeta_instantaneas()
+    nuevo = f'{respaldos.PREFIJO_INSTANTANEA}{fecha}{respaldos.EXTENSION_INSTANTANEA}'
+    os.replace(os.path.join(carpeta, nombre), os.path.join(carpeta, nuevo))
+    return nuevo
+
+
+def escribir(ruta, contenido):
+    """Escribe y adelanta el mtime: dentro del mismo tick de reloj el cambio podría no notarse."""
+    ruta.write_bytes(contenido)
+    estado = ruta.stat()
+    os.utime(ruta, ns=(estado.st_atime_ns, estado.st_mtime_ns + 10 ** 9))
+
+
+def objetos():
+    carpeta = os.path.join(respaldos.carpeta_instantaneas(), 'objetos')
+    return sorted(nombre for _, _, nombres in os.walk(carpeta) for nombre in nombres)
+
+
+def test_instantanea_incremental_y_deduplicada(subidas):
+    primera = respaldos.crear_instantanea()
+    assert (primera['archivos'], primera['hasheados'], primera['objetos_nuevos']) == (3, 3, 2)
+    fechar_instantanea(primera['instantanea'], '20260101_020000')
+
+    escribir(subidas / 'avatars' / 'beto.png', b'foto nueva de beto')
+    escribir(subidas / 'nueva.png', b'foto de ana')
+    segunda = respaldos.crear_instantanea()
+    # Solo se leen los archivos con tamaño o mtime distintos; nueva.png ya estaba en el almacén
+    assert (segunda['archivos'], segunda['hasheados'], segunda['objetos_nuevos']) == (4, 2, 1)
+    assert segunda['bytes_nuevos'] == len(b'foto nueva de beto')
+    assert len(objetos()) == 3
+
+    manifiesto = respaldos.leer_manifiesto(respaldos.listar_instantaneas()[0][1])
+    assert manifiesto['nueva.png'][0] == manifiesto['avatars/ana.png'][0] == manifiesto['copia.png'][0]
+
+
+def test_restaurar_completa_y_por_archivo(subidas, tmp_path):
+    respaldos.crear_instantanea()
+    (ruta, ) = [ruta for _, ruta in respaldos.listar_instantaneas()]
+    original = (subidas / 'avatars' / 'beto.png').stat().st_mtime_ns
+    os.remove(subidas / 'avatars' / 'ana.png')
+    escribir(subidas / 'avatars' / 'beto.png', b'pisada')
+
+    assert respaldos.restaurar_instantanea(ruta) == (2, 1, [])
+    assert (subidas / 'avatars' / 'ana.png').read_bytes() == b'foto de ana'
+    assert (subidas / 'avatars' / 'beto.png').read_bytes() == b'foto de beto'
+    assert (subidas / 'avatars' / 'beto.png').stat().st_mtime_ns == original
+    assert respaldos.restaurar_instantanea(ruta) == (0, 3, [])
+
+    # Un solo archivo en otra carpeta, con una ruta que no está en la instantánea
+    destino = tmp_path / 'recuperado'
+    assert respaldos.restaurar_instantanea(os.path.basename(ruta), ['avatars/beto.png', 'no/existe.png'],
+                                           str(destino)) == (1, 0, ['no/existe.png'])
+    assert [p.name for p in destino.rglob('*') if p.is_file()] == ['beto.png']
+
+
+def test_restaurar_un_objeto_danado_falla(subidas):
+    respaldos.crear_instantanea()
+    (ruta, ) = [ruta for _, ruta in respaldos.listar_instantaneas()]
+    sha256 = respaldos.leer_manifiesto(ruta)['avatars/beto.png'][0]
+    with open(respaldos._ruta_objeto(respaldos.carpeta_instantaneas(), sha256), 'wb') as f:
+        f.write(b'basura')
+    os.remove(subidas / 'avatars' / 'beto.png')
+    with pytest.raises(RuntimeError, match='dañado'):
+        respaldos.restaurar_instantanea(ruta, ['avatars/beto.png'])
+    assert not (subidas / 'avatars' / 'beto.png').exists()
+    assert not [p for p in (subidas / 'avatars').iterdir() if p.name.startswith('.restaurando.')]
+
+
+def test_podar_instantaneas_y_objetos_sin_uso(app, subidas, monkeypatch):
+    monkeypatch.setitem(app.config, 'BACKUP_KEEP_DAILY', 2)
+    monkeypatch.setitem(app.config, 'BACKUP_KEEP_WEEKLY', 0)
+    monkeypatch.setitem(app.config, 'BACKUP_KEEP_MONTHLY', 0)
+    antigua = fechar_instantanea(respaldos.crear_instantanea()['instantanea'], '20260101_020000')
+    escribir(subidas / 'avatars' / 'beto.png', b'beto v2')
+    fechar_instantanea(respaldos.crear_instantanea()['instantanea'], '20260102_020000')
+    escribir(subidas / 'avatars' / 'beto.png', b'beto v3')
+    respaldos.crear_instantanea()
+    assert len(objetos()) == 4
+
+    borradas, sin_uso = respaldos.podar_instantaneas(dry_run=True)
+    assert [os.path.basename(ruta) for ruta in borradas] == [antigua]
+    assert len(sin_uso) == 1 and len(objetos()) == 4
+
+    respaldos.podar_instantaneas()
+    assert len(respaldos.listar_instantaneas()) == 2
+    # Solo se borró el contenido original de beto.png, que ya no aparece en ninguna instantánea
+    assert hashlib.sha256(b'foto de beto').hexdigest() not in objetos()
+    assert hashlib.sha256(b'foto de ana').hexdigest() in objetos()
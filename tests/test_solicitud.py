@@ -0,0 +1,82 @@
+# tests/test_solicitud.py
+# Lote de sincronización de la bandeja offline: elementos válidos e inválidos mezclados, claves
+# repetidas dentro del lote, reintentos con las mismas claves y campos que no son texto.
+import pytest
+
+from solicitud import Solicitud
+
+URL = '/guardar_solicitudes_batch'
+
+
+def elemento(clave, **campos):
+    datos = {
+        'clave_idempotencia': clave,
+        'userHasAccount': False,
+        'tipo_servicio_nuevo': 'Particular',
+        'nombre_personal': 'Ana',
+        'primer_apellido_personal': 'Mora',
+        'telefono_personal': '88880000',
+        'a_donde_va': 'Volcán Poás',
+        'cantidad_personas': '4',
+        'actividad_select': 'Senderismo',
+        'lugar_salida': 'San José',
+        'lugar_destino': 'Poás',
+        'fecha': '2030-05-01',
+    }
+    datos.update(campos)
+    return datos
+
+
+def enviar(client, *elementos):
+    respuesta = client.post(URL, json={'solicitudes': list(elementos)})
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    return respuesta.get_json()
+
+
+def estados(datos):
+    return [resultado['estado'] for resultado in datos['resultados']]
+
+
+def test_lote_con_validas_e_invalidas(client):
+    datos = enviar(client, elemento('a'), elemento('b', a_donde_va=''), 'no es un objeto', elemento(None), elemento('c'))
+    assert estados(datos) == ['guardada', 'invalida', 'invalida', 'invalida', 'guardada']
+    assert datos['guardadas'] == 2
+    assert datos['resultados'][1]['message'] == 'Faltan datos obligatorios del viaje.'
+    assert sorted(s.clave_idempotencia for s in Solicitud.query) == ['a', 'c']
+
+
+def test_clave_repetida_dentro_del_lote(client):
+    datos = enviar(client, elemento('a'), elemento('a', a_donde_va='Otro destino'))
+    primera, repetida = datos['resultados']
+    assert (primera['estado'], repetida['estado']) == ('guardada', 'duplicada')
+    assert repetida['duplicada'] is True
+    assert repetida['solicitud_id'] == primera['solicitud_id']
+    assert Solicitud.query.count() == 1
+
+
+def test_reintento_con_las_mismas_claves(client):
+    primero = enviar(client, elemento('a'), elemento('b'))
+    segundo = enviar(client, elemento('a'), elemento('b'), elemento('c'))
+    assert estados(segundo) == ['duplicada', 'duplicada', 'guardada']
+    assert [r['solicitud_id'] for r in segundo['resultados'][:2]] == [r['solicitud_id'] for r in primero['resultados']]
+    assert Solicitud.query.count() == 3
+
+
+@pytest.mark.parametrize('campos', [
+    {'clave_idempotencia': 1234},
+    {'fecha': 20300501},
+    {'a_donde_va': ['Poás']},
+    {'nombre_personal': {'nombre': 'Ana'}},
+    {'cantidad_personas': True},
+], ids=['clave-numerica', 'fecha-numerica', 'lista', 'objeto', 'booleano'])
+def test_campos_que_no_son_texto_se_informan_como_invalidos(client, campos):
+    datos = enviar(client, elemento('a'), elemento('b', **campos))
+    assert estados(datos) == ['guardada', 'invalida']
+    assert Solicitud.query.count() == 1
+
+
+def test_numeros_se_aceptan_como_texto(client):
+    datos = enviar(client, elemento('a', cantidad_personas=4, telefono_personal=88880000))
+    assert estados(datos) == ['guardada']
+    solicitud = Solicitud.query.one()
+    assert (solicitud.cantidad_personas, solicitud.telefono) == (4, '88880000')
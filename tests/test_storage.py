@@ -0,0 +1,259 @@
+# tests/test_storage.py
+# Almacén de blobs: el archivo de un blob liberado no se borra si otro worker lo vuelve a referenciar,
+# `flask storage fragmentar` lleva los blobs de la carpeta plana a <ab>/<cd>/ y enviar_archivo entrega
+# con Range/206 desde el worker o solo con cabeceras para el proxy (X-Accel-Redirect / X-Sendfile).
+# `flask storage gc` aparta los huérfanos a cuarentena sin tocar un blob que se está volviendo a usar.
+import io
+import os
+import time
+import sqlite3
+import threading
+import hashlib
+import tempfile
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import storage
+from models import db, Blob
+
+
+def otro_worker(engine):
+    """Conexión propia a la misma base, como la de otro proceso de gunicorn."""
+    return sqlite3.connect(engine.url.database, isolation_level=None, check_same_thread=False)
+
+
+def test_no_borra_un_blob_que_otra_transaccion_esta_referenciando(app, db):
+    contenido = b'mapa de la ruta'
+    sha256 = hashlib.sha256(contenido).hexdigest()
+    ruta, _ = storage.guardar_stream(io.BytesIO(contenido), 'mapa.png')
+    db.session.commit()
+    absoluta = storage.ruta_absoluta(ruta)
+
+    # Este worker libera la última referencia; el borrado del archivo se hace a mano más abajo
+    storage.liberar(ruta)
+    pendientes = db.session.info.pop(storage._BLOBS_LIBERADOS)
+    db.session.commit()
+
+    # Otro worker sube el mismo contenido: tiene la fila nueva sin confirmar cuando llega el after_commit
+    conexion = otro_worker(db.engine)
+    confirmar = threading.Timer(0.3, conexion.execute, args=('COMMIT',))
+    try:
+        conexion.execute('BEGIN IMMEDIATE')
+        conexion.execute(f"INSERT INTO {Blob.__tablename__} (sha256, path, size, mime_type, ref_count, created_at) "
+                         "VALUES (?, ?, ?, NULL, 1, CURRENT_TIMESTAMP)", (sha256, ruta, len(contenido)))
+        confirmar.start()
+        storage._borrar_blobs_liberados(SimpleNamespace(info={storage._BLOBS_LIBERADOS: pendientes}))
+    finally:
+        if confirmar.is_alive():
+            confirmar.join()
+        conexion.close()
+
+    assert db.session.execute(db.select(Blob.ref_count).where(Blob.sha256 == sha256)).scalar() == 1
+    assert os.path.exists(absoluta)
+
+
+def test_borra_el_archivo_cuando_nadie_lo_referencia(app, db):
+    ruta, _ = storage.guardar_stream(io.BytesIO(b'sin uso'), 'nota.txt')
+    db.session.commit()
+    storage.liberar(ruta)
+    db.session.commit()
+    assert not os.path.exists(storage.ruta_absoluta(ruta))
+    assert Blob.query.count() == 0
+
+
+def test_guardar_repone_el_archivo_de_un_blob_existente(app, db):
+    contenido = b'foto de la caminata'
+    ruta, _ = storage.guardar_stream(io.BytesIO(contenido), 'foto.jpg')
+    db.session.commit()
+    # Un borrado que ganó la carrera antes de que esta transacción sumara su referencia
+    os.remove(storage.ruta_absoluta(ruta))
+
+    otra, _ = storage.guardar_stream(io.BytesIO(contenido), 'foto.jpg')
+    db.session.commit()
+    assert otra == ruta
+    with open(storage.ruta_absoluta(ruta), 'rb') as f:
+        assert f.read() == contenido
+    assert Blob.query.one().ref_count == 2
+
+
+def test_fragmentar_mueve_los_blobs_planos(app, db, crear_usuario):
+    # Blobs guardados antes de la fragmentación: <sha256><ext> directamente en la carpeta del almacén
+    prefijo = storage.prefijo_blobs()
+    usuarios = []
+    for n in range(3):
+        contenido = f'avatar {n}'.encode()
+        sha256 = hashlib.sha256(contenido).hexdigest()
+        ruta = f'{prefijo}{sha256}.png'
+        with open(storage.ruta_absoluta(ruta), 'wb') as f:
+            f.write(contenido)
+        db.session.add(Blob(sha256=sha256, path=ruta, size=len(contenido), ref_count=1))
+        usuarios.append(crear_usuario(f'usuario{n}', avatar_url=ruta))
+    db.session.commit()
+
+    runner = app.test_cli_runner()
+    resultado = runner.invoke(args=['storage', 'fragmentar', '--lote', '2'])
+    assert resultado.exit_code == 0, resultado.output
+    assert '3 blobs por mover en lotes de 2.' in resultado.output
+    assert 'Listo: 3 blobs en la estructura fragmentada, 0 sin archivo en disco.' in resultado.output
+
+    db.session.expire_all()
+    for blob in Blob.query:
+        assert blob.path == storage.ruta_blob(blob.sha256, '.png')
+        assert os.path.isfile(storage.ruta_absoluta(blob.path))
+        assert not os.path.exists(os.path.join(storage.carpeta_blobs(), f'{blob.sha256}.png'))
+        assert storage.ubicar_por_nombre(f'{blob.sha256}.png') == storage.ruta_absoluta(blob.path)
+    assert sorted(u.avatar_url for u in usuarios) == sorted(b.path for b in Blob.query)
+
+    # Volver a ejecutarlo no mueve nada
+    assert '0 blobs por mover' in runner.invoke(args=['storage', 'fragmentar']).output
+
+
+# --- Entrega de archivos ---
+
+@pytest.fixture
+def foto(app, db, monkeypatch):
+    """Foto en el almacén servida por /uploads/colaboradores/<nombre> (colaboradores.uploaded_file)."""
+    monkeypatch.setitem(app.config, 'FILE_DELIVERY_ROOT', app.static_folder)
+    contenido = bytes(range(256)) * 40
+    ruta, _ = storage.guardar_stream(io.BytesIO(contenido), 'perfil.jpg')
+    db.session.commit()
+    return SimpleNamespace(url=f'/uploads/colaboradores/{os.path.basename(ruta)}', ruta=ruta, contenido=contenido)
+
+
+def test_sin_proxy_el_worker_responde_rangos(client, foto, monkeypatch):
+    monkeypatch.setitem(client.application.config, 'FILE_DELIVERY', None)
+    completa = client.get(foto.url)
+    assert completa.status_code == 200
+    assert completa.data == foto.contenido
+    assert completa.headers['Accept-Ranges'] == 'bytes'
+
+    parcial = client.get(foto.url, headers={'Range': 'bytes=100-199'})
+    assert parcial.status_code == 206
+    assert parcial.data == foto.contenido[100:200]
+    assert parcial.headers['Content-Range'] == f'bytes 100-199/{len(foto.contenido)}'
+
+    assert client.get(foto.url, headers={'If-None-Match': completa.headers['ETag']}).status_code == 304
+
+
+@pytest.mark.parametrize('modo', ['x-accel', 'x-sendfile'])
+def test_con_proxy_solo_se_envian_las_cabeceras(client, foto, monkeypatch, modo):
+    monkeypatch.setitem(client.application.config, 'FILE_DELIVERY', modo)
+    # El rango lo resuelve el proxy: la aplicación responde 200 sin cuerpo aunque se pida un rango
+    respuesta = client.get(foto.url, headers={'Range': 'bytes=100-199'})
+    assert respuesta.status_code == 200
+    assert respuesta.data == b''
+    assert respuesta.headers['Content-Type'] == 'image/jpeg'
+    assert respuesta.headers['Accept-Ranges'] == 'bytes'
+    assert 'Content-Range' not in respuesta.headers
+    if modo == 'x-accel':
+        assert respuesta.headers['X-Accel-Redirect'] == f'/_protegido/{foto.ruta}'
+        assert 'X-Sendfile' not in respuesta.headers
+    else:
+        assert respuesta.headers['X-Sendfile'] == os.path.realpath(storage.ruta_absoluta(foto.ruta))
+        assert 'X-Accel-Redirect' not in respuesta.headers
+
+    # Las revalidaciones se siguen resolviendo en la aplicación, sin pasar el archivo al proxy
+    revalidada = client.get(foto.url, headers={'If-None-Match': respuesta.headers['ETag']})
+    assert revalidada.status_code == 304
+    assert 'X-Accel-Redirect' not in revalidada.headers and 'X-Sendfile' not in revalidada.headers
+
+
+def test_fuera_de_la_raiz_lo_envia_el_worker(client, foto, monkeypatch, tmp_path):
+    monkeypatch.setitem(client.application.config, 'FILE_DELIVERY', 'x-accel')
+    monkeypatch.setitem(client.application.config, 'FILE_DELIVERY_ROOT', str(tmp_path))
+    respuesta = client.get(foto.url)
+    assert respuesta.data == foto.contenido
+    assert 'X-Accel-Redirect' not in respuesta.headers
+
+
+# --- Recolección de huérfanos (`flask storage gc`) ---
+
+@pytest.fixture
+def gc(app, db, monkeypatch, tmp_path):
+    # Almacén propio: las demás pruebas dejan blobs en la carpeta compartida de la sesión
+    carpeta = tempfile.mkdtemp(prefix='blobs-', dir=os.path.dirname(app.config['BLOB_STORE_FOLDER']))
+    monkeypatch.setitem(app.config, 'BLOB_STORE_FOLDER', carpeta)
+    monkeypatch.setitem(app.config, 'UPLOAD_QUARANTINE_FOLDER', str(tmp_path / 'cuarentena'))
+    monkeypatch.setitem(app.config, 'UPLOAD_GC_FOLDERS', [carpeta])
+    monkeypatch.setitem(app.config, 'UPLOAD_GC_MIN_AGE_HOURS', 1)
+    monkeypatch.setitem(app.config, 'UPLOAD_GC_GRACE_DAYS', 7)
+    runner = app.test_cli_runner()
+
+    def ejecutar(*argumentos):
+        resultado = runner.invoke(args=['storage', *argumentos])
+        assert resultado.exit_code == 0, resultado.output
+        return resultado.output
+    return ejecutar
+
+
+def huerfano(contenido, horas=2):
+    """Archivo con forma de blob que ninguna fila referencia, modificado hace `horas`."""
+    ruta = storage.ruta_blob(hashlib.sha256(contenido).hexdigest(), '.jpg')
+    absoluta = storage.ruta_absoluta(ruta)
+    os.makedirs(os.path.dirname(absoluta), exist_ok=True)
+    with open(absoluta, 'wb') as f:
+        f.write(contenido)
+    antes = time.time() - horas * 3600
+    os.utime(absoluta, (antes, antes))
+    return ruta, absoluta
+
+
+def test_gc_mueve_huerfanos_a_cuarentena_y_se_restauran(app, gc, crear_usuario):
+    usada, _ = storage.guardar_stream(io.BytesIO(b'avatar en uso'), 'avatar.jpg')
+    crear_usuario('ana', avatar_url=usada)
+    os.utime(storage.ruta_absoluta(usada), (time.time() - 7200,) * 2)
+    viejo, viejo_abs = huerfano(b'foto borrada')
+    _, reciente_abs = huerfano(b'subida en curso', horas=0)
+
+    # Un lote de cuarentena vencido y otro dentro del plazo de gracia
+    cuarentena = app.config['UPLOAD_QUARANTINE_FOLDER']
+    vencido = (datetime.utcnow() - timedelta(days=8)).strftime(storage._FORMATO_LOTE)
+    vigente = (datetime.utcnow() - timedelta(days=6)).strftime(storage._FORMATO_LOTE)
+    for nombre in (vencido, vigente):
+        os.makedirs(os.path.join(cuarentena, nombre, 'uploads'))
+        with open(os.path.join(cuarentena, nombre, 'uploads', 'x.jpg'), 'wb') as f:
+            f.write(b'x' * 10)
+
+    assert 'Se moverían a cuarentena: 1 archivos' in gc('gc', '--dry-run')
+    assert os.path.exists(viejo_abs)
+
+    salida = gc('gc')
+    assert 'Movidos a cuarentena: 1 archivos, 12 B (1 huérfanos con menos de 1 h se conservan).' in salida
+    assert 'Borrados 1 lotes de cuarentena con más de 7 días: 10 B recuperados.' in salida
+    assert not os.path.exists(viejo_abs)
+    assert os.path.exists(reciente_abs)
+    assert os.path.exists(storage.ruta_absoluta(usada))
+    lotes = sorted(os.listdir(cuarentena))
+    assert vencido not in lotes and vigente in lotes
+    lote, = (nombre for nombre in lotes if nombre != vigente)
+    assert os.path.isfile(os.path.join(cuarentena, lote, *viejo.split('/')))
+
+    assert '1 archivos restaurados, 0 omitidos porque ya existían.' in gc('restaurar-cuarentena', lote)
+    with open(viejo_abs, 'rb') as f:
+        assert f.read() == b'foto borrada'
+    assert not os.path.exists(os.path.join(cuarentena, lote))
+
+
+def test_gc_no_mueve_un_blob_que_otra_transaccion_esta_registrando(app, gc):
+    contenido = b'foto que se vuelve a subir'
+    ruta, absoluta = huerfano(contenido)
+
+    # Otro worker registra la referencia al blob mientras la recolección arma su lista de huérfanos
+    conexion = otro_worker(db.engine)
+    confirmar = threading.Timer(0.3, conexion.execute, args=('COMMIT',))
+    try:
+        conexion.execute('BEGIN IMMEDIATE')
+        conexion.execute(f"INSERT INTO {Blob.__tablename__} (sha256, path, size, mime_type, ref_count, created_at) "
+                         "VALUES (?, ?, ?, NULL, 1, CURRENT_TIMESTAMP)",
+                         (hashlib.sha256(contenido).hexdigest(), ruta, len(contenido)))
+        confirmar.start()
+        salida = gc('gc')
+    finally:
+        if confirmar.is_alive():
+            confirmar.join()
+        conexion.close()
+
+    assert 'Movidos a cuarentena: 0 archivos' in salida
+    assert os.path.exists(absoluta)
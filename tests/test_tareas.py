@@ -0,0 +1,207 @@
+# tests/test_tareas.py
+# Cola de tareas: prioridad, retraso, reintentos con espera exponencial hasta 'fallida', reclamo de
+# tareas cuyo plazo de visibilidad venció, cierres de un worker que ya no es dueño de la tarea y el
+# latido que mantiene reclamada una tarea larga. Además, `flask worker --procesos N`: el padre
+# detiene a sus hijos al recibir SIGTERM o SIGINT.
+import os
+import sys
+import time
+import signal
+import subprocess
+import multiprocessing
+
+import pytest
+
+import tareas
+from models import db, TaskQueue
+from tareas import tarea, encolar, reclamar, terminar, fallar, ejecutar_siguiente, renovar_visibilidad
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EJECUTADAS = []
+
+
+@tarea('pruebas.anotar')
+def anotar(valor):
+    EJECUTADAS.append(valor)
+
+
+@tarea('pruebas.fallar')
+def fallar_siempre():
+    raise RuntimeError('servicio caído')
+
+
+@tarea('pruebas.lenta')
+def lenta(segundos):
+    time.sleep(segundos)
+    # A mitad de la tarea otro worker busca trabajo: no debe encontrar esta
+    EJECUTADAS.append(reclamar('otro-worker'))
+
+
+@pytest.fixture
+def cola(app, db, monkeypatch):
+    EJECUTADAS.clear()
+    monkeypatch.setitem(app.config, 'TASK_MAX_ATTEMPTS', 3)
+    monkeypatch.setitem(app.config, 'TASK_BACKOFF_SECONDS', 30)
+    monkeypatch.setitem(app.config, 'TASK_VISIBILITY_SECONDS', 300)
+    return db
+
+
+def fila(id_tarea):
+    db.session.expire_all()
+    return db.session.get(TaskQueue, id_tarea)
+
+
+def vencer(id_tarea):
+    """Lleva disponible_en al pasado: fin del retraso, de la espera de reintento o del plazo de visibilidad."""
+    TaskQueue.query.filter_by(id=id_tarea).update({'disponible_en': time.time() - 1})
+    db.session.commit()
+
+
+def vaciar(trabajador='w1'):
+    while ejecutar_siguiente(trabajador):
+        pass
+
+
+def test_mayor_prioridad_primero(cola):
+    encolar('pruebas.anotar', valor='normal')
+    encolar('pruebas.anotar', prioridad=5, valor='urgente 1')
+    encolar('pruebas.anotar', prioridad=5, valor='urgente 2')
+    encolar('pruebas.anotar', prioridad=-1, valor='baja')
+    vaciar()
+    assert EJECUTADAS == ['urgente 1', 'urgente 2', 'normal', 'baja']
+    assert {t.estado for t in TaskQueue.query} == {'hecha'}
+
+
+def test_una_tarea_con_retraso_espera_su_turno(cola):
+    id_tarea = encolar('pruebas.anotar', retraso=60, valor='luego')
+    assert ejecutar_siguiente('w1') is False
+    assert fila(id_tarea).estado == 'pendiente'
+    vencer(id_tarea)
+    assert ejecutar_siguiente('w1') is True
+    assert EJECUTADAS == ['luego']
+
+
+def test_tarea_desconocida_al_encolar(cola):
+    with pytest.raises(ValueError):
+        encolar('pruebas.no_existe')
+
+
+def test_reintentos_con_espera_exponencial_hasta_fallida(cola):
+    id_tarea = encolar('pruebas.fallar')
+    for intento, base in ((1, 30), (2, 60)):
+        antes = time.time()
+        assert ejecutar_siguiente('w1') is True
+        tarea_ = fila(id_tarea)
+        assert (tarea_.estado, tarea_.intentos) == ('pendiente', intento)
+        assert 'servicio caído' in tarea_.ultimo_error
+        # Espera base * 2^(intento-1) con ±20 % de variación
+        assert antes + base * 0.8 <= tarea_.disponible_en <= time.time() + base * 1.2
+        assert ejecutar_siguiente('w1') is False
+        vencer(id_tarea)
+
+    assert ejecutar_siguiente('w1') is True
+    tarea_ = fila(id_tarea)
+    assert (tarea_.estado, tarea_.intentos) == ('fallida', 3)
+    assert tarea_.terminada_en is not None
+    assert ejecutar_siguiente('w1') is False
+
+
+def test_otro_worker_retoma_la_tarea_al_vencer_la_visibilidad(cola):
+    id_tarea = encolar('pruebas.anotar', valor='x')
+    assert reclamar('caido').id == id_tarea
+    assert reclamar('w2') is None
+
+    vencer(id_tarea)
+    retomada = reclamar('w2')
+    assert (retomada.id, retomada.intentos) == (id_tarea, 2)
+
+    # El worker anterior termina tarde: ni su éxito, ni su fallo, ni su latido tocan la tarea retomada
+    terminar(id_tarea, 'caido')
+    fallar(id_tarea, 'caido', 1, 3, 'error tardío')
+    assert renovar_visibilidad(id_tarea, 'caido', 1) is False
+    tarea_ = fila(id_tarea)
+    assert (tarea_.estado, tarea_.trabajador, tarea_.ultimo_error) == ('en_curso', 'w2', None)
+
+    terminar(id_tarea, 'w2')
+    assert fila(id_tarea).estado == 'hecha'
+
+
+def test_visibilidad_vencida_en_todos_los_intentos(cola):
+    id_tarea = encolar('pruebas.anotar', max_intentos=1, valor='x')
+    reclamar('caido')
+    vencer(id_tarea)
+    assert ejecutar_siguiente('w2') is True
+    tarea_ = fila(id_tarea)
+    assert tarea_.estado == 'fallida'
+    assert 'Plazo de visibilidad vencido' in tarea_.ultimo_error
+    assert EJECUTADAS == []
+
+
+def test_el_latido_mantiene_reclamada_una_tarea_larga(app, cola, monkeypatch):
+    monkeypatch.setitem(app.config, 'TASK_VISIBILITY_SECONDS', 0.3)
+    id_tarea = encolar('pruebas.lenta', segundos=1.0)
+    assert ejecutar_siguiente('w1') is True
+    assert EJECUTADAS == [None]
+    tarea_ = fila(id_tarea)
+    assert (tarea_.estado, tarea_.intentos, tarea_.trabajador) == ('hecha', 1, 'w1')
+
+
+def test_purgar_terminadas(app, cola, monkeypatch):
+    vieja = encolar('pruebas.anotar', valor='vieja')
+    nueva = encolar('pruebas.anotar', valor='nueva')
+    vaciar()
+    TaskQueue.query.filter_by(id=vieja).update({'terminada_en': time.time() - 8 * 86400})
+    db.session.commit()
+    assert tareas.purgar_terminadas() == 1
+    assert [t.id for t in TaskQueue.query] == [nueva]
+
+
+def hijos_de(pid):
+    hijos = []
+    for entrada in os.listdir('/proc'):
+        if not entrada.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entrada}/stat') as f:
+                # El nombre del ejecutable va entre paréntesis y puede tener espacios
+                campos = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(campos[1]) == pid:
+            hijos.append(int(entrada))
+    return hijos
+
+
+def sigue_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc') or 'fork' not in multiprocessing.get_all_start_methods(),
+                    reason='requiere fork y /proc')
+@pytest.mark.parametrize('senal', [signal.SIGTERM, signal.SIGINT], ids=['SIGTERM', 'SIGINT'])
+def test_la_senal_al_padre_detiene_a_los_hijos(db, senal):
+    entorno = dict(os.environ, FLASK_APP='app.py', SCHEDULER_ENABLED='true')
+    padre = subprocess.Popen([sys.executable, '-m', 'flask', 'worker', '--procesos', '2', '--hilos', '1'],
+                             cwd=RAIZ, env=entorno, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    hijos = []
+    try:
+        limite = time.monotonic() + 30
+        while len(hijos) < 2 and time.monotonic() < limite:
+            time.sleep(0.2)
+            hijos = hijos_de(padre.pid)
+        assert len(hijos) == 2, padre.stdout.read1().decode() if padre.poll() is not None else hijos
+
+        padre.send_signal(senal)
+        assert padre.wait(20) == 0
+        assert not any(sigue_vivo(hijo) for hijo in hijos)
+    finally:
+        for pid in [padre.pid, *hijos]:
+            if sigue_vivo(pid):
+                os.kill(pid, signal.SIGKILL)
+        padre.wait()
+        padre.stdout.close()
@@ -0,0 +1,120 @@
+# tests/test_throttle.py
+# Límite de intentos de inicio de sesión: recarga de las cubetas de fichas, 429 con Retry-After por
+# IP y por cuenta, cubetas compartidas entre workers y la IP del cliente detrás de proxies.
+import pytest
+
+import throttle
+from throttle import CubetaDeFichas
+
+
+@pytest.fixture
+def limites(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'LOGIN_THROTTLE_ENABLED', True)
+    monkeypatch.setitem(app.config, 'LOGIN_THROTTLE_SHARED', False)
+    monkeypatch.setitem(app.config, 'LOGIN_THROTTLE_PROXIES', 0)
+    monkeypatch.setitem(app.config, 'LOGIN_THROTTLE_IP', (100, 60))
+    monkeypatch.setitem(app.config, 'LOGIN_THROTTLE_CUENTA', (2, 2))
+    throttle._cubetas.clear()
+    yield app.config
+    throttle._cubetas.clear()
+
+
+def intentar(client, cuenta='ana', ip='203.0.113.7'):
+    return client.post('/login', data={'username_or_email': cuenta, 'password': 'incorrecta'},
+                       environ_base={'REMOTE_ADDR': ip})
+
+
+# --- CubetaDeFichas ---
+
+def test_la_cubeta_se_recarga_con_el_tiempo():
+    cubeta = CubetaDeFichas(3, 60) # una ficha por segundo
+    assert [cubeta.consumir('a', ahora=0) for _ in range(3)] == [0, 0, 0]
+    assert cubeta.consumir('a', ahora=0) == pytest.approx(1.0)
+    assert cubeta.consultar('a', ahora=0.25) == pytest.approx(0.75)
+    assert cubeta.consumir('a', ahora=1.0) == 0
+    # Otra clave tiene su propia cubeta
+    assert cubeta.consumir('b', ahora=1.0) == 0
+
+
+def test_la_recarga_no_pasa_de_la_capacidad():
+    cubeta = CubetaDeFichas(2, 60)
+    cubeta.consumir('a', ahora=0)
+    assert cubeta.consultar('a', ahora=1000) == 0
+    assert [cubeta.consumir('a', ahora=1000) for _ in range(3)] == [0, 0, pytest.approx(1.0)]
+
+
+def test_un_intento_rechazado_no_descuenta_fichas():
+    cubeta = CubetaDeFichas(1, 6) # una ficha cada 10 s
+    cubeta.consumir('a', ahora=0)
+    assert cubeta.consumir('a', ahora=5) == pytest.approx(5.0)
+    assert cubeta.consumir('a', ahora=10) == 0
+
+
+def test_se_descartan_las_claves_menos_recientes():
+    cubeta = CubetaDeFichas(1, 1, max_claves=2)
+    for clave in ('a', 'b', 'c'):
+        cubeta.consumir(clave, ahora=0)
+    # 'a' se olvidó: vuelve con la cubeta llena
+    assert cubeta.consultar('a', ahora=0) == 0
+    assert cubeta.consultar('c', ahora=0) > 0
+
+
+# --- /login ---
+
+def test_las_contrasenas_incorrectas_agotan_la_cuenta(client, limites):
+    assert intentar(client).status_code == 200
+    assert intentar(client).status_code == 200
+    limitado = intentar(client)
+    assert limitado.status_code == 429
+    assert limitado.headers['Retry-After'] == '30'
+    assert limitado.headers['Cache-Control'] == 'no-store'
+    # La misma cuenta con otra escritura y desde otra IP sigue limitada; otra cuenta no
+    assert intentar(client, cuenta=' ANA', ip='198.51.100.1').status_code == 429
+    assert intentar(client, cuenta='beto').status_code == 200
+
+
+def test_la_ip_se_agota_con_cualquier_cuenta(client, limites):
+    limites['LOGIN_THROTTLE_IP'] = (2, 1)
+    assert intentar(client, cuenta='a').status_code == 200
+    assert intentar(client, cuenta='b').status_code == 200
+    limitado = intentar(client, cuenta='c')
+    assert limitado.status_code == 429
+    assert limitado.headers['Retry-After'] == '60'
+    assert intentar(client, cuenta='c', ip='198.51.100.1').status_code == 200
+
+
+def test_desactivado_no_limita(client, limites):
+    limites['LOGIN_THROTTLE_ENABLED'] = False
+    assert {intentar(client).status_code for _ in range(5)} == {200}
+
+
+def test_cubetas_compartidas_entre_workers(app, db, limites):
+    limites['LOGIN_THROTTLE_SHARED'] = True
+    with app.test_request_context('/login', method='POST', environ_base={'REMOTE_ADDR': '203.0.113.7'}):
+        throttle.registrar_fallo_de_login('ana')
+        throttle.registrar_fallo_de_login('ana')
+        # Otro worker no tiene la cubeta en memoria, pero la tabla login_throttle sí
+        throttle._cubetas.clear()
+        assert throttle.espera_para_login('ana') == pytest.approx(30, abs=1)
+        assert throttle.espera_para_login('beto') == 0
+
+
+# --- IP del cliente ---
+
+@pytest.mark.parametrize('proxies, esperada', [
+    (0, '10.0.0.1'),      # sin proxies de confianza X-Forwarded-For se ignora
+    (1, '192.0.2.2'),     # nginx: la dirección que agregó el proxy más cercano
+    (2, '192.0.2.1'),
+    (5, 'falsa'),         # más proxies que direcciones: la primera de la lista
+])
+def test_ip_del_cliente_detras_de_proxies(app, limites, proxies, esperada):
+    limites['LOGIN_THROTTLE_PROXIES'] = proxies
+    with app.test_request_context('/login', headers={'X-Forwarded-For': 'falsa, 192.0.2.1, 192.0.2.2'},
+                                  environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+        assert throttle.ip_del_cliente() == esperada
+
+
+def test_ip_del_cliente_sin_cabecera(app, limites):
+    limites['LOGIN_THROTTLE_PROXIES'] = 1
+    with app.test_request_context('/login', environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+        assert throttle.ip_del_cliente() == '10.0.0.1'
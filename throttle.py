@@ -0,0 +1,189 @@
+# throttle.py
+# Limitación de intentos de inicio de sesión con cubetas de fichas (token bucket).
+# Cada intento cuesta una verificación bcrypt completa; un bot que insiste sobre /login
+# acapara la CPU. Los intentos rechazados salen antes de consultar la base de datos o
+# calcular el hash.
+#
+# Dos cubetas por intento:
+# - IP: se descuenta una ficha en cada POST (protege la CPU).
+# - Cuenta (usuario o correo normalizado): se consulta antes y solo se descuenta cuando la
+#   contraseña es incorrecta, para que los inicios de sesión correctos no agoten la cuenta.
+# El estado vive en memoria en cada worker; con LOGIN_THROTTLE_SHARED también en la tabla
+# login_throttle de la base de datos, para que el límite sea global entre procesos.
+import math
+import time
+import threading
+from collections import OrderedDict
+
+from flask import request, current_app
+from sqlalchemy import text
+
+from models import db, normalizar_identificador
+
+# Claves recordadas por worker; las menos recientes se descartan (equivalen a una cubeta llena)
+MAX_CLAVES_EN_MEMORIA = 10000
+# Cada cuántas escrituras en la tabla compartida se borran las cubetas ya llenas
+PURGA_CADA = 500
+
+
+class CubetaDeFichas:
+    """
+    Cubetas en memoria: `capacidad` fichas como máximo, se recargan `por_minuto` fichas por minuto.
+    Devuelve los segundos de espera (0 si el intento se permite).
+    """
+
+    def __init__(self, capacidad, por_minuto, max_claves=MAX_CLAVES_EN_MEMORIA):
+        self.capacidad = float(capacidad)
+        self.tasa = por_minuto / 60.0
+        self.max_claves = max_claves
+        self._cubetas = OrderedDict() # clave -> (fichas, instante de la última recarga)
+        self._lock = threading.Lock()
+
+    def _recargar(self, clave, ahora):
+        fichas, instante = self._cubetas.get(clave, (self.capacidad, ahora))
+        return min(self.capacidad, fichas + (ahora - instante) * self.tasa)
+
+    def _espera(self, fichas):
+        return 0.0 if fichas >= 1 else (1 - fichas) / self.tasa
+
+    def consultar(self, clave, ahora=None):
+        ahora = time.monotonic() if ahora is None else ahora
+        with self._lock:
+            return self._espera(self._recargar(clave, ahora))
+
+    def consumir(self, clave, ahora=None):
+        ahora = time.monotonic() if ahora is None else ahora
+        with self._lock:
+            fichas = self._recargar(clave, ahora)
+            espera = self._espera(fichas)
+            if not espera:
+                fichas -= 1
+            self._cubetas[clave] = (fichas, ahora)
+            self._cubetas.move_to_end(clave)
+            while len(self._cubetas) > self.max_claves:
+                self._cubetas.popitem(last=False)
+            return espera
+
+
+# --- Estado compartido en SQLite ---
+# Una sola sentencia recarga y descuenta de forma atómica; SET usa los valores anteriores de la fila.
+_CONSUMIR_SQL = text("""
+    INSERT INTO login_throttle (clave, fichas, actualizado, permitido)
+    VALUES (:clave, :capacidad - 1, :ahora, 1)
+    ON CONFLICT (clave) DO UPDATE SET
+        fichas = MIN(:capacidad, fichas + (:ahora - actualizado) * :tasa)
+                 - (MIN(:capacidad, fichas + (:ahora - actualizado) * :tasa) >= 1),
+        permitido = MIN(:capacidad, fichas + (:ahora - actualizado) * :tasa) >= 1,
+        actualizado = :ahora
+    RETURNING fichas, permitido
+""")
+_CONSULTAR_SQL = text("""
+    SELECT MIN(:capacidad, fichas + (:ahora - actualizado) * :tasa) FROM login_throttle WHERE clave = :clave
+""")
+_PURGAR_SQL = text('DELETE FROM login_throttle WHERE actualizado < :limite')
+
+_escrituras_compartidas = 0
+
+
+def _parametros(cubeta, clave):
+    # Reloj de pared: se comparte entre procesos (time.monotonic no)
+    return {'clave': clave, 'capacidad': cubeta.capacidad, 'tasa': cubeta.tasa, 'ahora': time.time()}
+
+
+def _consumir_compartida(cubeta, clave):
+    global _escrituras_compartidas
+    parametros = _parametros(cubeta, clave)
+    with db.engine.begin() as conexion:
+        fichas, permitido = conexion.execute(_CONSUMIR_SQL, parametros).one()
+        _escrituras_compartidas += 1
+        if _escrituras_compartidas % PURGA_CADA == 0:
+            # Una cubeta sin uso durante capacidad/tasa segundos ya está llena: la fila sobra
+            conexion.execute(_PURGAR_SQL, {'limite': parametros['ahora'] - cubeta.capacidad / cubeta.tasa})
+    return 0.0 if permitido else cubeta._espera(fichas)
+
+
+def _consultar_compartida(cubeta, clave):
+    with db.engine.connect() as conexion:
+        fichas = conexion.execute(_CONSULTAR_SQL, _parametros(cubeta, clave)).scalar()
+    return 0.0 if fichas is None else cubeta._espera(fichas)
+
+
+# --- Cubetas de la aplicación ---
+
+_cubetas = {}
+_cubetas_lock = threading.Lock()
+
+
+def _cubeta(nombre):
+    """Cubeta en memoria de este worker para 'ip' o 'cuenta', creada con la configuración actual."""
+    capacidad, por_minuto = current_app.config[f'LOGIN_THROTTLE_{nombre.upper()}']
+    with _cubetas_lock:
+        cubeta = _cubetas.get(nombre)
+        if cubeta is None or (cubeta.capacidad, cubeta.tasa) != (float(capacidad), por_minuto / 60.0):
+            cubeta = _cubetas[nombre] = CubetaDeFichas(capacidad, por_minuto)
+        return cubeta
+
+
+def ip_del_cliente():
+    """
+    IP del cliente. Detrás de LOGIN_THROTTLE_PROXIES proxies de confianza (p. ej. nginx) se toma
+    la dirección que agregó el más cercano en X-Forwarded-For; sin proxies, remote_addr.
+    """
+    proxies = current_app.config.get('LOGIN_THROTTLE_PROXIES', 0)
+    if proxies and request.headers.get('X-Forwarded-For'):
+        # Cada proxy agrega al final la dirección de quien le habló; lo anterior lo controla el cliente
+        ruta = request.access_route
+        return ruta[-min(proxies, len(ruta))]
+    return request.remote_addr or 'desconocida'
+
+
+def normalizar_cuenta(username_or_email):
+    # La misma normalización que User.por_identidad: 'Ana' y ' ana' comparten cubeta
+    return normalizar_identificador(username_or_email) or ''
+
+
+def _consumir(nombre, clave):
+    cubeta = _cubeta(nombre)
+    espera = cubeta.consumir(clave)
+    if not espera and current_app.config.get('LOGIN_THROTTLE_SHARED'):
+        espera = _consumir_compartida(cubeta, f'{nombre}:{clave}')
+    return espera
+
+
+def _consultar(nombre, clave):
+    cubeta = _cubeta(nombre)
+    espera = cubeta.consultar(clave)
+    if not espera and current_app.config.get('LOGIN_THROTTLE_SHARED'):
+        espera = _consultar_compartida(cubeta, f'{nombre}:{clave}')
+    return espera
+
+
+def espera_para_login(username_or_email):
+    """
+    Segundos que el cliente debe esperar antes de intentar de nuevo (0 = puede intentar).
+    Se llama al inicio del POST de login, antes de buscar al usuario.
+    """
+    if not current_app.config.get('LOGIN_THROTTLE_ENABLED', True):
+        return 0.0
+    espera = _consumir('ip', ip_del_cliente())
+    if espera:
+        return espera
+    return _consultar('cuenta', normalizar_cuenta(username_or_email))
+
+
+def registrar_fallo_de_login(username_or_email):
+    """Descuenta una ficha de la cuenta tras una contraseña incorrecta (o un usuario inexistente)."""
+    if current_app.config.get('LOGIN_THROTTLE_ENABLED', True):
+        _consumir('cuenta', normalizar_cuenta(username_or_email))
+
+
+def respuesta_limitada(espera):
+    """429 mínimo, sin plantilla: render_template consultaría la base de datos (context processors)."""
+    segundos = max(1, math.ceil(espera))
+    response = current_app.response_class(
+        f'Demasiados intentos de inicio de sesión. Intenta de nuevo en {segundos} segundos.',
+        status=429, mimetype='text/plain'
+    )
+    response.headers['Retry-After'] = str(segundos)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
@@ -3,6 +3,8 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from models import db # IMPORTANTE: Importa la instancia de 'db' desde models.py
 from datetime import datetime
 from functools import wraps # Necesario para el decorador role_required
+from http_cache import respuesta_condicional
+from cache import cache, tabla
 
 # DECORADOR PARA ROLES (Ahora definido dentro de version.py)
 def role_required(roles):
@@ -46,7 +48,30 @@ class Version(db.Model):
 
 version_bp = Blueprint('version', __name__)
 
+def ultima_version():
+    """
+    (numero_version, fecha_modificacion) de la versión más reciente, o () si no hay ninguna.
+    La usan el navbar de todas las páginas y los ETag de las vistas con sesión, así que se guarda
+    en caché; cualquier commit que cambie la tabla version la invalida.
+    """
+    def calcular():
+        fila = db.session.query(Version.numero_version, Version.fecha_modificacion) \
+            .order_by(Version.fecha_creacion.desc()).first()
+        return tuple(fila) if fila else ()
+    return cache.obtener_o_calcular(tabla('version'), 'ultima', calcular)
+
+def validador_ver_versiones():
+    """
+    Validadores HTTP del listado: cantidad, ID máximo y última modificación.
+    Cualquier alta, baja o edición cambia al menos uno de los tres valores.
+    """
+    total, max_id, ultima_modificacion = db.session.query(
+        db.func.count(Version.id), db.func.max(Version.id), db.func.max(Version.fecha_modificacion)
+    ).one()
+    return (total, max_id, ultima_modificacion), ultima_modificacion
+
 @version_bp.route('/ver_versiones')
+@respuesta_condicional(validador_ver_versiones, debil=True, por_sesion=True)
 def ver_versiones():
     """
     Muestra una lista de todas las versiones registradas.